@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Benchmark de bout en bout (noyau.py contre un OpenAI local simulé)
+
+- Démarre bench/mock_openai.py en tâche de fond (latence / erreurs configurables).
+- Exécute noyau.py sur un corpus d'instructions (JSONL : "instruction", ou
+  "title" pour un requests.jsonl), à un ou plusieurs niveaux de concurrence.
+- Rapporte p50/p95/p99 de bout en bout et par phase (meta.json "timings"),
+  requêtes/s, taux d'échec et RSS max, puis écrit le tout en JSON.
+- --compare <ancien.json> affiche les écarts (comparaison entre commits).
+- --stream : noyau en PIWI_STREAM=1 (comparer ttfc/total avec un run sans).
+- --rpm / --tpm : limites de débit du mock ; 429 reçus et attente d'admission
+  (piwi_ratelimit, meta.json "ratelimit") rapportés ; --no-ratelimit pour comparer.
+
+Chaque requête tourne avec un HOME temporaire : PIWI_HOME et les dossiers de
+requêtes restent dans un bac à sable jetable.
+
+Usage :
+  python3 bench/bench_e2e.py --concurrency 1,4 --latency 0.3 --repeat 2
+  python3 bench/bench_e2e.py --compare bench/results/<ancien>.json
+  python3 bench/bench_e2e.py --concurrency 8 --repeat 3 --rpm 60 [--no-ratelimit]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+sys.path.insert(0, str(HERE))
+import mock_openai as MO
+
+
+def load_corpus(path: Path) -> list:
+    out = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        ent = json.loads(line)
+        instr = (ent.get("instruction") or ent.get("title") or "").strip()
+        if instr:
+            out.append(instr)
+    return out
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    v = sorted(values)
+    k = max(0, min(len(v) - 1, int(round(q / 100.0 * len(v) + 0.5)) - 1))
+    return round(v[k], 4)
+
+
+def summarize(values: list) -> dict:
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95),
+            "p99": percentile(values, 99), "n": len(values)}
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def run_one(instruction: str, idx: int, workdir: Path, base_url: str, timeout: float, stream: bool = False,
+            ratelimit: bool = True) -> dict:
+    home = workdir / f"home_{idx}"
+    reqdir = home / "piwi_requests" / f"req_bench_{idx}"
+    reqdir.mkdir(parents=True, exist_ok=True)
+    env = dict(os.environ)
+    env.update({
+        "HOME": str(home),
+        "PIWI_OPENAI_KEY": "sk-bench",
+        "PIWI_OPENAI_BASE_URL": base_url,
+        "PIWI_ASSUME_WSL": "1",
+        "PIWI_STREAM": "1" if stream else "",
+        "PIWI_RATELIMIT": "1" if ratelimit else "0",
+    })
+    env.pop("PIWI_SUDO_PASSWORD", None)
+    t0 = time.perf_counter()
+    p = subprocess.Popen([sys.executable, str(ROOT / "noyau.py"), instruction, str(reqdir)],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, cwd=str(home))
+    deadline = t0 + timeout
+    while True:
+        pid, status, ru = os.wait4(p.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.perf_counter() > deadline:
+            p.kill()
+            pid, status, ru = os.wait4(p.pid, 0)
+            break
+        time.sleep(0.005)
+    wall = time.perf_counter() - t0
+    rc = os.waitstatus_to_exitcode(status)
+    p.returncode = rc
+    meta = {}
+    try:
+        meta = json.loads((reqdir / "meta.json").read_text(encoding="utf-8"))
+    except Exception:
+        pass
+    return {"rc": rc, "wall": wall, "timings": meta.get("timings", {}), "maxrss_kb": ru.ru_maxrss,
+            "ratelimit": meta.get("ratelimit", {})}
+
+
+def run_level(corpus: list, concurrency: int, repeat: int, base_url: str, timeout: float, stream: bool = False,
+              ratelimit: bool = True) -> dict:
+    items = [instr for _ in range(repeat) for instr in corpus]
+    workdir = Path(tempfile.mkdtemp(prefix="piwi_bench_"))
+    try:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            results = list(ex.map(lambda a: run_one(a[1], a[0], workdir, base_url, timeout, stream, ratelimit), enumerate(items)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    phases: dict = {}
+    for r in results:
+        for k, v in r["timings"].items():
+            phases.setdefault(k, []).append(v)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "failures": sum(1 for r in results if r["rc"] != 0),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "latency_s": summarize([r["wall"] for r in results]),
+        "phases_s": {k: summarize(v) for k, v in sorted(phases.items())},
+        "peak_rss_kb": max((r["maxrss_kb"] for r in results), default=0),
+        "admission_wait_s": summarize([r["ratelimit"].get("wait_s", 0.0) for r in results]),
+        "rate_limited": sum(r["ratelimit"].get("rate_limited", 0) for r in results),
+    }
+
+
+def compare(old: dict, new: dict):
+    prev = {r["concurrency"]: r for r in old.get("runs", [])}
+    print(f"\nComparaison {old.get('meta', {}).get('git', '?')} -> {new['meta']['git']}")
+    for r in new["runs"]:
+        o = prev.get(r["concurrency"])
+        if not o:
+            continue
+        def d(a, b):
+            return f"{a:.3f} -> {b:.3f} ({(b - a) / a * 100:+.1f}%)" if a else f"{a} -> {b}"
+        print(f"  c={r['concurrency']:<3} p50 {d(o['latency_s']['p50'], r['latency_s']['p50'])}"
+              f" | p95 {d(o['latency_s']['p95'], r['latency_s']['p95'])}"
+              f" | rps {d(o['rps'], r['rps'])}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de bout en bout de noyau.py (OpenAI simulé).")
+    ap.add_argument("--corpus", default=str(HERE / "corpus.jsonl"))
+    ap.add_argument("--responses", default=str(HERE / "canned.jsonl"))
+    ap.add_argument("--concurrency", default="1,4", help="niveaux, ex. 1,4,8")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--jitter", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-status", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--timeout", type=float, default=120.0, help="par requête (s)")
+    ap.add_argument("--stream", action="store_true", help="génération en flux + exécution en pipeline")
+    ap.add_argument("--token-delay", type=float, default=0.01, help="mock : délai entre morceaux du flux (s)")
+    ap.add_argument("--rpm", type=int, default=0, help="mock : requêtes par minute (0 = illimité)")
+    ap.add_argument("--tpm", type=int, default=0, help="mock : jetons par minute (0 = illimité)")
+    ap.add_argument("--no-ratelimit", action="store_true", help="noyau sans admission partagée (PIWI_RATELIMIT=0)")
+    ap.add_argument("--out", default="", help="def=bench/results/<date>_<git>.json")
+    ap.add_argument("--compare", default="", help="résultats précédents à comparer")
+    a = ap.parse_args()
+
+    corpus = load_corpus(Path(a.corpus))
+    if not corpus:
+        print("[ERROR] corpus vide")
+        sys.exit(1)
+
+    cfg = MO.MockConfig(MO.load_responses(a.responses), latency=a.latency, jitter=a.jitter,
+                        error_rate=a.error_rate, error_status=a.error_status, seed=a.seed,
+                        token_delay=a.token_delay, rpm=a.rpm, tpm=a.tpm)
+    srv, base_url = MO.start_background(cfg)
+
+    runs = []
+    try:
+        for c in [int(x) for x in a.concurrency.split(",") if x.strip()]:
+            n429 = cfg.stats["rate_limited"]
+            r = run_level(corpus, c, a.repeat, base_url, a.timeout, a.stream, not a.no_ratelimit)
+            r["mock_429"] = cfg.stats["rate_limited"] - n429
+            runs.append(r)
+            print(f"c={c:<3} n={r['requests']:<4} échecs={r['failures']:<3} rps={r['rps']:<8} "
+                  f"p50={r['latency_s']['p50']}s p95={r['latency_s']['p95']}s p99={r['latency_s']['p99']}s "
+                  f"rss_max={r['peak_rss_kb']}KB")
+            if a.rpm or a.tpm:
+                print(f"      429 (mock)={r['mock_429']} admission p50={r['admission_wait_s']['p50']}s "
+                      f"p95={r['admission_wait_s']['p95']}s")
+            for k, v in r["phases_s"].items():
+                print(f"      {k:<18} p50={v['p50']}s p95={v['p95']}s p99={v['p99']}s")
+    finally:
+        srv.shutdown()
+
+    result = {
+        "meta": {
+            "git": git_rev(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": a.corpus,
+            "stream": a.stream,
+            "ratelimit": not a.no_ratelimit,
+            "mock": {"latency": a.latency, "jitter": a.jitter, "error_rate": a.error_rate,
+                     "error_status": a.error_status, "token_delay": a.token_delay, "rpm": a.rpm, "tpm": a.tpm,
+                     "requests": cfg.stats["requests"], "errors": cfg.stats["errors"],
+                     "rate_limited": cfg.stats["rate_limited"]},
+        },
+        "runs": runs,
+    }
+    out = Path(a.out) if a.out else HERE / "results" / f"{datetime.now():%Y%m%d-%H%M%S}_{result['meta']['git']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nRésultats : {out}")
+
+    if a.compare:
+        compare(json.loads(Path(a.compare).read_text(encoding="utf-8")), result)
+
+
+if __name__ == "__main__":
+    main()
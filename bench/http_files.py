@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Serveur HTTP de fichiers pour tester piwi-fetch (bench / dev, sans réseau)
+
+- GET/HEAD d'un dossier, avec ETag / Last-Modified / Accept-Ranges.
+- Requêtes Range (bytes=a-b, a-) et If-Range -> 206 / 200.
+- --rate : débit max PAR connexion (o/s), pour mesurer le gain des plages parallèles.
+- --drop-after : coupe chaque réponse après N octets (la 1re fois par fichier),
+  pour tester la reprise.
+
+Usage :
+  python3 bench/http_files.py --dir /tmp/files --port 8780 --rate 2M
+  piwi-fetch http://127.0.0.1:8780/gros.bin -d /tmp/out
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def parse_rate(v: str) -> float:
+    m = re.match(r"^(\d+(?:\.\d+)?)([kmg]?)$", (v or "0").strip().lower())
+    return float(m.group(1)) * {"": 1, "k": 1e3, "m": 1e6, "g": 1e9}[m.group(2)] if m else 0.0
+
+
+class Handler(BaseHTTPRequestHandler):
+    root = "."
+    rate = 0.0
+    drop_after = 0
+    dropped: set = set()
+    lock = threading.Lock()
+
+    def log_message(self, *a):
+        pass
+
+    def _file(self):
+        path = os.path.realpath(os.path.join(self.root, self.path.split("?", 1)[0].lstrip("/")))
+        if not path.startswith(os.path.realpath(self.root)) or not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        return path
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body: bool):
+        path = self._file()
+        if not path:
+            return
+        st = os.stat(path)
+        size = st.st_size
+        etag = '"' + hashlib.sha1(f"{path}:{st.st_mtime_ns}:{size}".encode()).hexdigest()[:16] + '"'
+        lm = formatdate(st.st_mtime, usegmt=True)
+        start, end, status = 0, size - 1, 200
+        m = _RANGE.match(self.headers.get("Range", ""))
+        if_range = self.headers.get("If-Range")
+        if m and (not if_range or if_range in (etag, lm)):
+            a, b = m.group(1), m.group(2)
+            start, end = (int(a), int(b) if b else size - 1) if a else (max(0, size - int(b)), size - 1)
+            end = min(end, size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", lm)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not body:
+            return
+        drop = 0
+        with self.lock:
+            if self.drop_after and path not in self.dropped:
+                self.dropped.add(path)
+                drop = self.drop_after
+        sent, t0 = 0, time.monotonic()
+        with open(path, "rb") as f:
+            f.seek(start)
+            left = end - start + 1
+            while left > 0:
+                buf = f.read(min(65536, left))
+                if not buf:
+                    break
+                if drop and sent + len(buf) > drop:
+                    self.wfile.write(buf[:max(0, drop - sent)])
+                    self.close_connection = True
+                    return
+                self.wfile.write(buf)
+                sent += len(buf)
+                left -= len(buf)
+                if self.rate:
+                    ahead = sent / self.rate - (time.monotonic() - t0)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serveur de fichiers avec Range/ETag (tests piwi-fetch).")
+    ap.add_argument("--dir", default=".")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8780)
+    ap.add_argument("--rate", default="0", help="débit max par connexion (ex. 2M)")
+    ap.add_argument("--drop-after", type=int, default=0, help="coupe la 1re réponse de chaque fichier après N octets")
+    a = ap.parse_args()
+    Handler.root, Handler.rate, Handler.drop_after = a.dir, parse_rate(a.rate), a.drop_after
+    srv = ThreadingHTTPServer((a.host, a.port), Handler)
+    print(f"http_files: http://{a.host}:{a.port}/ -> {os.path.abspath(a.dir)}", file=sys.stderr, flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
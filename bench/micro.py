@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Micro-benchmarks des chemins chauds (sur un /mnt/c simulé et lent)
+
+- Arborescence factice type /mnt/c/Users : --users utilisateurs (Desktop, Documents,
+  Downloads..., piwi_requests/req_*), l'un d'eux avec Desktop/Piwi (marqueur
+  .piwi_home.json) contenant --reqs dossiers req_* dans _internal.
+- Système de fichiers lent simulé : os.stat/listdir/scandir/mkdir/open... sous cette
+  arborescence comptés (ops/appel, déterministe) et retardés de --fs-latency ms
+  (ordre de grandeur d'un aller-retour 9P vers /mnt/c).
+- wsl.exe et powershell.exe remplacés par les stubs de bench/stubs/ (tmpfs pour
+  l'arborescence si /dev/shm existe : mesures reproductibles d'une machine à l'autre).
+- Cas : path_resolver (find_piwi_home, resolve_hint), noyau (logln, clean_code,
+  write_text, handle_post_install), wsl_bridge (_decode_bytes, _normalize_lines,
+  distro_list_quiet), piwi_purge.sh.
+- Référence JSON (--save-baseline) ; la comparaison échoue (code 1) si un cas
+  régresse de plus de --threshold % en temps (minimum des répétitions) ou en ops.
+  Un "threshold" par cas dans le fichier de référence remplace la valeur globale.
+- bench/micro_baseline.json (versionné) ne garde que les ops, identiques d'une
+  machine à l'autre (--ops-only, seuil 0 par cas) ; les temps se comparent à une
+  référence locale.
+  Sans référence, --threshold explicite échoue (code 1) au lieu de passer en silence.
+
+Usage :
+  python3 bench/micro.py                            # compare à bench/micro_baseline.json
+  python3 bench/micro.py --save-baseline --ops-only # régénère la référence versionnée
+  python3 bench/micro.py --save-baseline --baseline /tmp/local.json   # référence locale (temps + ops)
+  python3 bench/micro.py --threshold 20             # compare, code 1 si régression
+  python3 bench/micro.py --filter noyau --repeat 9
+Env : PIWI_BENCH_THRESHOLD (def=25)
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import builtins
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from contextlib import redirect_stdout
+from datetime import datetime
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+STUBS = HERE / "stubs"
+sys.path.insert(0, str(ROOT))
+
+FOLDERS = ("Desktop", "Documents", "Downloads", "Pictures", "Music", "Videos")
+RESPONSE = ("Voici le script :\n```bash\nset -euo pipefail\nsudo apt-get install -y ffmpeg\n"
+            + "".join(f'ffmpeg -i "$DEST_DIR/in_{i}.mp4" "$DEST_DIR/out_{i}.mp3"\n' for i in range(40))
+            + "```\nBonne utilisation !")
+SHORTCUTS = json.dumps([{"name": f"Outil {i}", "target": f"C:\\Program Files\\Outil{i}\\outil.exe",
+                         "workdir": f"C:\\Program Files\\Outil{i}", "icon": ""} for i in range(8)])
+WSL_VERBOSE = "  NAME          STATE           VERSION\r\n* PiwiUbuntu    Running         2\r\n" \
+              + "".join(f"  Distro{i}       Stopped         2\r\n" for i in range(20))
+
+
+class SlowFS:
+    """Retarde et compte les appels système de fichiers visant `root`."""
+
+    FUNCS = ("stat", "lstat", "listdir", "scandir", "mkdir", "rmdir", "unlink", "replace", "rename", "chmod")
+
+    def __init__(self, root: Path, latency_ms: float):
+        self.root = str(root)
+        self.delay = latency_ms / 1000.0
+        self.ops = 0
+        self.orig = {}
+
+    def _hit(self, p) -> bool:
+        try:
+            p = os.fsdecode(p) if not isinstance(p, int) else ""
+        except TypeError:
+            return False
+        if p.startswith(self.root):
+            self.ops += 1
+            if self.delay:
+                time.sleep(self.delay)
+            return True
+        return False
+
+    def _wrap(self, fn):
+        def slow(p=".", *a, **kw):
+            self._hit(p)
+            return fn(p, *a, **kw)
+        return slow
+
+    def __enter__(self):
+        for name in self.FUNCS:
+            self.orig[name] = getattr(os, name)
+            setattr(os, name, self._wrap(self.orig[name]))
+        self.orig["open"] = builtins.open
+        builtins.open = io.open = self._wrap(self.orig["open"])
+        return self
+
+    def __exit__(self, *exc):
+        for name in self.FUNCS:
+            setattr(os, name, self.orig[name])
+        builtins.open = io.open = self.orig["open"]
+
+
+# --- Arborescence factice ---
+def build_tree(base: Path, users: int, reqs: int) -> dict:
+    mnt = base / "mnt_c" / "Users"
+    names = [f"user{i:03d}" for i in range(users)]
+    for u in names:
+        for f in FOLDERS:
+            (mnt / u / f).mkdir(parents=True, exist_ok=True)
+        for r in range(3):
+            (mnt / u / "piwi_requests" / f"req_2026-01-0{r + 1}_10-00-00_{u}").mkdir(parents=True, exist_ok=True)
+    owner = names[-1]  # dernier listé : pire cas du balayage
+    home = mnt / owner / "Desktop" / "Piwi"
+    (home / ".piwi").mkdir(parents=True, exist_ok=True)
+    (home / ".piwi" / ".piwi_home.json").write_text("{}", encoding="utf-8")
+    (home / "bin").mkdir()
+    shutil.copy(ROOT / "create_shortcut.sh", home / "bin" / "create_shortcut.sh")  # comme setup_piwi.sh
+    os.chmod(home / "bin" / "create_shortcut.sh", 0o755)
+    reqdir = mnt / owner / "piwi_requests" / "req_bench"
+    reqdir.mkdir(parents=True, exist_ok=True)
+    linux_home = base / "home"
+    linux_home.mkdir(parents=True, exist_ok=True)
+    # bash -l (create_shortcut) : le stub powershell.exe doit rester dans le PATH
+    (linux_home / ".bash_profile").write_text(f'export PATH="{STUBS}:$PATH"\n', encoding="utf-8")
+    return {"users_dir": mnt, "piwi_home": home, "reqdir": reqdir, "home": linux_home}
+
+
+def build_purge_tree(piwi_home: Path, reqs: int):
+    internal = piwi_home / "_internal"
+    shutil.rmtree(internal, ignore_errors=True)
+    old = time.time() - 30 * 86400
+    for i in range(reqs):
+        d = internal / f"req_2026-01-01_10-00-{i:05d}"
+        d.mkdir(parents=True)
+        (d / "log.txt").write_text("ligne de journal\n" * 20, encoding="utf-8")
+        (d / "meta.json").write_text('{"rc": 0}', encoding="utf-8")
+        if i % 2 == 0:
+            os.utime(d, (old, old))
+
+
+# --- Cas ---
+def make_cases(tree: dict, reqs: int) -> list:
+    """[(nom, fn, number, setup | None)]"""
+    import path_resolver as PR
+    PR.is_wsl = lambda: True
+    PR.windows_users_dir = lambda: str(tree["users_dir"])
+    import wsl_bridge as WB
+
+    cases = [
+        ("path_resolver.find_piwi_home", PR.find_piwi_home, 5, None),
+        ("path_resolver.resolve_hint.alias", lambda: PR.resolve_hint("téléchargements"), 5, None),
+        ("path_resolver.resolve_hint.windows", lambda: PR.resolve_hint("C:\\Users\\user000\\Videos\\clips"), 200, None),
+        ("wsl_bridge._decode_bytes", lambda: WB._decode_bytes(WSL_VERBOSE.encode("utf-16le")), 2000, None),
+        ("wsl_bridge._normalize_lines", lambda: WB._normalize_lines(WSL_VERBOSE.replace("\r\n", "\x00\n")), 2000, None),
+        ("wsl_bridge.distro_list_quiet", WB.distro_list_quiet, 10, None),
+    ]
+
+    NY = load_noyau(tree)
+    if NY is not None:
+        log = NY.REQ_INTERNAL / "log.txt"
+        shortcuts = NY.REQ_INTERNAL / "shortcuts.json"
+        real_create = NY.create_shortcut
+
+        def reset_log():
+            log.write_text("".join(f"[INFO] ligne {i:04d} du journal de la requête en cours\n" for i in range(300)),
+                           encoding="utf-8")
+
+        def post_install(stub: bool):
+            def setup():
+                reset_log()
+                shortcuts.write_text(SHORTCUTS if stub else SHORTCUTS[:SHORTCUTS.index("},") + 1] + "]",
+                                     encoding="utf-8")
+                NY.create_shortcut = (lambda *a, **k: True) if stub else real_create
+            return setup
+
+        cases += [
+            ("noyau.logln", lambda: NY.logln("[INFO] étape terminée", echo=False), 20, reset_log),
+            ("noyau.clean_code", lambda: NY.clean_code(RESPONSE), 2000, None),
+            ("noyau.write_text", lambda: NY.write_text(NY.REQ_INTERNAL / "exec.sh", RESPONSE), 20, None),
+            ("noyau.handle_post_install.parse", NY.handle_post_install, 5, post_install(True)),
+            ("noyau.handle_post_install.shortcut", NY.handle_post_install, 1, post_install(False)),
+        ]
+
+    env = dict(os.environ, PIWI_HOME=str(tree["piwi_home"]), PIWI_ARCHIVE_DAYS="0")
+
+    def purge():
+        subprocess.run(["bash", str(ROOT / "piwi_purge.sh")], env=env, cwd=str(ROOT),
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    cases.append(("piwi_purge.sh", purge, 1, lambda: build_purge_tree(tree["piwi_home"], reqs)))
+    return cases
+
+
+def load_noyau(tree: dict):
+    """Importe noyau.py comme pour une requête (argv, REQ_INTERNAL factice) ; None si impossible."""
+    argv = sys.argv
+    sys.argv = ["noyau.py", "bench", str(tree["reqdir"])]
+    try:
+        import noyau
+        return noyau
+    except SystemExit:
+        print("[WARN] noyau.py non importable (openai absent ?) : cas noyau.* ignorés.", file=sys.stderr)
+        return None
+    finally:
+        sys.argv = argv
+
+
+# --- Mesure ---
+def measure(fn, number: int, repeat: int, setup, fs: SlowFS) -> dict:
+    times, ops = [], []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        fs.ops = 0
+        with fs, redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            dt = time.perf_counter() - t0
+        times.append(dt / number * 1e6)
+        ops.append(fs.ops / number)
+    return {"us": round(min(times), 2), "median_us": round(statistics.median(times), 2),
+            "ops": round(min(ops), 2), "number": number, "repeat": repeat}
+
+
+def check(results: dict, baseline: dict, threshold: float, metrics=("us", "ops")) -> list:
+    """Cas en régression : [(nom, métrique, référence, mesure, seuil %)]."""
+    out = []
+    for name, r in results.items():
+        b = baseline.get("cases", {}).get(name)
+        if not b:
+            continue
+        t = float(b.get("threshold", threshold))
+        for metric in metrics:
+            ref = b.get(metric)
+            if ref is not None and r[metric] > ref * (1 + t / 100.0) + (0.5 if metric == "ops" else 0.0):
+                out.append((name, metric, ref, r[metric], t))
+    return out
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks des chemins chauds de Piwi (/mnt/c simulé).")
+    ap.add_argument("--filter", default="", help="sous-chaîne du nom des cas")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--fs-latency", type=float, default=0.2, help="ms par opération sur le /mnt/c simulé")
+    ap.add_argument("--users", type=int, default=40)
+    ap.add_argument("--reqs", type=int, default=300, help="dossiers req_* pour la purge")
+    ap.add_argument("--baseline", default=str(HERE / "micro_baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true", help="écrit la référence au lieu de comparer")
+    ap.add_argument("--ops-only", action="store_true", help="avec --save-baseline : ops seulement (portable)")
+    ap.add_argument("--threshold", type=float, default=None,
+                    help="régression tolérée en %% (def=PIWI_BENCH_THRESHOLD ou 25)")
+    ap.add_argument("--out", default="", help="def=bench/results/micro_<date>_<git>.json")
+    a = ap.parse_args()
+    threshold = a.threshold if a.threshold is not None else float(os.getenv("PIWI_BENCH_THRESHOLD", "") or 25)
+
+    # tmpfs si possible : seule la latence simulée compte, pas le disque de la machine de test
+    work = Path(tempfile.mkdtemp(prefix="piwi_micro_", dir="/dev/shm" if os.path.isdir("/dev/shm") else None))
+    try:
+        tree = build_tree(work, a.users, a.reqs)
+        os.environ.update({"HOME": str(tree["home"]), "PIWI_WSL_EXE": str(STUBS / "wsl.exe"),
+                           "PIWI_OPENAI_KEY": "sk-bench", "PIWI_ASSUME_WSL": "1", "PIWI_PREFETCH": "0",
+                           "PIWI_IDLE": "0", "PIWI_CACHE_DIR": str(work / "cache"),
+                           "PIWI_STATE_DIR": str(work / "state"),
+                           "PATH": f"{STUBS}{os.pathsep}{os.environ.get('PATH', '')}"})
+        for k in ("USERPROFILE", "USERNAME", "PIWI_HOME"):
+            os.environ.pop(k, None)
+        fs = SlowFS(tree["users_dir"], a.fs_latency)
+        results = {}
+        for name, fn, number, setup in make_cases(tree, a.reqs):
+            if a.filter and a.filter not in name:
+                continue
+            results[name] = measure(fn, number, a.repeat, setup, fs)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    base_path = Path(a.baseline)
+    baseline = {}
+    if base_path.exists() and not a.save_baseline:
+        baseline = json.loads(base_path.read_text(encoding="utf-8"))
+    print(f"{'cas':<38} {'µs/appel':>12} {'médiane':>12} {'ops/appel':>10}   référence")
+    for name, r in results.items():
+        b = baseline.get("cases", {}).get(name)
+        ref = "-"
+        if b and b.get("us"):
+            ref = f"{b['us']:.1f} µs ({(r['us'] - b['us']) / b['us'] * 100:+.1f}%)"
+        elif b and "ops" in b:
+            ref = f"{b['ops']:.1f} ops"
+        print(f"{name:<38} {r['us']:>12.1f} {r['median_us']:>12.1f} {r['ops']:>10.1f}   {ref}")
+
+    meta = {"git": git_rev(), "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "fs_latency_ms": a.fs_latency, "users": a.users, "reqs": a.reqs, "repeat": a.repeat}
+    out = Path(a.out) if a.out else HERE / "results" / f"micro_{datetime.now():%Y%m%d-%H%M%S}_{meta['git']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": meta, "cases": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nRésultats : {out}")
+
+    if a.save_baseline:
+        prev = json.loads(base_path.read_text(encoding="utf-8")) if base_path.exists() else {}
+        # ops déterministes : tolérance nulle par défaut (le seuil par cas déjà présent est gardé)
+        keys, tol = (("ops",), {"threshold": 0}) if a.ops_only else (("us", "ops"), {})
+        cases = {n: {**{k: r[k] for k in keys},
+                     **({"threshold": prev["cases"][n]["threshold"]}
+                        if "threshold" in prev.get("cases", {}).get(n, {}) else tol)}
+                 for n, r in results.items()}
+        base_path.write_text(json.dumps({"meta": meta, "cases": {**prev.get("cases", {}), **cases}},
+                                        ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Référence : {base_path}")
+        return
+    if not baseline:
+        if a.threshold is not None:
+            print(f"[ERROR] Pas de référence ({base_path}) : rien à comparer avec --threshold.", file=sys.stderr)
+            sys.exit(1)
+        print(f"[INFO] Pas de référence ({base_path}) : lancer avec --save-baseline.")
+        return
+    metrics = ("us", "ops")
+    bmeta = baseline.get("meta", {})
+    if (bmeta.get("users"), bmeta.get("reqs")) not in ((a.users, a.reqs), (None, None)):
+        print(f"[WARN] Référence construite avec --users {bmeta.get('users')} --reqs {bmeta.get('reqs')} : "
+              "ops non comparables, temps seulement.")
+        metrics = ("us",)
+    bad = check(results, baseline, threshold, metrics)
+    for name, metric, ref, val, t in bad:
+        print(f"[REGRESSION] {name} : {metric} {ref} -> {val} (> +{t:g}%)")
+    if bad:
+        sys.exit(1)
+    print(f"[OK] Aucune régression au-delà du seuil ({threshold:g}% par défaut).")
+
+
+if __name__ == "__main__":
+    main()
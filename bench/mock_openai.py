@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Serveur local compatible OpenAI (bench / dev, sans réseau ni coût)
+
+- POST /v1/chat/completions : renvoie une complétion "canned" ou rejouée
+  (en SSE morceau par morceau si "stream": true, cf. --token-delay).
+- GET  /v1/models           : liste minimale (test de clé de la GUI).
+- Latence configurable (base + gigue) et injection d'erreurs (500/429).
+- Limites de débit simulées (--rpm / --tpm par modèle, seau par minute comme l'API) : en-têtes
+  x-ratelimit-{limit,remaining,reset}-{requests,tokens} sur chaque réponse, 429 +
+  retry-after au-delà.
+
+Réponses : fichier JSONL (--responses) de lignes {"match": "<regex>", "content": "..."} ;
+la première regex qui matche le dernier message utilisateur l'emporte, sinon
+la réponse par défaut (--default).
+
+Usage :
+  python3 bench/mock_openai.py --port 8765 --latency 0.3 --jitter 0.1 --error-rate 0.05
+  python3 bench/mock_openai.py --port 8765 --rpm 30 --tpm 40000
+  PIWI_OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python3 noyau.py "..."
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_CONTENT = "```bash\necho \"piwi-bench ok\" > \"$REQ_INTERNAL/bench.txt\"\n```"
+
+
+def load_responses(path: str) -> list:
+    out = []
+    if not path:
+        return out
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            ent = json.loads(line)
+            out.append((re.compile(ent["match"], re.I | re.S), ent["content"]))
+    return out
+
+
+class MockConfig:
+    def __init__(self, responses=None, default=DEFAULT_CONTENT, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=500, seed=None, token_delay=0.0, chunk_chars=8,
+                 rpm=0, tpm=0):
+        self.responses = responses or []
+        self.default = default
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_delay = token_delay
+        self.chunk_chars = max(1, chunk_chars)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+        self.rates = {dim: lim for dim, lim in (("requests", rpm), ("tokens", tpm)) if lim > 0}
+        self.buckets: dict = {}  # modèle -> {dim: {limit, avail, ts}}
+
+    def pick(self, prompt: str) -> str:
+        for rx, content in self.responses:
+            if rx.search(prompt):
+                return content
+        return self.default
+
+    def admit(self, model: str, tokens: int) -> tuple:
+        """(admis?, en-têtes x-ratelimit-*) ; seaux du modèle remplis à limite/60 par seconde."""
+        if not self.rates:
+            return True, {}
+        cost = {"requests": 1, "tokens": tokens}
+        with self.lock:
+            now = time.monotonic()
+            limits = self.buckets.setdefault(model, {d: {"limit": lim, "avail": float(lim), "ts": now}
+                                                     for d, lim in self.rates.items()})
+            for b in limits.values():
+                b["avail"] = min(b["limit"], b["avail"] + (now - b["ts"]) * b["limit"] / 60.0)
+                b["ts"] = now
+            need = {d: min(cost[d], b["limit"]) for d, b in limits.items()}
+            short = [d for d, b in limits.items() if b["avail"] < need[d]]
+            if not short:
+                for d, b in limits.items():
+                    b["avail"] -= need[d]
+            else:
+                self.stats["rate_limited"] += 1
+            hdr = {}
+            for d, b in limits.items():
+                rem = max(0, int(b["avail"]))
+                hdr[f"x-ratelimit-limit-{d}"] = str(b["limit"])
+                hdr[f"x-ratelimit-remaining-{d}"] = str(rem)
+                hdr[f"x-ratelimit-reset-{d}"] = f"{(b['limit'] - b['avail']) * 60.0 / b['limit']:.3f}s"
+            if short:
+                wait = max((need[d] - limits[d]["avail"]) * 60.0 / limits[d]["limit"] for d in short)
+                hdr["retry-after"] = f"{max(0.05, wait):.3f}"
+        return not short, hdr
+
+    def roll(self) -> tuple:
+        """(délai, erreur?) tirés sous verrou pour rester reproductibles avec --seed."""
+        with self.lock:
+            self.stats["requests"] += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+        return delay, fail
+
+
+class Handler(BaseHTTPRequestHandler):
+    cfg: MockConfig = None  # injecté par make_server()
+    rl_headers: dict = {}   # en-têtes x-ratelimit-* de la requête en cours
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, status: int, obj: dict, headers: dict | None = None):
+        headers = {**self.rl_headers, **(headers or {})}
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        self.rl_headers = {}
+        n = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(n) or b"{}")
+        except Exception:
+            return self._json(400, {"error": {"message": "bad json"}})
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+
+        delay, fail = self.cfg.roll()
+        time.sleep(delay)
+        if fail:
+            st = self.cfg.error_status
+            hdr = {"retry-after": "1"} if st == 429 else {}
+            return self._json(st, {"error": {"message": "injected error", "type": "mock"}}, hdr)
+
+        msgs = req.get("messages") or []
+        prompt = next((m.get("content", "") for m in reversed(msgs) if m.get("role") == "user"), "")
+        content = self.cfg.pick(prompt)
+        chars = sum(len(str(m.get("content") or "")) for m in msgs) + len(content)
+        ok, self.rl_headers = self.cfg.admit(req.get("model", ""), chars // 4)
+        if not ok:
+            return self._json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                              "code": "rate_limit_exceeded"}})
+        if req.get("stream"):
+            return self._stream(req, content)
+        self._json(200, {
+            "id": f"chatcmpl-mock-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        })
+
+    def _stream(self, req: dict, content: str):
+        """Réponse SSE "chat.completion.chunk" : chunk_chars caractères toutes les token_delay s."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        for k, v in self.rl_headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        base = {"id": f"chatcmpl-mock-{int(time.time() * 1000)}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": req.get("model", "gpt-4o-mini")}
+
+        def send(delta: dict, finish=None):
+            ev = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish}])
+            self.wfile.write(b"data: " + json.dumps(ev).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        try:
+            send({"role": "assistant", "content": ""})
+            step = self.cfg.chunk_chars
+            for i in range(0, len(content), step):
+                if self.cfg.token_delay:
+                    time.sleep(self.cfg.token_delay)
+                send({"content": content[i:i + step]})
+            send({}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client parti (flux interrompu)
+
+
+def make_server(cfg: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("MockHandler", (Handler,), {"cfg": cfg})
+    srv = ThreadingHTTPServer((host, port), handler)
+    srv.daemon_threads = True
+    return srv
+
+
+def start_background(cfg: MockConfig, host: str = "127.0.0.1", port: int = 0):
+    """Démarre le serveur dans un thread. Retourne (server, base_url)."""
+    srv = make_server(cfg, host, port)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://{host}:{srv.server_address[1]}/v1"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serveur local compatible OpenAI pour les benchs Piwi.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--responses", default="", help="JSONL {match, content}")
+    ap.add_argument("--latency", type=float, default=0.0, help="latence de base (s)")
+    ap.add_argument("--jitter", type=float, default=0.0, help="gigue +/- (s)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="proportion de réponses en erreur")
+    ap.add_argument("--error-status", type=int, default=500, help="code HTTP des erreurs injectées")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--token-delay", type=float, default=0.0, help="délai entre morceaux en mode stream (s)")
+    ap.add_argument("--rpm", type=int, default=0, help="limite de requêtes par minute (0 = aucune)")
+    ap.add_argument("--tpm", type=int, default=0, help="limite de jetons par minute (0 = aucune)")
+    a = ap.parse_args()
+
+    cfg = MockConfig(load_responses(a.responses), latency=a.latency, jitter=a.jitter,
+                     error_rate=a.error_rate, error_status=a.error_status, seed=a.seed,
+                     token_delay=a.token_delay, rpm=a.rpm, tpm=a.tpm)
+    srv = make_server(cfg, a.host, a.port)
+    print(f"mock OpenAI : http://{a.host}:{srv.server_address[1]}/v1", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(cfg.stats), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,18 @@
 # Piwi launcher — crée un dossier de requête et délègue à noyau.py
 set -euo pipefail
 
+# --- Option : profilage de la requête (cf. piwi_profile.py) ---
+if [ "${1:-}" = "--profile" ]; then
+  export PIWI_PROFILE="${PIWI_PROFILE:-full}"
+  shift
+fi
+
+# Lancement manuel = interactif (cf. piwi_sched.py)
+export PIWI_PRIORITY="${PIWI_PRIORITY:-interactive}"
+
 # --- Usage ---
 if [ $# -lt 1 ]; then
-  echo "Usage: $0 <instruction utilisateur...> [destination_optionnelle]"
+  echo "Usage: $0 [--profile] <instruction utilisateur...> [destination_optionnelle]"
   echo "Exemples :"
   echo "  $0 \"copie la page Wikipédia d'Elon Musk dans elon.txt sur le Bureau\""
   echo "  $0 \"télécharge ce PDF\" desktop"
@@ -31,8 +40,9 @@ fi
 
 # --- Dossier de requête ---
 TIMESTAMP="$(date +%F_%H-%M-%S)"
-REQDIR="${HOME}/piwi_requests/req_${TIMESTAMP}"
-mkdir -p "$REQDIR"
+mkdir -p "${HOME}/piwi_requests"
+# suffixe unique : deux lancements dans la même seconde n'écrasent pas le même dossier
+REQDIR="$(mktemp -d "${HOME}/piwi_requests/req_${TIMESTAMP}_XXXXXXXX")"
 
 # --- Dossier d’installation = là où se trouve ce script ---
 INSTALL_PATH="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
@@ -55,6 +65,7 @@ echo "✅ Terminé. Artefacts générés (si présents) :"
 [ -f "$REQDIR/log.txt" ]  && echo "  • Log IA      : $REQDIR/log.txt"
 [ -f "$REQDIR/meta.txt" ] && echo "  • Métadonnées : $REQDIR/meta.txt"
 [ -f "$REQDIR/action.py" ] && echo "  • Action      : $REQDIR/action.py (déplacé ensuite si noyau l'a détecté)"
+[ -f "$REQDIR/flame.collapsed.txt" ] && echo "  • Profil      : $REQDIR/{profile.pstats,flame.collapsed.txt,alloc_top.txt}"
 
 echo
 echo "ℹ️ Tous les dossiers de requêtes sont conservés dans: $HOME/piwi_requests"
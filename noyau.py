@@ -9,14 +9,50 @@ Piwi – Noyau complet (génération IA + exécution dans WSL)
 - I/O : données "utilisateur" -> PIWI_HOME (ou DEST_DIR si précisé)
         artefacts techniques -> REQ_INTERNAL.
 - sudo : si lancé en root (wsl -u root) inutile ; sinon possible via PIWI_SUDO_PASSWORD.
+  Analyse statique des privilèges (piwi_privs.py, PIWI_PRIV_PREFLIGHT=0 pour désactiver) :
+  un script qui en a besoin (apt/dpkg, écriture /etc|/usr, systemctl, usermod...) part
+  sous sudo dès la première exécution, sans exécution ratée puis relancée -> meta.json "privilege".
+- Échecs mécaniques (verrou dpkg, index apt, PEP 668, réseau, droits) : correctif
+  local déterministe (piwi_fixer.py) avant toute correction par l'IA.
+- Limites (temps réel/CPU/mémoire/processus, cgroup v2 ou rlimits) et comptabilité
+  de chaque exécution dans meta.json "usage" (piwi_limits.py, PIWI_LIMIT_*).
+- Backends d'exécution (piwi_exec.py, PIWI_EXEC_BACKEND=local|container|ssh) :
+  conteneur jetable ou pool de workers SSH, repli local si indisponible.
+- Correction : l'erreur est distillée (piwi_errctx.py : commande en échec, blocs
+  d'erreur, sans bruit ni doublons, budget PIWI_ERR_BUDGET) -> meta.json "error_context".
+- Téléchargements : piwi-fetch (cache, plages parallèles, reprise) proposé au modèle
+  s'il est installé -> meta.json "fetch".
+- Préchargement (piwi_prefetch.py, PIWI_PREFETCH=0 pour désactiver) : le modèle annonce
+  ses paquets apt/pip et URLs en tête de réponse ; téléchargés en arrière-plan dès la
+  réception de l'en-tête, pendant la génération -> meta.json "prefetch" (hits/misses).
+- Invites interactives (piwi_pty.py) : script exécuté sous pty ; réponse sûre aux
+  invites connues, sinon arrêt avec diagnostic pour la correction -> meta.json "prompts".
+- Inactivité (piwi_idle.py) : paquets souvent demandés pré-chargés hors requête ; tout
+  noyau qui démarre interrompt la passe en cours -> meta.json "idle" (hits/misses).
+- Limites de débit OpenAI (piwi_ratelimit.py, PIWI_RATELIMIT=0 pour désactiver) : admission
+  partagée par tous les noyaux de la machine (seau à jetons recalé sur les en-têtes
+  x-ratelimit-*, file à priorités PIWI_PRIORITY), 429 ré-admis -> meta.json "ratelimit".
 - Post-install : si REQ_INTERNAL/shortcuts.json existe, création de .lnk via create_shortcut.sh.
 
+- Actions : chaque action.py est archivée et indexée (piwi_actions.py) ;
+  "action: <sig|instruction>" la rejoue via le pool de workers préforkés.
+
 Args :
-  argv[1] = instruction (ou "shell: <cmd>")
+  argv[1] = instruction (ou "shell: <cmd>", ou "action: <sig|instruction>")
   argv[2] = REQ_INTERNAL (ex: /mnt/c/Users/<u>/piwi_requests/req_YYYY-MM-DD_HH-MM-SS)
   argv[3] = dest_hint (optionnel)
 Env :
   PIWI_OPENAI_KEY, PIWI_MODEL (def="gpt-4o-mini"), PIWI_SUDO_PASSWORD
+  PIWI_MODELS="rapide,fort" : routage adaptatif (piwi_router.py), le plus fort pour la correction
+  PIWI_OPENAI_BASE_URL (optionnel : serveur compatible OpenAI, ex. bench/mock_openai.py)
+  PIWI_ASSUME_WSL=1 (bench/tests uniquement : saute la vérification WSL)
+  PIWI_PROFILE=full|sample (+ PIWI_PROFILE_RATE, ...) : rapports de profil dans REQ_INTERNAL
+  PIWI_PRIORITY=interactive|normal|batch : priorité dans les files de ressources (piwi_sched.py)
+  PIWI_STREAM=1 : génération en flux, instructions exécutées au fil de l'eau (piwi_stream.py)
+  PIWI_PLAN=1 : plan JSON d'étapes avec dépendances, étapes indépendantes en parallèle (piwi_plan.py)
+  PIWI_PREGEN_ONLY=1 : génère le script dans REQ_INTERNAL/pregen.json et s'arrête (pré-génération
+  de la GUI pendant la saisie) ; le lancement suivant dans le même REQ_INTERNAL le réutilise
+  si le prompt est identique (PIWI_PREGEN_TTL, def=600 s) -> meta.json "pregen".
 """
 
 import os
@@ -24,10 +60,24 @@ import sys
 import re
 import shlex
 import json
+import hashlib
+import string
 import time
+import tempfile
+import threading
 import subprocess
 from pathlib import Path
+from types import SimpleNamespace
 from datetime import datetime
+from contextlib import contextmanager, ExitStack
+
+# --- Profilage opt-in (PIWI_PROFILE) : démarré avant les imports lourds ---
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    import piwi_profile as PP
+except Exception:
+    PP = None
+PROFILER = PP.maybe_start() if PP else None
 
 # --- OpenAI client ---
 try:
@@ -37,6 +87,7 @@ except Exception:
 
 # --- Sanity: WSL? ---
 IS_WSL = "microsoft" in open("/proc/version","r",encoding="utf-8",errors="ignore").read().lower() if os.path.exists("/proc/version") else False
+IS_WSL = IS_WSL or os.getenv("PIWI_ASSUME_WSL","") == "1"
 
 def euid_is_root() -> bool:
     try:
@@ -53,6 +104,62 @@ try:
     import path_resolver as PR
 except Exception:
     PR = None
+try:
+    import piwi_actions as AL
+except Exception:
+    AL = None
+try:
+    import piwi_sched as SCH
+except Exception:
+    SCH = None
+try:
+    import piwi_fixer as FX
+except Exception:
+    FX = None
+try:
+    import piwi_stream as PS
+except Exception:
+    PS = None
+try:
+    import piwi_limits as LM
+except Exception:
+    LM = None
+try:
+    import piwi_exec as EX
+except Exception:
+    EX = None
+try:
+    import piwi_errctx as EC
+except Exception:
+    EC = None
+try:
+    import piwi_router as RT
+except Exception:
+    RT = None
+try:
+    import piwi_plan as PN
+except Exception:
+    PN = None
+try:
+    import piwi_pty as PT
+except Exception:
+    PT = None
+try:
+    import piwi_prefetch as PF
+except Exception:
+    PF = None
+try:
+    import piwi_idle as IDLE
+except Exception:
+    IDLE = None
+try:
+    import piwi_ratelimit as RL
+except Exception:
+    RL = None
+try:
+    import piwi_privs as PV
+except Exception:
+    PV = None
 
 def find_piwi_home() -> Path:
     # [AJUSTÉ] Privilégier ~/Piwi si path_resolver ne fournit rien
@@ -82,10 +189,11 @@ if len(sys.argv) < 2 or not str(sys.argv[1]).strip():
     sys.exit(1)
 
 INSTRUCTION = str(sys.argv[1]).strip()
-REQ_INTERNAL = Path(sys.argv[2]).resolve() if len(sys.argv) >= 3 and sys.argv[2].strip() else (find_piwi_home() / "_internal" / f"req_{time.strftime('%F_%H-%M-%S')}")
+REQ_INTERNAL = Path(sys.argv[2]).resolve() if len(sys.argv) >= 3 and sys.argv[2].strip() else (find_piwi_home() / "_internal" / f"req_{time.strftime('%F_%H-%M-%S')}_{os.getpid()}")
 DEST_HINT = str(sys.argv[3]).strip() if len(sys.argv) >= 4 else ""
 PIWI_HOME = find_piwi_home()
 DEST_DIR = resolve_hint(DEST_HINT)
+PIWI_BIN = PIWI_HOME / "bin"  # utilitaires installés par setup_piwi.sh (piwi-venv, ...)
 
 REQ_INTERNAL.mkdir(parents=True, exist_ok=True)
 try:
@@ -96,6 +204,14 @@ except Exception:
 # --- OpenAI init ---
 API_KEY = os.getenv("PIWI_OPENAI_KEY","").strip()
 MODEL = os.getenv("PIWI_MODEL","gpt-4o-mini").strip()
+ROUTE = None          # choix du routeur (piwi_router.py) pour cette requête
+LAST_CALL = {}        # dernier appel de génération : {"ok", "seconds"}
+STREAM = os.getenv("PIWI_STREAM","") == "1"
+PLAN = os.getenv("PIWI_PLAN","") == "1"
+PREGEN_ONLY = os.getenv("PIWI_PREGEN_ONLY","") == "1"
+PREFETCH_HEADER = bool(PF and PF.enabled() and not PLAN)  # en-tête de dépendances demandé au modèle
+PREFETCH = None       # Prefetcher de cette requête (pas en pré-génération)
+HEADER = PF.HeaderParser() if PREFETCH_HEADER else None
 if not API_KEY:
     print("[ERROR] PIWI_OPENAI_KEY manquant.")
     sys.exit(1)
@@ -103,7 +219,11 @@ if OpenAI is None:
     print("[ERROR] Bibliothèque 'openai' absente. Installez-la : pip install --upgrade openai")
     sys.exit(1)
 
-client = OpenAI(api_key=API_KEY)
+BASE_URL = os.getenv("PIWI_OPENAI_BASE_URL","").strip() or None
+RL_ON = bool(RL and RL.enabled())
+# Avec l'admission partagée, _chat() relance lui-même les 429 (ré-admission) et les erreurs
+# passagères (connexion, 5xx...) que le client relançait, hors de l'admission (pas à l'aveugle)
+client = OpenAI(api_key=API_KEY, base_url=BASE_URL, **({"max_retries": 0} if RL_ON else {}))
 
 # --- Utils ---
 def clean_code(txt: str) -> str:
@@ -119,23 +239,52 @@ def write_text(p: Path, content: str, mode=0o644):
     except Exception:
         pass
 
-def logln(msg: str):
-    print(msg, flush=True)
+_IO_LOCK = threading.RLock()  # log.txt / meta.json : étapes d'un plan exécutées en parallèle
+
+def logln(msg: str, echo: bool = True):
+    if echo:
+        print(msg, flush=True)
     logf = REQ_INTERNAL / "log.txt"
-    try:
-        prev = ""
-        if logf.exists():
-            prev = logf.read_text(encoding="utf-8")
-        write_text(logf, prev + msg + "\n", 0o644)
-    except Exception:
-        pass
+    with _IO_LOCK:
+        try:
+            prev = ""
+            if logf.exists():
+                prev = logf.read_text(encoding="utf-8")
+            write_text(logf, prev + msg + "\n", 0o644)
+        except Exception:
+            pass
+
+# Trace de la commande en échec sur stderr (reprise par piwi_errctx pour la correction)
+ERR_TRAP = """trap 'printf "[piwi] échec rc=%s : %s\\n" "$?" "$BASH_COMMAND" >&2' ERR"""
 
-def write_exec(script_text: str) -> Path:
-    p = REQ_INTERNAL / "exec.sh"
-    text = "#!/bin/bash\nset -euo pipefail\n" + script_text.rstrip() + "\n"
+def write_exec(script_text: str, p: Path | None = None) -> Path:
+    p = p or REQ_INTERNAL / "exec.sh"
+    text = "#!/bin/bash\nset -euo pipefail\n" + ERR_TRAP + "\n" + script_text.rstrip() + "\n"
     write_text(p, text, 0o755)
     return p
 
+# --- Chronométrage par phase (-> meta.json "timings") ---
+TIMINGS: dict[str, float] = {}
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS[name] = round(TIMINGS.get(name, 0.0) + time.perf_counter() - t0, 4)
+
+def update_meta(**fields):
+    """Fusionne des champs dans REQ_INTERNAL/meta.json (créé si absent)."""
+    p = REQ_INTERNAL / "meta.json"
+    with _IO_LOCK:
+        try:
+            meta = json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+        except Exception:
+            meta = {}
+        meta.update(fields)
+        write_text(p, json.dumps(meta, ensure_ascii=False, indent=2))
+
 def save_meta(script_text: str):
     meta = {
         "instruction": INSTRUCTION,
@@ -147,7 +296,7 @@ def save_meta(script_text: str):
         "ts": datetime.utcnow().isoformat()+"Z",
         "model": MODEL
     }
-    write_text(REQ_INTERNAL / "meta.json", json.dumps(meta, ensure_ascii=False, indent=2))
+    update_meta(**meta)
     write_text(REQ_INTERNAL / "script.generated.sh", script_text)
 
 def detect_action_script():
@@ -160,6 +309,13 @@ def detect_action_script():
             logln(f"💾 action.py archivé: {dst}")
         except Exception as e:
             logln(f"[WARN] move action.py: {e}")
+            return
+        if AL:
+            try:
+                ent = AL.archive(dst, INSTRUCTION, REQ_INTERNAL.name, PIWI_HOME)
+                logln(f"📚 action indexée: {ent['id']} (rejouer : \"action: {ent['id']}\")")
+            except Exception as e:
+                logln(f"[WARN] index action: {e}")
 
 def update_cache():
     try:
@@ -234,22 +390,88 @@ RÈGLES :
    {{ "name":"...", "target":"C:\\\\Path\\\\app.exe", "workdir":"...", "icon":"..." }}).
 5) set -euo pipefail & n'utilise sudo que si indispensable.
 """
+LOCAL_EXEC = (EX.backend_kind() if EX else "local") == "local"  # conteneur / SSH : pas de PIWI_BIN
+if LOCAL_EXEC and (PIWI_BIN / "piwi-venv").exists():
+    IO_RULES += """6) Besoin d'un virtualenv Python : `piwi-venv create <dir> [-r requirements.txt] [paquet ...]`
+   (wheelhouse partagé + venv modèle cloné, bien plus rapide que `python3 -m venv` + `pip install`).
+"""
+if LOCAL_EXEC and (PIWI_BIN / "piwi-fetch").exists():
+    IO_RULES += """7) Téléchargements (archives, installeurs, modèles...) : `piwi-fetch <url> -d <dossier>` (ou `-o <fichier>`)
+   plutôt que curl/wget : cache local, plages parallèles, reprise ; affiche le chemin obtenu.
+"""
+
+def _record_call(ok: bool, seconds: float):
+    LAST_CALL.update(ok=ok, seconds=round(seconds, 3))
+    if RT and ROUTE and ok:
+        RT.record("call", MODEL, ROUTE.features["bucket"], seconds=round(seconds, 3))
 
-def generate_script(prompt: str) -> str:
+def _record_result(rnd: str, rc: int):
+    """Résultat d'exécution pour le modèle courant (ignoré si la génération elle-même a échoué)."""
+    if RT and ROUTE and LAST_CALL.get("ok"):
+        RT.record("result", MODEL, ROUTE.features["bucket"], round=rnd, ok=rc == 0)
+
+SYSTEM_BASH = "Tu es une IA système Ubuntu. Retourne UNIQUEMENT du code bash, sans explications."
+SYSTEM_PLAN = "Tu es une IA système Ubuntu. Retourne UNIQUEMENT un plan JSON valide, sans explications."
+
+def _chat(**kw):
+    """chat.completions.create ; avec piwi_ratelimit : admission partagée entre processus,
+    seau recalé sur les en-têtes x-ratelimit-*, 429 ré-admis au lieu d'échouer."""
+    if not RL_ON:
+        return client.chat.completions.create(**kw)
+    key = RL.bucket_key(BASE_URL or "", API_KEY, kw["model"])
+    prio = SCH.priority() + (1 if PREGEN_ONLY else 0)  # la pré-génération passe après les vraies requêtes
+    limited = transient = 0
+    while True:
+        with RL.Slot(key, RL.estimate(kw["messages"]), prio, log=logln) as slot:
+            try:
+                raw = client.chat.completions.with_raw_response.create(**kw)
+            except Exception as e:
+                if slot.failed(e) and limited < RL.retries():
+                    limited += 1
+                    RL.STATS["retries"] += 1
+                    logln(f"[WARN] OpenAI 429 : nouvelle admission ({limited}/{RL.retries()}).")
+                    continue
+                if not RL.transient(e) or transient >= RL.transient_retries():
+                    raise
+                transient += 1
+                RL.STATS["retries"] += 1
+                delay = RL.backoff(transient)
+                logln(f"[WARN] OpenAI : erreur passagère ({type(e).__name__}), nouvel essai dans {delay:.1f}s "
+                      f"({transient}/{RL.transient_retries()}).")
+            else:
+                slot.update(raw.headers)
+                return raw.parse()
+        time.sleep(delay)  # hors admission : le créneau est rendu pendant l'attente
+
+def generate_script(prompt: str, system: str = SYSTEM_BASH, on_delta=None) -> str:
+    """on_delta(texte) : réponse lue en flux, morceau par morceau (en-tête de préchargement)."""
+    t0 = time.perf_counter()
     try:
-        resp = client.chat.completions.create(
+        resp = _chat(
             model=MODEL or "gpt-4o-mini",
             messages=[
-                {"role": "system", "content": "Tu es une IA système Ubuntu. Retourne UNIQUEMENT du code bash, sans explications."},
+                {"role": "system", "content": system},
                 {"role": "user", "content": prompt}
             ],
             temperature=0,
             timeout=30,  # <— timeout dur
+            stream=on_delta is not None,
         )
-        content = resp.choices[0].message.content
+        if on_delta is None:
+            content = resp.choices[0].message.content
+        else:
+            parts = []
+            for chunk in resp:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+            content = "".join(parts)
     except Exception as e:
         logln(f"[ERROR] Appel OpenAI: {e}")
+        _record_call(False, time.perf_counter() - t0)
         return "echo 'OpenAI indisponible pour le moment' >&2; exit 2"
+    _record_call(True, time.perf_counter() - t0)
     return clean_code(content)
 
 def build_prompt() -> str:
@@ -259,42 +481,625 @@ def build_prompt() -> str:
 CONSIGNE :
 - Écris un script BASH pour réaliser la tâche, en respectant strictement les règles I/O ci-dessous.
 - Tu n'écris QUE du BASH (aucun commentaire/texte hors code).
+{PF.HEADER_RULES if PREFETCH_HEADER else ""}
+{IO_RULES}
+"""
 
+def build_plan_prompt() -> str:
+    """Prompt du mode plan : règles I/O seulement (ni « QUE du BASH » ni en-tête de dépendances)."""
+    return f"""Instruction utilisateur :
+{INSTRUCTION}
+
+CONSIGNE :
+- Réalise la tâche par un plan d'étapes ; le script de chaque étape respecte strictement les règles I/O ci-dessous.
+{PN.PLAN_RULES}
 {IO_RULES}
 """
 
+# --- Préchargement des dépendances annoncées (piwi_prefetch.py) ---
+def prefetch_feed(text: str):
+    """Morceau de réponse : dès l'en-tête complet, téléchargements en arrière-plan."""
+    deps = HEADER.feed(text) if HEADER else None
+    if deps and PREFETCH:
+        PREFETCH.start(deps)
+
+def prefetch_report(bash_code: str, exec_start: float | None):
+    if not PREFETCH or PREFETCH.t_header is None:
+        return
+    rep = PREFETCH.report(bash_code, exec_start)
+    PF.record(rep)
+    update_meta(prefetch=rep)
+    logln(f"[INFO] Préchargement : {rep['hits']} hit(s), {rep['misses']} miss(es), {rep['unused']} inutilisé(s)"
+          + (f", {rep['late']} en retard" if rep["late"] else "") + ".")
+
+def idle_report(bash_code: str):
+    """Paquets du script déjà pré-chargés par une passe d'inactivité (piwi_idle.py)."""
+    if not IDLE or not PF:
+        return
+    try:
+        rep = IDLE.report(bash_code)
+    except Exception:
+        return
+    if rep:
+        update_meta(idle=rep)
+        if rep["hits"]:
+            logln(f"[INFO] Pré-chargés en période d'inactivité : {' '.join(rep['hit']['apt'] + rep['hit']['pip'])}.")
+
+# --- Pré-génération (GUI : script demandé pendant la saisie, même REQ_INTERNAL) ---
+def _prompt_sha(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def pregenerate(prompt: str):
+    """Mode PIWI_PREGEN_ONLY : génère sans exécuter ; pregen.json écrit en dernier (atomique)."""
+    t0 = time.perf_counter()
+    bash_code = generate_script(prompt)
+    if not LAST_CALL.get("ok"):
+        sys.exit(2)
+    p = REQ_INTERNAL / "pregen.json"
+    tmp = p.with_suffix(".tmp")
+    write_text(tmp, json.dumps({"sha": _prompt_sha(prompt), "model": MODEL, "script": bash_code,
+                                "seconds": round(time.perf_counter() - t0, 3), "ts": time.time()},
+                               ensure_ascii=False))
+    os.replace(tmp, p)
+    sys.exit(0)
+
+def take_pregen(prompt: str) -> str | None:
+    """Script pré-généré pour ce prompt exact (consommé), sinon None."""
+    global MODEL
+    p = REQ_INTERNAL / "pregen.json"
+    if not p.exists():
+        return None
+    try:
+        rec = json.loads(p.read_text(encoding="utf-8"))
+        p.unlink()
+    except Exception:
+        return None
+    try:
+        ttl = float(os.getenv("PIWI_PREGEN_TTL", "") or 600)
+    except ValueError:
+        ttl = 600.0
+    age = time.time() - float(rec.get("ts", 0))
+    if rec.get("sha") != _prompt_sha(prompt) or age > ttl or not rec.get("script"):
+        update_meta(pregen={"used": False, "reason": "périmé" if age > ttl else "prompt différent"})
+        return None
+    MODEL = rec.get("model") or MODEL  # résultat attribué au modèle qui a généré
+    LAST_CALL.update(ok=True, seconds=rec.get("seconds"))
+    logln(f"[INFO] Script pré-généré pendant la saisie ({rec.get('seconds')}s, il y a {age:.0f}s) : génération sautée.")
+    update_meta(pregen={"used": True, "generate_s": rec.get("seconds"), "age_s": round(age, 1)})
+    return rec["script"]
+
 # --- Exécution script (sudo si nécessaire) ---
 def run_script_with_env(script_path: Path) -> tuple[int, str, str]:
+    """Exécute sous les verrous de ressources du script (dpkg, pip, DEST_DIR) ; attente -> meta.json "sched"."""
+    if EX:
+        be, info = EX.select_backend(logln)
+        if be is not None:
+            return _run_on_backend(be, info, script_path)
+    if SCH is None:
+        return _run_script(script_path)
+    try:
+        res = SCH.classify(script_path.read_text(encoding="utf-8"), DEST_DIR.as_posix() if DEST_HINT else "")
+    except Exception:
+        res = []
+    with SCH.hold(res, log=logln) as info:
+        TIMINGS["queue_wait"] = round(TIMINGS.get("queue_wait", 0.0) + info["wait_s"], 4)
+        if info["wait_s"] >= 0.05:
+            logln(f"[INFO] Ressources {', '.join(res)} obtenues après {info['wait_s']:.2f}s d'attente.")
+        update_meta(sched=info)
+        return _run_script(script_path)
+
+# --- Limites & comptabilité des exécutions (piwi_limits.py) ---
+SANDBOX = None
+_STEP = threading.local()  # étape de plan en cours dans ce thread : sandbox (cgroup) propre
+USAGE: dict = {}
+LIMIT_KILL: str | None = None  # dernière limite ayant tué le script (pour la correction)
+PROMPTS: dict = {"answered": [], "wait_s": 0.0, "blocked": None}
+PROMPT_BLOCK: dict | None = None  # dernière invite sur laquelle le script a été arrêté
+PRIVILEGE: dict = {"runs": [], "started_under_sudo": 0, "avoided_reruns": 0, "missed": 0}
+
+def sandbox():
+    global SANDBOX
+    if getattr(_STEP, "sb", None):
+        return _STEP.sb
+    if SANDBOX is None and LM:
+        try:
+            SANDBOX = LM.Sandbox(REQ_INTERNAL.name)
+        except Exception as e:
+            logln(f"[WARN] Limites indisponibles : {e}")
+    return SANDBOX
+
+def account(usage: dict, killed: str | None) -> str | None:
+    """
+    Cumule la comptabilité (pic RSS : maximum) et signale un arrêt par limite. Retourne
+    `killed` : l'appelant s'y fie pour sa propre exécution (LIMIT_KILL = la dernière, pour
+    la correction du script complet ; partagé par les étapes de plan en parallèle).
+    """
+    global LIMIT_KILL
+    with _IO_LOCK:
+        for k in ("wall_s", "cpu_s", "io_read_bytes", "io_write_bytes"):
+            USAGE[k] = round(USAGE.get(k, 0) + usage.get(k, 0), 3)
+        USAGE["peak_rss_kb"] = max(USAGE.get("peak_rss_kb", 0), usage.get("peak_rss_kb", 0))
+        if usage.get("peak_rss_scope") == "lifetime" or "peak_rss_scope" not in USAGE:
+            USAGE["peak_rss_scope"] = usage.get("peak_rss_scope", "run")
+        USAGE["runs"] = USAGE.get("runs", 0) + 1
+        USAGE["mode"] = usage.get("mode")
+        LIMIT_KILL = killed
+        fields = {"usage": USAGE}
+        if killed:
+            desc = LM.describe(killed, sandbox().lim)
+            logln(f"⛔ Script arrêté : limite atteinte ({desc}).")
+            fields["limit_kill"] = {"limit": killed, "detail": desc}
+        update_meta(**fields)
+    return killed
+
+def note_prompts(r) -> dict | None:
+    """Invites rencontrées par une exécution sous pty (cumulées) -> meta.json "prompts" ; retourne r.blocked."""
+    global PROMPT_BLOCK
+    PROMPT_BLOCK = r.blocked
+    if not r.prompts["answered"] and not r.blocked:
+        return None
+    with _IO_LOCK:  # étapes de plan en parallèle
+        PROMPTS["answered"] = (PROMPTS["answered"] + r.prompts["answered"])[-50:]
+        PROMPTS["wait_s"] = round(PROMPTS["wait_s"] + r.prompts["wait_s"], 3)
+        PROMPTS["blocked"] = r.blocked or PROMPTS["blocked"]
+        update_meta(prompts=PROMPTS)
+    return r.blocked
+
+_SUDO_SECRETS = {"PIWI_SUDO_PASSWORD", "PIWI_OPENAI_KEY", "SUDO_ASKPASS"}
+
+def _sudo_env_cmd(script_path: Path, run_env: dict) -> list:
+    """
+    `env ... bash script` à lancer sous sudo. env_reset de sudo : on réexporte tout ce que
+    script_env() et les correctifs ajoutent, PIWI_* et les valeurs non interactives de
+    piwi_pty. Pas HOME : sous root, ~/.cache et pip --user deviendraient propriété de root
+    chez l'utilisateur (EACCES aux exécutions suivantes).
+    """
+    keep = {k for k, v in run_env.items() if os.environ.get(k) != v or k.startswith("PIWI_")}
+    keep -= _SUDO_SECRETS
+    env = dict(PT.NONINTERACTIVE) if PT and PT.enabled() else {}
+    env.update({k: run_env[k] for k in keep if k in run_env})
+    return ["env", *(f"{k}={v}" for k, v in sorted(env.items())), "bash", str(script_path)]
+
+def _exec_script(script_path: Path, env: dict, state: dict) -> tuple[int, str, str]:
+    """Une exécution ; state : extra (env des correctifs), sudo -> kill / prompt (arrêt de CETTE exécution)."""
+    extra, as_sudo = state["extra"], state["sudo"]
+    state["kill"] = state["prompt"] = None
+    run_env = dict(env, **extra)
+    args, shell = ["bash", str(script_path)], False
+    if as_sudo and PV:
+        # mot de passe via SUDO_ASKPASS : le stdin du script reste le pty (réponses aux invites)
+        args = ["sudo", "-A", "-p", "", *_sudo_env_cmd(script_path, run_env)]
+        run_env["SUDO_ASKPASS"] = PV.askpass()
+    elif as_sudo:
+        pw = os.getenv("PIWI_SUDO_PASSWORD","").strip()
+        args, shell = f'echo {shlex.quote(pw)} | sudo -S -p "" {shlex.join(_sudo_env_cmd(script_path, run_env))}', True
+    sb = sandbox()
+    if PT and PT.enabled():
+        snap0 = sb.snapshot(own_usage=True) if sb else None
+        if sb:
+            args, shell = sb.wrap(args, shell, snap0), False
+        r = PT.run(args, shell=shell, cwd=str(REQ_INTERNAL), env=run_env,
+                   popen_kwargs=sb.popen_kwargs() if sb else None,
+                   timeout=sb.lim.wall or None if sb else None, log=logln)
+        state["prompt"] = note_prompts(r)
+        if sb:
+            state["kill"] = account(*sb.report(snap0, r.rc, r.err, r.timed_out))
+        return r.rc, r.out, r.err
+    if sb is None:
+        cp = subprocess.run(args, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=str(REQ_INTERNAL), env=run_env)
+        return cp.returncode, cp.stdout or "", cp.stderr or ""
+    r = sb.run(args, shell=shell, cwd=str(REQ_INTERNAL), env=run_env)
+    state["kill"] = account(r.usage, r.killed)
+    return r.rc, r.out, r.err
+
+def _run_as_root(cmd: str) -> int | None:
+    """Commande de remédiation en root (directement ou via sudo). None si impossible."""
+    if euid_is_root():
+        wrapped = cmd
+    else:
+        pw = os.getenv("PIWI_SUDO_PASSWORD","").strip()
+        if not pw:
+            return None
+        wrapped = f'echo {shlex.quote(pw)} | sudo -S -p "" bash -c {shlex.quote(cmd)}'
+    cp = subprocess.run(wrapped, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if cp.returncode != 0 and cp.stdout:
+        logln("[stderr] " + cp.stdout[-2000:])
+    return cp.returncode
+
+def _apply_fix(rule, attempt: int, state: dict) -> bool:
+    """Applique le correctif déterministe de `rule` ; False s'il est inapplicable."""
+    if rule.fix == "wait_dpkg_lock":
+        return FX.wait_dpkg_lock(log=logln)
+    if rule.fix == "dpkg_configure":
+        return _run_as_root("DEBIAN_FRONTEND=noninteractive dpkg --configure -a") == 0
+    if rule.fix == "apt_update":
+        return _run_as_root("apt-get update -q") == 0
+    if rule.fix == "pip_break_system":
+        state["extra"]["PIP_BREAK_SYSTEM_PACKAGES"] = "1"
+        return True
+    if rule.fix == "backoff":
+        d = FX.backoff_delay(attempt)
+        logln(f"[INFO] Nouvel essai dans {d:.0f}s...")
+        time.sleep(d)
+        return True
+    if rule.fix == "sudo":
+        if not os.getenv("PIWI_SUDO_PASSWORD","").strip():
+            logln("🔒 Sudo requis mais aucun mot de passe fourni (PIWI_SUDO_PASSWORD).")
+            return False
+        state["sudo"] = True
+        return True
+    return False
+
+def _run_on_backend(be, info: dict, script_path: Path) -> tuple[int, str, str]:
+    """Backend distant/conteneur : sortie relayée en direct, journal complet à la fin."""
+    sb = sandbox()
+    logln(f"[INFO] Exécution via le backend {be.name} ({', '.join(f'{k}={v}' for k, v in info.items())}).")
+    r = be.run(script_path, script_env(), on_line=lambda l: print(l, flush=True),
+               timeout=sb.lim.wall if sb and sb.lim.wall else None)
+    update_meta(executor={"backend": r.backend, "worker": r.worker, "wall_s": r.wall, **info})
+    if sb:
+        account({"mode": r.backend, "wall_s": r.wall}, None)
+    if r.out: logln(r.out, echo=False)
+    if r.err: logln("[stderr] " + r.err, echo=False)
+    return r.rc, r.out, r.err
+
+def script_env() -> dict:
     env = dict(os.environ)
     env["PIWI_HOME"]    = PIWI_HOME.as_posix()
     env["REQ_INTERNAL"] = REQ_INTERNAL.as_posix()
     env["DEST_DIR"]     = DEST_DIR.as_posix()
+    env["PATH"]         = f"{PIWI_BIN.as_posix()}:{env.get('PATH', '/usr/bin:/bin')}"
+    if PREFETCH:
+        env.update(PREFETCH.env())
+    if IDLE:
+        env.update(IDLE.env())
+    return env
 
-    cp = subprocess.run(["bash", str(script_path)], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=str(REQ_INTERNAL), env=env)
-    out, err, rc = cp.stdout or "", cp.stderr or "", cp.returncode
-    if rc == 0:
+def privilege_preflight(script_path: Path) -> dict | None:
+    """Décision avant la 1re exécution : user | root | sudo (lancé sous sudo) | no_password."""
+    if not PV or not PV.enabled():
+        return None
+    try:
+        a = PV.analyze(script_path.read_text(encoding="utf-8"))
+    except Exception as e:
+        logln(f"[WARN] Analyse des privilèges impossible : {e}")
+        return None
+    if not a.need_root:
+        decision = "user"
+    elif euid_is_root():
+        decision = "root"
+    elif os.getenv("PIWI_SUDO_PASSWORD","").strip():
+        decision = "sudo"
+        logln(f"🔐 Droits root requis ({', '.join(a.reasons[:5])}) : exécution sous sudo dès le départ.")
+    else:
+        decision = "no_password"
+        logln(f"🔒 Droits root probablement requis ({', '.join(a.reasons[:5])}) mais aucun mot de passe "
+              "(PIWI_SUDO_PASSWORD) : exécution sans privilèges.")
+    return {"script": script_path.name, "decision": decision, "reasons": a.reasons, "root_only": a.root_only}
+
+def _record_privilege(pre: dict, fixes: list, rc: int):
+    """
+    Parti sous sudo ; relance évitée (dont une opération réservée à root, pas seulement
+    un sudo explicite) ; manquée (relance sudo malgré l'analyse) -> meta.json.
+    """
+    late = any(f["rule"] == "needs_root" and f["applied"] for f in fixes)
+    started = pre["decision"] == "sudo"
+    pre.update(rc=rc, started_under_sudo=started, avoided_rerun=started and pre.pop("root_only"), missed=late)
+    if started:
+        PRIVILEGE["started_under_sudo"] += 1
+    if pre["avoided_rerun"]:
+        PRIVILEGE["avoided_reruns"] += 1
+    if late:
+        PRIVILEGE["missed"] += 1
+        logln("[INFO] Relance sous sudo non prévue par l'analyse des privilèges.")
+    PRIVILEGE["runs"] = (PRIVILEGE["runs"] + [pre])[-20:]
+    update_meta(privilege=PRIVILEGE)
+    PV.record({k: pre[k] for k in ("decision", "reasons", "rc", "started_under_sudo", "avoided_rerun", "missed")})
+
+def _run_script(script_path: Path) -> tuple[int, str, str]:
+    env = script_env()
+    pre = privilege_preflight(script_path)
+    state = {"extra": {}, "sudo": bool(pre) and pre["decision"] == "sudo"}
+    rc, out, err = _exec_script(script_path, env, state)
+
+    # Échecs mécaniques : correctif local déterministe puis relance, avant tout appel IA
+    tried, fixes = {}, []
+    while rc != 0 and not state["kill"] and not state["prompt"]:  # relancer tel quel ne sert à rien
+        text = out + "\n" + err
+        if FX:
+            rule = FX.classify(text, tried, euid_is_root() or state["sudo"])
+        else:
+            low = text.lower()
+            coarse = ("sudo" in low or "permission denied" in low or "operation not permitted" in low)
+            rule = SimpleNamespace(name="needs_root", label="droits root requis", fix="sudo", max_tries=1) \
+                if coarse and not tried and not euid_is_root() else None
+        if rule is None:
+            if fixes:
+                logln("[INFO] Échec non reconnu par les correctifs locaux.")
+            break
+        tried[rule.name] = tried.get(rule.name, 0) + 1
+        logln(f"🔧 Échec reconnu : {rule.name} ({rule.label}) -> correctif '{rule.fix}' (essai {tried[rule.name]}/{rule.max_tries})")
         if out: logln(out)
         if err: logln("[stderr] " + err)
-        return rc, out, err
+        t0 = time.perf_counter()
+        if not _apply_fix(rule, tried[rule.name], state):
+            fixes.append({"rule": rule.name, "fix": rule.fix, "applied": False})
+            logln(f"[WARN] Correctif '{rule.fix}' inapplicable.")
+            break
+        rc, out, err = _exec_script(script_path, env, state)
+        fixes.append({"rule": rule.name, "fix": rule.fix, "applied": True, "rc": rc,
+                      "seconds": round(time.perf_counter() - t0, 3)})
+        logln(f"[INFO] Correctif {rule.name} : {'✅ réussi' if rc == 0 else f'toujours en échec (rc={rc})'}")
+    if fixes:
+        update_meta(local_fixes=fixes)
+    if pre:
+        _record_privilege(pre, fixes, rc)
 
-    low = (out + "\n" + err).lower()
-    need_sudo = ("sudo" in low or "permission denied" in low or "operation not permitted" in low)
-    if need_sudo and not euid_is_root():
-        pw = os.getenv("PIWI_SUDO_PASSWORD","").strip()
-        if not pw:
-            logln("🔒 Sudo requis mais aucun mot de passe fourni (PIWI_SUDO_PASSWORD).")
-            return rc, out, err
-        wrapped = f'echo {shlex.quote(pw)} | sudo -S -p "" env PIWI_HOME={shlex.quote(env["PIWI_HOME"])} REQ_INTERNAL={shlex.quote(env["REQ_INTERNAL"])} DEST_DIR={shlex.quote(env["DEST_DIR"])} bash {shlex.quote(str(script_path))}'
-        cp2 = subprocess.run(wrapped, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=str(REQ_INTERNAL), env=env)
-        out2, err2, rc2 = cp2.stdout or "", cp2.stderr or "", cp2.returncode
-        if out2: logln(out2)
-        if err2: logln("[stderr] " + err2)
-        return rc2, out2, err2
+    if out: logln(out)
+    if err: logln("[stderr] " + err)
+    return rc, out, err
 
+# --- Génération en flux + exécution en pipeline (PIWI_STREAM=1) ---
+def generate_and_run_streamed(prompt: str) -> tuple[str, int, str, str]:
+    """
+    Chaque instruction complète part dans un bash persistant pendant que la suite
+    est générée. Au premier échec plus rien n'est exécuté (le reste du script est
+    tout de même lu, pour la correction). Une instruction qui demande root (analyse
+    piwi_privs) arrête l'envoi : la suite part sous sudo par le chemin habituel
+    (les descripteurs du tube ne survivent pas au closefrom de sudo). Reprise
+    (correctif local ou sudo) à partir de la 1re instruction non réussie, jamais du
+    script entier. Retourne (script, rc, out, err).
+    """
+    t0 = time.perf_counter()
+    split = PS.StatementSplitter()
+    sb = sandbox()
+    snap0 = sb.snapshot(own_usage=True) if sb else None
+    env = script_env()
+    if PT and PT.enabled():
+        for k, v in PT.NONINTERACTIVE.items():
+            env.setdefault(k, v)  # pas de pty ici : stdin /dev/null, les invites échouent au lieu d'attendre
+    shell = PS.ShellPipe(str(REQ_INTERNAL), env, argv_prefix=sb.wrap([], snap=snap0) if sb else None,
+                         popen_kwargs=sb.popen_kwargs() if sb else None)
+    shell.send("set -euo pipefail; " + ERR_TRAP)
+    dest = DEST_DIR.as_posix() if DEST_HINT else ""
+    can_sudo = bool(PV and PV.enabled() and not euid_is_root() and os.getenv("PIWI_SUDO_PASSWORD","").strip())
+    locks, held = ExitStack(), []
+    first, sent, stmts, to_sudo = None, 0, [], None
+
+    def run(stmt: str):
+        nonlocal first, sent, to_sudo
+        stmts.append(stmt)
+        if shell.failed or to_sudo is not None:
+            return
+        priv = PV.analyze(stmt) if can_sudo else None
+        if priv and priv.need_root:
+            to_sudo = len(stmts) - 1
+            logln(f"🔐 Droits root requis ({', '.join(priv.reasons[:5])}) : la suite du script part sous sudo.")
+            return
+        need = [r for r in SCH.classify(stmt, dest) if r not in held] if SCH else []
+        if need:
+            # Verrous pris au fil de l'eau : hors ordre, attente bornée (anti-interblocage)
+            timeout = None if not held or min(need) > max(held) else float(os.getenv("PIWI_STREAM_LOCK_TIMEOUT","30") or 30)
+            info = locks.enter_context(SCH.hold(need, log=logln, timeout=timeout))
+            held.extend(need)
+            TIMINGS["queue_wait"] = round(TIMINGS.get("queue_wait", 0.0) + info["wait_s"], 4)
+        if shell.send(stmt):
+            sent += 1
+            first = first or time.perf_counter()
+
+    gen_error = False
+    try:
+        resp = _chat(
+            model=MODEL or "gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": SYSTEM_BASH},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            timeout=30,
+            stream=True,
+        )
+        for chunk in resp:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            prefetch_feed(delta or "")
+            for stmt in split.feed(delta or ""):
+                run(stmt)
+        for stmt in split.close():
+            run(stmt)
+    except Exception as e:
+        logln(f"[ERROR] Appel OpenAI (flux): {e}")
+        gen_error = True
+        if sent:
+            shell.abort()  # script tronqué : on n'exécute pas la suite
+        else:
+            stmts.clear()
+            to_sudo = None
+            shell.send("echo 'OpenAI indisponible pour le moment' >&2; exit 2")
+    t_gen = time.perf_counter()
+    _record_call(not gen_error, t_gen - t0)
+    try:
+        left = max(1.0, sb.lim.wall - (t_gen - t0)) if sb and sb.lim.wall else None
+        rc, out, err = shell.finish(timeout=left)
+    finally:
+        locks.close()
+    t_end = time.perf_counter()
+    killed = account(*sb.report(snap0, rc, err, shell.timed_out)) if sb else None
+
+    bash_code = split.script
+    prefetch_report(bash_code, first)
+    script_path = write_exec(bash_code)
+    save_meta(bash_code)
+    TIMINGS["generate"] = round(t_gen - t0, 4)
+    TIMINGS["exec"] = round(t_end - (first or t_gen), 4)
+    TIMINGS["ttfc"] = round((first or t_end) - t0, 4)
+    done = max(0, shell.ok - 1)  # instructions réussies (hors préambule) : reprise à stmts[done]
+    update_meta(pipeline={"mode": "stream", "ttfc_s": TIMINGS["ttfc"], "wall_s": round(t_end - t0, 4),
+                          "statements": sent, "succeeded": done, "aborted": shell.failed or gen_error,
+                          "sudo_from": to_sudo})
+    logln(f"[INFO] Flux : {sent} instruction(s), 1re commande à {TIMINGS['ttfc']:.2f}s, total {t_end - t0:.2f}s.")
     if out: logln(out)
     if err: logln("[stderr] " + err)
+
+    resume = None
+    if gen_error or killed or done >= len(stmts):
+        pass
+    elif rc == 0 and to_sudo is not None:
+        resume = "sudo"
+    elif rc != 0 and FX and FX.classify(out + "\n" + err, {}, euid_is_root()):
+        resume = "correctif local"
+    if resume is None:
+        return bash_code, rc, out, err
+    # Reprise : état du shell (variables, cd, fonctions...) rejoué, puis instructions restantes
+    replay = [st for st in stmts[:done] if PS.replayable(st)]
+    rest_path = write_exec("\n".join(replay + stmts[done:]), REQ_INTERNAL / "exec.resume.sh")
+    logln(f"[INFO] Reprise ({resume}) à l'instruction {done + 1}/{len(stmts)} "
+          f"({len(replay)} instruction(s) d'état rejouée(s)) : {rest_path.name}")
+    update_meta(pipeline_resume={"reason": resume, "from": done, "replayed": len(replay)})
+    with phase("exec"):
+        rc, out2, err2 = run_script_with_env(rest_path)
+    return bash_code, rc, out + out2, err + err2
+
+# --- Plan d'étapes (PIWI_PLAN=1, piwi_plan.py) ---
+PLAN_STATE: dict = {}  # steps, done, durées, workers : pour la reprise des seules étapes en échec
+
+def _run_plan_step(step) -> tuple[int, str, str]:
+    """
+    Une étape = un script sous les mêmes verrous/correctifs/limites qu'exec.sh, dans son
+    propre cgroup (comptabilité et arrêts par limite attribués à la bonne étape).
+    """
+    sb = sandbox()
+    _STEP.sb = sb.child(step.id) if sb else None
+    try:
+        rc, out, err = run_script_with_env(write_exec(step.script, REQ_INTERNAL / "steps" / f"{step.id}.sh"))
+    finally:
+        if _STEP.sb:
+            _STEP.sb.close()
+        _STEP.sb = None
+    if rc == 0:
+        env = script_env()
+        missing = [o for o in step.outputs if not Path(string.Template(o).safe_substitute(env)).exists()]
+        if missing:
+            logln(f"[WARN] Étape {step.id} : sortie(s) déclarée(s) absente(s) : {', '.join(missing)}")
     return rc, out, err
 
+def _plan_outcome(res) -> tuple[int, str, str]:
+    if res.ok:
+        return 0, "", ""
+    if not res.failed:
+        return 1, "", "étapes bloquées : " + ", ".join(res.blocked) + "\n"
+    sid, (rc, out, err) = next(iter(res.failed.items()))
+    return rc, out, err
+
+def _plan_report():
+    st = PLAN_STATE
+    rep = PN.report(st["steps"], st["durations"], st["wall"], st["workers"])
+    rep.update(retried=st.get("retried", []), failed=st.get("failed", []))
+    update_meta(plan=rep)
+    logln(f"[INFO] Plan : {rep['wall_s']:.2f}s réel, chemin critique {rep['critical_path_s']:.2f}s "
+          f"({' -> '.join(rep['critical_path'])}), somme en série {rep['serial_s']:.2f}s.")
+
+def generate_and_run_plan():
+    """Plan JSON -> exécution parallèle. None si le plan est inexploitable (repli script classique)."""
+    with phase("generate"):
+        raw = generate_script(build_plan_prompt(), system=SYSTEM_PLAN)
+    try:
+        steps = PN.parse_plan(raw)
+    except PN.PlanError as e:
+        logln(f"[WARN] Plan inexploitable ({e}) : génération d'un script classique.")
+        return None
+    write_text(REQ_INTERNAL / "plan.json", json.dumps([vars(s) for s in steps], ensure_ascii=False, indent=2))
+    bash_code = PN.as_script(steps)
+    write_exec(bash_code)
+    save_meta(bash_code)
+    workers = PN.workers_from_env()
+    logln(f"[INFO] Plan : {len(steps)} étape(s), jusqu'à {workers} en parallèle.")
+    with phase("exec"):
+        res = PN.run_plan(steps, _run_plan_step, workers, log=logln)
+    PLAN_STATE.update(steps=steps, done=res.done, durations=dict(res.durations), wall=res.wall_s,
+                      workers=workers, failed=sorted(res.failed), last=res)
+    TIMINGS["ttfc"] = TIMINGS["generate"]
+    update_meta(pipeline={"mode": "plan", "ttfc_s": TIMINGS["generate"],
+                          "wall_s": round(TIMINGS["generate"] + TIMINGS["exec"], 4)})
+    _plan_report()
+    return (bash_code, *_plan_outcome(res))
+
+def correct_plan() -> int:
+    """Correction ciblée : seules les étapes en échec sont régénérées, puis rejouées avec leurs dépendantes."""
+    st = PLAN_STATE
+    by_id = {s.id: s for s in st["steps"]}
+    for sid, (rc, out, err) in st["last"].failed.items():
+        step = by_id[sid]
+        err_ctx = EC.distill(err, out).text if EC else err
+        corr = f"""ÉTAPE "{sid}" ({step.desc}) d'un plan plus large.
+SCRIPT BASH DE L'ÉTAPE :
+{step.script}
+
+ERREUR :
+{err_ctx}
+
+Corrige UNIQUEMENT le script de cette étape (mêmes entrées/sorties). Rappels OBLIGATOIRES :
+- Artefacts techniques UNIQUEMENT dans "$REQ_INTERNAL".
+- Données utilisateur dans "$DEST_DIR" si défini, sinon à la racine de "$PIWI_HOME".
+- Retourne UNIQUEMENT du BASH.
+"""
+        with phase("correct_generate"):
+            step.script = generate_script(corr)
+    retried = sorted(PN.dependents(st["steps"], st["last"].failed))
+    logln(f"[INFO] Reprise des étapes {', '.join(retried)} (les autres sont conservées).")
+    bash_code = PN.as_script(st["steps"])
+    write_exec(bash_code)
+    save_meta(bash_code)
+    write_text(REQ_INTERNAL / "plan.json", json.dumps([vars(s) for s in st["steps"]], ensure_ascii=False, indent=2))
+    with phase("correct_exec"):
+        res = PN.run_plan(st["steps"], _run_plan_step, st["workers"], done=st["done"], log=logln)
+    st["durations"].update(res.durations)
+    st.update(wall=st["wall"] + res.wall_s, retried=retried, failed=sorted(res.failed), last=res)
+    _plan_report()
+    return _plan_outcome(res)[0]
+
+def correct_script(bash_code: str, out: str, err: str) -> int:
+    """Tour de correction par l'IA du script complet ; retourne le code de retour du script corrigé."""
+    err_ctx = err
+    if EC:
+        dist = EC.distill(err, out)
+        err_ctx = dist.text
+        update_meta(error_context=dist.stats)
+        logln(f"[INFO] Contexte d'erreur : {dist.stats['orig_bytes']} -> {dist.stats['distilled_bytes']} octets "
+              f"(~{dist.stats['distilled_tokens']} tokens).", echo=False)
+    corr = f"""SCRIPT BASH :
+{bash_code}
+
+ERREUR :
+{err_ctx}
+
+Corrige le script ci-dessus. Rappels OBLIGATOIRES :
+- Artefacts techniques UNIQUEMENT dans "$REQ_INTERNAL".
+- Données utilisateur dans "$DEST_DIR" si défini, sinon à la racine de "$PIWI_HOME".
+- Pour les raccourcis Windows, écris un manifest JSON "$REQ_INTERNAL/shortcuts.json" (liste d'objets).
+- Retourne UNIQUEMENT du BASH.
+"""
+    if LIMIT_KILL:
+        corr += f"""
+ATTENTION : le script a été TUÉ pour dépassement de limite ({LM.describe(LIMIT_KILL, SANDBOX.lim)}).
+Produis une version plus légère : moins de mémoire et de processus, étapes bornées, aucune boucle sans fin.
+"""
+    if PROMPT_BLOCK:
+        cmd = f" (commande : {PROMPT_BLOCK['command']})" if PROMPT_BLOCK["command"] else ""
+        corr += f"""
+ATTENTION : le script a été ARRÊTÉ car il attendait une saisie interactive ({PROMPT_BLOCK['reason']}) :
+« {PROMPT_BLOCK['prompt']} »{cmd}.
+Rends-le entièrement non interactif : options -y/--yes/--no-input, DEBIAN_FRONTEND=noninteractive,
+aucun `read`, aucun mot de passe ni identifiant demandé (utilise les variables d'environnement fournies).
+"""
+    with phase("correct_generate"):
+        fixed = generate_script(corr)
+    script_path2 = write_exec(fixed)
+    save_meta(fixed)
+    logln("[INFO] Exécution du script corrigé...")
+    with phase("correct_exec"):
+        rc2, out2, err2 = run_script_with_env(script_path2)
+    return rc2
+
 # --- Shell passthrough ---
 def maybe_shell_passthrough() -> bool:
     low = INSTRUCTION.strip().lower()
@@ -307,11 +1112,79 @@ def maybe_shell_passthrough() -> bool:
         return True
     return False
 
+# --- Action archivée ---
+def maybe_action_passthrough() -> int | None:
+    low = INSTRUCTION.strip().lower()
+    if not low.startswith("action:"):
+        return None
+    query = INSTRUCTION.split(":",1)[1].strip()
+    if not AL:
+        logln("[ERROR] piwi_actions.py indisponible.")
+        return 1
+    ent = AL.Index(AL.library_dir(PIWI_HOME)).find(query)
+    if not ent:
+        logln(f"[ERROR] Aucune action archivée ne correspond à : {query}")
+        return 2
+    logln(f"> action {ent['id']} : {(ent.get('instructions') or [''])[-1]}")
+    env = {"PIWI_HOME": PIWI_HOME.as_posix(), "REQ_INTERNAL": REQ_INTERNAL.as_posix(), "DEST_DIR": DEST_DIR.as_posix()}
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as fo, tempfile.TemporaryFile("w+", encoding="utf-8") as fe:
+        rc, lat, mode = AL.run_action(ent, cwd=REQ_INTERNAL, env=env, stdout=fo, stderr=fe, piwi_home=PIWI_HOME)
+        fo.seek(0); fe.seek(0)
+        out, err = fo.read(), fe.read()
+    if out: logln(out)
+    if err: logln("[stderr] " + err)
+    logln(f"[INFO] action rc={rc} en {lat:.3f}s ({mode})")
+    update_meta(action={"id": ent["id"], "rc": rc, "latency": round(lat, 4), "mode": mode})
+    return rc
+
 # --- Main ---
+def finish(rc: int):
+    TIMINGS["total"] = round(time.perf_counter() - T_MAIN, 4)
+    extra = {}
+    venvs = REQ_INTERNAL / "venv_stats.jsonl"  # écrit par piwi-venv
+    if venvs.exists():
+        try:
+            recs = [json.loads(l) for l in venvs.read_text(encoding="utf-8").splitlines() if l.strip()]
+            extra["venv"] = {"created": len(recs),
+                             "seconds": round(sum(r.get("seconds", 0) for r in recs), 3),
+                             "bytes_saved": sum(r.get("bytes_saved", 0) for r in recs),
+                             "templates_reused": sum(1 for r in recs if r.get("template_reused"))}
+        except Exception:
+            pass
+    fetches = REQ_INTERNAL / "fetch_stats.jsonl"  # écrit par piwi-fetch
+    if fetches.exists():
+        try:
+            recs = [json.loads(l) for l in fetches.read_text(encoding="utf-8").splitlines() if l.strip()]
+            extra["fetch"] = {"downloads": len(recs),
+                              "bytes": sum(r.get("bytes", 0) for r in recs),
+                              "cache_hits": sum(1 for r in recs if r.get("cache_hit")),
+                              "resumed_bytes": sum(r.get("resumed_bytes", 0) for r in recs),
+                              "seconds": round(sum(r.get("seconds", 0) for r in recs), 3)}
+        except Exception:
+            pass
+    if RL_ON and RL.STATS["calls"]:
+        extra["ratelimit"] = dict(RL.STATS)
+    update_meta(timings=TIMINGS, rc=rc, **extra)
+    if SANDBOX:
+        SANDBOX.close()
+    sys.exit(rc)
+
+T_MAIN = time.perf_counter()
+
 def main():
+    global MODEL, ROUTE, PREFETCH
     if not IS_WSL:
         print("[ERROR] Ce noyau doit tourner dans WSL.")
         sys.exit(1)
+    if IDLE:
+        IDLE.interrupt()  # une passe d'inactivité ne doit pas concurrencer une vraie requête
+
+    if RT and RT.enabled():
+        ROUTE = RT.choose(INSTRUCTION)
+        MODEL = ROUTE.model
+
+    if PREGEN_ONLY:
+        pregenerate(build_prompt())
 
     logln("=== Piwi noyau (IA + WSL) ===")
     logln(f"Date: {datetime.now().isoformat(sep=' ', timespec='seconds')}")
@@ -320,7 +1193,7 @@ def main():
     logln(f"REQ_INTERNAL: {REQ_INTERNAL}")
     if DEST_DIR and DEST_DIR != PIWI_HOME:
         logln(f"DEST_DIR: {DEST_DIR}")
-    logln(f"Model: {MODEL}")
+    logln(f"Model: {MODEL}" + (f" (routage : {ROUTE.reason})" if ROUTE else ""))
     write_text(REQ_INTERNAL / "info.json", json.dumps({
         "instruction": INSTRUCTION,
         "created_at": datetime.utcnow().isoformat()+"Z",
@@ -329,42 +1202,69 @@ def main():
 
     if maybe_shell_passthrough():
         handle_post_install()
-        sys.exit(0)
-
-    prompt = build_prompt()
-    bash_code = generate_script(prompt)
-    script_path = write_exec(bash_code)
-    save_meta(bash_code)
+        finish(0)
 
-    rc, out, err = run_script_with_env(script_path)
-    detect_action_script()
-    update_cache()
-    handle_post_install()
-
-    if rc != 0:
-        corr = f"""SCRIPT BASH :
-{bash_code}
+    arc = maybe_action_passthrough()
+    if arc is not None:
+        handle_post_install()
+        finish(arc)
 
-ERREUR :
-{err}
+    prompt = build_prompt()
+    if PREFETCH_HEADER and not PREGEN_ONLY:
+        PREFETCH = PF.Prefetcher(_run_as_root, (lambda: SCH.hold(["dpkg"], log=logln)) if SCH else None, logln)
+    planned = generate_and_run_plan() if PLAN and PN else None
+    if planned is not None:
+        bash_code, rc, out, err = planned
+    elif STREAM and PS and LOCAL_EXEC:
+        bash_code, rc, out, err = generate_and_run_streamed(prompt)
+    else:
+        with phase("generate"):
+            bash_code = take_pregen(prompt) or generate_script(prompt, on_delta=prefetch_feed if PREFETCH else None)
+        script_path = write_exec(bash_code)
+        save_meta(bash_code)
 
-Corrige le script ci-dessus. Rappels OBLIGATOIRES :
-- Artefacts techniques UNIQUEMENT dans "$REQ_INTERNAL".
-- Données utilisateur dans "$DEST_DIR" si défini, sinon à la racine de "$PIWI_HOME".
-- Pour les raccourcis Windows, écris un manifest JSON "$REQ_INTERNAL/shortcuts.json" (liste d'objets).
-- Retourne UNIQUEMENT du BASH.
-"""
-        fixed = generate_script(corr)
-        script_path2 = write_exec(fixed)
-        save_meta(fixed)
-        logln("[INFO] Exécution du script corrigé...")
-        rc2, out2, err2 = run_script_with_env(script_path2)
+        t_exec = time.perf_counter()
+        with phase("exec"):
+            rc, out, err = run_script_with_env(script_path)
+        prefetch_report(bash_code, t_exec)
+        TIMINGS["ttfc"] = TIMINGS["generate"]
+        update_meta(pipeline={"mode": "batch", "ttfc_s": TIMINGS["generate"],
+                              "wall_s": round(TIMINGS["generate"] + TIMINGS["exec"], 4)})
+    _record_result("first", rc)
+    idle_report(bash_code)
+    if ROUTE:
+        update_meta(routing={"model": MODEL, "reason": ROUTE.reason, **ROUTE.features,
+                             "estimates": ROUTE.estimates, "first_try_ok": rc == 0})
+    with phase("post"):
         detect_action_script()
         update_cache()
         handle_post_install()
-        sys.exit(rc2)
 
-    sys.exit(0)
+    if rc != 0:
+        if ROUTE:
+            first_model, MODEL = MODEL, RT.escalate(MODEL)
+            if MODEL != first_model:
+                logln(f"[INFO] Correction confiée à {MODEL} (au lieu de {first_model}).")
+        if PLAN_STATE:
+            rc2 = correct_plan()
+        else:
+            rc2 = correct_script(bash_code, out, err)
+        _record_result("fix", rc2)
+        if ROUTE:
+            update_meta(routing={"model": first_model, "reason": ROUTE.reason, **ROUTE.features,
+                                 "estimates": ROUTE.estimates, "first_try_ok": False,
+                                 "correction_model": MODEL, "correction_ok": rc2 == 0})
+        with phase("post"):
+            detect_action_script()
+            update_cache()
+            handle_post_install()
+        finish(rc2)
+
+    finish(0)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        if PROFILER:
+            PROFILER.stop(REQ_INTERNAL)
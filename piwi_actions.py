@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Bibliothèque d'actions archivées + pool de workers préforkés
+
+- archive() : chaque action.py détectée par noyau est copiée dans
+  PIWI_HOME/_internal/actions/<sig>.py, compilée en .pyc et indexée
+  (signature = sha256 du source, instruction normalisée).
+- run_action() : exécute une action via le serveur de fork (workers préforkés
+  qui ont déjà importé les modules courants -> ni démarrage d'interpréteur, ni
+  imports lourds). Si le serveur n'est pas là, il est lancé en tâche de fond et
+  l'action tourne cette fois-ci en sous-processus classique.
+- Chaque exécution met à jour le compteur et les latences de l'action.
+
+CLI :
+  python3 piwi_actions.py list | stats
+  python3 piwi_actions.py run <sig|instruction> [args...]
+  python3 piwi_actions.py serve | stop
+
+Env :
+  PIWI_ACTION_PRELOAD  modules préchargés (def="json,re,csv,urllib.request,requests,pandas,numpy")
+  PIWI_ACTION_WORKERS  workers préforkés (def=2)
+  PIWI_ACTION_IDLE     arrêt du serveur après N s sans activité (def=900)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import errno
+import signal
+import socket
+import hashlib
+import marshal
+import traceback
+import py_compile
+import subprocess
+import unicodedata
+import importlib.util
+from pathlib import Path
+from typing import Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BASE_DIR))
+try:
+    import path_resolver as PR
+except Exception:
+    PR = None
+
+PRELOAD = os.getenv("PIWI_ACTION_PRELOAD", "json,re,csv,urllib.request,requests,pandas,numpy")
+WORKERS = max(1, int(os.getenv("PIWI_ACTION_WORKERS", "2") or 2))
+IDLE_TIMEOUT = float(os.getenv("PIWI_ACTION_IDLE", "900") or 900)
+MAX_LATENCIES = 50
+
+
+# ---------- Emplacements ----------
+
+def library_dir(piwi_home: Optional[Path] = None) -> Path:
+    if piwi_home is None:
+        piwi_home = Path(PR.find_piwi_home()) if PR else Path.home() / "Piwi"
+    return Path(piwi_home) / "_internal" / "actions"
+
+
+def _runtime_dir() -> Path:
+    d = os.getenv("XDG_RUNTIME_DIR", "")
+    return Path(d) if d and os.path.isdir(d) else Path("/tmp")
+
+
+def socket_path() -> Path:
+    return _runtime_dir() / f"piwi-actions-{os.getuid()}.sock"
+
+
+def _lock_path() -> Path:
+    # verrou hors /mnt/c : flock n'est pas fiable sur DrvFs
+    return _runtime_dir() / f"piwi-actions-{os.getuid()}.lock"
+
+
+# ---------- Index ----------
+
+def normalize_instruction(text: str) -> str:
+    t = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"\s+", " ", t.lower()).strip()
+
+
+class Index:
+    """index.json de la bibliothèque, modifié sous verrou exclusif."""
+
+    def __init__(self, lib: Path):
+        self.lib = lib
+        self.path = lib / "index.json"
+
+    def load(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            return {"actions": {}}
+
+    def update(self, fn):
+        self.lib.mkdir(parents=True, exist_ok=True)
+        with open(_lock_path(), "a+") as lk:
+            fcntl.flock(lk, fcntl.LOCK_EX)
+            data = self.load()
+            res = fn(data)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+            return res
+
+    def find(self, query: str) -> Optional[dict]:
+        acts = self.load().get("actions", {})
+        q = (query or "").strip()
+        if q in acts:
+            return acts[q]
+        # préfixe de signature (>= 6 caractères)
+        if len(q) >= 6:
+            hits = [a for s, a in acts.items() if s.startswith(q)]
+            if len(hits) == 1:
+                return hits[0]
+        key = normalize_instruction(q)
+        cands = [a for a in acts.values() if key in a.get("keys", [])]
+        return max(cands, key=lambda a: a.get("created", 0)) if cands else None
+
+
+def _compile(src: Path, pyc: Path):
+    py_compile.compile(str(src), cfile=str(pyc), doraise=True)
+
+
+def _load_code(entry: dict, lib: Path):
+    """Code objet depuis le .pyc (recompilé si absent ou d'une autre version de Python)."""
+    src, pyc = lib / entry["source"], lib / entry["pyc"]
+    try:
+        data = pyc.read_bytes()
+        if data[:4] != importlib.util.MAGIC_NUMBER:
+            raise ValueError("magic")
+    except Exception:
+        _compile(src, pyc)
+        data = pyc.read_bytes()
+    return marshal.loads(data[16:])
+
+
+def archive(action_py: Path, instruction: str, req_name: str = "", piwi_home: Optional[Path] = None) -> dict:
+    """Copie, compile et indexe une action. Retourne l'entrée d'index."""
+    lib = library_dir(piwi_home)
+    lib.mkdir(parents=True, exist_ok=True)
+    raw = Path(action_py).read_bytes()
+    sig = hashlib.sha256(raw).hexdigest()[:16]
+    src, pyc = lib / f"{sig}.py", lib / f"{sig}.pyc"
+    if not src.exists():
+        src.write_bytes(raw)
+    _compile(src, pyc)
+    key = normalize_instruction(instruction)
+
+    def upd(data):
+        acts = data.setdefault("actions", {})
+        ent = acts.setdefault(sig, {
+            "id": sig, "source": src.name, "pyc": pyc.name, "created": time.time(),
+            "instructions": [], "keys": [], "reqs": [],
+            "runs": 0, "failures": 0, "latencies": [], "last_run": None,
+        })
+        if instruction and instruction not in ent["instructions"]:
+            ent["instructions"].append(instruction)
+            ent["keys"].append(key)
+        if req_name and req_name not in ent["reqs"]:
+            ent["reqs"].append(req_name)
+        return dict(ent)
+    return Index(lib).update(upd)
+
+
+def record_run(lib: Path, sig: str, rc: int, latency: float, mode: str):
+    def upd(data):
+        ent = data.get("actions", {}).get(sig)
+        if not ent:
+            return
+        ent["runs"] += 1
+        ent["failures"] += int(rc != 0)
+        ent["latencies"] = (ent.get("latencies", []) + [round(latency, 4)])[-MAX_LATENCIES:]
+        ent["last_run"] = {"ts": time.time(), "rc": rc, "latency": round(latency, 4), "mode": mode}
+    try:
+        Index(lib).update(upd)
+    except Exception:
+        pass
+
+
+# ---------- Serveur de fork ----------
+
+def _preload():
+    for name in [m.strip() for m in PRELOAD.split(",") if m.strip()]:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+
+def _serve_one(conn: socket.socket):
+    """Dans un worker : exécute UNE action puis sort (état propre pour la suivante)."""
+    msg, fds, _, _ = socket.recv_fds(conn, 1 << 20, 3)
+    req = json.loads(msg.decode("utf-8"))
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    rc = 0
+    try:
+        os.chdir(req.get("cwd") or "/")
+        os.environ.update(req.get("env") or {})
+        sys.argv = [req["source"]] + list(req.get("argv") or [])
+        with open(req["pyc"], "rb") as f:
+            code = marshal.loads(f.read()[16:])
+        exec(code, {"__name__": "__main__", "__file__": req["source"], "__builtins__": __builtins__})
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        rc = 1
+    finally:
+        try:
+            sys.stdout.flush(); sys.stderr.flush()
+        except Exception:
+            pass
+    conn.sendall(json.dumps({"rc": rc}).encode("utf-8"))
+    conn.close()
+
+
+def _worker(listener: socket.socket):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        conn, _ = listener.accept()
+        listener.close()
+        _serve_one(conn)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        os._exit(0)
+
+
+def _server_alive() -> bool:
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(str(socket_path()))
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+def serve():
+    if _server_alive():
+        return  # un autre serveur tient déjà le socket
+    sock = socket_path()
+    try:
+        sock.unlink()
+    except FileNotFoundError:
+        pass
+    _preload()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(sock))
+    os.chmod(str(sock), 0o600)
+    listener.listen(16)
+
+    children: set = set()
+    stopping = False
+    def _stop(*_):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    last_activity = time.monotonic()
+    try:
+        while not stopping:
+            while len(children) < WORKERS:
+                pid = os.fork()
+                if pid == 0:
+                    _worker(listener)
+                children.add(pid)
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid:
+                children.discard(pid)
+                last_activity = time.monotonic()
+                continue
+            if time.monotonic() - last_activity > IDLE_TIMEOUT:
+                break
+            time.sleep(0.2)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        try:
+            sock.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def start_server_background():
+    subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "serve"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True, close_fds=True)
+
+
+def stop_server() -> bool:
+    cmd = ["pkill", "-TERM", "-f", f"{Path(__file__).name} serve"]
+    return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+
+
+# ---------- Client ----------
+
+def _run_via_server(entry: dict, lib: Path, argv, cwd, env, fds) -> Optional[int]:
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(str(socket_path()))
+    except OSError as e:
+        s.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    with s:
+        _load_code(entry, lib)  # garantit un .pyc à jour avant envoi
+        msg = {"source": str(lib / entry["source"]), "pyc": str(lib / entry["pyc"]),
+               "argv": list(argv), "cwd": str(cwd), "env": dict(env)}
+        socket.send_fds(s, [json.dumps(msg).encode("utf-8")], list(fds))
+        buf = b""
+        while True:
+            chunk = s.recv(4096)
+            if not chunk:
+                break
+            buf += chunk
+    try:
+        return int(json.loads(buf.decode("utf-8"))["rc"])
+    except Exception:
+        return 1
+
+
+def run_action(entry: dict, argv=(), cwd=None, env=None, stdout=None, stderr=None,
+               piwi_home: Optional[Path] = None) -> tuple:
+    """
+    Exécute une action indexée. stdout/stderr : objets fichier (def=sys.stdout/err).
+    Retourne (rc, latence_s, mode) avec mode "pool" ou "direct".
+    """
+    lib = library_dir(piwi_home)
+    cwd = cwd or os.getcwd()
+    env = env or {}
+    out = stdout or sys.stdout
+    err = stderr or sys.stderr
+    out.flush(); err.flush()
+    try:
+        fd_in = sys.stdin.fileno()
+    except Exception:
+        fd_in = os.open(os.devnull, os.O_RDONLY)
+    t0 = time.perf_counter()
+    rc = _run_via_server(entry, lib, argv, cwd, env, (fd_in, out.fileno(), err.fileno()))
+    mode = "pool"
+    if rc is None:
+        # pas de serveur : on le démarre pour les prochaines fois, et on exécute directement
+        start_server_background()
+        _load_code(entry, lib)
+        cp = subprocess.run([sys.executable, str(lib / entry["pyc"])] + list(argv), cwd=str(cwd),
+                            env={**os.environ, **env}, stdout=out, stderr=err)
+        rc, mode = cp.returncode, "direct"
+    latency = time.perf_counter() - t0
+    record_run(lib, entry["id"], rc, latency, mode)
+    return rc, latency, mode
+
+
+# ---------- CLI ----------
+
+def _p50(vals):
+    v = sorted(vals)
+    return v[len(v) // 2] if v else 0.0
+
+
+def main():
+    args = sys.argv[1:]
+    cmd = args[0] if args else "list"
+    if cmd == "serve":
+        serve(); return
+    if cmd == "stop":
+        print("arrêté" if stop_server() else "aucun serveur"); return
+    idx = Index(library_dir())
+    if cmd in ("list", "stats"):
+        acts = sorted(idx.load().get("actions", {}).values(), key=lambda a: -a.get("runs", 0))
+        for a in acts:
+            instr = (a.get("instructions") or [""])[-1]
+            print(f"{a['id']}  runs={a.get('runs', 0):<4} échecs={a.get('failures', 0):<3} "
+                  f"p50={_p50(a.get('latencies', [])):.3f}s  {instr[:70]}")
+        if not acts:
+            print("(bibliothèque vide)")
+        return
+    if cmd == "run" and len(args) >= 2:
+        entry = idx.find(args[1])
+        if not entry:
+            print(f"[ERROR] action introuvable : {args[1]}", file=sys.stderr)
+            sys.exit(2)
+        rc, lat, mode = run_action(entry, args[2:])
+        print(f"[INFO] action {entry['id']} rc={rc} ({lat:.3f}s, {mode})", file=sys.stderr)
+        sys.exit(rc)
+    print(__doc__)
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Archive compressée des anciens dossiers de requêtes (req_*)
+
+- pack : les req_* plus vieux que N jours sont rangés dans des segments
+  append-only (PIWI_HOME/_internal/archive/seg-000001.pzs, ...), chaque fichier
+  étant une trame compressée (zstd si le module `zstandard` est présent, sinon
+  zlib). Le dossier d'origine est ensuite supprimé.
+- Index SQLite (index.sqlite) : accès direct à n'importe quel artefact
+  (segment, offset, taille) sans décompresser le reste du segment.
+- Déduplication : un contenu identique (ex. requirements.txt répété) n'est
+  stocké qu'une fois (clé = sha256).
+- read(req, name) / restore(req, dest) / list_requests() pour relire.
+- prune : rétention de l'archive elle-même. Les requêtes plus vieilles que
+  PIWI_ARCHIVE_KEEP_DAYS sont oubliées, puis les plus anciennes jusqu'à ce que
+  les blobs encore référencés tiennent dans PIWI_ARCHIVE_MAX_MB ; les segments
+  contenant des blobs morts sont recopiés (blobs vivants seulement) puis supprimés.
+
+Les venvs (dossiers contenant pyvenv.cfg) et fichiers > PIWI_ARCHIVE_MAX_FILE
+ne sont pas archivés : un dossier qui en contient est conservé tel quel.
+
+Usage :
+  python3 piwi_archive.py pack [--days 3] [dossier ...]   (def : PIWI_HOME/_internal, ~/piwi_requests,
+                                                             /mnt/c/Users/*/piwi_requests)
+  python3 piwi_archive.py ls [motif]
+  python3 piwi_archive.py cat <req> <fichier>
+  python3 piwi_archive.py restore <req> <dest>
+  python3 piwi_archive.py prune [--keep-days 90] [--max-mb 1024]
+  python3 piwi_archive.py stats
+
+Env : PIWI_ARCHIVE_DAYS (def=3), PIWI_ARCHIVE_SEGMENT_MB (def=64),
+      PIWI_ARCHIVE_MAX_FILE (octets, def=16 Mo), PIWI_ARCHIVE_DIR,
+      PIWI_ARCHIVE_KEEP_DAYS (def=90), PIWI_ARCHIVE_MAX_MB (def=1024) ; 0 = sans limite
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import fcntl
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import struct
+from pathlib import Path
+
+try:
+    import zstandard as ZSTD
+except Exception:
+    ZSTD = None
+
+MAGIC = b"PZB1"
+HEADER = struct.Struct(">4sBII")   # magic, codec, taille brute, taille compressée
+CODEC_ZLIB, CODEC_ZSTD = 1, 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (hash TEXT PRIMARY KEY, seg INTEGER, off INTEGER, clen INTEGER, rlen INTEGER, codec INTEGER);
+CREATE TABLE IF NOT EXISTS files (req TEXT, name TEXT, hash TEXT, mtime REAL, PRIMARY KEY (req, name));
+CREATE TABLE IF NOT EXISTS reqs  (req TEXT PRIMARY KEY, src TEXT, mtime REAL, archived_at REAL, nfiles INTEGER, rbytes INTEGER);
+CREATE INDEX IF NOT EXISTS files_hash ON files (hash);
+"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(float(os.getenv(name, "") or default))
+    except ValueError:
+        return default
+
+
+def find_piwi_home() -> Path:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        import path_resolver as PR
+        return Path(PR.find_piwi_home())
+    except Exception:
+        return Path.home() / "Piwi"
+
+
+def archive_dir(piwi_home: Path | None = None) -> Path:
+    d = os.getenv("PIWI_ARCHIVE_DIR", "")
+    return Path(d) if d else (piwi_home or find_piwi_home()) / "_internal" / "archive"
+
+
+def compress(data: bytes) -> tuple:
+    if ZSTD is not None:
+        return CODEC_ZSTD, ZSTD.ZstdCompressor(level=10).compress(data)
+    return CODEC_ZLIB, zlib.compress(data, 9)
+
+
+def decompress(codec: int, data: bytes, rlen: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        if ZSTD is None:
+            raise RuntimeError("segment zstd : installez le module 'zstandard' pour le relire")
+        return ZSTD.ZstdDecompressor().decompress(data, max_output_size=rlen)
+    return zlib.decompress(data)
+
+
+class Archive:
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(root / "index.sqlite"))
+        self.db.executescript(SCHEMA)
+        self.seg_max = _env_int("PIWI_ARCHIVE_SEGMENT_MB", 64) * 1024 * 1024
+
+    def close(self):
+        self.db.close()
+
+    def _seg_path(self, n: int) -> Path:
+        return self.root / f"seg-{n:06d}.pzs"
+
+    def _current_segment(self) -> int:
+        n = self.db.execute("SELECT COALESCE(MAX(seg), 1) FROM blobs").fetchone()[0]
+        p = self._seg_path(n)
+        if p.exists() and p.stat().st_size >= self.seg_max:
+            n += 1
+        return n
+
+    # -- écriture --
+    def add_request(self, req_dir: Path, max_file: int) -> dict | None:
+        """Archive un dossier req_* (sans le supprimer). None si un fichier n'est pas archivable."""
+        files = []
+        for root, dirs, names in os.walk(req_dir):
+            if "pyvenv.cfg" in names:
+                return None
+            for nm in names:
+                p = Path(root) / nm
+                if p.is_symlink():
+                    continue
+                if p.stat().st_size > max_file:
+                    return None
+                files.append(p)
+        req = req_dir.name
+        seg = self._current_segment()
+        new_blobs, rows, rbytes, stored = [], [], 0, 0
+        with open(self._seg_path(seg), "ab") as f:
+            for p in sorted(files):
+                data = p.read_bytes()
+                h = hashlib.sha256(data).hexdigest()
+                rbytes += len(data)
+                known = self.db.execute("SELECT 1 FROM blobs WHERE hash=?", (h,)).fetchone()
+                if not known and h not in {b[0] for b in new_blobs}:
+                    codec, comp = compress(data)
+                    off = f.tell()
+                    f.write(HEADER.pack(MAGIC, codec, len(data), len(comp)))
+                    f.write(comp)
+                    new_blobs.append((h, seg, off + HEADER.size, len(comp), len(data), codec))
+                    stored += HEADER.size + len(comp)
+                rows.append((req, p.relative_to(req_dir).as_posix(), h, p.stat().st_mtime))
+            f.flush()
+            os.fsync(f.fileno())
+        # Index mis à jour seulement une fois les octets sur disque (segment append-only)
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO blobs VALUES (?,?,?,?,?,?)", new_blobs)
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?,?,?,?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO reqs VALUES (?,?,?,?,?,?)",
+                            (req, str(req_dir.parent), req_dir.stat().st_mtime, time.time(), len(rows), rbytes))
+        return {"req": req, "files": len(rows), "raw": rbytes, "stored": stored, "new_blobs": len(new_blobs)}
+
+    # -- lecture --
+    def read(self, req: str, name: str) -> bytes:
+        row = self.db.execute(
+            "SELECT b.seg, b.off, b.clen, b.rlen, b.codec FROM files f JOIN blobs b ON b.hash=f.hash "
+            "WHERE f.req=? AND f.name=?", (req, name)).fetchone()
+        if not row:
+            raise KeyError(f"{req}/{name}")
+        seg, off, clen, rlen, codec = row
+        with open(self._seg_path(seg), "rb") as f:
+            f.seek(off)
+            return decompress(codec, f.read(clen), rlen)
+
+    def list_requests(self, pattern: str = "") -> list:
+        return [r[0] for r in self.db.execute("SELECT req FROM reqs WHERE req LIKE ? ORDER BY req",
+                                              (f"%{pattern}%",))]
+
+    def list_files(self, req: str) -> list:
+        return [r[0] for r in self.db.execute("SELECT name FROM files WHERE req=? ORDER BY name", (req,))]
+
+    def restore(self, req: str, dest: Path) -> int:
+        n = 0
+        for name in self.list_files(req):
+            out = dest / name
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_bytes(self.read(req, name))
+            n += 1
+        return n
+
+    # -- rétention --
+    def live_bytes(self) -> int:
+        """Octets de segment occupés par les blobs encore référencés."""
+        return self.db.execute(f"SELECT COALESCE(SUM(clen), 0) + COUNT(*) * {HEADER.size} FROM blobs "
+                               "WHERE hash IN (SELECT hash FROM files)").fetchone()[0]
+
+    def prune(self, keep_days: float, max_bytes: int) -> dict:
+        """Oublie les requêtes trop vieilles ou en trop (plus anciennes d'abord), puis compacte."""
+        limit = time.time() - keep_days * 86400 if keep_days > 0 else None
+        dropped = 0
+        with self.db:
+            for req, mtime in self.db.execute("SELECT req, mtime FROM reqs ORDER BY mtime").fetchall():
+                too_old = limit is not None and mtime < limit
+                if not too_old and not (max_bytes > 0 and self.live_bytes() > max_bytes):
+                    break
+                self.db.execute("DELETE FROM files WHERE req=?", (req,))
+                self.db.execute("DELETE FROM reqs WHERE req=?", (req,))
+                dropped += 1
+        before = sum(p.stat().st_size for p in self.root.glob("seg-*.pzs"))
+        self._compact()
+        after = sum(p.stat().st_size for p in self.root.glob("seg-*.pzs"))
+        return {"requests": dropped, "freed": before - after, "segment_bytes": after}
+
+    def _compact(self):
+        """Recopie les blobs vivants des segments qui contiennent des blobs morts, puis les supprime."""
+        with self.db:
+            self.db.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM files)")
+        live = dict(self.db.execute(f"SELECT seg, SUM(clen) + COUNT(*) * {HEADER.size} FROM blobs GROUP BY seg"))
+        segs = {int(p.stem[4:]): p for p in self.root.glob("seg-*.pzs")}
+        dirty = [n for n, p in sorted(segs.items()) if live.get(n, 0) < p.stat().st_size]
+        moving = [n for n in dirty if live.get(n)]
+        if moving:
+            new = max(segs) + 1
+            moved = []
+            with open(self._seg_path(new), "ab") as out:
+                for n in moving:
+                    with open(segs[n], "rb") as f:
+                        for h, off, clen in self.db.execute("SELECT hash, off, clen FROM blobs WHERE seg=?", (n,)):
+                            f.seek(off - HEADER.size)
+                            noff = out.tell() + HEADER.size
+                            out.write(f.read(HEADER.size + clen))
+                            moved.append((new, noff, h))
+                out.flush()
+                os.fsync(out.fileno())
+            # Index basculé seulement une fois la copie sur disque
+            with self.db:
+                self.db.executemany("UPDATE blobs SET seg=?, off=? WHERE hash=?", moved)
+        for n in dirty:
+            segs[n].unlink()
+
+    def stats(self) -> dict:
+        nreq, raw = self.db.execute("SELECT COUNT(*), COALESCE(SUM(rbytes),0) FROM reqs").fetchone()
+        nfiles = self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        nblobs = self.db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        disk = sum(p.stat().st_size for p in self.root.glob("seg-*.pzs"))
+        return {"requests": nreq, "files": nfiles, "blobs": nblobs, "raw_bytes": raw, "segment_bytes": disk,
+                "ratio": round(raw / disk, 2) if disk else 0.0}
+
+
+def default_sources(piwi_home: Path = None) -> list:
+    """
+    Dossiers où naissent les req_* : PIWI_HOME/_internal, ~/piwi_requests côté WSL et
+    %USERPROFILE%\\piwi_requests côté Windows (/mnt/c/Users/*/piwi_requests, créés par la GUI).
+    Dédoublonnés, existants seulement.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try:
+        import path_resolver as PR
+        users = Path(PR.windows_users_dir())
+    except Exception:
+        users = Path("/mnt/c/Users")
+    out = [(piwi_home or find_piwi_home()) / "_internal", Path.home() / "piwi_requests"]
+    try:
+        out += sorted(users.glob("*/piwi_requests"))
+    except OSError:
+        pass
+    seen, res = set(), []
+    for d in out:
+        if d not in seen and d.is_dir():
+            seen.add(d)
+            res.append(d)
+    return res
+
+
+def _lock_path(root: Path) -> Path:
+    return Path("/tmp") / f"piwi-archive-{hashlib.sha1(str(root).encode()).hexdigest()[:10]}.lock"
+
+
+def pack(sources: list, days: float, root: Path) -> dict:
+    """Archive puis supprime les req_* plus vieux que `days` jours."""
+    limit = time.time() - days * 86400
+    max_file = _env_int("PIWI_ARCHIVE_MAX_FILE", 16 * 1024 * 1024)
+    tot = {"requests": 0, "files": 0, "raw": 0, "stored": 0, "kept": 0}
+    with open(_lock_path(root), "w") as lk:
+        fcntl.flock(lk, fcntl.LOCK_EX)  # un seul archiveur à la fois (flock peu fiable sur /mnt/c)
+        ar = Archive(root)
+        try:
+            for src in sources:
+                if not src.is_dir():
+                    continue
+                for d in sorted(src.glob("req_*")):
+                    if not d.is_dir() or d.stat().st_mtime > limit:
+                        continue
+                    res = ar.add_request(d, max_file)
+                    if res is None:
+                        tot["kept"] += 1
+                        continue
+                    shutil.rmtree(d, ignore_errors=True)
+                    tot["requests"] += 1
+                    for k in ("files", "raw", "stored"):
+                        tot[k] += res[k]
+        finally:
+            ar.close()
+    return tot
+
+
+def prune(root: Path, keep_days: float, max_bytes: int) -> dict:
+    """Rétention de l'archive (voir Archive.prune), sous le même verrou que pack."""
+    if not (root / "index.sqlite").exists():
+        return {"requests": 0, "freed": 0, "segment_bytes": 0}
+    with open(_lock_path(root), "w") as lk:
+        fcntl.flock(lk, fcntl.LOCK_EX)
+        ar = Archive(root)
+        try:
+            return ar.prune(keep_days, max_bytes)
+        finally:
+            ar.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Archive compressée des dossiers req_* de Piwi.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack")
+    p.add_argument("--days", type=float, default=float(os.getenv("PIWI_ARCHIVE_DAYS", "3") or 3))
+    p.add_argument("dirs", nargs="*")
+    p = sub.add_parser("prune")
+    p.add_argument("--keep-days", type=float, default=float(os.getenv("PIWI_ARCHIVE_KEEP_DAYS", "90") or 90))
+    p.add_argument("--max-mb", type=float, default=float(os.getenv("PIWI_ARCHIVE_MAX_MB", "1024") or 1024))
+    p = sub.add_parser("ls")
+    p.add_argument("pattern", nargs="?", default="")
+    p = sub.add_parser("cat")
+    p.add_argument("req")
+    p.add_argument("name")
+    p = sub.add_parser("restore")
+    p.add_argument("req")
+    p.add_argument("dest")
+    sub.add_parser("stats")
+    a = ap.parse_args()
+
+    home = find_piwi_home()
+    root = archive_dir(home)
+    if a.cmd == "pack":
+        srcs = [Path(d) for d in a.dirs] if a.dirs else default_sources(home)
+        t0 = time.perf_counter()
+        tot = pack(srcs, a.days, root)
+        print(f"🗜  {tot['requests']} requête(s), {tot['files']} fichier(s) archivé(s) : "
+              f"{tot['raw'] / 1024:.0f} Kio -> {tot['stored'] / 1024:.0f} Kio ajoutés "
+              f"({tot['kept']} conservé(s) tel quel) en {time.perf_counter() - t0:.2f}s -> {root}")
+        return
+    if a.cmd == "prune":
+        tot = prune(root, a.keep_days, int(a.max_mb * 1024 * 1024))
+        print(f"🗜  {tot['requests']} requête(s) oubliée(s), {tot['freed'] / 1024:.0f} Kio libérés "
+              f"-> archive : {tot['segment_bytes'] / 1024:.0f} Kio")
+        return
+    ar = Archive(root)
+    try:
+        if a.cmd == "ls":
+            for r in ar.list_requests(a.pattern):
+                print(r)
+        elif a.cmd == "cat":
+            try:
+                sys.stdout.buffer.write(ar.read(a.req, a.name))
+            except KeyError:
+                print(f"[ERROR] introuvable : {a.req}/{a.name}", file=sys.stderr)
+                sys.exit(1)
+        elif a.cmd == "restore":
+            print(f"{ar.restore(a.req, Path(a.dest))} fichier(s) restauré(s) dans {a.dest}")
+        elif a.cmd == "stats":
+            print(json.dumps(ar.stats(), indent=2))
+    finally:
+        ar.close()
+
+
+if __name__ == "__main__":
+    main()
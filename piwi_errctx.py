@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Distillation du contexte d'erreur pour le prompt de correction (côté WSL)
+
+Une sortie apt/pip/compilation peut peser des mégaoctets (barres de progression,
+avertissements répétés) : l'embarquer telle quelle dans le prompt gonfle tokens,
+latence et coût, voire dépasse la fenêtre de contexte. distill() garde :
+- la dernière commande en échec (ligne "[piwi] échec ..." du trap ERR du noyau) ;
+- les blocs d'erreur (Traceback complet, lignes error/E:/fatal/... + contexte) ;
+- à défaut de place, la fin de la sortie ;
+après suppression des codes ANSI, des retours chariot de progression, des lignes
+de progression (Get:, Hit:, %, barres) et des doublons (comptés "(×N)").
+Le résultat tient dans un budget de tokens (estimation rapide : tiktoken si
+présent, sinon ~4 caractères par token).
+
+Env : PIWI_ERR_BUDGET (tokens, def=1500)
+"""
+
+import os
+import re
+import time
+from types import SimpleNamespace
+
+try:
+    import tiktoken as TK
+except Exception:
+    TK = None
+
+FAIL_MARK = "[piwi] échec"
+_ANSI = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]")
+_NOISE = re.compile(
+    r"^\s*(?:"
+    r"(?:Get|Hit|Ign):\d+\s"                                  # apt update
+    r"|Reading (?:package lists|database|state information)"
+    r"|Building dependency tree"
+    r"|(?:Selecting previously unselected|Preparing to unpack|Unpacking|Setting up|Processing triggers for) "
+    r"|Progress: \[\s*\d+%\]"
+    r"|\d+% \[.*\]"                                          # apt : 45% [3 libfoo ...]
+    r"|[━─█▏▎▍▌▋▊▉#= >|.-]*\s*\d+(?:\.\d+)?\s*/\s*\d+(?:\.\d+)?\s*[kMG]?B\b"  # pip : 1.2/3.4 MB
+    r"|\s*[━█#=]{5,}"                                         # barres seules
+    r"|\d+K[ .]+\d+%"                                        # wget
+    r"|Downloading .*\(\d+(?:\.\d+)? [kMG]?B\)$"
+    r")")
+_ERROR = re.compile(
+    r"(?:^|\b)(?:error|erreur|fatal|failed|failure|exception|cannot|can't|could not|unable to|"
+    r"not found|no such file|permission denied|denied|refused|timed? ?out|segmentation fault|killed|"
+    r"unmet dependencies|broken packages|abort)"
+    r"|^E: |^\S+:\d+(?::\d+)?: (?:error|fatal)|^\s*\^\s*$", re.I)
+_TRACE_START = re.compile(r"^Traceback \(most recent call last\):")
+_DIGITS = re.compile(r"\d+")
+
+
+def budget_from_env() -> int:
+    try:
+        return max(100, int(os.getenv("PIWI_ERR_BUDGET", "") or 1500))
+    except ValueError:
+        return 1500
+
+
+_ENC = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation rapide : tiktoken si disponible (texte déjà réduit), sinon ~4 caractères/token."""
+    global _ENC
+    if TK is not None and len(text) < 200_000:
+        try:
+            if _ENC is None:
+                _ENC = TK.get_encoding("o200k_base")
+            return len(_ENC.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return (len(text) + 3) // 4
+
+
+def clean_lines(text: str) -> tuple:
+    """ANSI, \\r de progression et lignes de bruit retirés. Retourne (lignes, nb_lignes_bruit)."""
+    out, noise = [], 0
+    for raw in _ANSI.sub("", text or "").split("\n"):
+        line = raw.rstrip("\r").rsplit("\r", 1)[-1].rstrip()   # barre réécrite : seul l'état final compte
+        if not line.strip():
+            continue
+        if _NOISE.match(line) and not _ERROR.search(line):
+            noise += 1
+            continue
+        out.append(line)
+    return out, noise
+
+
+def dedupe(lines: list) -> tuple:
+    """Doublons (à chiffres près) fusionnés sur la 1re occurrence avec "(×N)". Retourne (lignes, nb_retirées)."""
+    counts, first, keys = {}, {}, []
+    for i, line in enumerate(lines):
+        k = line if line[:1] in " \t" else _DIGITS.sub("#", line)  # frames de traceback : exactes
+        if k not in counts:
+            counts[k], first[k] = 0, i
+            keys.append(k)
+        counts[k] += 1
+    out = []
+    for k in keys:
+        line = lines[first[k]]
+        out.append(f"{line}  (×{counts[k]})" if counts[k] > 1 else line)
+    return out, len(lines) - len(out)
+
+
+def _blocks(lines: list, context: int = 2) -> list:
+    """Intervalles [a, b) des régions d'erreur (traceback entier, sinon ligne ± contexte)."""
+    spans, i, n = [], 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if _TRACE_START.match(line):
+            j = i + 1
+            while j < n and (lines[j].startswith((" ", "\t")) or lines[j].startswith("During handling")
+                             or _TRACE_START.match(lines[j]) or not lines[j].strip()):
+                j += 1
+            spans.append((max(0, i - context), min(n, j + 1)))
+            i = j + 1
+            continue
+        if line.startswith(FAIL_MARK) or _ERROR.search(line):
+            spans.append((max(0, i - context), min(n, i + context + 1)))
+        i += 1
+    merged = []
+    for a, b in spans:
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+
+def distill(err: str, out: str = "", budget: int | None = None) -> SimpleNamespace:
+    """
+    Contexte d'erreur réduit pour le prompt de correction.
+    Retourne text + stats {orig_bytes, orig_tokens, distilled_bytes, distilled_tokens, ...}.
+    """
+    t0 = time.perf_counter()
+    budget = budget or budget_from_env()
+    lines, noise = clean_lines(err)
+    if not any(_ERROR.search(l) for l in lines):
+        # stderr muet : l'erreur est sans doute sur stdout (ex. apt/pip redirigés)
+        more, n2 = clean_lines(out)
+        lines, noise = more[-200:] + lines, noise + n2
+    lines, dup = dedupe(lines)
+    fails = [l for l in lines if l.startswith(FAIL_MARK)]
+    last_fail = fails[-1] if fails else None
+
+    keep, blocks = set(), _blocks(lines)
+    used = estimate_tokens(last_fail or "")
+    # Blocs d'erreur, du plus récent au plus ancien, tant que le budget le permet
+    for a, b in reversed(blocks):
+        cost = estimate_tokens("\n".join(lines[a:b]))
+        if used + cost > budget:
+            if not keep:  # bloc unique trop gros : on garde sa fin
+                while a < b and used + estimate_tokens("\n".join(lines[a:b])) > budget:
+                    a += max(1, (b - a) // 4)
+                keep.update(range(a, b))
+            break
+        keep.update(range(a, b))
+        used += cost
+    # Reste du budget : fin de la sortie
+    for i in range(len(lines) - 1, -1, -1):
+        if i in keep:
+            continue
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost > budget:
+            break
+        keep.add(i)
+        used += cost
+
+    parts, prev = [], -1
+    for i in sorted(keep):
+        if i != prev + 1:
+            parts.append(f"[... {i - prev - 1} ligne(s) omise(s) ...]")
+        parts.append(lines[i])
+        prev = i
+    if keep and prev < len(lines) - 1:
+        parts.append(f"[... {len(lines) - 1 - prev} ligne(s) omise(s) ...]")
+    if last_fail and last_fail not in parts:
+        parts.append(last_fail)
+    text = "\n".join(parts)
+    if last_fail:
+        text = f"Dernière commande en échec : {last_fail[len(FAIL_MARK):].lstrip(' :')}\n\n{text}"
+
+    orig = err or ""  # ce que le prompt embarquait jusqu'ici
+    return SimpleNamespace(text=text, stats={
+        "orig_bytes": len(orig.encode("utf-8", "replace")),
+        "orig_tokens": (len(orig) + 3) // 4,  # pas de tokenizer sur des Mo de journal
+        "distilled_bytes": len(text.encode("utf-8", "replace")),
+        "distilled_tokens": estimate_tokens(text),
+        "budget": budget,
+        "noise_lines": noise,
+        "dup_lines": dup,
+        "blocks": len(blocks),
+        "last_failed": last_fail[len(FAIL_MARK):].lstrip(" :") if last_fail else None,
+        "seconds": round(time.perf_counter() - t0, 4),
+    })
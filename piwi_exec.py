@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Backends d'exécution des scripts générés (côté WSL)
+
+- local     : la distro PiwiUbuntu elle-même (chemin historique du noyau).
+- container : conteneur jetable (podman ou docker) ; REQ_INTERNAL, DEST_DIR et
+              PIWI_HOME y sont montés aux mêmes chemins, env passé en -e.
+- ssh       : pool de machines Linux. exec.sh + env.sh (exports) sont expédiés (tar sur ssh),
+              la sortie est relayée ligne à ligne, puis les artefacts de
+              REQ_INTERNAL (et les données utilisateur) sont rapatriés.
+              Choix du worker le moins chargé (loadavg / nproc) parmi ceux qui
+              répondent au contrôle de santé ; aucun -> repli local.
+- env transmis (shipped_env) : ce que le noyau ajoute à son environnement (correctifs,
+  préchargement...) et les réglages PIWI_* / PIP_*, sans chemins locaux ni secrets.
+  Pas de PATH : les utilitaires de PIWI_HOME/bin (piwi-venv, piwi-fetch) n'existent que
+  localement, le noyau ne les propose au modèle qu'en exécution locale.
+
+Transports : SSHTransport ("user@hôte[:port]") ou FakeTransport ("fake:/dossier",
+exécution locale dans un HOME simulé) pour tester sans sshd.
+
+Env :
+  PIWI_EXEC_BACKEND   local | container | ssh (def=local)
+  PIWI_WORKERS        liste séparée par des virgules (ex. "ci@build1,build2:2222,fake:/tmp/w1")
+  PIWI_SSH_OPTS       options ssh supplémentaires (ex. "-i ~/.ssh/piwi")
+  PIWI_WORKER_TIMEOUT délai du contrôle de santé en s (def=5)
+  PIWI_WORKER_KEEP=1  conserve le dossier distant (débogage)
+  PIWI_CONTAINER_IMAGE (def=ubuntu:22.04), PIWI_CONTAINER_RUNTIME (def=podman, sinon docker)
+"""
+
+import os
+import time
+import shlex
+import signal
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+REMOTE_BASE = "$HOME/.piwi-worker"
+_PATHS = {"PIWI_HOME", "REQ_INTERNAL", "DEST_DIR"}  # remplacés par leurs équivalents distants
+_LOCAL_ONLY = {"PATH", "HOME", "PWD", "OLDPWD", "SHLVL", "_", "PIWI_OPENAI_KEY", "PIWI_SUDO_PASSWORD"}
+
+
+def shipped_env(env: dict) -> dict:
+    """Variables du script à transmettre au worker / conteneur (cf. docstring du module)."""
+    return {k: v for k, v in env.items()
+            if (os.environ.get(k) != v or k.startswith(("PIWI_", "PIP_"))) and k not in _LOCAL_ONLY | _PATHS}
+
+
+def stream_proc(argv, on_line=None, timeout: float | None = None, env: dict | None = None,
+                stdin=subprocess.DEVNULL) -> tuple:
+    """Lance argv, relaie chaque ligne (stdout et stderr) à on_line. Retourne (rc, out, err)."""
+    p = subprocess.Popen(argv, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                         text=True, errors="replace", bufsize=1, start_new_session=True)
+    out, err = [], []
+
+    def pump(stream, sink, prefix):
+        for line in stream:
+            sink.append(line)
+            if on_line:
+                on_line(prefix + line.rstrip("\n"))
+
+    ts = [threading.Thread(target=pump, args=(p.stdout, out, ""), daemon=True),
+          threading.Thread(target=pump, args=(p.stderr, err, "[stderr] "), daemon=True)]
+    for t in ts:
+        t.start()
+    try:
+        rc = p.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(p.pid, signal.SIGKILL)  # tout le groupe : sinon un enfant garde les tubes ouverts
+        except OSError:
+            p.kill()
+        rc = p.wait()
+    for t in ts:
+        t.join(timeout=5)
+    return rc, "".join(out), "".join(err)
+
+
+# ---------- transports ----------
+class SSHTransport:
+    def __init__(self, spec: str):
+        self.spec = spec
+        host, _, port = spec.partition(":")
+        self.argv = ["ssh", "-o", "BatchMode=yes", "-o", "ConnectTimeout=5"]
+        if port:
+            self.argv += ["-p", port]
+        self.argv += shlex.split(os.getenv("PIWI_SSH_OPTS", "")) + [host]
+
+    def sh(self, cmd: str, on_line=None, timeout: float | None = None) -> tuple:
+        return stream_proc(self.argv + [cmd], on_line, timeout)
+
+    def push(self, local_dir: Path, remote_dir: str) -> bool:
+        tar = subprocess.Popen(["tar", "-C", str(local_dir), "-cf", "-", "."], stdout=subprocess.PIPE)
+        rc = subprocess.run(self.argv + [f'mkdir -p "{remote_dir}" && tar -C "{remote_dir}" -xf -'],
+                            stdin=tar.stdout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        tar.stdout.close()
+        return tar.wait() == 0 and rc == 0
+
+    def pull(self, remote_dir: str, local_dir: Path) -> bool:
+        local_dir.mkdir(parents=True, exist_ok=True)
+        src = subprocess.Popen(self.argv + [f'tar -C "{remote_dir}" -cf - .'], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+        rc = subprocess.run(["tar", "-C", str(local_dir), "-xf", "-"], stdin=src.stdout).returncode
+        src.stdout.close()
+        return src.wait() == 0 and rc == 0
+
+
+class FakeTransport:
+    """Stand-in local d'un worker : commandes exécutées par bash avec HOME=<root>."""
+
+    def __init__(self, root: str):
+        self.spec = f"fake:{root}"
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, remote: str) -> Path:
+        return Path(remote.replace("$HOME", str(self.root)))
+
+    def sh(self, cmd: str, on_line=None, timeout: float | None = None) -> tuple:
+        env = dict(os.environ, HOME=str(self.root))
+        return stream_proc(["bash", "-c", cmd], on_line, timeout, env=env)
+
+    def push(self, local_dir: Path, remote_dir: str) -> bool:
+        shutil.copytree(local_dir, self._path(remote_dir), dirs_exist_ok=True)
+        return True
+
+    def pull(self, remote_dir: str, local_dir: Path) -> bool:
+        src = self._path(remote_dir)
+        if src.is_dir():
+            shutil.copytree(src, local_dir, dirs_exist_ok=True)
+        return True
+
+
+def make_transport(spec: str):
+    return FakeTransport(spec[5:]) if spec.startswith("fake:") else SSHTransport(spec)
+
+
+# ---------- backends ----------
+class ContainerBackend:
+    name = "container"
+
+    def __init__(self):
+        self.runtime = os.getenv("PIWI_CONTAINER_RUNTIME", "") or shutil.which("podman") or shutil.which("docker")
+        self.image = os.getenv("PIWI_CONTAINER_IMAGE", "ubuntu:22.04")
+
+    def healthy(self) -> bool:
+        return bool(self.runtime) and subprocess.run([self.runtime, "version"], stdout=subprocess.DEVNULL,
+                                                     stderr=subprocess.DEVNULL).returncode == 0
+
+    def run(self, script_path: Path, env: dict, on_line=None, timeout: float | None = None) -> SimpleNamespace:
+        t0 = time.perf_counter()
+        argv = [self.runtime, "run", "--rm", "-w", env["REQ_INTERNAL"]]
+        for k, v in sorted(shipped_env(env).items()):
+            argv += ["-e", f"{k}={v}"]
+        for k in ("PIWI_HOME", "REQ_INTERNAL", "DEST_DIR"):
+            argv += ["-v", f"{env[k]}:{env[k]}", "-e", f"{k}={env[k]}"]
+        argv += [self.image, "bash", str(script_path)]
+        rc, out, err = stream_proc(argv, on_line, timeout)
+        return SimpleNamespace(rc=rc, out=out, err=err, backend=self.name, worker=self.image,
+                               wall=round(time.perf_counter() - t0, 3))
+
+
+class SSHPool:
+    name = "ssh"
+
+    def __init__(self, specs: list):
+        self.transports = [make_transport(s) for s in specs if s.strip()]
+        self.chosen = None
+
+    @staticmethod
+    def from_env():
+        return SSHPool([s.strip() for s in os.getenv("PIWI_WORKERS", "").split(",") if s.strip()])
+
+    def probe(self, tr) -> float | None:
+        """Charge normalisée (load1 / nproc) ou None si le worker ne répond pas."""
+        try:
+            timeout = float(os.getenv("PIWI_WORKER_TIMEOUT", "5") or 5)
+        except ValueError:
+            timeout = 5.0
+        rc, out, _ = tr.sh("cat /proc/loadavg && nproc", timeout=timeout)
+        if rc != 0:
+            return None
+        try:
+            lines = out.split("\n")
+            return float(lines[0].split()[0]) / max(1, int(lines[1]))
+        except (IndexError, ValueError):
+            return None
+
+    def pick(self):
+        """(transport, charge) du worker sain le moins chargé, ou (None, None)."""
+        if not self.transports:
+            return None, None
+        with ThreadPoolExecutor(max_workers=min(8, len(self.transports))) as ex:
+            loads = list(ex.map(self.probe, self.transports))
+        ok = [(l, i) for i, l in enumerate(loads) if l is not None]
+        if not ok:
+            return None, None
+        load, i = min(ok)
+        return self.transports[i], load
+
+    def run(self, script_path: Path, env: dict, on_line=None, timeout: float | None = None,
+            transport=None) -> SimpleNamespace:
+        """Expédie, exécute sur le worker (choisi par pick() si besoin), rapatrie."""
+        t0 = time.perf_counter()
+        tr = transport or self.chosen or self.pick()[0]
+        req = Path(env["REQ_INTERNAL"])
+        base = f"{REMOTE_BASE}/{req.name}"
+        same = env["DEST_DIR"] == env["PIWI_HOME"]
+        r_req, r_dest = f"{base}/req", f"{base}/dest"
+        r_home = r_dest if same else f"{base}/home"
+        stage = Path(env["REQ_INTERNAL"]) / ".ship"
+        shutil.rmtree(stage, ignore_errors=True)
+        stage.mkdir(parents=True)
+        shutil.copy2(script_path, stage / "exec.sh")
+        (stage / "env.sh").write_text("".join(f"export {k}={shlex.quote(v)}\n"
+                                              for k, v in sorted(shipped_env(env).items())), encoding="utf-8")
+        if not tr.push(stage, r_req):
+            shutil.rmtree(stage, ignore_errors=True)
+            return SimpleNamespace(rc=255, out="", err=f"envoi vers {tr.spec} impossible\n",
+                                   backend=self.name, worker=tr.spec, wall=round(time.perf_counter() - t0, 3))
+        shutil.rmtree(stage, ignore_errors=True)
+        exports = (f'. "{r_req}/env.sh"; export PIWI_HOME="{r_home}" REQ_INTERNAL="{r_req}" DEST_DIR="{r_dest}"; '
+                   f'mkdir -p "$PIWI_HOME" "$DEST_DIR"; cd "$REQ_INTERNAL" && bash exec.sh')
+        rc, out, err = tr.sh(exports, on_line, timeout)
+        # Rapatriement : artefacts techniques puis données utilisateur
+        tr.sh(f'rm -f "{r_req}/exec.sh" "{r_req}/env.sh"')
+        tr.pull(r_req, req)
+        tr.pull(r_dest, Path(env["DEST_DIR"]))
+        if not same:
+            tr.pull(r_home, Path(env["PIWI_HOME"]))
+        if os.getenv("PIWI_WORKER_KEEP", "") != "1":
+            tr.sh(f'rm -rf "{base}"')
+        return SimpleNamespace(rc=rc, out=out, err=err, backend=self.name, worker=tr.spec,
+                               wall=round(time.perf_counter() - t0, 3))
+
+
+def backend_kind() -> str:
+    """local | container | ssh, tel que demandé par PIWI_EXEC_BACKEND."""
+    return os.getenv("PIWI_EXEC_BACKEND", "local").strip().lower() or "local"
+
+
+def select_backend(log=None):
+    """Backend demandé par PIWI_EXEC_BACKEND, ou None pour l'exécution locale (repli compris)."""
+    kind = backend_kind()
+    if kind == "container":
+        be = ContainerBackend()
+        if be.healthy():
+            return be, {"image": be.image}
+        if log:
+            log("[WARN] Runtime de conteneur indisponible : exécution locale.")
+    elif kind == "ssh":
+        pool = SSHPool.from_env()
+        tr, load = pool.pick()
+        if tr is not None:
+            pool.chosen = tr
+            return pool, {"worker": tr.spec, "load": round(load, 3)}
+        if log:
+            log("[WARN] Aucun worker SSH disponible (PIWI_WORKERS) : exécution locale.")
+    return None, {}
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+piwi-fetch – Téléchargement avec cache, requêtes Range parallèles et reprise
+
+- Cache de contenu (~/.cache/piwi/fetch) : clé = URL + validateur (ETag, sinon
+  Last-Modified). Même URL, même validateur -> aucun octet retéléchargé.
+  Contenus stockés une seule fois (sha256), purge LRU au-delà de PIWI_FETCH_CACHE_MAX.
+- Gros fichiers (>= PIWI_FETCH_SPLIT_MIN, serveur "Accept-Ranges: bytes") : découpés
+  en N plages téléchargées en parallèle, écrites à leur offset.
+- Reprise : le fichier partiel et l'avancement de chaque plage sont conservés ;
+  un nouvel appel (ou une nouvelle tentative après coupure) repart de là.
+- Même URL demandée deux fois en même temps (préchargement + script) : verrou
+  exclusif sur le fichier partiel, le second attend puis sert le cache.
+- Le téléchargement se fait dans un fichier temporaire du système de fichiers
+  natif (ext4 de la distro), puis le résultat est déplacé dans la destination
+  (souvent /mnt/c : une seule copie séquentielle, renommage atomique).
+- Affiche le chemin final sur stdout ; statistiques sur stderr et dans
+  $REQ_INTERNAL/fetch_stats.jsonl (agrégées par le noyau dans meta.json "fetch").
+
+Usage :
+  piwi-fetch <url> [-o fichier | -d dossier] [-c connexions] [--no-cache] [-q]
+  piwi-fetch stats | prune
+  (module : warm(url) remplit le cache sans placer de fichier, cf. piwi_prefetch.py)
+
+Env : PIWI_CACHE_DIR (def=~/.cache/piwi), PIWI_FETCH_CONNECTIONS (def=4),
+      PIWI_FETCH_SPLIT_MIN (def=8M), PIWI_FETCH_CACHE_MAX (def=2G), DEST_DIR (dossier par défaut)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+from contextlib import contextmanager
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi") / "fetch"
+BLOBS = CACHE / "blobs"
+INDEX = CACHE / "index"
+PARTS = CACHE / "partial"
+UA = "piwi-fetch/1.0"
+CHUNK = 1 << 16
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.I)
+
+
+def info(msg: str, quiet: bool = False):
+    if not quiet:
+        print(f"piwi-fetch: {msg}", file=sys.stderr, flush=True)
+
+
+def parse_size(v: str, default: int) -> int:
+    m = _SIZE.match(v or "")
+    if not m:
+        return default
+    return int(float(m.group(1)) * {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}[m.group(2).lower()])
+
+
+def _key(*parts) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def _request(url: str, method: str = "GET", headers: dict | None = None, timeout: float = 30):
+    req = urllib.request.Request(url, method=method, headers={"User-Agent": UA, **(headers or {})})
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+def probe(url: str) -> dict:
+    """URL finale, taille, validateur, support des plages, nom suggéré (HEAD, sinon GET 0-0)."""
+    try:
+        r = _request(url, "HEAD")
+        h, final = r.headers, r.geturl()
+        r.close()
+        size = int(h.get("Content-Length") or -1)
+    except urllib.error.HTTPError as e:
+        if e.code not in (403, 405, 501):
+            raise
+        r = _request(url, headers={"Range": "bytes=0-0"})
+        h, final = r.headers, r.geturl()
+        r.close()
+        m = re.search(r"/(\d+)$", h.get("Content-Range", ""))
+        size = int(m.group(1)) if m else -1
+    name = ""
+    cd = h.get("Content-Disposition", "")
+    m = re.search(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)", cd, re.I)
+    if m:
+        name = urllib.parse.unquote(m.group(1)).strip()
+    if not name:
+        name = urllib.parse.unquote(Path(urllib.parse.urlparse(final).path).name)
+    return {"url": final, "size": size, "etag": h.get("ETag", ""), "last_modified": h.get("Last-Modified", ""),
+            "ranges": h.get("Accept-Ranges", "").lower() == "bytes", "name": Path(name).name or "download"}
+
+
+def validator(meta: dict) -> str:
+    return meta["etag"] or meta["last_modified"]
+
+
+# ---------- cache ----------
+def cache_lookup(url: str, meta: dict):
+    v = validator(meta)
+    if not v:
+        return None
+    try:
+        ent = json.loads((INDEX / f"{_key(url)}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    blob = BLOBS / ent.get("sha256", "-")
+    if ent.get("validator") != v or not blob.exists() or (meta["size"] >= 0 and blob.stat().st_size != meta["size"]):
+        return None
+    os.utime(blob)  # LRU
+    return blob
+
+
+def cache_store(url: str, meta: dict, tmp: Path, sha: str) -> Path:
+    BLOBS.mkdir(parents=True, exist_ok=True)
+    INDEX.mkdir(parents=True, exist_ok=True)
+    blob = BLOBS / sha
+    if blob.exists():
+        tmp.unlink()
+    else:
+        os.replace(tmp, blob)
+    ent = {"url": url, "validator": validator(meta), "sha256": sha, "size": blob.stat().st_size, "ts": time.time()}
+    (INDEX / f"{_key(url)}.json").write_text(json.dumps(ent), encoding="utf-8")
+    return blob
+
+
+def prune(max_bytes: int | None = None) -> int:
+    """Supprime les contenus les moins récemment utilisés au-delà de max_bytes. Retourne les octets libérés."""
+    max_bytes = max_bytes if max_bytes is not None else parse_size(os.getenv("PIWI_FETCH_CACHE_MAX", ""), 2 << 30)
+    blobs = sorted((p for p in BLOBS.glob("*") if p.is_file()), key=lambda p: p.stat().st_mtime) if BLOBS.exists() else []
+    total, freed = sum(p.stat().st_size for p in blobs), 0
+    for p in blobs:
+        if total <= max_bytes:
+            break
+        sz = p.stat().st_size
+        p.unlink()
+        total, freed = total - sz, freed + sz
+    return freed
+
+
+# ---------- téléchargement ----------
+def _part_key(meta: dict) -> str:
+    return _key(meta["url"], validator(meta) or "-")
+
+
+@contextmanager
+def _exclusive(meta: dict, quiet: bool = True):
+    """
+    Verrou du fichier partiel de cette URL (flock, entre processus), tenu du cache à l'écriture.
+    Fichier .lock supprimé en cas de succès : un processus qui attendait sur l'ancien inode
+    le voit (inode différent du chemin) et reprend le verrou sur le nouveau.
+    """
+    PARTS.mkdir(parents=True, exist_ok=True)
+    path = PARTS / f"{_part_key(meta)}.lock"
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            info("téléchargement de la même URL déjà en cours : attente", quiet)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+    try:
+        yield
+        path.unlink(missing_ok=True)
+    finally:
+        os.close(fd)
+
+
+class Download:
+    """Fichier partiel + état des plages (reprise) dans PARTS/<clé> ; à créer sous _exclusive()."""
+
+    def __init__(self, meta: dict, connections: int, split_min: int):
+        self.meta = meta
+        PARTS.mkdir(parents=True, exist_ok=True)
+        k = _part_key(meta)
+        self.part = PARTS / f"{k}.part"
+        self.state_file = PARTS / f"{k}.json"
+        self.lock = threading.Lock()
+        size = meta["size"]
+        n = connections if (meta["ranges"] and size >= split_min and validator(meta)) else 1
+        self.ranges = self._load_state(size, n)
+        self.resumed = sum(r["pos"] - r["start"] for r in self.ranges)
+
+    def _load_state(self, size: int, n: int) -> list:
+        try:
+            st = json.loads(self.state_file.read_text(encoding="utf-8"))
+            if st["size"] == size and self.part.exists() and validator(self.meta):
+                return st["ranges"]
+        except (OSError, ValueError, KeyError):
+            pass
+        self.part.unlink(missing_ok=True)
+        if size < 0:
+            return [{"start": 0, "end": -1, "pos": 0}]
+        step = -(-size // n) if size else 0
+        return [{"start": i, "end": min(size, i + step) - 1, "pos": i} for i in range(0, max(size, 1), max(step, 1))][:n]
+
+    def _save_state(self):
+        with self.lock:
+            tmp = self.state_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"size": self.meta["size"], "ranges": self.ranges}), encoding="utf-8")
+            os.replace(tmp, self.state_file)
+
+    def _fetch_range(self, r: dict, fd: int, tries: int = 4):
+        for attempt in range(tries):
+            if r["end"] >= 0 and r["pos"] > r["end"]:
+                return
+            headers = {}
+            if r["end"] >= 0 and (len(self.ranges) > 1 or r["pos"] > 0):
+                headers["Range"] = f"bytes={r['pos']}-{r['end']}"
+            elif r["pos"] > 0 and self.meta["ranges"]:
+                headers["Range"] = f"bytes={r['pos']}-"
+            if headers and validator(self.meta):
+                headers["If-Range"] = validator(self.meta)  # contenu modifié -> 200 complet
+            try:
+                with _request(self.meta["url"], headers=headers) as resp:
+                    if headers and resp.status != 206:
+                        if len(self.ranges) > 1:
+                            raise ValueError("plages refusées ou contenu modifié pendant le téléchargement")
+                        r["pos"] = r["start"] = 0  # reprise ignorée par le serveur : tout reprendre
+                    last_save = time.monotonic()
+                    while True:
+                        buf = resp.read(CHUNK)
+                        if not buf:
+                            break
+                        os.pwrite(fd, buf, r["pos"])
+                        r["pos"] += len(buf)
+                        if time.monotonic() - last_save > 1.0:
+                            self._save_state()
+                            last_save = time.monotonic()
+                if r["end"] < 0 or r["pos"] > r["end"]:
+                    return
+            except (OSError, urllib.error.URLError):
+                pass
+            self._save_state()
+            time.sleep(min(8, 2 ** attempt * 0.5))
+        raise OSError(f"plage {r['start']}-{r['end']} incomplète après {tries} essais")
+
+    def run(self) -> Path:
+        fd = os.open(self.part, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            ts = [threading.Thread(target=self._guard, args=(r, fd), daemon=True) for r in self.ranges]
+            self.errors = []
+            for t in ts:
+                t.start()
+            for t in ts:
+                t.join()
+        finally:
+            os.close(fd)
+        self._save_state()
+        if self.errors:
+            raise self.errors[0]
+        if self.meta["size"] >= 0 and self.part.stat().st_size != self.meta["size"]:
+            raise OSError(f"taille inattendue ({self.part.stat().st_size} au lieu de {self.meta['size']})")
+        self.state_file.unlink(missing_ok=True)
+        return self.part
+
+    def _guard(self, r, fd):
+        try:
+            self._fetch_range(r, fd)
+        except Exception as e:
+            self.errors.append(e)
+
+
+def _sha256(p: Path) -> str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for b in iter(lambda: f.read(1 << 20), b""):
+            h.update(b)
+    return h.hexdigest()
+
+
+def place(src: Path, dest: Path, keep_src: bool):
+    """Copie (jamais de lien : le cache doit survivre aux modifications) ou déplacement vers dest,
+    via un nom temporaire voisin puis renommage atomique."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.piwi-tmp")
+    tmp.unlink(missing_ok=True)
+    if not keep_src:
+        try:
+            os.replace(src, tmp)  # même système de fichiers
+        except OSError:
+            pass
+    if not tmp.exists():
+        shutil.copyfile(src, tmp)
+        if not keep_src:
+            src.unlink(missing_ok=True)
+    os.replace(tmp, dest)
+
+
+def _log_stats(rec: dict):
+    if not os.getenv("REQ_INTERNAL"):
+        return
+    try:
+        with open(Path(os.environ["REQ_INTERNAL"]) / "fetch_stats.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def fetch(url: str, dest: Path | None = None, dest_dir: Path | None = None, connections: int = 4,
+          use_cache: bool = True, quiet: bool = False) -> Path:
+    t0 = time.perf_counter()
+    meta = probe(url)
+    if dest is None:
+        dest = (dest_dir or Path(os.getenv("DEST_DIR", "") or ".")) / meta["name"]
+    blob = cache_lookup(url, meta) if use_cache else None
+    rec = {"url": url, "dest": str(dest), "cache_hit": blob is not None, "connections": 0, "resumed_bytes": 0}
+    if blob is not None:
+        place(blob, dest, keep_src=True)
+    else:
+        with _exclusive(meta, quiet):
+            blob = cache_lookup(url, meta) if use_cache else None  # rempli pendant l'attente ?
+            rec["cache_hit"] = blob is not None
+            if blob is not None:
+                place(blob, dest, keep_src=True)
+            else:
+                dl = Download(meta, connections, parse_size(os.getenv("PIWI_FETCH_SPLIT_MIN", ""), 8 << 20))
+                rec.update(connections=len(dl.ranges), resumed_bytes=dl.resumed)
+                if dl.resumed:
+                    info(f"reprise à {dl.resumed} octets", quiet)
+                part = dl.run()
+                if use_cache and validator(meta):
+                    blob = cache_store(url, meta, part, _sha256(part))
+                    place(blob, dest, keep_src=True)
+                    prune()
+                else:
+                    place(part, dest, keep_src=False)
+    rec.update(bytes=dest.stat().st_size, seconds=round(time.perf_counter() - t0, 3))
+    how = "cache" if rec["cache_hit"] else f"{rec['connections']} connexion(s)"
+    info(f"{dest.name} : {rec['bytes'] / (1 << 20):.1f} Mio en {rec['seconds']:.2f}s ({how})", quiet)
+    _log_stats(rec)
+    return dest
+
+
+def warm(url: str, connections: int = 4) -> str:
+    """Remplit le cache sans rien placer (préchargement) : "cache" | "fetched" | "uncacheable"."""
+    meta = probe(url)
+    if cache_lookup(url, meta) is not None:
+        return "cache"
+    if not validator(meta):
+        return "uncacheable"  # sans ETag ni Last-Modified, le cache ne resservirait pas
+    with _exclusive(meta):
+        if cache_lookup(url, meta) is not None:  # le script l'a téléchargée entre-temps
+            return "cache"
+        part = Download(meta, connections, parse_size(os.getenv("PIWI_FETCH_SPLIT_MIN", ""), 8 << 20)).run()
+        cache_store(url, meta, part, _sha256(part))
+    prune()
+    return "fetched"
+
+
+def main():
+    if sys.argv[1:2] in (["stats"], ["prune"]):
+        if sys.argv[1] == "prune":
+            print(f"{prune() / (1 << 20):.1f} Mio libérés")
+        blobs = list(BLOBS.glob("*")) if BLOBS.exists() else []
+        print(json.dumps({"cache": str(CACHE), "blobs": len(blobs),
+                          "bytes": sum(p.stat().st_size for p in blobs)}, indent=2))
+        return
+    ap = argparse.ArgumentParser(prog="piwi-fetch", description="Téléchargement avec cache, plages parallèles et reprise.")
+    ap.add_argument("url")
+    ap.add_argument("-o", "--output", help="fichier de destination")
+    ap.add_argument("-d", "--dir", help="dossier de destination (def : $DEST_DIR, sinon dossier courant)")
+    ap.add_argument("-c", "--connections", type=int, default=int(os.getenv("PIWI_FETCH_CONNECTIONS", "4") or 4))
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("-q", "--quiet", action="store_true")
+    a = ap.parse_args()
+    try:
+        out = fetch(a.url, Path(a.output) if a.output else None, Path(a.dir) if a.dir else None,
+                    max(1, a.connections), not a.no_cache, a.quiet)
+    except (OSError, urllib.error.URLError, ValueError) as e:
+        info(f"échec : {e}")
+        sys.exit(1)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Classification locale des échecs de script et correctifs déterministes
+
+Avant toute correction par l'IA, la sortie d'un script en échec est comparée à
+une bibliothèque de motifs ; chaque règle correspond à un correctif mécanique :
+
+  dpkg_lock         verrou dpkg/apt tenu par un autre processus -> attendre, relancer
+  dpkg_interrupted  "dpkg was interrupted"                      -> dpkg --configure -a, relancer
+  pep668            pip "externally-managed-environment"         -> PIP_BREAK_SYSTEM_PACKAGES=1, relancer
+  apt_stale         paquet introuvable / index périmés           -> apt-get update, relancer
+  network           DNS / réseau momentanément indisponible      -> relances à délai exponentiel
+  needs_root        droits insuffisants                          -> relancer sous sudo
+
+Le noyau applique la règle (classify) puis relance le script ; chaque
+classification et son issue sont journalisées (log.txt, meta.json "local_fixes").
+
+Env : PIWI_FIX_LOCK_WAIT (attente max du verrou dpkg en s, def=300),
+      PIWI_FIX_DISABLE=1 (seule la relance sudo historique reste active)
+"""
+
+import os
+import re
+import time
+import subprocess
+from types import SimpleNamespace
+
+
+def _rule(name, label, patterns, fix, max_tries=1):
+    return SimpleNamespace(name=name, label=label, fix=fix, max_tries=max_tries,
+                           patterns=[re.compile(p, re.I) for p in patterns])
+
+
+# Ordre = priorité : le premier motif reconnu l'emporte.
+RULES = [
+    _rule("dpkg_lock", "verrou dpkg/apt occupé",
+          [r"could not get lock /var/lib/(?:dpkg|apt)", r"unable to acquire the dpkg frontend lock",
+           r"unable to lock (?:the )?(?:administration|download) directory.*held"],
+          "wait_dpkg_lock", max_tries=2),
+    _rule("dpkg_interrupted", "dpkg interrompu",
+          [r"dpkg was interrupted, you must manually run"],
+          "dpkg_configure"),
+    _rule("pep668", "environnement Python géré par le système (PEP 668)",
+          [r"externally-managed-environment"],
+          "pip_break_system"),
+    _rule("apt_stale", "index apt périmés",
+          [r"E: Unable to locate package", r"E: Package '[^']+' has no installation candidate",
+           r"E: Failed to fetch .*404", r"Hash Sum mismatch", r"Release file .* is not valid yet"],
+          "apt_update"),
+    _rule("network", "réseau/DNS indisponible",
+          [r"Temporary failure (?:in name resolution|resolving)", r"Could not resolve host",
+           r"Network is unreachable", r"Connection timed out", r"Connection reset by peer",
+           r"curl: \((?:6|7|28|35|56)\)", r"ReadTimeoutError", r"NewConnectionError"],
+          "backoff", max_tries=3),
+    _rule("needs_root", "droits root requis",
+          [r"Permission denied", r"Operation not permitted", r"are you root\?",
+           r"must be run as root", r"requires (?:root|superuser) privileges", r"\bsudo: "],
+          "sudo"),
+]
+
+
+def classify(text: str, tried: dict | None = None, is_root: bool = False):
+    """Première règle reconnue dans `text` encore tentable (tried: nom -> essais déjà faits)."""
+    tried = tried or {}
+    disabled = os.getenv("PIWI_FIX_DISABLE", "") == "1"
+    for r in RULES:
+        if disabled and r.fix != "sudo":
+            continue
+        if tried.get(r.name, 0) >= r.max_tries:
+            continue
+        if r.fix == "sudo" and is_root:
+            continue
+        if any(p.search(text) for p in r.patterns):
+            return r
+    return None
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 30.0) -> float:
+    """1er essai -> 2s, 2e -> 4s, 3e -> 8s (plafonné)."""
+    return min(cap, base * (2 ** max(0, attempt - 1)))
+
+
+# Verrous posés par apt/dpkg (fcntl F_SETLK) ; lock-frontend d'abord (dpkg >= 1.19).
+DPKG_LOCKS = ("/var/lib/dpkg/lock-frontend", "/var/lib/dpkg/lock",
+              "/var/lib/apt/lists/lock", "/var/cache/apt/archives/lock")
+
+
+def _lock_holder(path: str):
+    """PID qui tient le verrou fcntl de `path`, 0 si libre, None si illisible (non root).
+
+    F_GETLK interroge sans prendre le verrou : un apt qui démarre au même moment
+    n'échoue pas à cause de nous."""
+    import fcntl
+    import struct
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return 0
+    except OSError:
+        return None
+    try:
+        # struct flock (Linux) : l_type, l_whence, l_start, l_len, l_pid
+        fmt = "hhqqi4x"
+        req = struct.pack(fmt, fcntl.F_WRLCK, os.SEEK_SET, 0, 0, 0)
+        l_type, _, _, _, pid = struct.unpack(fmt, fcntl.fcntl(fd, fcntl.F_GETLK, req))
+        return 0 if l_type == fcntl.F_UNLCK else (pid or -1)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def dpkg_busy() -> list:
+    """PIDs qui tiennent un verrou apt/dpkg (hors nous).
+
+    Sans accès aux fichiers de verrou (non root), repli sur les noms de processus
+    apt/dpkg ; les démons permanents (packagekitd, unattended-upgrade-shutdown) ne
+    tiennent le verrou que pendant une opération et ne sont donc pas comptés."""
+    holders, readable = set(), False
+    for path in DPKG_LOCKS:
+        pid = _lock_holder(path)
+        if pid is None:
+            continue
+        readable = True
+        if pid:
+            holders.add(pid)
+    if readable:
+        return sorted(p for p in holders if p != os.getpid())
+    cp = subprocess.run(["pgrep", "-x", "-d", " ", "apt|apt-get|dpkg|aptitude"],
+                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    return [int(x) for x in cp.stdout.split() if x.isdigit() and int(x) != os.getpid()]
+
+
+def wait_dpkg_lock(timeout: float | None = None, log=None) -> bool:
+    """Attend la libération des verrous apt/dpkg. True si libres avant `timeout`."""
+    if timeout is None:
+        try:
+            timeout = float(os.getenv("PIWI_FIX_LOCK_WAIT", "300") or 300)
+        except ValueError:
+            timeout = 300.0
+    t0 = time.time()
+    told = False
+    while True:
+        busy = dpkg_busy()
+        if not busy:
+            return True
+        if time.time() - t0 > timeout:
+            return False
+        if log and not told:
+            log(f"⏳ dpkg occupé par {', '.join(map(str, busy))} : attente (max {timeout:.0f}s)...")
+            told = True
+        time.sleep(1.0)
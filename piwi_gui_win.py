@@ -2,13 +2,27 @@
 r"""
 Piwi – Interface principale (WSL + élévation à la demande)
 
-- Vérifie WSL + distro "PiwiUbuntu".
+- Vérifie WSL + distro "PiwiUbuntu" en arrière-plan (sondes parallèles + cache,
+  cf. wsl_bridge.py) : la fenêtre s'affiche immédiatement.
 - Auto-réparation : tente d'importer la distro depuis {app}\\wsl\\*.rootfs.tar.gz
   et lance setup_piwi.sh en root WSL si la distro manque.
 - Si non prête après ça : lance l’installateur et s’arrête.
 - UI minimaliste : clé OpenAI, requête, mot de passe sudo (optionnel), mode root (bandeau visible).
-- Si la tâche échoue par manque de droits, propose automatiquement de relancer
-  avec sudo (en demandant le mot de passe) ou en root WSL.
+- File de tâches : plusieurs requêtes exécutées en parallèle (limite réglable,
+  PIWI_MAX_JOBS), chacune avec son REQ_INTERNAL unique, son statut, sa durée et
+  son log ; annulation et changement de priorité (ordre de la file).
+- Si une tâche échoue par manque de droits, propose (sans bloquer les autres)
+  de la relancer avec sudo (en demandant le mot de passe) ou en root WSL.
+- Préchauffage (PIWI_PREWARM=0 pour désactiver) : dès que WSL est prêt, démarre
+  la distro, précharge noyau/openai et la connexion API (piwi_warm.py), puis
+  garde une session keep-alive jusqu'à la fermeture (pas d'arrêt pour inactivité).
+  Latence de la première requête (à froid / à chaud) journalisée (latency.jsonl).
+- Pré-génération (opt-in : case à cocher, cochée si PIWI_PREGEN=1) : après une pause
+  de saisie (PIWI_PREGEN_DEBOUNCE_MS), le script de la requête en cours est généré
+  en arrière-plan (noyau PIWI_PREGEN_ONLY=1) dans un REQ_INTERNAL réservé ; une
+  génération périmée par la suite de la saisie est annulée. Au clic, si le texte
+  correspond, la tâche reprend ce dossier et noyau saute l'appel OpenAI.
+  Plafond PIWI_PREGEN_PER_MIN appels/minute ; taux de réussite dans latency.jsonl.
 
 Dépendances Windows :
 - PyQt5
@@ -17,22 +31,41 @@ Dépendances Windows :
 
 import os
 import sys
+import time
+import uuid
+import json
 import shlex
+import shutil
+import threading
 import subprocess
+from collections import deque
 import requests
 import datetime
 from pathlib import Path
-from types import SimpleNamespace
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QTextEdit, QPushButton, QMessageBox, QCheckBox,
-    QInputDialog, QFrame, QDialog, QDialogButtonBox
+    QInputDialog, QFrame, QDialog, QDialogButtonBox, QTableWidget,
+    QTableWidgetItem, QAbstractItemView, QHeaderView, QSpinBox
 )
 from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import QThread, pyqtSignal, QTimer
 
-DISTRO_NAME = os.environ.get("PIWI_DISTRO_NAME", "PiwiUbuntu")
-CREATE_NO_WINDOW = 0x08000000 if os.name == "nt" else 0
+import wsl_bridge as WB
+from wsl_bridge import DISTRO_NAME, CREATE_NO_WINDOW, wsl_bash
+
+MAX_JOBS = max(1, int(os.environ.get("PIWI_MAX_JOBS", "2") or 2))
+PREWARM = os.environ.get("PIWI_PREWARM", "1") != "0"
+PREGEN = os.environ.get("PIWI_PREGEN", "0") == "1"
+PREGEN_DEBOUNCE_MS = max(200, int(os.environ.get("PIWI_PREGEN_DEBOUNCE_MS", "1200") or 1200))
+PREGEN_PER_MIN = max(1, int(os.environ.get("PIWI_PREGEN_PER_MIN", "4") or 4))
+PREGEN_MIN_CHARS = 12
+CLOSE_WAIT_MS = 5000  # fermeture : attente max (cumulée) des threads annulés
+
+# Exécuté dans WSL : noyau devient chef de session (setsid) et note son PGID
+# dans REQ_INTERNAL pour qu'une annulation tue tout l'arbre de processus.
+NOYAU_EXEC = 'echo $$ > "$REQDIR/.piwi_pgid"; exec python3 noyau.py "$@"'
 
 
 # ---------- Helpers système ----------
@@ -42,89 +75,8 @@ def app_dir() -> Path:
         return Path(sys.executable).resolve().parent
     return Path(__file__).resolve().parent
 
-def _decode_bytes(b) -> str:
-    if not b:
-        return ""
-    if isinstance(b, str):
-        return b
-    if b.startswith(b"\xff\xfe") or b"\x00" in b[:4]:
-        try:
-            return b.decode("utf-16le", errors="replace")
-        except Exception:
-            pass
-    try:
-        return b.decode("utf-8")
-    except Exception:
-        return b.decode("cp1252", errors="replace")
-
-def run(cmd, **kw) -> SimpleNamespace:
-    if os.name == "nt":
-        kw.setdefault("creationflags", CREATE_NO_WINDOW)
-        kw.setdefault("shell", False)
-    kw.setdefault("stdout", subprocess.PIPE)
-    kw.setdefault("stderr", subprocess.PIPE)
-    kw["text"] = False
-    p = subprocess.run(cmd, **kw)
-    return SimpleNamespace(
-        returncode=p.returncode,
-        stdout=_decode_bytes(p.stdout),
-        stderr=_decode_bytes(p.stderr),
-    )
-
-def _normalize_lines(s: str):
-    s = (s or "").replace("\x00", "")
-    out = []
-    for ln in s.splitlines():
-        ln = ln.replace("\ufeff", "").lstrip("*").strip()
-        if ln:
-            out.append(ln)
-    return out
-
-def wsl_ok() -> bool:
-    if os.name != "nt":
-        return False
-    try:
-        c = run(["wsl.exe", "--status"])
-        return c.returncode == 0
-    except Exception:
-        return False
-
-def distro_list_quiet():
-    q = run(["wsl.exe", "-l", "-q"])
-    return _normalize_lines(q.stdout) if q.returncode == 0 else []
-
-def distro_exists(name: str = DISTRO_NAME) -> bool:
-    try:
-        lines = distro_list_quiet()
-        if any(ln.lower() == name.lower() for ln in lines):
-            return True
-    except Exception:
-        pass
-    try:
-        out = run(["wsl.exe", "-l", "-v"])
-        if out.returncode != 0:
-            return False
-        lines = _normalize_lines(out.stdout)
-        return any(name.lower() in ln.lower() for ln in lines)
-    except Exception:
-        return False
-
-def wsl_bash(cmd: str, *, user: str | None = None) -> list[str]:
-    base = ["wsl", "-d", DISTRO_NAME]
-    if user:
-        base += ["-u", user]
-    base += ["--", "bash", "-lc", cmd]
-    return base
-
-def distro_healthy(name: str = DISTRO_NAME) -> bool:
-    try:
-        r = run(["wsl.exe", "-d", name, "--", "bash", "-lc", "echo OK"])
-        return r.returncode == 0 and "OK" in (r.stdout or "")
-    except Exception:
-        return False
-
 def need_install() -> bool:
-    return (not wsl_ok()) or (not distro_exists(DISTRO_NAME)) or (not distro_healthy(DISTRO_NAME))
+    return WB.need_install(DISTRO_NAME)
 
 def _show_error_window(msg: str):
     app = QApplication.instance() or QApplication(sys.argv)
@@ -144,32 +96,31 @@ def _show_error_window(msg: str):
     w.show()
     app.exec_()
 
-def launch_installer_and_exit():
+def launch_installer() -> str:
+    """Démarre l'installateur. Retourne "" si OK, sinon un message d'erreur."""
     exe = app_dir() / "piwi_installer_gui.exe"
     if not exe.exists():
-        _show_error_window(
-            "L’installateur est introuvable.\n"
-            f"Chemin attendu : {exe}\n"
-            "Réinstallez Piwi."
-        )
-        sys.exit(1)
+        return ("L’installateur est introuvable.\n"
+                f"Chemin attendu : {exe}\n"
+                "Réinstallez Piwi.")
     try:
         if os.name == "nt":
             subprocess.Popen([str(exe)], creationflags=CREATE_NO_WINDOW)
         else:
             subprocess.Popen([str(exe)])
     except Exception as e:
-        _show_error_window(f"Impossible de démarrer l’installateur :\n{e}")
+        return f"Impossible de démarrer l’installateur :\n{e}"
+    return ""
+
+def launch_installer_and_exit():
+    err = launch_installer()
+    if err:
+        _show_error_window(err)
         sys.exit(1)
     sys.exit(0)
 
 def to_wsl_path(win_path: str) -> str:
-    if not win_path or len(win_path) < 3:
-        return win_path
-    if win_path[1:3] != ":\\":
-        return win_path
-    drive = win_path[0].lower()
-    return f"/mnt/{drive}{win_path[2:].replace('\\', '/')}"
+    return WB.to_wsl_path(win_path)
 
 # ---------- Auto-réparation au démarrage ----------
 
@@ -179,12 +130,7 @@ def try_auto_repair():
     puis exécute setup_piwi.sh en root dans WSL. Silencieux et idempotent.
     """
     # Déjà présente ? on sort
-    try:
-        q = subprocess.run(["wsl.exe", "-l", "-q"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        have = any(DISTRO_NAME.lower() == ln.strip().lower() for ln in (q.stdout or "").splitlines())
-    except Exception:
-        have = False
-    if have:
+    if WB.distro_exists(DISTRO_NAME):
         return
 
     # Cherche un rootfs embarqué
@@ -206,18 +152,284 @@ def try_auto_repair():
     # Import WSL2
     install_dir = os.path.join(rootfs_dir, "PiwiUbuntuFS")
     os.makedirs(install_dir, exist_ok=True)
-    subprocess.run(
-        ["wsl.exe", "--import", DISTRO_NAME, install_dir, rootfs, "--version", "2"],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-    )
+    WB.run([WB.WSL_EXE, "--import", DISTRO_NAME, install_dir, rootfs, "--version", "2"])
+    WB.wait_for_distro(DISTRO_NAME)
 
     # Setup initial dans WSL (root)
     app_wsl = to_wsl_path(base_dir_win)
     bash = f'cd {shlex.quote(app_wsl)} && chmod +x setup_piwi.sh || true && ./setup_piwi.sh || true'
-    subprocess.run(
-        ["wsl.exe", "-d", DISTRO_NAME, "-u", "root", "--", "bash", "-lc", bash],
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    WB.run(wsl_bash(bash, user="root"))
+    WB.invalidate_health_cache()
+
+
+class HealthWorker(QThread):
+    """Sonde WSL (+ auto-réparation si besoin) hors du thread UI."""
+    # done(ready: bool, summary: str)
+    done = pyqtSignal(bool, str)
+
+    def run(self):
+        try:
+            h = WB.probe_health(DISTRO_NAME)
+            if not h.ready:
+                try_auto_repair()
+                h = WB.probe_health(DISTRO_NAME, use_cache=False)
+            src = "cache" if h.cached else f"{h.elapsed:.2f}s"
+            self.done.emit(bool(h.ready), f"wsl={h.wsl_ok} distro={h.exists} sain={h.healthy} ({src})")
+        except Exception as e:
+            self.done.emit(False, f"sonde WSL en erreur : {e}")
+
+class WarmWorker(QThread):
+    """Préchauffe la distro (piwi_warm.py) puis tient la session keep-alive ouverte."""
+    # done(ok: bool, summary: str)
+    done = pyqtSignal(bool, str)
+
+    def __init__(self):
+        super().__init__()
+        self.proc: subprocess.Popen | None = None
+        self.t_ready: float | None = None   # monotonic : préchauffage terminé
+        self.seconds = 0.0
+        self.info: dict = {}
+        self._stopping = False
+
+    def run(self):
+        base_dir_wsl = to_wsl_path(str(app_dir()))
+        cmd = wsl_bash(f'cd {shlex.quote(base_dir_wsl)} && exec python3 piwi_warm.py --hold')
+        t0 = time.monotonic()
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL, creationflags=CREATE_NO_WINDOW)
+            raw = self.proc.stdout.readline()
+        except Exception as e:
+            self.done.emit(False, f"préchauffage impossible : {e}")
+            return
+        self.seconds = time.monotonic() - t0
+        try:
+            self.info = json.loads(WB._decode_bytes(raw) or "{}")
+        except ValueError:
+            self.info = {}
+        if not self.info:
+            self.done.emit(False, "préchauffage : pas de réponse de piwi_warm.py")
+            return
+        self.t_ready = time.monotonic()
+        self.done.emit(True, f"préchauffé en {self.seconds:.1f} s (imports {self.info.get('import_s')} s, "
+                             f"API {self.info.get('connect_s')} s)")
+        # Keep-alive : tant que ce processus vit, la VM ne s'arrête pas pour inactivité
+        self.proc.wait()
+        if not self._stopping:
+            self.t_ready = None  # session perdue (ex. wsl --shutdown) : prochaine requête à froid
+
+    def stop(self):
+        self._stopping = True
+        if self.proc and self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()  # EOF -> le cat côté WSL se termine
+                self.proc.wait(timeout=2)
+            except Exception:
+                self.proc.kill()
+
+# ---------- File de tâches ----------
+
+_KEY_STATUS: dict = {}
+_KEY_LOCK = threading.Lock()
+
+def api_key_ok(api_key: str) -> bool:
+    """Petit test de la clé (une fois par clé et par session). Réseau KO -> on laisse noyau trancher."""
+    with _KEY_LOCK:
+        if api_key in _KEY_STATUS:
+            return _KEY_STATUS[api_key]
+    try:
+        r = requests.get("https://api.openai.com/v1/models",
+                         headers={"Authorization": f"Bearer {api_key}"}, timeout=5)
+        ok = r.status_code != 401
+    except Exception:
+        ok = True
+    with _KEY_LOCK:
+        _KEY_STATUS[api_key] = ok
+    return ok
+
+def new_reqdir_win() -> str:
+    # Suffixe aléatoire : deux requêtes dans la même seconde ne partagent plus de dossier
+    stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(os.path.expanduser("~"), "piwi_requests", f"req_{stamp}_{uuid.uuid4().hex[:8]}")
+
+def build_cmd(instruction: str, api_key: str, reqdir_wsl: str, sudo_pw: str | None, as_root: bool,
+              extra_env: dict | None = None):
+    base_dir_win = os.path.dirname(os.path.abspath(
+        sys.executable if getattr(sys, 'frozen', False) else __file__
+    ))
+    base_dir_wsl = to_wsl_path(base_dir_win)
+
+    env_exports = f'export PIWI_OPENAI_KEY={shlex.quote(api_key)}; '
+    if (not as_root) and sudo_pw:
+        env_exports += f'export PIWI_SUDO_PASSWORD={shlex.quote(sudo_pw)}; '
+    # Requête GUI = interactive : passe devant les lots dans les files dpkg/pip du noyau
+    env_exports += f'export PIWI_PRIORITY={shlex.quote(os.environ.get("PIWI_PRIORITY", "interactive"))}; '
+    # Profilage opt-in : PIWI_PROFILE* côté Windows est relayé au noyau
+    for k, v in sorted(os.environ.items()):
+        if k.startswith("PIWI_PROFILE"):
+            env_exports += f'export {k}={shlex.quote(v)}; '
+    for k, v in (extra_env or {}).items():
+        env_exports += f'export {k}={shlex.quote(v)}; '
+
+    bash_fragment = (
+        f'{env_exports}'
+        f' export REQDIR="{reqdir_wsl}"; '
+        f' mkdir -p "$REQDIR"; '
+        f' cd {shlex.quote(base_dir_wsl)} || exit 2; '
+        f' setsid -w bash -c {shlex.quote(NOYAU_EXEC)} noyau {shlex.quote(instruction)} "$REQDIR"'
     )
+    if as_root:
+        cmd_list = wsl_bash(bash_fragment, user="root")
+    else:
+        cmd_list = wsl_bash(bash_fragment)
+    return cmd_list, bash_fragment
+
+
+class Job:
+    """Une requête soumise : paramètres, statut, chronométrage et log."""
+    _seq = 0
+
+    def __init__(self, instruction: str, api_key: str, sudo_pw: str | None, as_root: bool,
+                 spec: "SpecWorker | None" = None):
+        Job._seq += 1
+        self.id = Job._seq
+        self.instruction = instruction
+        self.api_key = api_key
+        self.sudo_pw = sudo_pw
+        self.as_root = as_root
+        self.spec = spec  # pré-génération adoptée : même REQ_INTERNAL
+        self.reqdir_win = spec.reqdir_win if spec else new_reqdir_win()
+        self.reqdir_wsl = to_wsl_path(self.reqdir_win)
+        self.status = "en attente"
+        self.log: list[str] = []
+        self.t_start: float | None = None
+        self.t_end: float | None = None
+        self.runner: "JobRunner | None" = None
+        self.cancelled = False
+        self.t_first_out: float | None = None  # premier octet reçu de WSL
+
+    @property
+    def running(self) -> bool:
+        return self.status == "en cours"
+
+    @property
+    def active(self) -> bool:
+        """Occupe un créneau de PIWI_MAX_JOBS jusqu'à done(), annulation en cours comprise."""
+        return self.running or self.status == "annulation…"
+
+    def elapsed(self) -> float:
+        if self.t_start is None:
+            return 0.0
+        return (self.t_end or time.monotonic()) - self.t_start
+
+    def masked(self, text: str) -> str:
+        masked_key = self.api_key[:6] + "..." if len(self.api_key) > 8 else "****"
+        text = text.replace(self.api_key, masked_key)
+        if self.sudo_pw:
+            text = text.replace(self.sudo_pw, "******")
+        return text
+
+
+class JobRunner(QThread):
+    """Exécute une tâche dans WSL et remonte sa sortie ligne à ligne."""
+    # line(job_id, text) / done(job_id, returncode, full_output)
+    line = pyqtSignal(int, str)
+    done = pyqtSignal(int, int, str)
+
+    def __init__(self, job: Job):
+        super().__init__()
+        self.job = job
+        self.proc: subprocess.Popen | None = None
+
+    def run(self):
+        job = self.job
+        if not api_key_ok(job.api_key):
+            self.line.emit(job.id, "[ERROR] Clé OpenAI refusée (401).")
+            self.done.emit(job.id, 1, "")
+            return
+        if job.spec and job.spec.isRunning():
+            self.line.emit(job.id, "… attente de la pré-génération en cours")
+            job.spec.wait()
+        if job.cancelled:
+            self.done.emit(job.id, 1, "")
+            return
+        try:
+            os.makedirs(job.reqdir_win, exist_ok=True)
+            cmd_list, frag = build_cmd(job.instruction, job.api_key, job.reqdir_wsl, job.sudo_pw, job.as_root)
+            self.line.emit(job.id, "> " + " ".join(shlex.quote(x) for x in cmd_list[:-1]) + " " +
+                           shlex.quote(job.masked(frag)))
+            self.proc = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         creationflags=CREATE_NO_WINDOW)
+            out = []
+            for raw in self.proc.stdout:
+                if job.t_first_out is None:
+                    job.t_first_out = time.monotonic()
+                ln = WB._decode_bytes(raw).rstrip("\r\n")
+                out.append(ln)
+                self.line.emit(job.id, ln)
+            rc = self.proc.wait()
+        except Exception as e:
+            self.line.emit(job.id, f"[ERROR] {e}")
+            self.done.emit(job.id, 1, "")
+            return
+        self.done.emit(job.id, rc, "\n".join(out))
+
+    def cancel(self):
+        if self.job.spec and self.job.spec.isRunning():  # même dossier : même .piwi_pgid
+            kill_tree(self.job.spec.reqdir_wsl, self.job.spec.proc)
+        kill_tree(self.job.reqdir_wsl, self.proc)
+
+
+def kill_tree(reqdir_wsl: str, proc: subprocess.Popen | None):
+    """Tue l'arbre noyau côté WSL (root : couvre aussi les relances sudo), puis wsl.exe."""
+    kill = f'pg=$(cat {shlex.quote(reqdir_wsl)}/.piwi_pgid 2>/dev/null) && kill -TERM -- -"$pg"'
+    threading.Thread(target=WB.run, args=(wsl_bash(kill, user="root"),), daemon=True).start()
+    if proc and proc.poll() is None:
+        try:
+            proc.kill()
+        except Exception:
+            pass
+
+
+class SpecWorker(QThread):
+    """Pré-génère le script d'une requête en cours de saisie (noyau PIWI_PREGEN_ONLY=1)."""
+    # done(ok: bool)
+    done = pyqtSignal(bool)
+
+    def __init__(self, instruction: str, api_key: str, as_root: bool):
+        super().__init__()
+        self.instruction = instruction
+        self.api_key = api_key
+        self.as_root = as_root
+        self.reqdir_win = new_reqdir_win()
+        self.reqdir_wsl = to_wsl_path(self.reqdir_win)
+        self.proc: subprocess.Popen | None = None
+        self.ok = False
+        self.stale = False
+        self.t_start = time.monotonic()
+        self.t_end: float | None = None
+
+    def matches(self, instruction: str, as_root: bool) -> bool:
+        return not self.stale and instruction == self.instruction and as_root == self.as_root
+
+    def run(self):
+        try:
+            os.makedirs(self.reqdir_win, exist_ok=True)
+            cmd_list, _ = build_cmd(self.instruction, self.api_key, self.reqdir_wsl, None, self.as_root,
+                                    extra_env={"PIWI_PREGEN_ONLY": "1"})
+            if not self.stale:
+                self.proc = subprocess.Popen(cmd_list, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                             creationflags=CREATE_NO_WINDOW)
+                self.ok = self.proc.wait() == 0 and not self.stale
+        except Exception:
+            self.ok = False
+        self.t_end = time.monotonic()
+        self.done.emit(self.ok)
+
+    def cancel(self):
+        """Texte modifié depuis : génération périmée, annulée (le dossier est supprimé à la fin)."""
+        self.stale = True
+        kill_tree(self.reqdir_wsl, self.proc)
 
 # ---------- UI ----------
 
@@ -258,7 +470,12 @@ class MainWindow(QMainWindow):
         sudo_row1 = QHBoxLayout()
         self.as_root_chk = QCheckBox("Exécuter en root (WSL)")
         self.as_root_chk.toggled.connect(self._toggle_root)
-        sudo_row1.addWidget(self.as_root_chk); sudo_row1.addStretch(1)
+        self.pregen_chk = QCheckBox("Pré-générer pendant la saisie")
+        self.pregen_chk.setChecked(PREGEN)
+        self.pregen_chk.setToolTip("Demande le script à l'IA pendant que vous tapez "
+                                   f"(au plus {PREGEN_PER_MIN} appels/minute) : le lancement est immédiat.")
+        self.pregen_chk.toggled.connect(lambda on: None if on else self._discard_spec())
+        sudo_row1.addWidget(self.as_root_chk); sudo_row1.addStretch(1); sudo_row1.addWidget(self.pregen_chk)
         layout.addLayout(sudo_row1)
 
         sudo_row2 = QHBoxLayout()
@@ -274,39 +491,201 @@ class MainWindow(QMainWindow):
         self.req_input = QTextEdit()
         self.req_input.setPlaceholderText("Ex : Installe nmap et scanne mon réseau local")
         self.req_input.setAcceptRichText(False)
+        self.req_input.textChanged.connect(self._on_text_changed)
         layout.addWidget(self.req_input, 1)
 
         # Exécution
         btn_row = QHBoxLayout()
+        self.health_lbl = QLabel("Vérification de WSL…")
+        self.max_jobs = QSpinBox(); self.max_jobs.setRange(1, 8); self.max_jobs.setValue(min(MAX_JOBS, 8))
+        self.max_jobs.valueChanged.connect(lambda _v: self._pump())
         self.run_btn = QPushButton("Lancer dans WSL")
         self.run_btn.clicked.connect(self.lancer_piwi)
-        btn_row.addStretch(1); btn_row.addWidget(self.run_btn)
+        self.run_btn.setEnabled(False)  # réactivé quand la sonde WSL est OK
+        btn_row.addWidget(self.health_lbl); btn_row.addStretch(1)
+        btn_row.addWidget(QLabel("Tâches simultanées :")); btn_row.addWidget(self.max_jobs)
+        btn_row.addWidget(self.run_btn)
         layout.addLayout(btn_row)
 
-        # Logs
+        # File de tâches
+        layout.addWidget(QLabel("File de tâches :"))
+        self.jobs_table = QTableWidget(0, 4)
+        self.jobs_table.setHorizontalHeaderLabels(["#", "Requête", "Statut", "Durée"])
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.jobs_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.jobs_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.jobs_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.jobs_table.currentCellChanged.connect(lambda *_: self._show_selected_log())
+        layout.addWidget(self.jobs_table, 1)
+
+        job_btns = QHBoxLayout()
+        self.cancel_btn = QPushButton("Annuler"); self.cancel_btn.clicked.connect(self._cancel_selected)
+        self.up_btn = QPushButton("▲ Priorité"); self.up_btn.clicked.connect(lambda: self._move_selected(-1))
+        self.down_btn = QPushButton("▼ Priorité"); self.down_btn.clicked.connect(lambda: self._move_selected(1))
+        job_btns.addWidget(self.cancel_btn); job_btns.addWidget(self.up_btn); job_btns.addWidget(self.down_btn)
+        job_btns.addStretch(1)
+        layout.addLayout(job_btns)
+
+        # Logs (de la tâche sélectionnée)
         layout.addWidget(QLabel("Sortie / Logs :"))
         self.result_box = QTextEdit(); self.result_box.setReadOnly(True)
         layout.addWidget(self.result_box, 2)
 
+        self.jobs: list[Job] = []
+        self._tick = QTimer(self)
+        self._tick.timeout.connect(self._refresh_durations)
+        self._tick.start(1000)
+
+        self.health_worker: HealthWorker | None = None
+        self.warm_worker: WarmWorker | None = None
+        self._latency_logged = False
+
+        # Pré-génération : une seule en vol (texte courant), anti-rebond + plafond par minute
+        self.spec: SpecWorker | None = None
+        self._spec_calls: deque = deque()
+        self._spec_dead: list[SpecWorker] = []
+        self.spec_stats = {"started": 0, "ready": 0, "failed": 0, "stale": 0, "throttled": 0,
+                           "hits": 0, "misses": 0}
+        self._spec_timer = QTimer(self)
+        self._spec_timer.setSingleShot(True)
+        self._spec_timer.timeout.connect(self._speculate)
+
+    def start_health_check(self):
+        self.health_worker = HealthWorker()
+        self.health_worker.done.connect(self._on_health)
+        self.health_worker.start()
+
+    def _on_health(self, ready: bool, summary: str):
+        if ready:
+            self.health_lbl.setText("WSL prêt.")
+            self.health_lbl.setToolTip(summary)
+            self.run_btn.setEnabled(True)
+            if PREWARM and self.warm_worker is None:
+                self.warm_worker = WarmWorker()
+                self.warm_worker.done.connect(self._on_warm)
+                self.warm_worker.start()
+            return
+        # Distro non prête malgré l'auto-réparation -> installateur
+        self.health_lbl.setText("WSL non prêt.")
+        err = launch_installer()
+        if err:
+            QMessageBox.critical(self, "Piwi", err)
+        QApplication.quit()
+
+    def _on_warm(self, ok: bool, summary: str):
+        self.health_lbl.setText("WSL prêt (préchauffé)." if ok else "WSL prêt.")
+        self.health_lbl.setToolTip(self.health_lbl.toolTip() + "\n" + summary)
+        WB.log_latency({"event": "prewarm", "ok": ok, "seconds": round(self.warm_worker.seconds, 3),
+                        **self.warm_worker.info})
+
+    def _log_first_latency(self, job: Job):
+        """Première requête de la session : à chaud si le préchauffage était fini à son lancement."""
+        if self._latency_logged or job.t_start is None:
+            return
+        self._latency_logged = True
+        ww = self.warm_worker
+        state = "warm" if ww and ww.t_ready is not None and ww.t_ready <= job.t_start else "cold"
+        first = (job.t_first_out - job.t_start) if job.t_first_out else None
+        WB.log_latency({"event": "first_request", "state": state, "prewarm": PREWARM,
+                        "first_output_s": round(first, 3) if first is not None else None,
+                        "total_s": round(job.elapsed(), 3)})
+        self._job_log(job, f"⏱ Première requête ({'à chaud' if state == 'warm' else 'à froid'}) : "
+                           f"1re sortie {first or 0:.2f} s, total {job.elapsed():.1f} s")
+
     def _toggle_root(self, checked: bool):
         self.root_banner.setVisible(checked)
         self.sudo_input.setEnabled(not checked)
         self.sudo_label.setEnabled(not checked)
+        self._on_text_changed()  # PIWI_HOME (donc le prompt) dépend de l'utilisateur WSL
+
+    # ----- Pré-génération pendant la saisie -----
+
+    def _on_text_changed(self):
+        if not self.pregen_chk.isChecked():
+            return
+        text = self.req_input.toPlainText().strip()
+        if self.spec and not self.spec.matches(text, self.as_root_chk.isChecked()):
+            self._discard_spec()
+        self._spec_timer.start(PREGEN_DEBOUNCE_MS)
+
+    def _speculate(self):
+        text = self.req_input.toPlainText().strip()
+        api_key = self.api_input.text().strip()
+        as_root = self.as_root_chk.isChecked()
+        if (not self.pregen_chk.isChecked() or not self.run_btn.isEnabled() or not api_key
+                or len(text) < PREGEN_MIN_CHARS or text.lower().startswith(("shell:", "action:"))
+                or (self.spec and self.spec.matches(text, as_root))):
+            return
+        now = time.monotonic()
+        while self._spec_calls and now - self._spec_calls[0] > 60:
+            self._spec_calls.popleft()
+        if len(self._spec_calls) >= PREGEN_PER_MIN:
+            self.spec_stats["throttled"] += 1
+            return
+        self._spec_calls.append(now)
+        self.spec_stats["started"] += 1
+        spec = SpecWorker(text, api_key, as_root)
+        spec.done.connect(lambda ok, s=spec: self._on_spec_done(s, ok))
+        self.spec = spec
+        spec.start()
+
+    def _on_spec_done(self, spec: SpecWorker, ok: bool):
+        if spec.stale:
+            shutil.rmtree(spec.reqdir_win, ignore_errors=True)
+            if spec in self._spec_dead:
+                self._spec_dead.remove(spec)
+            return
+        self.spec_stats["ready" if ok else "failed"] += 1
+
+    def _discard_spec(self):
+        spec, self.spec = self.spec, None
+        if spec is None:
+            return
+        self.spec_stats["stale"] += 1
+        spec.cancel()
+        if spec.isRunning():
+            self._spec_dead.append(spec)  # garde une référence jusqu'à done
+        else:
+            shutil.rmtree(spec.reqdir_win, ignore_errors=True)
+
+    def _take_spec(self, instruction: str, as_root: bool) -> SpecWorker | None:
+        """Pré-génération correspondant au texte lancé (adoptée par la tâche), sinon None."""
+        if not self.pregen_chk.isChecked():
+            return None
+        spec = self.spec
+        hit = bool(spec and spec.matches(instruction, as_root) and (spec.isRunning() or spec.ok))
+        self.spec_stats["hits" if hit else "misses"] += 1
+        rec = {"event": "pregen", "outcome": "hit" if hit else "miss"}
+        if hit:
+            self.spec = None
+            # > 0 : script prêt avant le clic (gain = durée de génération) ; < 0 : encore en vol
+            rec["ready_before_click_s"] = round(time.monotonic() - spec.t_end, 3) if spec.t_end else None
+            rec["in_flight"] = spec.isRunning()
+        else:
+            self._discard_spec()
+        WB.log_latency(rec)
+        return spec if hit else None
 
-    def _ask_sudo_password_now(self) -> str | None:
-        pw, ok = QInputDialog.getText(self, "Sudo requis",
-                                      "Entrez le mot de passe sudo (utilisateur 'piwi') :",
-                                      QLineEdit.Password)
-        return pw if ok and pw else None
+    # ----- Relance avec droits (par tâche, non bloquant) -----
 
-    def _ask_reauth_dialog(self, err_text: str) -> str:
+    def _ask_sudo_password(self, job: Job, then):
+        dlg = QInputDialog(self)
+        dlg.setWindowTitle(f"Sudo requis – tâche #{job.id}")
+        dlg.setLabelText("Entrez le mot de passe sudo (utilisateur 'piwi') :")
+        dlg.setTextEchoMode(QLineEdit.Password)
+        dlg.textValueSelected.connect(lambda pw: then(pw) if pw else None)
+        dlg.open()
+
+    def _ask_reauth_dialog(self, job: Job, err_text: str):
         """
-        Propose de relancer avec sudo (demande mdp) ou en root. Retourne "sudo", "root" ou "".
+        Propose de relancer la tâche avec sudo (demande mdp) ou en root.
+        Dialogue non modal : les autres tâches continuent pendant la réponse.
         """
-        dlg = QDialog(self); dlg.setWindowTitle("Droits requis")
+        dlg = QDialog(self); dlg.setWindowTitle(f"Droits requis – tâche #{job.id}")
         v = QVBoxLayout(dlg)
         m = QLabel(
-            "La tâche semble nécessiter des privilèges administrateur.\n\n"
+            f"La tâche #{job.id} semble nécessiter des privilèges administrateur.\n\n"
             "Voulez-vous la relancer avec sudo (mot de passe) ou en root WSL ?"
         ); m.setWordWrap(True); v.addWidget(m)
         if err_text:
@@ -322,41 +701,119 @@ class MainWindow(QMainWindow):
         def act(): dlg.done(2)
         def rej(): dlg.done(0)
         b_sudo.clicked.connect(acc); b_root.clicked.connect(act); b_cancel.clicked.connect(rej)
-        res = dlg.exec_()
-        return "sudo" if res == 1 else ("root" if res == 2 else "")
-
-    def _build_cmd(self, instruction: str, api_key: str, reqdir_wsl: str, sudo_pw: str | None, as_root: bool):
-        base_dir_win = os.path.dirname(os.path.abspath(
-            sys.executable if getattr(sys, 'frozen', False) else __file__
-        ))
-        base_dir_wsl = to_wsl_path(base_dir_win)
-
-        env_exports = f'export PIWI_OPENAI_KEY={shlex.quote(api_key)}; '
-        if (not as_root) and sudo_pw:
-            env_exports += f'export PIWI_SUDO_PASSWORD={shlex.quote(sudo_pw)}; '
-
-        bash_fragment = (
-            f'{env_exports}'
-            f' REQDIR="{reqdir_wsl}"; '
-            f' mkdir -p "$REQDIR"; '
-            f' cd {shlex.quote(base_dir_wsl)} || exit 2; '
-            f' python3 noyau.py {shlex.quote(instruction)} "$REQDIR"'
-        )
-        if as_root:
-            cmd_list = wsl_bash(bash_fragment, user="root")
+        dlg.finished.connect(lambda res: self._on_reauth_choice(job, res))
+        dlg.open()
+
+    def _on_reauth_choice(self, job: Job, res: int):
+        if res == 1:
+            if job.sudo_pw:
+                self._requeue(job, sudo_pw=job.sudo_pw, as_root=False)
+            else:
+                self._ask_sudo_password(job, lambda pw: self._requeue(job, sudo_pw=pw, as_root=False))
+        elif res == 2:
+            self._requeue(job, sudo_pw=None, as_root=True)
+
+    def _requeue(self, job: Job, *, sudo_pw: str | None, as_root: bool):
+        job.sudo_pw, job.as_root = sudo_pw, as_root
+        job.status, job.t_start, job.t_end, job.t_first_out = "en attente", None, None, None
+        self._job_log(job, "--- relance " + ("en root" if as_root else "avec sudo") + " ---")
+        self._pump()
+
+    # ----- File de tâches -----
+
+    def _job(self, job_id: int) -> Job | None:
+        return next((j for j in self.jobs if j.id == job_id), None)
+
+    def _selected_job(self) -> Job | None:
+        row = self.jobs_table.currentRow()
+        return self.jobs[row] if 0 <= row < len(self.jobs) else None
+
+    def _job_log(self, job: Job, text: str):
+        job.log.append(text)
+        if self._selected_job() is job:
+            self.result_box.append(text)
+
+    def _show_selected_log(self):
+        job = self._selected_job()
+        self.result_box.setPlainText("\n".join(job.log) if job else "")
+
+    def _refresh_table(self):
+        sel = self._selected_job()
+        self.jobs_table.setRowCount(len(self.jobs))
+        for row, job in enumerate(self.jobs):
+            first = job.instruction.splitlines()[0] if job.instruction else ""
+            for col, val in enumerate((str(job.id), first, job.status, f"{job.elapsed():.0f} s")):
+                self.jobs_table.setItem(row, col, QTableWidgetItem(val))
+        if sel in self.jobs:
+            self.jobs_table.blockSignals(True)
+            self.jobs_table.selectRow(self.jobs.index(sel))
+            self.jobs_table.blockSignals(False)
+
+    def _refresh_durations(self):
+        for row, job in enumerate(self.jobs):
+            if job.active:
+                self.jobs_table.setItem(row, 3, QTableWidgetItem(f"{job.elapsed():.0f} s"))
+
+    def _pump(self):
+        """Démarre les tâches en attente (ordre de la file) dans la limite de concurrence."""
+        running = sum(1 for j in self.jobs if j.active)
+        for job in self.jobs:
+            if running >= self.max_jobs.value():
+                break
+            if job.status != "en attente":
+                continue
+            job.status, job.t_start = "en cours", time.monotonic()
+            if job.runner:
+                job.runner.wait()  # relance : l'ancien thread a déjà émis done()
+            job.runner = JobRunner(job)
+            job.runner.line.connect(lambda jid, ln: self._job_log(self._job(jid), ln))
+            job.runner.done.connect(self._on_job_done)
+            job.runner.start()
+            running += 1
+        self._refresh_table()
+
+    def _on_job_done(self, job_id: int, rc: int, out: str):
+        job = self._job(job_id)
+        if job is None:
+            return
+        job.t_end = time.monotonic()
+        if job.cancelled:
+            job.status = "annulé"
         else:
-            cmd_list = wsl_bash(bash_fragment)
-        return cmd_list, bash_fragment
-
-    def _run_once(self, cmd_list, display_fragment):
-        self.result_box.append("> " + " ".join(shlex.quote(x) for x in cmd_list[:-1]) + " " +
-                               shlex.quote(display_fragment))
-        r = subprocess.run(cmd_list, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        out = r.stdout or ""
-        if r.stderr:
-            out += ("\n[stderr]\n" + r.stderr)
-        self.result_box.append(out)
-        return r.returncode, out
+            job.status = "terminé" if rc == 0 else f"échec ({rc})"
+            self._log_first_latency(job)
+        self._pump()
+        if rc == 0 or job.cancelled:
+            return
+
+        # Si échec permissions et qu’on n’était pas root -> proposer relance
+        low = out.lower()
+        likely_perm = ("permission denied" in low) or ("operation not permitted" in low) or ("sudo:" in low)
+        if (not job.as_root) and likely_perm:
+            self._ask_reauth_dialog(job, out)
+
+    def _cancel_selected(self):
+        job = self._selected_job()
+        if not job:
+            return
+        if job.status == "en attente":
+            job.status = "annulé"
+        elif job.running and job.runner:
+            job.cancelled = True
+            job.status = "annulation…"
+            job.runner.cancel()
+        self._refresh_table()
+
+    def _move_selected(self, delta: int):
+        job = self._selected_job()
+        if not job:
+            return
+        i = self.jobs.index(job)
+        j = i + delta
+        if 0 <= j < len(self.jobs):
+            self.jobs[i], self.jobs[j] = self.jobs[j], self.jobs[i]
+            self._refresh_table()
+            self.jobs_table.selectRow(j)
 
     def lancer_piwi(self):
         instruction = self.req_input.toPlainText().strip()
@@ -368,58 +825,52 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Champs manquants", "Merci de remplir la clé API et la requête.")
             return
 
-        # Petit test non-bloquant
-        try:
-            requests.get("https://api.openai.com/v1/models",
-                         headers={"Authorization": f"Bearer {api_key}"}, timeout=5)
-        except Exception:
-            pass
-
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        reqdir_win = os.path.join(os.path.expanduser("~"), "piwi_requests", f"req_{timestamp}")
-        os.makedirs(reqdir_win, exist_ok=True)
-        reqdir_wsl = to_wsl_path(reqdir_win)
-
-        cmd_list, frag = self._build_cmd(instruction, api_key, reqdir_wsl,
-                                         sudo_pw if sudo_pw else None, as_root)
-        masked_key = api_key[:6] + "..." if len(api_key) > 8 else "****"
-        display_fragment = frag.replace(api_key, masked_key)
-        if sudo_pw:
-            display_fragment = display_fragment.replace(sudo_pw, "******")
-
-        rc, out = self._run_once(cmd_list, display_fragment)
-        if rc == 0:
-            return
-
-        # Si échec permissions et qu’on n’était pas root -> proposer relance
-        low = out.lower()
-        likely_perm = ("permission denied" in low) or ("operation not permitted" in low) or ("sudo:" in low)
-        if (not as_root) and likely_perm:
-            choice = self._ask_reauth_dialog(out)
-            if choice == "sudo":
-                pw = sudo_pw or self._ask_sudo_password_now()
-                if not pw:
-                    return
-                cmd_list2, frag2 = self._build_cmd(instruction, api_key, reqdir_wsl, pw, False)
-                disp2 = frag2.replace(api_key, masked_key).replace(pw, "******")
-                self._run_once(cmd_list2, disp2)
-            elif choice == "root":
-                cmd_list3, frag3 = self._build_cmd(instruction, api_key, reqdir_wsl, None, True)
-                disp3 = frag3.replace(api_key, masked_key)
-                self._run_once(cmd_list3, disp3)
+        spec = self._take_spec(instruction, as_root)
+        job = Job(instruction, api_key, (sudo_pw or None) if not as_root else None, as_root, spec)
+        if spec:
+            self._job_log(job, "⚡ Requête pré-générée pendant la saisie : son script est repris.")
+        self.jobs.append(job)
+        self.req_input.clear()
+        self._pump()
+        self.jobs_table.selectRow(self.jobs.index(job))
+
+    def closeEvent(self, event):
+        active = [j for j in self.jobs if j.running]
+        if active:
+            res = QMessageBox.question(self, "Tâches en cours",
+                                       f"{len(active)} tâche(s) en cours. Les annuler et quitter ?")
+            if res != QMessageBox.Yes:
+                event.ignore()
+                return
+            for j in active:
+                j.cancelled = True
+                j.runner.cancel()
+        if self.warm_worker:
+            self.warm_worker.stop()
+        self._spec_timer.stop()
+        self._discard_spec()
+        # Processus tués : les threads sortent d'eux-mêmes ; délai borné si wsl.exe traîne
+        threads = [j.runner for j in self.jobs] + [j.spec for j in self.jobs] + self._spec_dead
+        threads += [self.warm_worker, self.health_worker]
+        deadline = time.monotonic() + CLOSE_WAIT_MS / 1000
+        for t in threads:
+            if t is not None and t.isRunning():
+                t.wait(max(0, int((deadline - time.monotonic()) * 1000)))
+        st = self.spec_stats
+        if st["started"] or st["hits"] or st["misses"]:
+            launched = st["hits"] + st["misses"]
+            WB.log_latency({"event": "pregen_session", **st,
+                            "hit_rate": round(st["hits"] / launched, 3) if launched else None})
+        super().closeEvent(event)
 
 
 # ---------- main ----------
 
 if __name__ == "__main__":
-    # Tente une auto-réparation silencieuse (import + setup) avant tout
-    try_auto_repair()
-
-    # Si malgré tout la distro n'est pas prête, on lance l'installateur
-    if need_install():
-        launch_installer_and_exit()
-
     app = QApplication(sys.argv)
     win = MainWindow()
     win.show()
+    # Sonde WSL (+ auto-réparation silencieuse) en arrière-plan ; si la distro
+    # n'est toujours pas prête, _on_health lance l'installateur.
+    win.start_health_check()
     sys.exit(app.exec_())
@@ -9,6 +9,25 @@ datas = []
 for fn in (
     "piwi_icon.ico", "piwi_icon.png",
     "noyau.py", "path_resolver.py",
+    "piwi_profile.py",
+    "piwi_actions.py",
+    "piwi_sched.py",
+    "piwi_fixer.py",
+    "piwi_stream.py",
+    "piwi_limits.py",
+    "piwi_exec.py",
+    "piwi_archive.py",
+    "piwi_warm.py",
+    "piwi_errctx.py",
+    "piwi_router.py",
+    "piwi_plan.py",
+    "piwi_pty.py",
+    "piwi_prefetch.py",
+    "piwi_fetch.py",
+    "piwi_idle.py",
+    "piwi_ratelimit.py",
+    "piwi_privs.py",
+    "piwi_venv.py",
     "create_shortcut.sh", "setup_piwi.sh",
     "piwi_purge.sh", "launch.sh",
 ):
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Pré-installation prédictive pendant les périodes d'inactivité (côté WSL)
+
+- mine() : lit les scripts des requêtes passées (exec.sh, sinon script.generated.sh)
+  dans les dossiers req_* (PIWI_HOME/_internal, ~/piwi_requests, /mnt/c/Users/*/piwi_requests)
+  et dans l'archive (piwi_archive) ; index incrémental ~/.cache/piwi/idle/history.json.
+- rank() : paquets apt/pip classés par fréquence pondérée par l'ancienneté (demi-vie
+  PIWI_IDLE_HALF_LIFE jours), demandés par au moins PIWI_IDLE_MIN_COUNT requêtes.
+- Passe : les N premiers absents -> apt-get --download-only (installation si
+  PIWI_IDLE_MODE=install), pip download dans le wheelhouse partagé (piwi_prefetch).
+  Processus à nice 19 / ionice idle, verrou "dpkg" de piwi_sched en priorité batch.
+- Interruptible : un noyau qui démarre envoie SIGUSR1 (interrupt()) et /proc est sondé ;
+  le téléchargement en cours est tué aussitôt. L'étape dpkg (mode install) n'est
+  jamais tuée : le noyau attend le verrou dpkg, quelques secondes (archives locales).
+- daemon : lancé par piwi_warm.py --hold, s'arrête avec la session ; une passe quand
+  aucune requête depuis PIWI_IDLE_AFTER s et charge < PIWI_IDLE_MAX_LOAD, au plus une
+  fois par PIWI_IDLE_EVERY s.
+- report() (noyau) : paquets du script pré-chargés par une passe -> hits/misses dans
+  meta.json "idle" et ~/.cache/piwi/idle.jsonl (passes et requêtes).
+
+Usage :
+  python3 piwi_idle.py rank          classement actuel et paquets déjà présents
+  python3 piwi_idle.py run           une passe immédiate (sauf requête en cours)
+  python3 piwi_idle.py daemon [--parent PID]
+  python3 piwi_idle.py stats
+Env : PIWI_IDLE=0 (désactive), PIWI_IDLE_TOP (def=8 par type), PIWI_IDLE_MODE=download|install,
+      PIWI_IDLE_AFTER (def=120), PIWI_IDLE_EVERY (def=3600), PIWI_IDLE_MAX_LOAD (def=CPU/2),
+      PIWI_SUDO_PASSWORD (apt hors root), PIWI_CACHE_DIR (def=~/.cache/piwi)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import shlex
+import signal
+import subprocess
+from pathlib import Path
+from contextlib import nullcontext
+
+try:
+    import piwi_prefetch as PF
+except Exception:
+    PF = None
+try:
+    import piwi_sched as SCH
+except Exception:
+    SCH = None
+try:
+    import piwi_archive as AR
+except Exception:
+    AR = None
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi")
+STATE_DIR = CACHE / "idle"
+HISTORY = STATE_DIR / "history.json"
+STAGED = STATE_DIR / "staged.json"
+PIDFILE = STATE_DIR / "daemon.pid"
+LOG = CACHE / "idle.jsonl"
+WHEELHOUSE = CACHE / "wheelhouse"  # celui de piwi_prefetch / piwi-venv
+APT_ARCHIVES = Path("/var/cache/apt/archives")
+APT_LISTS = Path("/var/lib/apt/lists")
+SCRIPTS = ("exec.sh", "script.generated.sh")
+POLL_S = 5.0
+
+_REQ_TS = re.compile(r"req_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})")
+
+
+def enabled() -> bool:
+    return os.getenv("PIWI_IDLE", "1") != "0"
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def _mode() -> str:
+    return "install" if os.getenv("PIWI_IDLE_MODE", "").strip().lower() == "install" else "download"
+
+
+def _load(p: Path, default):
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return default
+
+
+def _save(p: Path, data):
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def _update_staged(fn):
+    """Lecture-modification-écriture de staged.json sous flock (démon et noyaux concurrents)."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(STATE_DIR / "staged.lock", "a") as lk:
+        fcntl.flock(lk, fcntl.LOCK_EX)
+        st = _load(STAGED, {})
+        st.setdefault("apt", {})
+        st.setdefault("pip", {})
+        out = fn(st)
+        _save(STAGED, st)
+        return out
+
+
+def record(rec: dict):
+    try:
+        CACHE.mkdir(parents=True, exist_ok=True)
+        with open(LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+# --- Historique des requêtes ---
+def sources() -> list:
+    if AR:
+        try:
+            return AR.default_sources()
+        except Exception:
+            pass
+    d = Path.home() / "piwi_requests"
+    return [d] if d.is_dir() else []
+
+
+def _req_ts(name: str, default: float) -> float:
+    m = _REQ_TS.search(name)
+    if m:
+        try:
+            return time.mktime(time.strptime(m.group(1), "%Y-%m-%d_%H-%M-%S"))
+        except ValueError:
+            pass
+    return default
+
+
+def _entry(ts: float, script: str) -> dict:
+    used = PF.used_deps(script)
+    return {"ts": round(ts), "apt": sorted(used["apt"]), "pip": sorted(used["pip"])}
+
+
+def mine(hist: dict | None = None) -> dict:
+    """Index {req: {ts, apt, pip}} complété des requêtes pas encore lues."""
+    hist = _load(HISTORY, {}) if hist is None else hist
+    now = time.time()
+    for src in sources():
+        for d in src.glob("req_*"):
+            if d.name in hist or not d.is_dir():
+                continue
+            for nm in SCRIPTS:
+                try:
+                    p = d / nm
+                    script = p.read_text(encoding="utf-8", errors="replace")
+                    hist[d.name] = _entry(_req_ts(d.name, p.stat().st_mtime), script)
+                    break
+                except OSError:
+                    continue
+            else:
+                # sans script (shell:, action:) : noté une fois la requête sûrement terminée
+                try:
+                    if now - d.stat().st_mtime > 3600:
+                        hist[d.name] = {"ts": round(d.stat().st_mtime), "apt": [], "pip": []}
+                except OSError:
+                    pass
+    if AR:
+        arc = None
+        try:
+            root = AR.archive_dir()
+            if (root / "index.sqlite").exists():
+                arc = AR.Archive(root)
+                for req in arc.list_requests():
+                    if req in hist:
+                        continue
+                    names = set(arc.list_files(req))
+                    nm = next((n for n in SCRIPTS if n in names), None)
+                    script = arc.read(req, nm).decode("utf-8", "replace") if nm else ""
+                    hist[req] = _entry(_req_ts(req, now), script)
+        except Exception:
+            pass
+        finally:
+            if arc:
+                arc.close()
+    return hist
+
+
+def rank(hist: dict, now: float | None = None) -> dict:
+    """{kind: [(nom, score, nb_requêtes)]} par score décroissant ; score = somme des 0.5^(âge/demi-vie)."""
+    now = time.time() if now is None else now
+    half = _env_float("PIWI_IDLE_HALF_LIFE", 14.0) * 86400
+    min_count = int(_env_float("PIWI_IDLE_MIN_COUNT", 2))
+    out = {}
+    for kind in ("apt", "pip"):
+        score, count = {}, {}
+        for rec in hist.values():
+            w = 0.5 ** (max(0.0, now - rec.get("ts", now)) / half)
+            for n in rec.get(kind) or ():
+                score[n] = score.get(n, 0.0) + w
+                count[n] = count.get(n, 0) + 1
+        out[kind] = sorted(((n, round(s, 3), count[n]) for n, s in score.items() if count[n] >= min_count),
+                           key=lambda t: (-t[1], t[0]))
+    return out
+
+
+# --- Présence locale ---
+def apt_installed(names: list) -> set:
+    if not names:
+        return set()
+    try:
+        cp = subprocess.run(["dpkg-query", "-W", "-f=${Package}\t${db:Status-Status}\n", *names],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return set()
+    return {l.split("\t")[0] for l in cp.stdout.splitlines() if l.endswith("\tinstalled")}
+
+
+def apt_cached(name: str) -> bool:
+    return any(APT_ARCHIVES.glob(f"{name}_*.deb"))
+
+
+def pip_cached(name: str) -> bool:
+    try:
+        return any(PF._norm("pip", re.split(r"-(?=\d)", f.name, 1)[0]) == name for f in WHEELHOUSE.iterdir())
+    except OSError:
+        return False
+
+
+def _lists_stale() -> bool:
+    try:
+        return time.time() - max(p.stat().st_mtime for p in APT_LISTS.glob("*_Packages*")) > 86400
+    except (OSError, ValueError):
+        return True
+
+
+# --- Requêtes en cours ---
+def busy() -> bool:
+    """Un noyau.py tourne-t-il (requête réelle ou pré-génération) ?"""
+    me = os.getpid()
+    for p in Path("/proc").glob("[0-9]*"):
+        try:
+            if int(p.name) == me:
+                continue
+            args = (p / "cmdline").read_bytes().split(b"\0")
+        except (OSError, ValueError):
+            continue
+        if any(a.endswith(b"noyau.py") for a in args[:3]):
+            return True
+    return False
+
+
+def _daemon_pid() -> int | None:
+    try:
+        pid = int(PIDFILE.read_text().strip())
+        # pid réutilisé par un autre processus : surtout ne pas lui envoyer de signal
+        if b"piwi_idle.py" in Path(f"/proc/{pid}/cmdline").read_bytes():
+            return pid
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def interrupt():
+    """Appelé au démarrage d'une requête : la passe en cours s'arrête aussitôt."""
+    pid = _daemon_pid()
+    if pid:
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except OSError:
+            pass
+
+
+def env() -> dict:
+    """Wheelhouse proposé à pip si une passe y a déposé des paquets."""
+    st = _load(STAGED, {})
+    return {"PIP_FIND_LINKS": str(WHEELHOUSE)} if st.get("pip") else {}
+
+
+# --- Passe de pré-chargement ---
+class Runner:
+    def __init__(self, log=None):
+        self.log = log or (lambda _m: None)
+        self.proc: subprocess.Popen | None = None
+        self.interrupted = False
+        self.last_busy = time.time()
+
+    def interrupt(self, *_):
+        self.interrupted = True
+        self.last_busy = time.time()
+        p = self.proc
+        if p and p.poll() is None:
+            try:
+                os.killpg(p.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def _run(self, argv: list, stdin: str = "", env=None, interruptible: bool = True) -> int | None:
+        """rc, ou None si interrompu. Groupe de processus propre, tué dès qu'une requête démarre."""
+        if interruptible and self.interrupted:
+            return None
+        self.proc = p = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL, start_new_session=interruptible,
+                                         env=dict(os.environ, **(env or {})))
+        try:
+            p.stdin.write(stdin.encode())
+            p.stdin.close()
+        except OSError:
+            pass
+        while True:
+            try:
+                rc = p.wait(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                if interruptible and not self.interrupted and busy():
+                    self.interrupt()
+                if self.interrupted and interruptible:
+                    try:
+                        rc = p.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        os.killpg(p.pid, signal.SIGKILL)
+                        rc = p.wait()
+                    break
+        self.proc = None
+        return None if interruptible and self.interrupted else rc
+
+    def _root(self, cmd: str, interruptible: bool = True) -> int | None:
+        """Comme noyau._run_as_root ; -1 sans droits root."""
+        cmd = "exec env DEBIAN_FRONTEND=noninteractive " + cmd
+        if os.geteuid() == 0:
+            return self._run(["bash", "-c", cmd], interruptible=interruptible)
+        pw = os.getenv("PIWI_SUDO_PASSWORD", "").strip()
+        if not pw:
+            return -1
+        return self._run(["sudo", "-S", "-p", "", "bash", "-c", cmd], stdin=pw + "\n", interruptible=interruptible)
+
+    def _apt(self, names: list, mode: str) -> tuple:
+        quoted = " ".join(shlex.quote(n) for n in names)
+        lock = (lambda: SCH.hold(["dpkg"], prio=SCH.PRIORITIES["batch"])) if SCH else nullcontext
+        with lock():
+            if _lists_stale() and self._root("apt-get update -q") == -1:
+                return [], "droits root indisponibles"
+            rc = self._root(f"apt-get install -y -q --download-only {quoted}")
+            if rc == -1:
+                return [], "droits root indisponibles"
+            if rc not in (0, None):
+                # un paquet inconnu fait tout échouer : un par un
+                for n in names:
+                    self._root(f"apt-get install -y -q --download-only {shlex.quote(n)}")
+            done = [n for n in names if apt_cached(n)]
+            if mode == "install" and done and not self.interrupted:
+                self._root("apt-get install -y -q --no-download " + " ".join(shlex.quote(n) for n in done),
+                           interruptible=False)
+                done = sorted(apt_installed(done))
+        return done, "" if rc == 0 else ("interrompu" if rc is None else f"rc={rc}")
+
+    def _pip(self, names: list) -> list:
+        WHEELHOUSE.mkdir(parents=True, exist_ok=True)
+        done = []
+        for n in names:
+            rc = self._run(["python3", "-m", "pip", "download", "-q", "--disable-pip-version-check",
+                            "-d", str(WHEELHOUSE), "--find-links", str(WHEELHOUSE), n], env={"PIP_NO_INPUT": "1"})
+            if rc is None:
+                break
+            if rc == 0:
+                done.append(n)
+        return done
+
+    def run_pass(self, top: int | None = None, mode: str | None = None) -> dict:
+        t0 = time.time()
+        self.interrupted = False
+        top = top or int(_env_float("PIWI_IDLE_TOP", 8))
+        mode = mode or _mode()
+        hist = mine()
+        _save(HISTORY, hist)
+        ranked = rank(hist)
+        apt_names = [n for n, _s, _c in ranked["apt"]]
+        installed = apt_installed(apt_names)
+        apt = [n for n in apt_names if n not in installed and (mode == "install" or not apt_cached(n))][:top]
+        pip = [n for n, _s, _c in ranked["pip"] if not pip_cached(n)][:top]
+        rep = {"event": "pass", "ts": round(t0, 3), "mode": mode, "requests": len(hist),
+               "todo": {"apt": apt, "pip": pip}, "apt": [], "pip": [], "detail": ""}
+        if apt or pip:
+            self.log(f"📦 Passe d'inactivité ({mode}) : apt {' '.join(apt) or '-'} | pip {' '.join(pip) or '-'}")
+        if apt and not self.interrupted:
+            rep["apt"], rep["detail"] = self._apt(apt, mode)
+        if pip and not self.interrupted:
+            rep["pip"] = self._pip(pip)
+        rep["interrupted"] = self.interrupted
+        rep["seconds"] = round(time.time() - t0, 3)
+
+        def stage(st):
+            for kind in ("apt", "pip"):
+                for n in rep[kind]:
+                    st[kind][n] = round(t0)
+        _update_staged(stage)
+        record(rep)
+        self.log(f"[INFO] Passe terminée en {rep['seconds']}s : {len(rep['apt'])} apt, {len(rep['pip'])} pip"
+                 + (" (interrompue par une requête)" if self.interrupted else "") + ".")
+        return rep
+
+
+def daemon(parent: int | None = None):
+    if _daemon_pid():
+        return
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    PIDFILE.write_text(str(os.getpid()))
+    try:
+        os.nice(19)
+        subprocess.run(["ionice", "-c3", "-p", str(os.getpid())], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)  # hérité par apt / pip
+    except OSError:
+        pass
+    log = lambda m: print(m, file=sys.stderr, flush=True)
+    r = Runner(log)
+    signal.signal(signal.SIGUSR1, r.interrupt)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    after = _env_float("PIWI_IDLE_AFTER", 120)
+    every = _env_float("PIWI_IDLE_EVERY", 3600)
+    max_load = _env_float("PIWI_IDLE_MAX_LOAD", (os.cpu_count() or 2) / 2)
+    last_pass = max((r.get("ts", 0) for r in _records() if r.get("event") == "pass"), default=0.0)
+    try:
+        while parent is None or Path(f"/proc/{parent}").exists():
+            time.sleep(POLL_S)
+            now = time.time()
+            if busy():
+                r.last_busy = now
+                continue
+            if now - r.last_busy < after or now - last_pass < every or os.getloadavg()[0] > max_load:
+                continue
+            try:
+                r.run_pass()
+            except Exception as e:
+                log(f"[WARN] Passe d'inactivité en erreur : {e}")
+            last_pass = time.time()
+    finally:
+        try:
+            if _daemon_pid() == os.getpid():
+                PIDFILE.unlink()
+        except OSError:
+            pass
+
+
+# --- Taux de succès ---
+def report(script: str) -> dict | None:
+    """Paquets du script déjà pré-chargés par une passe (consommés : comptés une seule fois)."""
+    used = PF.used_deps(script)
+    if not used["apt"] and not used["pip"]:
+        return None
+
+    def consume(st):
+        hit = {}
+        for kind in ("apt", "pip"):
+            hit[kind] = sorted(used[kind] & set(st[kind]))
+            for n in hit[kind]:
+                st[kind].pop(n)
+        return hit
+    try:
+        hit = _update_staged(consume)
+    except OSError:
+        hit = {"apt": [], "pip": []}
+    hits = len(hit["apt"]) + len(hit["pip"])
+    n = len(used["apt"]) + len(used["pip"])
+    rep = {"hits": hits, "misses": n - hits, "hit_rate": round(hits / n, 3), "hit": hit}
+    record({"event": "request", "ts": round(time.time(), 3), "hits": hits, "misses": n - hits})
+    return rep
+
+
+def _records() -> list:
+    try:
+        return [json.loads(l) for l in LOG.read_text(encoding="utf-8").splitlines()[-5000:] if l.strip()]
+    except (OSError, ValueError):
+        return []
+
+
+def summary() -> dict:
+    recs = _records()
+    passes = [r for r in recs if r.get("event") == "pass"]
+    reqs = [r for r in recs if r.get("event") == "request"]
+    hits, misses = sum(r["hits"] for r in reqs), sum(r["misses"] for r in reqs)
+    st = _load(STAGED, {})
+    return {"passes": len(passes), "interrupted": sum(1 for r in passes if r.get("interrupted")),
+            "staged": {"apt": sum(len(r.get("apt", [])) for r in passes),
+                       "pip": sum(len(r.get("pip", [])) for r in passes)},
+            "pending": {k: len(st.get(k) or {}) for k in ("apt", "pip")},
+            "pass_seconds": round(sum(r.get("seconds", 0) for r in passes), 3),
+            "requests": len(reqs), "hits": hits, "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None}
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if PF is None or cmd not in ("rank", "run", "daemon", "stats"):
+        print(__doc__)
+        sys.exit(1)
+    if cmd == "stats":
+        print(json.dumps(summary(), indent=2))
+    elif cmd == "rank":
+        hist = mine()
+        _save(HISTORY, hist)
+        ranked = rank(hist)
+        inst = apt_installed([n for n, _s, _c in ranked["apt"]])
+        for kind in ("apt", "pip"):
+            for n, s, c in ranked[kind]:
+                here = (n in inst or apt_cached(n)) if kind == "apt" else pip_cached(n)
+                print(f"{kind}\t{s:8.3f}\t{c:4d}\t{n}{'  (présent)' if here else ''}")
+    elif cmd == "run":
+        if not enabled() or busy():
+            print("[INFO] Désactivé ou requête en cours : rien à faire.")
+            return
+        r = Runner(lambda m: print(m, flush=True))
+        signal.signal(signal.SIGUSR1, r.interrupt)
+        print(json.dumps(r.run_pass(), ensure_ascii=False, indent=2))
+    elif enabled():
+        parent = None
+        if "--parent" in sys.argv:
+            try:
+                parent = int(sys.argv[sys.argv.index("--parent") + 1])
+            except (IndexError, ValueError):
+                pass
+        daemon(parent)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,11 +15,9 @@ import os
 import sys
 import glob
 import shlex
-import time
 import subprocess
 from pathlib import Path
 from typing import Optional
-from types import SimpleNamespace
 
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
@@ -29,8 +27,10 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
 
+import wsl_bridge as WB
+from wsl_bridge import run, wsl_ok, distro_exists, CREATE_NO_WINDOW
+
 APP_DISTRO_NAME = "PiwiUbuntu"
-CREATE_NO_WINDOW = 0x08000000 if os.name == "nt" else 0
 
 
 # ---------- Helpers OS ----------
@@ -41,90 +41,8 @@ def app_dir() -> Path:
     return Path(__file__).resolve().parent
 
 
-def _decode_bytes(b: Optional[bytes]) -> str:
-    """Décodage robuste des sorties de wsl.exe (UTF-16LE fréquent)."""
-    if not b:
-        return ""
-    if b.startswith(b"\xff\xfe") or b"\x00" in b[:4]:
-        try:
-            return b.decode("utf-16le", errors="replace")
-        except Exception:
-            pass
-    try:
-        return b.decode("utf-8")
-    except Exception:
-        return b.decode("cp1252", errors="replace")
-
-
-def run(cmd, **kw) -> SimpleNamespace:
-    """
-    Lance un sous-processus, capture en BYTES, puis décode proprement.
-    Retourne un objet {returncode, stdout(str), stderr(str)}.
-    """
-    if os.name == "nt":
-        kw.setdefault("creationflags", CREATE_NO_WINDOW)
-        kw.setdefault("shell", False)
-    kw.setdefault("stdout", subprocess.PIPE)
-    kw.setdefault("stderr", subprocess.PIPE)
-    kw["text"] = False  # bytes
-
-    p = subprocess.run(cmd, **kw)
-    return SimpleNamespace(
-        returncode=p.returncode,
-        stdout=_decode_bytes(p.stdout),
-        stderr=_decode_bytes(p.stderr),
-    )
-
-
-def _normalize_lines(s: str):
-    """Nettoie les sorties : supprime NULs/BOM/astérisques éventuels, strip par ligne."""
-    s = s.replace("\x00", "")
-    lines = []
-    for ln in (s or "").splitlines():
-        ln = ln.replace("\ufeff", "").lstrip("*").strip()
-        if ln:
-            lines.append(ln)
-    return lines
-
-
-def wsl_ok() -> bool:
-    if os.name != "nt":
-        return False
-    try:
-        c = run(["wsl.exe", "--status"])
-        return c.returncode == 0
-    except Exception:
-        return False
-
-
-def distro_exists(name: str = APP_DISTRO_NAME) -> bool:
-    # 1) liste "quiet" fiable (non localisée)
-    try:
-        q = run(["wsl.exe", "-l", "-q"])
-        if q.returncode == 0:
-            lines = _normalize_lines(q.stdout)
-            return any(ln.lower() == name.lower() for ln in lines)
-    except Exception:
-        pass
-    # 2) fallback verbose
-    try:
-        out = run(["wsl.exe", "-l", "-v"])
-        if out.returncode != 0:
-            return False
-        lines = _normalize_lines(out.stdout)
-        return any(name.lower() in ln.lower() for ln in lines)
-    except Exception:
-        return False
-
-
 def to_wsl_path(win_path: Path) -> str:
-    p = str(win_path)
-    if not p or len(p) < 3:
-        return p
-    drive = p[0].lower()
-    if p[1:3] != ":\\":
-        return p
-    return f"/mnt/{drive}/{p[3:].replace('\\', '/')}"
+    return WB.to_wsl_path(win_path)
 
 
 def find_rootfs_tar() -> Optional[Path]:
@@ -149,11 +67,11 @@ def import_distro(log, install_dir: Path, archive: Path) -> bool:
     log(f"  - Archive: {archive}")
 
     # Log avant import
-    q1 = run(["wsl.exe", "-l", "-q"])
-    if q1.stdout:
-        log("  - Avant import, `wsl -l -q` : " + " | ".join(_normalize_lines(q1.stdout)))
+    before = WB.distro_list_quiet()
+    if before:
+        log("  - Avant import, `wsl -l -q` : " + " | ".join(before))
 
-    r = run(["wsl.exe", "--import", APP_DISTRO_NAME, str(install_dir), str(archive), "--version", "2"])
+    r = run([WB.WSL_EXE, "--import", APP_DISTRO_NAME, str(install_dir), str(archive), "--version", "2"])
     if r.stdout:
         log(r.stdout.strip())
     if r.stderr:
@@ -162,60 +80,51 @@ def import_distro(log, install_dir: Path, archive: Path) -> bool:
         log("❌ Échec de l'import WSL.")
         return False
 
-    # Attendre l’enregistrement côté WSL (jusqu’à ~15 s)
-    for _ in range(30):
-        time.sleep(0.5)
-        if distro_exists(APP_DISTRO_NAME):
-            log("✓ Distro importée et détectée.")
-            q2 = run(["wsl.exe", "-l", "-q"])
-            if q2.stdout:
-                log("  - Après import, `wsl -l -q` : " + " | ".join(_normalize_lines(q2.stdout)))
-            return True
+    # Attendre l’enregistrement côté WSL (jusqu’à ~15 s, une liste par tentative)
+    after = WB.wait_for_distro(APP_DISTRO_NAME, timeout=15.0)
+    if after is not None:
+        log("✓ Distro importée et détectée.")
+        log("  - Après import, `wsl -l -q` : " + " | ".join(after))
+        return True
 
     log("⚠️ Import déclenché mais non détecté (timeout).")
     return False
 
 
-def run_setup(log) -> bool:
+STEP_LABELS = {"ran": "exécutée", "skip": "inchangée", "fail": "ÉCHEC"}
+
+
+def run_setup(log, username: str = "piwi") -> bool:
     """
-    Exécute `setup_piwi.sh` depuis le dossier d'app, à l'intérieur de la distro.
+    Exécute `setup_piwi.sh` (en root) depuis le dossier d'app, à l'intérieur de la distro.
+    Une seule session WSL : paquets, SDK, PIWI_HOME, utilitaires et utilisateur
+    par défaut. Les étapes inchangées (empreinte identique) sont sautées ; leurs
+    durées (lignes PIWI_STEP) sont résumées dans les détails.
     """
     basedir = app_dir()
     basedir_wsl = to_wsl_path(basedir)
     sh_wsl = f"{basedir_wsl}/setup_piwi.sh"
     log(f"== Post-install : exécution de {sh_wsl} ==")
-    r = run(["wsl.exe", "-d", APP_DISTRO_NAME, "--", "bash", "-lc", f"bash {shlex.quote(sh_wsl)}"])
-    if r.stdout:
-        log(r.stdout.strip())
+    cmd = f"PIWI_DEFAULT_USER={shlex.quote(username)} bash {shlex.quote(sh_wsl)}"
+    r = run(WB.wsl_bash(cmd, user="root", distro=APP_DISTRO_NAME))
+    steps = []
+    for ln in (r.stdout or "").splitlines():
+        parts = ln.split()
+        if len(parts) == 4 and parts[0] == "PIWI_STEP":
+            steps.append(parts[1:])
+        elif ln.strip():
+            log(ln.rstrip())
     if r.stderr:
         log("[stderr] " + r.stderr.strip())
+    if steps:
+        log("⏱ Étapes :")
+        for name, status, secs in steps:
+            log(f"  - {name:<10} {STEP_LABELS.get(status, status):<10} {secs} s")
     ok = (r.returncode == 0)
     log("✓ Post-install OK." if ok else "❌ Post-install a renvoyé une erreur.")
     return ok
 
 
-def set_default_user(log, username: str = "piwi") -> bool:
-    """
-    S'assure que l'utilisateur existe, l'ajoute à 'sudo', puis écrit /etc/wsl.conf.
-    """
-    cmd = (
-        "set -e; "
-        f"if ! id -u {username} >/dev/null 2>&1; then "
-        f"  sudo adduser --disabled-password --gecos \"\" {username}; "
-        "fi; "
-        f"getent group sudo >/dev/null 2>&1 && sudo usermod -aG sudo {username} || true; "
-        f"sudo sh -c 'printf \"[user]\\ndefault={username}\\n\" > /etc/wsl.conf'"
-    )
-    r = run(["wsl.exe", "-d", APP_DISTRO_NAME, "--", "bash", "-lc", cmd])
-    if r.stdout:
-        log(r.stdout.strip())
-    if r.stderr:
-        log("[stderr] " + r.stderr.strip())
-    ok = (r.returncode == 0)
-    log("✓ Utilisateur par défaut configuré." if ok else "⚠️ Échec config utilisateur par défaut (non bloquant).")
-    return ok
-
-
 def launch_main_ui():
     """Démarre l'UI principale Piwi puis ferme l'installateur."""
     base = app_dir()
@@ -268,14 +177,14 @@ class InstallWorker(QThread):
                     self.finished.emit(False, "Échec de l'import de la distribution WSL.", "\n".join(self._logs))
                     return
 
-            # Post-install
-            ok2 = run_setup(self.log)
+            # Post-install (inclut l'utilisateur par défaut)
+            ok2 = run_setup(self.log, "piwi")
             if not ok2:
                 # Non bloquant mais on signale l'avertissement
                 self.log("⚠️  Post-install en erreur (continuation).")
 
-            # User par défaut
-            set_default_user(self.log, "piwi")
+            # La GUI principale re-sondera la distro au lieu de lire un état périmé
+            WB.invalidate_health_cache()
 
             # Succès
             self.finished.emit(True, "Installation/Configuration terminée.", "\n".join(self._logs))
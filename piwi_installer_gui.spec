@@ -12,7 +12,7 @@ if WSL_DIR.exists():
     datas.append((str(WSL_DIR), "wsl"))
 
 # Icônes & scripts nécessaires au post-install
-for fn in ("piwi_icon.ico", "piwi_icon.png", "setup_piwi.sh", "create_shortcut.sh", "launch.sh", "path_resolver.py"):
+for fn in ("piwi_icon.ico", "piwi_icon.png", "setup_piwi.sh", "create_shortcut.sh", "launch.sh", "path_resolver.py", "piwi_venv.py", "piwi_fetch.py"):
     p = HERE / fn
     if p.exists():
         datas.append((str(p), "."))
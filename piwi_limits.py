@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Limites de ressources et comptabilité d'exécution des scripts (côté WSL)
+
+- Sandbox : exécute un script dans un cgroup v2 transitoire (memory.max,
+  pids.max) si la hiérarchie v2 est inscriptible et ses contrôleurs disponibles,
+  sinon avec des rlimits (prlimit : RLIMIT_AS pour la mémoire, RLIMIT_NPROC).
+  Temps CPU : RLIMIT_CPU dans les deux cas (par processus) ; temps réel : délai
+  côté noyau (groupe de processus tué).
+- Comptabilité par exécution : CPU (s), pic RSS, octets lus/écrits, durée réelle
+  (cgroup : cpu.stat / memory.peak / io.stat ; sinon getrusage des enfants).
+  peak_rss_scope : "run" (cgroup ou rusage du lanceur) ou "lifetime" (RUSAGE_CHILDREN :
+  maximum sur toute la vie du noyau, pas celui de cette exécution).
+- Arrêt par limite signalé distinctement : killed = wall | cpu | memory | pids.
+- Pas de preexec_fn (risque d'interblocage avec les threads du noyau, ex. étapes de
+  plan en parallèle) : wrap() préfixe la commande par le lanceur
+  `python3 piwi_limits.py exec`, qui rejoint le cgroup et pose les rlimits dans le
+  processus lancé lui-même ; en mode rlimits il attend la commande (wait4) et écrit le
+  rusage de CETTE exécution. child() : un cgroup distinct par étape concurrente.
+
+Env (0 = pas de limite) :
+  PIWI_LIMIT_WALL  secondes de temps réel (def=3600, 0 pour ne jamais arrêter un script long)
+  PIWI_LIMIT_CPU   secondes CPU (def=0)
+  PIWI_LIMIT_MEM   mémoire, ex. 2G / 512M (def=auto : 80% de la RAM, en cgroup uniquement)
+  PIWI_LIMIT_PIDS  processus/threads simultanés (def=4096)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+import signal
+import resource
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+
+CONTROLLERS = ("memory", "pids", "cpu", "io")
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.I)
+_KILL_LABELS = {"wall": "temps réel", "cpu": "temps CPU", "memory": "mémoire", "pids": "nombre de processus"}
+
+
+def parse_size(v: str) -> int:
+    m = _SIZE.match(v or "")
+    if not m:
+        return 0
+    mult = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}[m.group(2).lower()]
+    return int(float(m.group(1)) * mult)
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def _mem_total() -> int:
+    try:
+        for line in open("/proc/meminfo", encoding="utf-8"):
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def limits_from_env() -> SimpleNamespace:
+    raw_mem = os.getenv("PIWI_LIMIT_MEM", "").strip().lower()
+    return SimpleNamespace(
+        wall=_env_num("PIWI_LIMIT_WALL", 3600),
+        cpu=int(_env_num("PIWI_LIMIT_CPU", 0)),
+        mem=parse_size(raw_mem) if raw_mem not in ("", "auto") else 0,
+        mem_auto=raw_mem in ("", "auto"),
+        pids=int(_env_num("PIWI_LIMIT_PIDS", 4096)),
+    )
+
+
+def describe(kind: str, lim: SimpleNamespace) -> str:
+    val = {"wall": f"{lim.wall:.0f}s", "cpu": f"{lim.cpu}s",
+           "memory": f"{lim.mem // (1 << 20)} MiB", "pids": str(lim.pids)}.get(kind, "?")
+    return f"{_KILL_LABELS.get(kind, kind)} > {val}"
+
+
+def _cgroup2_root():
+    try:
+        for line in open("/proc/mounts", encoding="utf-8"):
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == "cgroup2":
+                return Path(parts[1])
+    except OSError:
+        pass
+    return None
+
+
+def _write(p: Path, v: str) -> bool:
+    try:
+        p.write_text(v)
+        return True
+    except OSError:
+        return False
+
+
+def _read_kv(p: Path) -> dict:
+    out = {}
+    try:
+        for line in p.read_text().splitlines():
+            k, _, v = line.partition(" ")
+            if v.strip().isdigit():
+                out[k] = int(v)
+    except OSError:
+        pass
+    return out
+
+
+class Sandbox:
+    """Un cgroup (ou des rlimits) par requête ; run() exécute et comptabilise."""
+
+    def __init__(self, name: str, limits: SimpleNamespace | None = None):
+        self.name = re.sub(r"[^\w.-]+", "_", name)
+        self.lim = limits or limits_from_env()
+        self.cg = self._make_cgroup(self.name)
+        if self.lim.mem_auto:
+            self.lim.mem = int(_mem_total() * 0.8) if self.cg else 0
+            if self.cg and self.lim.mem:
+                _write(self.cg / "memory.max", str(self.lim.mem))
+        self.mode = "cgroup" if self.cg else "rlimit"
+        self._nproc_base = 0
+        if not self.cg and self.lim.pids and os.geteuid() != 0:
+            # RLIMIT_NPROC compte tous les processus de l'utilisateur : on ajoute l'existant
+            uid = os.getuid()
+            self._nproc_base = sum(1 for d in Path("/proc").iterdir()
+                                   if d.name.isdigit() and _owner(d) == uid)
+
+    def _make_cgroup(self, name: str):
+        root = _cgroup2_root()
+        if root is None:
+            return None
+        try:
+            avail = set((root / "cgroup.controllers").read_text().split())
+        except OSError:
+            return None
+        if not {"memory", "pids"} <= avail:
+            return None
+        parent = root / "piwi"
+        try:
+            parent.mkdir(exist_ok=True)
+            for base in (root, parent):
+                for c in CONTROLLERS:
+                    if c in avail:
+                        _write(base / "cgroup.subtree_control", f"+{c}")
+            cg = parent / name
+            cg.mkdir(exist_ok=True)
+        except OSError:
+            return None
+        if self.lim.mem:
+            _write(cg / "memory.max", str(self.lim.mem))
+        if self.lim.pids:
+            _write(cg / "pids.max", str(self.lim.pids))
+        return cg
+
+    def child(self, name: str) -> "Sandbox":
+        """Même limites, cgroup à part : comptabilité et arrêts propres à une exécution concurrente."""
+        lim = SimpleNamespace(**vars(self.lim))
+        lim.mem_auto = False
+        return Sandbox(f"{self.name}.{name}", lim)
+
+    def wrap(self, args, shell: bool = False, snap: SimpleNamespace | None = None) -> list:
+        """
+        argv lancé sous les limites (via le lanceur `exec`, cf. _exec) ; snap : snapshot()
+        de cette exécution, dont le fichier de rusage est alors rempli par le lanceur.
+        """
+        cmd = ["/bin/sh", "-c", args] if shell else list(args)
+        opts = []
+        if self.cg:
+            opts += ["--cgroup", str(self.cg)]
+        if self.lim.cpu:
+            opts += ["--cpu", str(self.lim.cpu)]
+        if not self.cg:
+            if self.lim.mem:
+                opts += ["--mem", str(self.lim.mem)]
+            if self.lim.pids and os.geteuid() != 0:
+                opts += ["--nproc", str(self._nproc_base + self.lim.pids)]
+            if snap is not None and snap.usage_file:
+                opts += ["--usage", snap.usage_file]
+        return [sys.executable, os.path.abspath(__file__), "exec", *opts, "--", *cmd]
+
+    def popen_kwargs(self) -> dict:
+        return {"start_new_session": True}
+
+    def _events(self) -> dict:
+        if not self.cg:
+            return {}
+        return {"oom_kill": _read_kv(self.cg / "memory.events").get("oom_kill", 0),
+                "pids_max": _read_kv(self.cg / "pids.events").get("max", 0),
+                "cpu_usec": _read_kv(self.cg / "cpu.stat").get("usage_usec", 0)}
+
+    def _io(self) -> tuple:
+        rb = wb = 0
+        try:
+            for line in (self.cg / "io.stat").read_text().splitlines():
+                for kv in line.split()[1:]:
+                    k, _, v = kv.partition("=")
+                    if k == "rbytes":
+                        rb += int(v)
+                    elif k == "wbytes":
+                        wb += int(v)
+        except (OSError, ValueError, TypeError):
+            return None
+        return rb, wb
+
+    def snapshot(self, own_usage: bool = False) -> SimpleNamespace:
+        """
+        Compteurs à l'instant t (rusage des enfants + cgroup) ; cf. report(). own_usage :
+        en mode rlimits, fichier où le lanceur écrira le rusage de l'exécution (wrap(snap=)).
+        """
+        usage_file = None
+        if own_usage and not self.cg:
+            fd, usage_file = tempfile.mkstemp(prefix="piwi-usage-", suffix=".json")
+            os.close(fd)
+        return SimpleNamespace(ru=resource.getrusage(resource.RUSAGE_CHILDREN), ev=self._events(),
+                               io=self._io() if self.cg else None, t=time.perf_counter(),
+                               usage_file=usage_file)
+
+    def report(self, snap0: SimpleNamespace, rc: int, err: str, timed_out: bool = False) -> tuple:
+        """(usage, killed) depuis snap0 : pour les exécutions lancées hors de run() (ex. ShellPipe)."""
+        snap1 = self.snapshot()
+        if snap0.usage_file:
+            try:
+                snap1.own = json.loads(Path(snap0.usage_file).read_text() or "null")
+            except (OSError, ValueError):
+                pass
+            try:
+                os.unlink(snap0.usage_file)
+            except OSError:
+                pass
+        return (self.usage(snap0, snap1),
+                self.killed_by(rc, err, timed_out, snap0.ev, snap1.ev))
+
+    def run(self, args, *, shell: bool = False, cwd: str | None = None, env: dict | None = None) -> SimpleNamespace:
+        """Exécute (sortie capturée) sous limites. Retourne rc, out, err, killed, usage."""
+        snap0 = self.snapshot(own_usage=True)
+        p = subprocess.Popen(self.wrap(args, shell, snap0), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             text=True, cwd=cwd, env=env, **self.popen_kwargs())
+        timed_out = False
+        try:
+            out, err = p.communicate(timeout=self.lim.wall or None)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            out, err = p.communicate()
+        out, err, rc = out or "", err or "", p.returncode
+        usage, killed = self.report(snap0, rc, err, timed_out)
+        return SimpleNamespace(rc=rc, out=out, err=err, killed=killed, usage=usage)
+
+    def usage(self, s0: SimpleNamespace, s1: SimpleNamespace) -> dict:
+        before, after = s0.ru, s1.ru
+        own = getattr(s1, "own", None)  # rusage de cette exécution seule (lanceur, mode rlimits)
+        cpu = (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+        if own:
+            cpu = own["utime"] + own["stime"]
+        if s1.ev.get("cpu_usec"):
+            cpu = (s1.ev["cpu_usec"] - s0.ev.get("cpu_usec", 0)) / 1e6
+        peak_kb, scope = (own["maxrss_kb"], "run") if own else (after.ru_maxrss, "lifetime")
+        if self.cg:
+            try:
+                peak_kb, scope = int((self.cg / "memory.peak").read_text()) // 1024, "run"
+            except (OSError, ValueError):
+                pass
+        if s0.io is not None and s1.io is not None:
+            rb, wb = s1.io[0] - s0.io[0], s1.io[1] - s0.io[1]
+        elif own:
+            rb, wb = own["inblock"] * 512, own["oublock"] * 512
+        else:
+            rb = (after.ru_inblock - before.ru_inblock) * 512
+            wb = (after.ru_oublock - before.ru_oublock) * 512
+        return {"mode": self.mode, "wall_s": round(s1.t - s0.t, 3), "cpu_s": round(cpu, 3), "peak_rss_kb": peak_kb,
+                "peak_rss_scope": scope, "io_read_bytes": rb, "io_write_bytes": wb}
+
+    def killed_by(self, rc: int, err: str, timed_out: bool, ev0=None, ev1=None):
+        """Limite responsable de l'arrêt, ou None."""
+        if timed_out:
+            return "wall"
+        if rc == 0:
+            return None
+        ev0, ev1 = ev0 or {}, ev1 or {}
+        if ev1.get("oom_kill", 0) > ev0.get("oom_kill", 0):
+            return "memory"
+        if ev1.get("pids_max", 0) > ev0.get("pids_max", 0):
+            return "pids"
+        if self.lim.cpu and (rc in (-signal.SIGXCPU, 128 + signal.SIGXCPU) or "cpu time limit exceeded" in err.lower()):
+            return "cpu"
+        if not self.cg:
+            low = err.lower()
+            if self.lim.mem and ("memoryerror" in low or "cannot allocate memory" in low or "out of memory" in low):
+                return "memory"
+            if self.lim.pids and "fork" in low and "resource temporarily unavailable" in low:
+                return "pids"
+        return None
+
+    def close(self):
+        """Supprime le cgroup (laissé en place s'il reste des processus détachés)."""
+        if self.cg:
+            try:
+                self.cg.rmdir()
+            except OSError:
+                pass
+
+
+def _owner(p: Path) -> int:
+    try:
+        return p.stat().st_uid
+    except OSError:
+        return -1
+
+
+def _exec(argv: list):
+    """
+    Lanceur : exec [--cgroup DIR] [--cpu S] [--mem B] [--nproc N] [--usage FICHIER] -- cmd...
+    Cgroup puis rlimits posés ici (hérités par tout le script), puis exec de cmd ; avec
+    --usage, cmd est attendu (wait4) et son rusage écrit en JSON, code de sortie relayé.
+    """
+    opts = {}
+    while argv and argv[0] != "--":
+        opts[argv[0]], argv = argv[1], argv[2:]
+    cmd = argv[1:]
+    if "--cgroup" in opts:
+        _write(Path(opts["--cgroup"]) / "cgroup.procs", "0")
+    if "--cpu" in opts:
+        cpu = int(opts["--cpu"])
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+    if "--mem" in opts:
+        mem = int(opts["--mem"])
+        resource.setrlimit(resource.RLIMIT_AS, (mem, mem))
+    if "--nproc" in opts:
+        n = int(opts["--nproc"])
+        resource.setrlimit(resource.RLIMIT_NPROC, (n, n))
+    if "--usage" not in opts:
+        os.execvp(cmd[0], cmd)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.execvp(cmd[0], cmd)
+        except OSError as e:
+            os.write(2, f"{cmd[0]}: {e.strerror}\n".encode())
+        os._exit(127)
+    _, status, ru = os.wait4(pid, 0)
+    try:
+        Path(opts["--usage"]).write_text(json.dumps({
+            "utime": ru.ru_utime, "stime": ru.ru_stime, "maxrss_kb": ru.ru_maxrss,
+            "inblock": ru.ru_inblock, "oublock": ru.ru_oublock}))
+    except OSError:
+        pass
+    if os.WIFSIGNALED(status):
+        sig = os.WTERMSIG(status)
+        signal.signal(sig, signal.SIG_DFL)
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        os.kill(os.getpid(), sig)
+    sys.exit(os.waitstatus_to_exitcode(status))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["exec"] or "--" not in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+    _exec(sys.argv[2:])
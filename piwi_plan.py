@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Plans d'étapes (DAG) exécutés en parallèle (côté WSL)
+
+- Le modèle renvoie un plan JSON : {"steps": [{"id", "desc", "needs": [...],
+  "outputs": [...], "script": "..."}]} ; parse_plan() valide (ids uniques,
+  dépendances connues, pas de cycle) et ordonne topologiquement.
+- run_plan() : les étapes prêtes (dépendances réussies) partent sur un pool
+  borné (PIWI_PLAN_WORKERS) ; l'exécution d'une étape est fournie par le noyau
+  (verrous dpkg/pip de piwi_sched, correctifs locaux, limites). Une étape en
+  échec bloque ses seules dépendantes ; les étapes déjà réussies ne sont jamais
+  rejouées (done=... lors d'une reprise).
+- Rapport : chemin critique (durées mesurées) face à la somme en série.
+
+Env : PIWI_PLAN=1 (noyau), PIWI_PLAN_WORKERS (def=4)
+"""
+
+import os
+import re
+import json
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PLAN_RULES = """FORMAT DE SORTIE : un plan JSON (et rien d'autre), de la forme
+{"steps": [{"id": "dl_a", "desc": "...", "needs": [], "outputs": ["$DEST_DIR/a.zip"], "script": "bash ..."}]}
+- Découpe la tâche en étapes ; "needs" liste les ids dont l'étape dépend (fichiers produits,
+  paquets installés...). Des étapes sans lien entre elles seront exécutées EN PARALLÈLE.
+- "script" : du BASH autonome (set -euo pipefail implicite), mêmes règles I/O que ci-dessous.
+- "outputs" : fichiers ou dossiers produits par l'étape (peut être vide).
+"""
+
+_ID = re.compile(r"^[\w.-]{1,64}$")
+
+
+class PlanError(ValueError):
+    pass
+
+
+def workers_from_env() -> int:
+    try:
+        n = int(os.getenv("PIWI_PLAN_WORKERS", "") or 0)
+    except ValueError:
+        n = 0
+    return n if n > 0 else 4  # étapes surtout réseau/disque : indépendant du nombre de CPU
+
+
+def parse_plan(text: str) -> list:
+    """Liste d'étapes (SimpleNamespace id, desc, needs, outputs, script) en ordre topologique."""
+    a, b = (text or "").find("{"), (text or "").rfind("}")
+    if a < 0 or b <= a:
+        raise PlanError("aucun objet JSON")
+    try:
+        raw = json.loads(text[a:b + 1])
+    except ValueError as e:
+        raise PlanError(f"JSON invalide : {e}") from None
+    items = raw.get("steps") if isinstance(raw, dict) else None
+    if not isinstance(items, list) or not items:
+        raise PlanError("clé 'steps' absente ou vide")
+    steps = {}
+    for i, it in enumerate(items):
+        if not isinstance(it, dict) or not str(it.get("script", "")).strip():
+            raise PlanError(f"étape {i + 1} sans script")
+        sid = str(it.get("id") or f"s{i + 1}")
+        if not _ID.match(sid) or sid in steps:
+            raise PlanError(f"id d'étape invalide ou dupliqué : {sid!r}")
+        steps[sid] = SimpleNamespace(id=sid, desc=str(it.get("desc", "")), script=str(it["script"]).strip(),
+                                     needs=[str(n) for n in it.get("needs") or []],
+                                     outputs=[str(o) for o in it.get("outputs") or []])
+    for s in steps.values():
+        unknown = [n for n in s.needs if n not in steps]
+        if unknown:
+            raise PlanError(f"étape {s.id} : dépendance inconnue {unknown}")
+    order, state = [], {}
+
+    def visit(sid, path):
+        if state.get(sid) == 2:
+            return
+        if state.get(sid) == 1:
+            raise PlanError(f"cycle : {' -> '.join(path + [sid])}")
+        state[sid] = 1
+        for n in steps[sid].needs:
+            visit(n, path + [sid])
+        state[sid] = 2
+        order.append(steps[sid])
+
+    for sid in steps:
+        visit(sid, [])
+    return order
+
+
+def as_script(steps: list) -> str:
+    """Plan aplati en un script séquentiel (exec.sh, archivage, correction)."""
+    return "\n\n".join(f"# --- étape {s.id} : {s.desc}\n{s.script}" for s in steps)
+
+
+def dependents(steps: list, ids) -> set:
+    """ids + toutes leurs dépendantes (transitivement)."""
+    out, changed = set(ids), True
+    while changed:
+        changed = False
+        for s in steps:
+            if s.id not in out and any(n in out for n in s.needs):
+                out.add(s.id)
+                changed = True
+    return out
+
+
+def critical_path(steps: list, durations: dict) -> tuple:
+    """(durée, [ids]) du plus long chemin pondéré par les durées mesurées."""
+    best = {}
+    for s in steps:  # ordre topologique
+        prev = max((best[n] for n in s.needs if n in best), default=(0.0, []))
+        best[s.id] = (prev[0] + durations.get(s.id, 0.0), prev[1] + [s.id])
+    return max(best.values(), default=(0.0, []))
+
+
+def run_plan(steps: list, run_step, workers: int | None = None, done: dict | None = None,
+             log=None) -> SimpleNamespace:
+    """
+    run_step(step) -> (rc, out, err). done = {id: durée} des étapes déjà réussies (reprise).
+    Retourne ok, done, failed {id: (rc, out, err)}, blocked, durations (de ce passage), wall_s.
+    """
+    workers = workers or workers_from_env()
+    done = dict(done or {})
+    failed, blocked, durations = {}, set(), {}
+    pending = [s for s in steps if s.id not in done]
+    t0 = time.perf_counter()
+
+    def timed(s):
+        t = time.perf_counter()
+        rc, out, err = run_step(s)
+        return rc, out, err, time.perf_counter() - t
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        running = {}
+        while True:
+            for s in list(pending):
+                if any(n in failed or n in blocked for n in s.needs):
+                    blocked.add(s.id)
+                    pending.remove(s)
+                elif len(running) < workers and all(n in done for n in s.needs):
+                    if log:
+                        log(f"▶ Étape {s.id} : {s.desc}")
+                    running[ex.submit(timed, s)] = s
+                    pending.remove(s)
+            if not running:
+                break
+            fin, _ = wait(running, return_when=FIRST_COMPLETED)
+            for f in fin:
+                s = running.pop(f)
+                try:
+                    rc, out, err, dt = f.result()
+                except Exception as e:
+                    rc, out, err, dt = 1, "", f"{e}\n", 0.0
+                durations[s.id] = round(dt, 3)
+                if rc == 0:
+                    done[s.id] = round(dt, 3)
+                    if log:
+                        log(f"✔ Étape {s.id} terminée ({dt:.2f}s)")
+                else:
+                    failed[s.id] = (rc, out, err)
+                    if log:
+                        log(f"✖ Étape {s.id} en échec (rc={rc}, {dt:.2f}s)")
+    blocked |= {s.id for s in pending}
+    return SimpleNamespace(ok=not failed and not blocked, done=done, failed=failed, blocked=sorted(blocked),
+                           durations=durations, wall_s=round(time.perf_counter() - t0, 3))
+
+
+def report(steps: list, all_durations: dict, wall_s: float, workers: int) -> dict:
+    serial = round(sum(all_durations.values()), 3)
+    cp, ids = critical_path(steps, all_durations)
+    return {"steps": len(steps), "workers": workers, "wall_s": round(wall_s, 3), "serial_s": serial,
+            "critical_path_s": round(cp, 3), "critical_path": ids,
+            "speedup": round(serial / wall_s, 2) if wall_s else None}
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Préchargement des dépendances annoncées en tête de script (côté WSL)
+
+- Le prompt demande au modèle un court en-tête (commentaires bash, donc script
+  toujours valide) AVANT le code :
+      # piwi-apt: paquet ...    # piwi-pip: paquet ...    # piwi-url: https://...    # piwi-end
+- HeaderParser lit la réponse au fil du flux : dès l'en-tête complet, Prefetcher
+  lance en arrière-plan, pendant que la suite du script est générée :
+    apt  apt-get install --download-only (root ou sudo ; sous le verrou "dpkg" de
+         piwi_sched : l'installation du script passe après, archives déjà locales)
+    pip  pip download dans le wheelhouse partagé (~/.cache/piwi/wheelhouse, aussi
+         celui de piwi-venv ; PIP_FIND_LINKS le propose au script)
+    url  cache de piwi-fetch (piwi_fetch.warm)
+- report() compare au script exécuté : hits (utilisé et préchargé), misses
+  (utilisé mais non annoncé ou en échec), unused (annoncé mais pas utilisé),
+  late (utilisé, mais préchargement pas fini au début de l'exécution) -> meta.json "prefetch"
+  et ~/.cache/piwi/prefetch.jsonl.
+
+Usage : python3 piwi_prefetch.py stats
+Env : PIWI_PREFETCH=0 (désactive), PIWI_CACHE_DIR (def=~/.cache/piwi)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import nullcontext
+
+try:
+    import piwi_fetch as FE
+except Exception:
+    FE = None
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi")
+WHEELHOUSE = CACHE / "wheelhouse"  # partagé avec piwi-venv
+LOG = CACHE / "prefetch.jsonl"
+MAX_ITEMS = 40
+
+HEADER_RULES = """EN-TÊTE OBLIGATOIRE, AVANT le code (commentaires bash) : dépendances que le script installera
+ou téléchargera (ligne vide après ":" s'il n'y en a pas), puis "# piwi-end" :
+# piwi-apt: paquet1 paquet2
+# piwi-pip: paquet1 paquet2==1.0
+# piwi-url: https://exemple.org/fichier.tar.gz
+# piwi-end
+"""
+
+_HEADER = re.compile(r"^\s*#\s*piwi-(apt|pip|url|end)\b\s*:?\s*(.*)$", re.I)
+_VALID = {
+    "apt": re.compile(r"^[a-z0-9][a-z0-9+.-]*(?::[a-z0-9-]+)?(?:=[\w.:~+-]+)?$"),
+    "pip": re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*(?:\[[\w,.-]+\])?(?:(?:==|>=|<=|~=|!=|>|<)[\w.*+!-]+)?$"),
+    "url": re.compile(r"^https?://[^\s'\"<>]+$"),
+}
+_RX_APT = re.compile(r"\b(?:apt-get|apt|aptitude)\s+(?:-\S+\s+)*install\b([^\n;&|]*)")
+_RX_PIP = re.compile(r"(?:\bpip3?(?:\.\d+)?|\bpython3?(?:\.\d+)?\s+-m\s+pip)\s+install\b([^\n;&|]*)")
+_RX_URL = re.compile(r"https?://[^\s'\"<>;|&)]+")
+
+
+def enabled() -> bool:
+    return os.getenv("PIWI_PREFETCH", "1") != "0"
+
+
+def _norm(kind: str, item: str) -> str:
+    """Nom comparable : apt sans version, pip PEP 503 sans extras ni version."""
+    if kind == "apt":
+        return item.split("=", 1)[0].split(":", 1)[0].lower()
+    if kind == "pip":
+        return re.sub(r"[-_.]+", "-", re.split(r"[\[=<>!~]", item, 1)[0]).lower()
+    return item
+
+
+def used_deps(script: str) -> dict:
+    """Paquets apt/pip (noms normalisés) et URLs qu'un script installe ou télécharge."""
+    used = {"apt": set(), "pip": set(), "url": set(_RX_URL.findall(script))}
+    code = "\n".join(l for l in script.splitlines() if not l.lstrip().startswith("#"))
+    for kind, rx in (("apt", _RX_APT), ("pip", _RX_PIP)):
+        for m in rx.finditer(code):
+            used[kind] |= {_norm(kind, w) for w in m.group(1).split()
+                           if not w.startswith(("-", "$", "/", ".")) and _VALID[kind].match(w)}
+    return used
+
+
+class HeaderParser:
+    """En-tête piwi-* lu au fil du flux ; feed() renvoie les dépendances une seule fois."""
+
+    def __init__(self):
+        self.buf = ""
+        self.deps = {"apt": [], "pip": [], "url": []}
+        self.done = False
+        self.seen = False
+
+    def feed(self, text: str):
+        if self.done:
+            return None
+        self.buf += text
+        while "\n" in self.buf and not self.done:
+            line, self.buf = self.buf.split("\n", 1)
+            self._line(line.strip())
+        if not self.done and len(self.buf) > 4000:
+            self.done = True
+        return self._result() if self.done else None
+
+    def close(self):
+        if self.done:
+            return None
+        if self.buf.strip():
+            self._line(self.buf.strip())
+        self.done = True
+        return self._result()
+
+    def _line(self, line: str):
+        if not line or line.startswith("```") or line.startswith("#!"):
+            return
+        m = _HEADER.match(line)
+        if not m:
+            # première ligne hors en-tête : le code commence
+            self.done = self.seen or not line.startswith("#")
+            return
+        self.seen = True
+        kind = m.group(1).lower()
+        if kind == "end":
+            self.done = True
+            return
+        for item in m.group(2).replace(",", " ").split():
+            if _VALID[kind].match(item) and item not in self.deps[kind] and len(self.deps[kind]) < MAX_ITEMS:
+                self.deps[kind].append(item)
+
+    def _result(self):
+        return self.deps if any(self.deps.values()) else None
+
+
+class Prefetcher:
+    """
+    Téléchargements en arrière-plan. run_root(cmd) -> rc | None (None : pas de droits root) ;
+    apt_lock() -> gestionnaire de contexte tenant le verrou dpkg.
+    """
+
+    def __init__(self, run_root, apt_lock=None, log=None):
+        self.run_root = run_root
+        self.apt_lock = apt_lock or nullcontext
+        self.log = log or (lambda _m: None)
+        self.deps = {"apt": [], "pip": [], "url": []}
+        self.results: dict = {}
+        self.threads: list = []
+        self.t0 = time.perf_counter()
+        self.t_header = None
+
+    def start(self, deps: dict):
+        self.deps = deps
+        self.t_header = time.perf_counter()
+        jobs = [(k, f) for k, f in (("apt", self._apt), ("pip", self._pip), ("url", self._url)) if deps.get(k)]
+        if not jobs:
+            return
+        self.log("📦 Préchargement : " + " | ".join(f"{k} {' '.join(deps[k])}" for k, _ in jobs))
+        for kind, fn in jobs:
+            t = threading.Thread(target=self._timed, args=(kind, fn), daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def _timed(self, kind: str, fn):
+        t = time.perf_counter()
+        try:
+            ok, detail = fn(self.deps[kind])
+        except Exception as e:
+            ok, detail = {}, str(e)[:200]
+        self.results[kind] = {"ok": ok, "detail": detail, "seconds": round(time.perf_counter() - t, 3),
+                              "end": time.perf_counter()}
+
+    def _apt(self, pkgs: list):
+        def download(names):
+            return self.run_root("DEBIAN_FRONTEND=noninteractive apt-get install -y -q --download-only "
+                                 + " ".join(shlex.quote(p) for p in names))
+        with self.apt_lock():
+            rc = download(pkgs)
+            if rc is None:
+                return set(), "droits root indisponibles"
+            if rc == 0:
+                return set(pkgs), ""
+            # un paquet inconnu fait tout échouer : un par un
+            return {p for p in pkgs if download([p]) == 0}, f"rc={rc}"
+
+    def _pip(self, pkgs: list):
+        WHEELHOUSE.mkdir(parents=True, exist_ok=True)
+
+        def download(names, *opts):
+            return subprocess.run(["python3", "-m", "pip", "download", "-q", "--disable-pip-version-check",
+                                   "-d", str(WHEELHOUSE), "--find-links", str(WHEELHOUSE), *opts, *names],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                  env=dict(os.environ, PIP_NO_INPUT="1"))
+        cp = download(pkgs)
+        if cp.returncode == 0:
+            return set(pkgs), ""
+        last = (cp.stderr or "").strip().splitlines()[-1:]
+        return {p for p in pkgs if download([p]).returncode == 0}, (last[0][:200] if last else f"rc={cp.returncode}")
+
+    def _url(self, urls: list):
+        if FE is None:
+            return {}, "piwi_fetch indisponible"
+        ok, notes = set(), []
+        for u in urls:
+            try:
+                how = FE.warm(u)
+            except Exception as e:
+                notes.append(f"{u}: {e}"[:120])
+                continue
+            if how != "uncacheable":
+                ok.add(u)
+            else:
+                notes.append(f"{u}: sans validateur")
+        return ok, "; ".join(notes)
+
+    def env(self) -> dict:
+        """Variables pour le script : wheelhouse proposé à pip si des wheels y ont été préchargées."""
+        return {"PIP_FIND_LINKS": str(WHEELHOUSE)} if self.deps.get("pip") else {}
+
+    def report(self, script: str, exec_start: float | None = None) -> dict:
+        used = used_deps(script)
+        rep = {"header_s": round(self.t_header - self.t0, 3) if self.t_header else None,
+               "hits": 0, "misses": 0, "unused": 0, "late": 0}
+        for kind in ("apt", "pip", "url"):
+            res = self.results.get(kind)
+            fetched = {_norm(kind, p) for p in (res or {}).get("ok") or ()}
+            declared = {_norm(kind, p) for p in self.deps.get(kind) or ()}
+            late = bool(used[kind] & declared) and (res is None or (exec_start is not None and res["end"] > exec_start))
+            entry = {"declared": sorted(declared), "fetched": sorted(fetched), "used": sorted(used[kind]),
+                     "hits": len(used[kind] & fetched), "misses": len(used[kind] - fetched),
+                     "unused": len(declared - used[kind]), "late": late}
+            if res:
+                entry.update(seconds=res["seconds"], detail=res["detail"])
+            for k in ("hits", "misses", "unused"):
+                rep[k] += entry[k]
+            rep["late"] += 1 if late else 0
+            if declared or used[kind]:
+                rep[kind] = entry
+        n = rep["hits"] + rep["misses"]
+        rep["hit_rate"] = round(rep["hits"] / n, 3) if n else None
+        return rep
+
+
+def record(rep: dict):
+    rec = {"ts": round(time.time(), 3), **{k: rep[k] for k in ("hits", "misses", "unused", "late", "header_s")}}
+    try:
+        CACHE.mkdir(parents=True, exist_ok=True)
+        with open(LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+    except OSError:
+        pass
+
+
+def summary() -> dict:
+    try:
+        recs = [json.loads(l) for l in LOG.read_text(encoding="utf-8").splitlines()[-2000:] if l.strip()]
+    except (OSError, ValueError):
+        recs = []
+    hits, misses = sum(r["hits"] for r in recs), sum(r["misses"] for r in recs)
+    return {"requests": len(recs), "hits": hits, "misses": misses,
+            "unused": sum(r["unused"] for r in recs), "late": sum(r["late"] for r in recs),
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["stats"]:
+        print(__doc__)
+        sys.exit(1)
+    print(json.dumps(summary(), indent=2))
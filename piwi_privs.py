@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Analyse statique des privilèges d'un script généré (côté WSL)
+
+- Avant la première exécution, le script est parcouru instruction par instruction
+  (commentaires et corps de heredoc ignorés, préfixes sudo/env/VAR=... retirés) :
+    paquets   apt/apt-get/aptitude install|remove|update..., dpkg -i|-r|--configure,
+              snap install, add-apt-repository, apt-key
+    services  systemctl start|enable|daemon-reload... (hors --user), service X start
+    comptes   useradd, usermod, groupadd, chpasswd, adduser...
+    système   mount <cible>, modprobe, sysctl -w, update-alternatives --set..., locale-gen,
+              ldconfig (hors -p), timedatectl set-*, chown/chgrp sur un chemin système...
+    écritures redirection ou tee vers /etc, /usr, /opt, /var, /lib, /boot, /root... ;
+              cp/mv/install/ln vers ces chemins ; mkdir/rm/touch/chmod/sed -i dessus
+    sudo      sudo explicite (sans mot de passe sur le terminal, il échouerait)
+- Le noyau lance alors le script sous sudo dès le départ (root ou PIWI_SUDO_PASSWORD)
+  au lieu d'une exécution vouée à l'échec suivie d'une relance complète. Mot de passe
+  fourni par askpass() (sudo -A) : le stdin du script reste le pty de piwi_pty.
+- Décisions journalisées (log.txt, meta.json "privilege") et ~/.cache/piwi/privs.jsonl :
+  lancements sous sudo, relances évitées (opération réservée à root, pas seulement un
+  sudo explicite) et "missed" (analyse négative mais relance sudo quand même).
+
+Usage : python3 piwi_privs.py check <script.sh>   (raisons trouvées)
+        python3 piwi_privs.py stats
+Env : PIWI_PRIV_PREFLIGHT=0 (désactive), PIWI_CACHE_DIR (def=~/.cache/piwi)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shlex
+from pathlib import Path
+from types import SimpleNamespace
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi")
+LOG = CACHE / "privs.jsonl"
+
+SYSTEM_PATHS = ("/etc", "/usr", "/opt", "/var", "/lib", "/lib32", "/lib64", "/bin", "/sbin",
+                "/boot", "/srv", "/root")
+USER_PATHS = ("/var/tmp", "/tmp", "/dev/null", "/dev/stdout", "/dev/stderr")
+
+# commande -> sous-commandes qui modifient le système (None : toutes)
+_ROOT_CMDS = {
+    "apt-get": {"install", "reinstall", "remove", "purge", "update", "upgrade", "dist-upgrade",
+                "full-upgrade", "autoremove", "autoclean", "clean", "build-dep"},
+    "apt": {"install", "reinstall", "remove", "purge", "update", "upgrade", "full-upgrade",
+            "dist-upgrade", "autoremove"},
+    "aptitude": {"install", "reinstall", "remove", "purge", "update", "upgrade", "safe-upgrade",
+                 "full-upgrade"},
+    "dpkg": {"-i", "--install", "-r", "--remove", "-P", "--purge", "--configure", "--unpack",
+             "--add-architecture"},
+    "snap": {"install", "remove", "refresh"},
+    "systemctl": {"start", "stop", "restart", "reload", "enable", "disable", "mask", "unmask",
+                  "daemon-reload", "set-default", "edit"},
+    "apt-mark": {"hold", "unhold", "auto", "manual", "minimize-manual", "install", "deinstall", "purge"},
+    "update-alternatives": {"--install", "--remove", "--remove-all", "--auto", "--set", "--config", "--all"},
+    "timedatectl": {"set-time", "set-timezone", "set-local-rtc", "set-ntp"},
+    "hostnamectl": {"set-hostname", "set-icon-name", "set-chassis", "set-deployment", "set-location"},
+    "add-apt-repository": None, "apt-key": None,
+    "useradd": None, "usermod": None, "userdel": None, "groupadd": None, "groupmod": None,
+    "groupdel": None, "adduser": None, "addgroup": None, "deluser": None, "chpasswd": None,
+    "modprobe": None, "insmod": None, "rmmod": None,
+    "locale-gen": None, "update-locale": None, "update-ca-certificates": None, "visudo": None,
+}
+# sans argument ni option d'écriture : simple lecture (liste des montages, cache ld.so)
+_MOUNT_ALL = {"-a", "--all"}
+_LDCONFIG_READ = {"-p", "--print-cache", "-V", "--version", "-?", "--help", "--usage"}
+_WRAPPERS = {"env", "nohup", "time", "exec", "command", "nice", "ionice", "stdbuf", "timeout", "xargs"}
+_SUDO = {"sudo", "$sudo", "${sudo}", "$SUDO", "${SUDO}", "doas"}
+_WRITE_LAST = {"cp", "mv", "install", "ln", "rsync"}      # destination = dernier argument
+_WRITE_ANY = {"mkdir", "rm", "rmdir", "touch", "chmod", "chown", "chgrp", "truncate", "unlink"}
+
+_SEP = re.compile(r"&&|\|\||[;&|]")
+_REDIR = re.compile(r"(?:^|[^<>&\d])\d?>>?\|?\s*([\"']?)(/[^\s\"';|&)]+)\1")
+_HEREDOC = re.compile(r"<<-?\s*([\"']?)([A-Za-z_][\w-]*)\1")
+_ASSIGN = re.compile(r"^[A-Za-z_]\w*=")
+EXPLICIT = "sudo explicite"  # seul motif qui n'échoue pas forcément sans root (sudo en cache, NOPASSWD)
+
+
+def enabled() -> bool:
+    return os.getenv("PIWI_PRIV_PREFLIGHT", "1") != "0"
+
+
+def _system_path(p: str) -> bool:
+    p = p.strip("\"'")
+    if not p.startswith("/") or p.startswith(USER_PATHS):
+        return False
+    return any(p == s or p.startswith(s + "/") for s in SYSTEM_PATHS)
+
+
+def _logical_lines(script: str):
+    """Lignes de code (continuations jointes) hors commentaires et corps de heredoc."""
+    lines, buf, end = [], "", None
+    for raw in script.splitlines():
+        if end is not None:
+            if raw.strip() == end:
+                end = None
+            continue
+        if buf:
+            raw = buf + " " + raw.lstrip()
+            buf = ""
+        if raw.rstrip().endswith("\\"):
+            buf = raw.rstrip()[:-1]
+            continue
+        if raw.lstrip().startswith("#") or not raw.strip():
+            continue
+        m = _HEREDOC.search(raw)
+        if m:
+            end = m.group(2)
+        lines.append(raw)
+    if buf:
+        lines.append(buf)
+    return lines
+
+
+def _words(segment: str) -> list:
+    try:
+        return shlex.split(segment, comments=True)
+    except ValueError:
+        return segment.split()
+
+
+def _command(words: list):
+    """(commande, arguments, sudo explicite) une fois préfixes et affectations retirés."""
+    sudo = False
+    i = 0
+    while i < len(words):
+        w = words[i]
+        if w in _SUDO:
+            sudo = True
+            i += 1
+            while i < len(words) and words[i].startswith("-"):  # sudo -E, -S, -u root...
+                i += 2 if words[i] in ("-u", "-g", "-p") else 1
+            continue
+        if _ASSIGN.match(w) or w in _WRAPPERS or (w.startswith("-") and i and words[i - 1] in _WRAPPERS):
+            i += 1
+            continue
+        break
+    if i >= len(words):
+        return None, [], sudo
+    return os.path.basename(words[i]), words[i + 1:], sudo
+
+
+def _segment(seg: str) -> list:
+    reasons = [f"écriture {m.group(2)}" for m in _REDIR.finditer(seg) if _system_path(m.group(2))]
+    cmd, args, sudo = _command(_words(seg))
+    if sudo:
+        reasons.append(EXPLICIT)
+    if cmd is None:
+        return reasons
+    if cmd in _ROOT_CMDS:
+        subs = _ROOT_CMDS[cmd]
+        hit = None if subs is None else next((a for a in args if a in subs), None)
+        if cmd == "systemctl" and "--user" in args:
+            pass
+        elif subs is None:
+            reasons.append(cmd)
+        elif hit:
+            reasons.append(f"{cmd} {hit}")
+    elif cmd == "service" and len(args) >= 2:
+        reasons.append(f"service {args[1]}")
+    elif cmd in ("mount", "umount"):
+        if any(not a.startswith("-") or a in _MOUNT_ALL for a in args):
+            reasons.append(cmd)
+    elif cmd == "ldconfig":
+        if not any(a in _LDCONFIG_READ for a in args):
+            reasons.append(cmd)
+    elif cmd == "sysctl" and any(a in ("-w", "-p", "--write", "--load", "--system") for a in args):
+        reasons.append("sysctl -w")
+    elif cmd == "tee":
+        reasons += [f"écriture {a}" for a in args if _system_path(a)]
+    elif cmd in _WRITE_LAST:
+        paths = [a for a in args if not a.startswith("-")]
+        if paths and _system_path(paths[-1]):
+            reasons.append(f"{cmd} -> {paths[-1]}")
+    elif cmd in _WRITE_ANY or (cmd == "sed" and any(a.startswith(("-i", "--in-place")) for a in args)):
+        reasons += [f"{cmd} {a}" for a in args if _system_path(a)]
+    return reasons
+
+
+def analyze(script: str) -> SimpleNamespace:
+    """
+    need_root : le script a besoin de root ; reasons : instructions en cause (dédoublonnées) ;
+    root_only : au moins une opération qui échoue à coup sûr sans root.
+    """
+    reasons = []
+    for line in _logical_lines(script):
+        for seg in _SEP.split(line):
+            if seg.strip():
+                for r in _segment(seg.strip(" \t({")):
+                    if r not in reasons:
+                        reasons.append(r)
+    return SimpleNamespace(need_root=bool(reasons), reasons=reasons[:20],
+                           root_only=any(r != EXPLICIT for r in reasons))
+
+
+def askpass() -> str:
+    """
+    Programme SUDO_ASKPASS (sudo -A) : écrit PIWI_SUDO_PASSWORD, lu dans l'environnement
+    de sudo lui-même (env_reset : jamais transmis au script). Dans le cache de
+    l'utilisateur, pas dans /tmp où un autre compte pourrait le préparer.
+    """
+    p = CACHE / "askpass.sh"
+    body = '#!/bin/sh\nprintf \'%s\\n\' "$PIWI_SUDO_PASSWORD"\n'
+    try:
+        if p.read_text(encoding="utf-8") == body and p.stat().st_mode & 0o777 == 0o700:
+            return str(p)
+    except OSError:
+        pass
+    CACHE.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f".askpass.{os.getpid()}")
+    tmp.write_text(body, encoding="utf-8")
+    tmp.chmod(0o700)
+    os.replace(tmp, p)
+    return str(p)
+
+
+def record(rec: dict):
+    rec = {"ts": round(time.time(), 3), **rec}
+    try:
+        CACHE.mkdir(parents=True, exist_ok=True)
+        with open(LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def summary() -> dict:
+    try:
+        recs = [json.loads(l) for l in LOG.read_text(encoding="utf-8").splitlines()[-2000:] if l.strip()]
+    except (OSError, ValueError):
+        recs = []
+    decisions: dict = {}
+    for r in recs:
+        decisions[r["decision"]] = decisions.get(r["decision"], 0) + 1
+    return {"runs": len(recs), "decisions": decisions,
+            "started_under_sudo": sum(1 for r in recs if r.get("started_under_sudo")),
+            "avoided_reruns": sum(1 for r in recs if r.get("avoided_rerun")),
+            "missed": sum(1 for r in recs if r.get("missed"))}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["stats"]:
+        print(json.dumps(summary(), indent=2))
+    elif sys.argv[1:2] == ["check"] and len(sys.argv) == 3:
+        a = analyze(Path(sys.argv[2]).read_text(encoding="utf-8"))
+        print(json.dumps(vars(a), indent=2, ensure_ascii=False))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Profilage opt-in d'une requête (cProfile / tracemalloc / échantillonneur)
+
+Activé par l'environnement, sans effet sinon :
+  PIWI_PROFILE=full      cProfile + tracemalloc + échantillonneur de piles
+  PIWI_PROFILE=sample    échantillonneur seul (faible coût, utilisable en prod)
+  PIWI_PROFILE_RATE      fraction des requêtes profilées (def=1.0, ex. 0.05)
+  PIWI_PROFILE_INTERVAL_MS  période d'échantillonnage (def=10 en full, 20 en sample)
+  PIWI_PROFILE_ALLOC=1   active tracemalloc aussi en mode sample
+  PIWI_PROFILE_FRAMES    profondeur des traces tracemalloc (def=10)
+
+Écrit dans REQ_INTERNAL :
+  profile.pstats      (full)     -> python3 -m pstats profile.pstats
+  flame.collapsed.txt            -> piles repliées "a;b;c N" (flamegraph.pl, speedscope)
+  alloc_top.txt       (si alloc) -> top allocations + pic mémoire
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+from pathlib import Path
+from typing import Optional
+
+MODES = {"1": "full", "full": "full", "cprofile": "full", "sample": "sample"}
+
+
+class StackSampler(threading.Thread):
+    """Échantillonne périodiquement les piles de tous les threads (hors lui-même)."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="piwi-profile-sampler", daemon=True)
+        self.interval = interval
+        self.counts: dict = {}
+        self.samples = 0
+        self._stop_evt = threading.Event()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        parts = []
+        while frame is not None:
+            co = frame.f_code
+            parts.append(f"{os.path.basename(co.co_filename)}:{co.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_evt.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                key = self._collapse(frame)
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_evt.set()
+        self.join(timeout=1.0)
+
+    def write(self, path: Path):
+        lines = [f"{stack} {n}" for stack, n in sorted(self.counts.items(), key=lambda kv: -kv[1])]
+        path.write_text("\n".join(lines) + ("\n" if lines else ""), encoding="utf-8")
+
+
+class Profiler:
+    def __init__(self, mode: str, interval: float, alloc: bool, frames: int):
+        self.mode = mode
+        self.alloc = alloc
+        self.t0 = time.perf_counter()
+        self.cprof = None
+        if mode == "full":
+            import cProfile
+            self.cprof = cProfile.Profile()
+        if alloc:
+            import tracemalloc
+            tracemalloc.start(frames)
+        self.sampler = StackSampler(interval)
+        self.sampler.start()
+        if self.cprof:
+            self.cprof.enable()
+
+    def stop(self, out_dir: Path):
+        """Arrête tout et écrit les rapports dans out_dir (erreurs ignorées : jamais bloquant)."""
+        if self.cprof:
+            self.cprof.disable()
+        self.sampler.stop()
+        wall = time.perf_counter() - self.t0
+        try:
+            out_dir.mkdir(parents=True, exist_ok=True)
+            if self.alloc:  # en premier : l'écriture des autres rapports alloue aussi
+                self._write_alloc(out_dir / "alloc_top.txt")
+            if self.cprof:
+                self.cprof.dump_stats(str(out_dir / "profile.pstats"))
+            self.sampler.write(out_dir / "flame.collapsed.txt")
+            print(f"[INFO] Profil ({self.mode}, {wall:.2f}s, {self.sampler.samples} échantillons) -> {out_dir}",
+                  file=sys.stderr, flush=True)
+        except Exception as e:
+            print(f"[WARN] profil non écrit : {e}", file=sys.stderr, flush=True)
+
+    @staticmethod
+    def _write_alloc(path: Path, top: int = 30):
+        import tracemalloc
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        out = [f"courant: {cur / 1024:.1f} KiB | pic: {peak / 1024:.1f} KiB", ""]
+        for st in snap.statistics("traceback")[:top]:
+            out.append(f"{st.size / 1024:.1f} KiB en {st.count} blocs")
+            out.extend("    " + ln for ln in st.traceback.format(limit=5))
+        path.write_text("\n".join(out) + "\n", encoding="utf-8")
+
+
+def maybe_start(env=None) -> Optional[Profiler]:
+    """Démarre un Profiler si PIWI_PROFILE le demande (et si le tirage PIWI_PROFILE_RATE l'accepte)."""
+    env = os.environ if env is None else env
+    mode = MODES.get(env.get("PIWI_PROFILE", "").strip().lower())
+    if not mode:
+        return None
+    try:
+        rate = float(env.get("PIWI_PROFILE_RATE", "1") or 1)
+    except ValueError:
+        rate = 1.0
+    if rate < 1.0 and random.random() >= rate:
+        return None
+    try:
+        interval = float(env.get("PIWI_PROFILE_INTERVAL_MS", "") or (10 if mode == "full" else 20)) / 1000.0
+        frames = int(env.get("PIWI_PROFILE_FRAMES", "10") or 10)
+    except ValueError:
+        interval, frames = 0.02, 10
+    alloc = mode == "full" or env.get("PIWI_PROFILE_ALLOC", "") == "1"
+    return Profiler(mode, max(interval, 0.001), alloc, frames)
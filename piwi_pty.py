@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Exécution sous pseudo-terminal et détection des invites interactives (côté WSL)
+
+Un script généré peut rester bloqué indéfiniment sur une invite (apt "[Y/n]",
+conffile dpkg, `read`, identifiants git, mot de passe sudo/ssh...). run() :
+- donne au script un pty comme stdin et terminal de contrôle (/dev/tty), stdout
+  et stderr restant des tubes séparés ;
+- pose des valeurs non interactives par défaut (DEBIAN_FRONTEND=noninteractive,
+  GIT_TERMINAL_PROMPT=0, PIP_NO_INPUT=1, NEEDRESTART_MODE=a) si absentes ;
+- après PIWI_PROMPT_IDLE secondes sans sortie, regarde si un processus du script
+  est bloqué en lecture sur le pty (/proc/<pid>/syscall) et compare la fin de la
+  sortie à une table de règles : réponse sûre envoyée (valeur par défaut,
+  « ne pas écraser »...) ou, pour les secrets et invites inconnues, arrêt
+  immédiat du script avec un diagnostic précis ("[piwi] échec : bloqué sur
+  une invite ...") repris par la correction. Processus non inspectable (sous
+  sudo) : arrêt uniquement sur une règle reconnue, sinon simple attente.
+- Temps perdu sur des invites (attente avant réponse ou arrêt) : prompts.wait_s.
+
+Règles supplémentaires (prioritaires) : fichier JSON PIWI_PROMPT_RULES
+(def=~/.cache/piwi/prompt_rules.json), liste de {"name", "pattern", "answer"} ;
+"answer": null = arrêter le script. "\\n" = valider la valeur par défaut.
+
+Env : PIWI_PTY=0 (désactive), PIWI_PROMPT_IDLE (s, def=4), PIWI_PROMPT_RULES
+"""
+
+import os
+import re
+import sys
+import pty
+import json
+import time
+import codecs
+import signal
+import platform
+import selectors
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi")
+FAIL_MARK = "[piwi] échec"  # cf. piwi_errctx.FAIL_MARK
+NONINTERACTIVE = {"DEBIAN_FRONTEND": "noninteractive", "GIT_TERMINAL_PROMPT": "0",
+                  "PIP_NO_INPUT": "1", "NEEDRESTART_MODE": "a", "APT_LISTCHANGES_FRONTEND": "none"}
+MAX_ANSWERS = 20  # par règle : au-delà, le script boucle sur l'invite
+_ANSI = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)")
+# read(2), pread64, readv : x86_64 / aarch64
+_READ_SYSCALLS = {"x86_64": {0, 17, 19}, "aarch64": {63, 65, 67}}.get(platform.machine(), {0})
+_DEV_TTY = os.makedev(5, 0)  # /dev/tty : le terminal de contrôle, donc notre pty
+# le pty devient /dev/tty du script : fait par un court lanceur plutôt qu'un preexec_fn
+# (risque d'interblocage quand le noyau a d'autres threads, ex. étapes de plan en parallèle)
+_CTTY = "import fcntl, os, sys, termios; fcntl.ioctl(0, termios.TIOCSCTTY, 0); os.execvp(sys.argv[1], sys.argv[1:])"
+
+
+def _rule(name, label, patterns, answer):
+    return SimpleNamespace(name=name, label=label, answer=answer,
+                           patterns=[re.compile(p, re.I | re.M) for p in patterns])
+
+
+# Ordre = priorité. answer=None : pas de réponse sûre -> arrêt avec diagnostic.
+RULES = [
+    _rule("secret", "mot de passe / phrase secrète",
+          [r"\[sudo\] (?:password|mot de passe)", r"^\s*(?:password|passphrase|mot de passe)[^\n]*:\s*$",
+           r"enter (?:pass ?phrase|password)", r"password for ['\w@.-]+:\s*$"], None),
+    _rule("git_credentials", "identifiants git/https",
+          [r"Username for '?https?://", r"Password for '?https?://"], None),
+    _rule("ssh_hostkey", "clé d'hôte SSH inconnue",
+          [r"Are you sure you want to continue connecting \(yes/no"], None),
+    _rule("dpkg_conffile", "fichier de configuration modifié (dpkg) : garder la version installée",
+          [r"\(Y/I/N/O/D/Z\) \[default=N\] \?\s*$"], "N\n"),
+    _rule("apt_continue", "confirmation apt",
+          [r"Do you want to continue\? \[Y/n\]\s*$", r"Voulez-vous continuer \? \[O/n\]\s*$"], "Y\n"),
+    _rule("proceed", "confirmation (pip/conda)",
+          [r"Proceed \(\[?y\]?/n\)\?\s*$", r"Proceed \(Y/n\)\?\s*$"], "y\n"),
+    _rule("overwrite", "écrasement de fichier : ne pas écraser",
+          [r"replace .+\? \[y\]es, \[n\]o, \[A\]ll, \[N\]one, \[r\]ename:\s*$", r"overwrite '.+'\?\s*$",
+           r"(?:Overwrite|Replace)\b.*\? *(?:\[y/N\]|\(y/n\))\s*$"], "n\n"),
+    _rule("press_enter", "appui sur Entrée",
+          [r"press \[?(?:enter|return)\]?", r"appuyez sur \[?entrée", r"press any key"], "\n"),
+    _rule("default_choice", "question avec valeur par défaut",
+          [r"\[(?:Y/n|y/N|O/n|o/N)\]\s*$", r"\((?:Y/n|y/N)\)\s*\??\s*$", r"\[default[=:][^\]]*\]\s*[:?]?\s*$"], "\n"),
+]
+
+
+def load_rules() -> list:
+    """Règles utilisateur (PIWI_PROMPT_RULES) puis règles intégrées."""
+    p = Path(os.getenv("PIWI_PROMPT_RULES", "") or CACHE / "prompt_rules.json")
+    extra = []
+    try:
+        for r in json.loads(p.read_text(encoding="utf-8")):
+            extra.append(_rule(str(r["name"]), str(r.get("label") or r["name"]), [r["pattern"]], r.get("answer")))
+    except (OSError, ValueError, KeyError, TypeError, re.error):
+        pass
+    return extra + RULES
+
+
+def enabled() -> bool:
+    return os.getenv("PIWI_PTY", "1") != "0"
+
+
+def idle_from_env() -> float:
+    try:
+        return max(0.5, float(os.getenv("PIWI_PROMPT_IDLE", "") or 4))
+    except ValueError:
+        return 4.0
+
+
+def tty_readers(sid: int, rdev: int) -> tuple:
+    """
+    Processus de la session `sid` bloqués en lecture sur le pty (rdev).
+    Retourne ([(pid, cmdline)], inconnu) ; inconnu=True si un processus n'a pas pu
+    être inspecté (ex. sous sudo).
+    """
+    readers, unknown = [], False
+    for d in Path("/proc").iterdir():
+        if not d.name.isdigit():
+            continue
+        try:
+            if int((d / "stat").read_text().rsplit(")", 1)[1].split()[3]) != sid:
+                continue
+        except (OSError, ValueError, IndexError):
+            continue
+        try:
+            sc = (d / "syscall").read_text().split()
+        except OSError:
+            unknown = True  # autre utilisateur (sudo) : pas d'inspection possible
+            continue
+        if len(sc) < 2 or not sc[0].isdigit() or int(sc[0]) not in _READ_SYSCALLS:
+            continue
+        try:
+            if os.stat(d / "fd" / str(int(sc[1], 16))).st_rdev not in (rdev, _DEV_TTY):
+                continue
+            cmd = (d / "cmdline").read_bytes().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+        except (OSError, ValueError):
+            continue
+        readers.append((int(d.name), cmd))
+    return readers, unknown
+
+
+def match(tail: str, rules: list):
+    text = _ANSI.sub("", tail).replace("\r", "\n")[-400:]
+    for r in rules:
+        if any(p.search(text) for p in r.patterns):
+            return r
+    return None
+
+
+def _last_line(tail: str) -> str:
+    lines = [l.strip() for l in _ANSI.sub("", tail).replace("\r", "\n").splitlines() if l.strip()]
+    return lines[-1][-200:] if lines else ""
+
+
+def run(args, *, shell: bool = False, cwd: str | None = None, env: dict | None = None,
+        popen_kwargs: dict | None = None, timeout: float | None = None, log=None) -> SimpleNamespace:
+    """
+    Exécute sous pty (stdin + /dev/tty) avec détection des invites.
+    Retourne rc, out, err, timed_out, blocked (diagnostic ou None), prompts {answered, wait_s, blocked}.
+    """
+    rules, idle = load_rules(), idle_from_env()
+    env = dict(env or os.environ)
+    for k, v in NONINTERACTIVE.items():
+        env.setdefault(k, v)
+    kw = dict(popen_kwargs or {})
+    kw["start_new_session"] = True
+    argv = [sys.executable, "-c", _CTTY, *(["/bin/sh", "-c", args] if shell else args)]
+
+    master, slave = pty.openpty()
+    rdev = os.fstat(slave).st_rdev
+    try:
+        p = subprocess.Popen(argv, stdin=slave, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=cwd, env=env, **kw)
+    finally:
+        os.close(slave)
+    os.set_blocking(master, False)
+    sel = selectors.DefaultSelector()
+    bufs = {"out": bytearray(), "err": bytearray(), "tty": bytearray()}
+    decs = {k: codecs.getincrementaldecoder("utf-8")("replace") for k in bufs}
+    sel.register(p.stdout, selectors.EVENT_READ, "out")
+    sel.register(p.stderr, selectors.EVENT_READ, "err")
+    sel.register(master, selectors.EVENT_READ, "tty")
+
+    t0 = last = time.monotonic()
+    tail, answered, counts = "", [], {}
+    wait_s, blocked, timed_out, t_exit = 0.0, None, False, None
+
+    def kill():
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    while True:
+        for key, _ in sel.select(0.25):
+            try:
+                chunk = os.read(key.fd, 65536)
+            except BlockingIOError:
+                continue
+            except OSError:  # EIO : plus aucun processus sur le pty
+                chunk = b""
+            if not chunk:
+                sel.unregister(key.fileobj)
+                continue
+            bufs[key.data] += chunk
+            tail = (tail + decs[key.data].decode(chunk))[-2000:]
+            last = time.monotonic()
+        now = time.monotonic()
+        if p.poll() is not None:
+            t_exit = t_exit or now
+            # tubes gardés ouverts par un démon lancé en arrière-plan : on n'attend pas indéfiniment
+            if not any(k.data in ("out", "err") for k in sel.get_map().values()) or now - t_exit > 5:
+                break
+            continue
+        if timeout and now - t0 > timeout:
+            timed_out = True
+            kill()
+            continue
+        if blocked or now - last < idle:
+            continue
+        readers, unknown = tty_readers(p.pid, rdev)
+        rule = match(tail, rules)
+        prompt = _last_line(tail)
+        if rule and (readers or unknown):
+            counts[rule.name] = counts.get(rule.name, 0) + 1
+            if rule.answer is not None and counts[rule.name] <= MAX_ANSWERS:
+                os.write(master, rule.answer.encode())
+                wait_s += now - last
+                answered.append({"rule": rule.name, "prompt": prompt, "answer": rule.answer.strip() or "<Entrée>",
+                                 "after_s": round(now - last, 2)})
+                if log:
+                    log(f"⌨️  Invite détectée ({rule.label}) : « {prompt} » -> réponse "
+                        f"« {rule.answer.strip() or '<Entrée>'} »")
+                tail, last = "", now
+                continue
+            why = rule.label if rule.answer is None else f"{rule.label} (répétée {counts[rule.name]} fois)"
+        elif readers:
+            why = "saisie attendue sans réponse sûre connue"
+        else:
+            # simple silence (compilation, téléchargement...), ou processus non inspectable
+            # (sudo) sans règle reconnue : on attend, la limite de temps réel reste en place
+            continue
+        cmd = readers[0][1] if readers else ""
+        blocked = {"reason": why, "prompt": prompt, "command": cmd[:300], "after_s": round(now - last, 2)}
+        wait_s += now - last
+        if log:
+            log(f"⛔ Script bloqué sur une invite ({why}) : « {prompt} »" + (f" [{cmd[:120]}]" if cmd else ""))
+        kill()
+
+    sel.close()
+    os.close(master)
+    rc = p.wait()
+    out = bytes(bufs["out"]).decode("utf-8", "replace")
+    err = bytes(bufs["err"]).decode("utf-8", "replace")
+    tty = bytes(bufs["tty"]).decode("utf-8", "replace")
+    if tty.strip():
+        out += ("" if not out or out.endswith("\n") else "\n") + _ANSI.sub("", tty).replace("\r\n", "\n")
+    if blocked:
+        err += (f"\n{FAIL_MARK} : bloqué sur une invite interactive ({blocked['reason']}) : "
+                f"« {blocked['prompt']} »" + (f" (commande : {blocked['command']})" if blocked["command"] else "")
+                + "\n")
+    return SimpleNamespace(rc=rc, out=out, err=err, timed_out=timed_out, blocked=blocked,
+                           prompts={"answered": answered, "blocked": blocked, "wait_s": round(wait_s, 3)})
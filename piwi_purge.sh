@@ -1,8 +1,8 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-# Trouver PiwiHome via path_resolver (WSL)
-PIWI_HOME="$(python3 - <<'PY'
+# Trouver PiwiHome via path_resolver (WSL), sauf si PIWI_HOME est fourni
+PIWI_HOME="${PIWI_HOME:-$(python3 - <<'PY'
 import os, json, sys
 try:
     import path_resolver as PR
@@ -11,7 +11,7 @@ except Exception:
     # fallback Desktop/Piwi
     print(os.path.join(os.path.expanduser("~"), "Desktop", "Piwi"))
 PY
-)"
+)}"
 
 INTERNAL_DIR="$PIWI_HOME/_internal"
 REQBASE="$INTERNAL_DIR"   # req_* vivent ici
@@ -21,6 +21,18 @@ CACHE_DIR="$PIWI_HOME/cache"  # si tu utilises ce cache ; sinon laisse vide
 # Paramètres
 KEEP_DAYS="${PIWI_KEEP_REQUESTS_DAYS:-7}"
 MAX_BYTES="${PIWI_MAX_REQUESTS_BYTES:-2147483648}"  # 2 Go
+ARCHIVE_DAYS="${PIWI_ARCHIVE_DAYS:-3}"              # 0 = pas d'archivage (suppression seule)
+ARCHIVER="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/piwi_archive.py"
+
+# (0) Archivage compressé des req_* anciens (segments + index, voir piwi_archive.py)
+#     L'archive a sa propre rétention (prune : PIWI_ARCHIVE_KEEP_DAYS, PIWI_ARCHIVE_MAX_MB),
+#     elle n'est donc ni comptée ni supprimée par les étapes suivantes.
+if [ "$ARCHIVE_DAYS" != "0" ] && [ -f "$ARCHIVER" ]; then
+  python3 "$ARCHIVER" pack --days "$ARCHIVE_DAYS" || echo "[WARN] Archivage impossible, purge classique."
+fi
+if [ -f "$ARCHIVER" ]; then
+  python3 "$ARCHIVER" prune || echo "[WARN] Rétention de l'archive impossible."
+fi
 
 # (1) Purge des req_* par ancienneté
 if [ -d "$REQBASE" ]; then
@@ -29,10 +41,10 @@ fi
 
 # (2) Plafond d'espace total des req_* (on ne touche PAS aux fichiers à la racine de PiwiHome)
 if [ -d "$REQBASE" ]; then
-  current_size=$(du -sb "$REQBASE" 2>/dev/null | awk '{print $1}')
+  current_size=$(du -sb --exclude=archive "$REQBASE" 2>/dev/null | awk '{print $1}')
   if [ -n "${current_size:-}" ] && [ "$current_size" -gt "$MAX_BYTES" ]; then
     while true; do
-      current_size=$(du -sb "$REQBASE" 2>/dev/null | awk '{print $1}')
+      current_size=$(du -sb --exclude=archive "$REQBASE" 2>/dev/null | awk '{print $1}')
       [ -z "$current_size" ] && break
       [ "$current_size" -le "$MAX_BYTES" ] && break
       oldest="$(find "$REQBASE" -maxdepth 1 -type d -name 'req_*' -printf '%T@ %p\n' | sort -n | head -n1 | cut -d' ' -f2-)"
@@ -54,5 +66,8 @@ fi
 # (4) Info
 human() { numfmt --to=iec "$1" 2>/dev/null || echo "$1"; }
 sz="0"
-[ -d "$REQBASE" ] && sz="$(du -sb "$REQBASE" 2>/dev/null | awk '{print $1}')"
+[ -d "$REQBASE" ] && sz="$(du -sb --exclude=archive "$REQBASE" 2>/dev/null | awk '{print $1}')"
 echo "🧹 Purge OK (<= $(human "$MAX_BYTES") visé) — espace actuel reqs: $(human "${sz:-0}") — base: $REQBASE"
+if [ -d "$REQBASE/archive" ]; then
+  echo "🗜  Archive: $(human "$(du -sb "$REQBASE/archive" | awk '{print $1}')") — consulter avec: python3 $ARCHIVER ls | cat <req> <fichier>"
+fi
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Admission des appels OpenAI partagée entre processus (côté WSL)
+
+- Un seau à jetons par (URL de base, clé, modèle), commun à tous les noyaux de la
+  machine (GUI, launch.sh, lots scriptés) : état JSON sous flock dans le dossier de
+  verrous de piwi_sched (/tmp/piwi-locks, natif et partagé root/utilisateur).
+- Les en-têtes x-ratelimit-{limit,remaining,reset}-{requests,tokens} de chaque
+  réponse recalent le seau (restant réel, vitesse de remplissage déduite du reset) ;
+  un 429 le vide jusqu'à retry-after et l'appel est ré-admis au lieu d'échouer.
+- Le client OpenAI ne relance plus rien lui-même (max_retries=0) : les erreurs
+  passagères qu'il relançait (connexion, délai, 408/409, 5xx) le sont par l'appelant,
+  transient() + backoff(), PIWI_RL_TRANSIENT_RETRIES fois (def=2, comme le SDK).
+- File d'attente équitable : tickets (priorité, arrivée) comme piwi_sched ; seul le
+  premier ticket vivant consomme des jetons, un ticket plus prioritaire (GUI
+  "interactive") passe devant un lot ("batch") dès qu'il arrive.
+- Avant que les limites soient connues : au plus PIWI_RL_CONCURRENCY appels en vol.
+- STATS (par processus) -> meta.json "ratelimit" : attente, 429 reçus, relances.
+
+Usage : python3 piwi_ratelimit.py stats      (état des seaux)
+Env : PIWI_RATELIMIT=0 (désactive), PIWI_RL_CONCURRENCY (def=8), PIWI_RL_MAX_WAIT (def=300 s),
+      PIWI_RL_RETRIES (def=4), PIWI_RL_TRANSIENT_RETRIES (def=2),
+      PIWI_RL_MAX_OUT (jetons de réponse estimés, def=800)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import random
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import piwi_sched as SCH
+except Exception:
+    SCH = None
+
+DIMS = ("requests", "tokens")
+STATS = {"calls": 0, "wait_s": 0.0, "rate_limited": 0, "retries": 0}
+
+_DUR = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def enabled() -> bool:
+    return SCH is not None and os.getenv("PIWI_RATELIMIT", "1") != "0"
+
+
+def _env_num(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, "") or default)
+    except ValueError:
+        return default
+
+
+def retries() -> int:
+    return int(_env_num("PIWI_RL_RETRIES", 4))
+
+
+def transient_retries() -> int:
+    return int(_env_num("PIWI_RL_TRANSIENT_RETRIES", 2))
+
+
+def transient(exc) -> bool:
+    """Erreur que le SDK OpenAI relancerait : connexion/délai, 408, 409, 5xx (hors 429)."""
+    if any(c.__name__ in ("APIConnectionError", "APITimeoutError") for c in type(exc).__mro__):
+        return True
+    code = getattr(exc, "status_code", None)
+    return code in (408, 409) or (code is not None and code >= 500)
+
+
+def backoff(attempt: int) -> float:
+    """Comme le SDK : 0.5 s, 1 s, 2 s... (plafond 8 s), moins 0 à 25 % d'aléa."""
+    return min(0.5 * 2 ** (attempt - 1), 8.0) * (1 - 0.25 * random.random())
+
+
+def bucket_key(base_url: str, api_key: str, model: str) -> str:
+    return hashlib.sha1(f"{base_url}|{api_key}|{model}".encode("utf-8")).hexdigest()[:12]
+
+
+def estimate(messages: list) -> int:
+    """Jetons consommés par l'appel : ~4 caractères par jeton + réponse attendue."""
+    chars = sum(len(str(m.get("content") or "")) for m in messages)
+    return chars // 4 + int(_env_num("PIWI_RL_MAX_OUT", 800))
+
+
+def _dur(v) -> float | None:
+    """'6m0s', '1.5s', '20ms' -> secondes."""
+    if v is None:
+        return None
+    parts = _DUR.findall(str(v))
+    if not parts:
+        try:
+            return float(v)
+        except ValueError:
+            return None
+    return sum(float(n) * _UNIT[u] for n, u in parts)
+
+
+def _int(v) -> int | None:
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return None
+
+
+# --- État partagé ---
+def _dir():
+    d = SCH.LOCK_DIR / "openai"
+    SCH._ensure_dir(SCH.LOCK_DIR)
+    SCH._ensure_dir(d)
+    return d
+
+
+@contextmanager
+def _state(key: str):
+    """État du seau sous flock, réécrit sur place en sortie de bloc (dossier sticky partagé :
+    pas de renommage par-dessus le fichier d'un autre utilisateur)."""
+    fd = os.open(_dir() / f"{key}.json", os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        os.fchmod(fd, 0o666)
+    except OSError:
+        pass
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        try:
+            st = json.loads(os.pread(fd, 1 << 16, 0) or b"{}")
+        except ValueError:
+            st = {}
+        st.setdefault("blocked_until", 0.0)
+        st.setdefault("inflight", {})
+        yield st
+        data = json.dumps(st).encode("utf-8")
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, data, 0)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _refill(b: dict, now: float):
+    b["avail"] = min(b["limit"], b["avail"] + max(0.0, now - b["ts"]) * b["rate"])
+    b["ts"] = now
+
+
+def _take(st: dict, cost: dict, now: float) -> float:
+    """0 si admis (jetons réservés), sinon délai estimé avant de réessayer."""
+    st["inflight"] = {pid: v for pid, v in st["inflight"].items() if v[0] > 0 and SCH._alive(int(pid))}
+    if now < st["blocked_until"]:
+        return st["blocked_until"] - now
+    if sum(v[0] for v in st["inflight"].values()) >= _env_num("PIWI_RL_CONCURRENCY", 8):
+        return 0.1
+    wait = 0.0
+    for dim in DIMS:
+        b = st.get(dim)
+        if not b:
+            continue  # limite encore inconnue
+        _refill(b, now)
+        need = min(cost[dim], b["limit"])  # une demande plus grosse que le seau passerait jamais
+        if b["avail"] < need:
+            wait = max(wait, (need - b["avail"]) / b["rate"] if b["rate"] > 0 else 1.0)
+    if wait:
+        return wait
+    for dim in DIMS:
+        if st.get(dim):
+            st[dim]["avail"] -= min(cost[dim], st[dim]["limit"])
+    v = st["inflight"].setdefault(str(os.getpid()), [0, 0])
+    v[0] += 1
+    v[1] += cost["tokens"]
+    return 0.0
+
+
+def learn(st: dict, headers, limited: bool = False, own: dict | None = None):
+    """
+    Recale le seau sur les en-têtes de réponse (ou d'un 429). Les autres appels admis et
+    encore en vol (own = coût de celui-ci, exclu) ne sont peut-être pas encore comptés
+    par le serveur : ils restent déduits, quitte à sous-utiliser un peu la limite.
+    """
+    now = time.time()
+    own = own or {"requests": 0, "tokens": 0}
+    pending = {"requests": sum(v[0] for v in st["inflight"].values()) - own["requests"],
+               "tokens": sum(v[1] for v in st["inflight"].values()) - own["tokens"]}
+    resets = []
+    for dim in DIMS:
+        lim = _int(headers.get(f"x-ratelimit-limit-{dim}"))
+        rem = _int(headers.get(f"x-ratelimit-remaining-{dim}"))
+        reset = _dur(headers.get(f"x-ratelimit-reset-{dim}"))
+        if not lim or rem is None:
+            continue
+        rate = (lim - rem) / reset if reset and lim > rem else lim / 60.0  # limites par minute
+        st[dim] = {"limit": lim, "avail": float(min(rem, lim) - max(0, pending[dim])), "ts": now,
+                   "rate": max(rate, lim / 3600.0)}
+        if rem <= 0 and reset:
+            resets.append(reset)
+    if limited:
+        ra = _dur(headers.get("retry-after")) or max(resets, default=1.0)
+        st["blocked_until"] = max(st["blocked_until"], now + ra)
+        for dim in DIMS:
+            if st.get(dim):
+                st[dim]["avail"] = min(st[dim]["avail"], 0.0)
+
+
+# --- Admission ---
+class Slot:
+    """
+    with Slot(key, cost) as s : bloque jusqu'à admission (file à priorités partagée),
+    puis s.update(headers) après la réponse, ou s.failed(exc) sur erreur (True si 429).
+    """
+
+    def __init__(self, key: str, tokens: int, prio: int | None = None, log=None):
+        self.key = key
+        self.cost = {"requests": 1, "tokens": tokens}
+        self.prio = SCH.priority() if prio is None else prio
+        self.log = log
+        self.wait_s = 0.0
+
+    def __enter__(self):
+        t0 = time.perf_counter()
+        qdir = _dir() / f"queue-{self.key}"
+        SCH._ensure_dir(qdir)
+        ticket = qdir / f"{self.prio:03d}-{time.time_ns()}-{os.getpid()}"
+        ticket.touch()
+        deadline = time.time() + _env_num("PIWI_RL_MAX_WAIT", 300)
+        told = False
+        try:
+            while True:
+                delay = 0.05
+                if SCH._front_ticket(qdir) == ticket:
+                    with _state(self.key) as st:
+                        delay = _take(st, self.cost, time.time())
+                    if not delay:
+                        break
+                if time.time() > deadline:
+                    if self.log:
+                        self.log("[WARN] Attente de la limite OpenAI dépassée : appel sans admission.")
+                    break
+                if self.log and not told and time.perf_counter() - t0 > 0.2:
+                    self.log(f"⏳ Limite de débit OpenAI : appel mis en file (priorité {self.prio}).")
+                    told = True
+                # court : un ticket plus prioritaire arrivé entre-temps passe devant
+                time.sleep(min(max(delay, 0.02), 0.25))
+        finally:
+            try:
+                ticket.unlink()
+            except OSError:
+                pass
+        self.wait_s = time.perf_counter() - t0
+        STATS["calls"] += 1
+        STATS["wait_s"] = round(STATS["wait_s"] + self.wait_s, 3)
+        return self
+
+    def __exit__(self, *exc):
+        with _state(self.key) as st:
+            v = st["inflight"].get(str(os.getpid()))
+            if v and v[0] > 0:
+                v[0] -= 1
+                v[1] = max(0, v[1] - self.cost["tokens"])
+
+    def update(self, headers):
+        with _state(self.key) as st:
+            learn(st, headers, own=self.cost)
+
+    def failed(self, exc) -> bool:
+        """Erreur de l'appel : True (et seau vidé jusqu'au retry-after) si c'est un 429."""
+        resp = getattr(exc, "response", None)
+        if getattr(exc, "status_code", None) != 429 or resp is None:
+            return False
+        with _state(self.key) as st:
+            learn(st, resp.headers, limited=True, own=self.cost)
+        STATS["rate_limited"] += 1
+        return True
+
+
+def summary() -> dict:
+    out = {}
+    if SCH is None:
+        return out
+    for p in sorted(_dir().glob("*.json")):
+        try:
+            st = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        now = time.time()
+        ent = {"inflight": sum(v[0] for v in st.get("inflight", {}).values()),
+               "blocked_s": round(max(0.0, st.get("blocked_until", 0) - now), 3)}
+        for dim in DIMS:
+            if st.get(dim):
+                _refill(st[dim], now)
+                ent[dim] = {"limit": st[dim]["limit"], "avail": round(st[dim]["avail"], 1),
+                            "rate_per_s": round(st[dim]["rate"], 3)}
+        out[p.stem] = ent
+    return out
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["stats"]:
+        print(__doc__)
+        sys.exit(1)
+    print(json.dumps(summary(), indent=2))
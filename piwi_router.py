@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Routage adaptatif des modèles (côté WSL)
+
+- Échelle de modèles du plus rapide au plus fort (PIWI_MODELS, def="gpt-4o-mini,gpt-4o").
+- Complexité de l'instruction (longueur, nombre d'étapes, mots-clés : compilation,
+  services, conteneurs, bases de données...) -> classe low | mid | high.
+- choose() : le premier modèle de l'échelle dont le taux de réussite au premier
+  essai estimé pour cette classe atteint PIWI_ROUTER_MIN_SUCCESS (a priori
+  optimiste : on commence par le rapide) ; sinon le plus fort.
+- escalate() : modèle suivant de l'échelle, pour le tour de correction.
+- record() : chaque appel (latence) et chaque résultat (réussite au 1er essai ou
+  après correction) est ajouté à ~/.cache/piwi/router.jsonl ; la table de routage
+  est recalculée à chaque requête depuis les derniers enregistrements.
+
+PIWI_MODEL seul (sans PIWI_MODELS) fixe le modèle comme avant ; PIWI_ROUTER=0 désactive.
+
+Usage : python3 piwi_router.py stats     (p50 de latence et réussite au 1er essai par modèle)
+Env : PIWI_MODELS, PIWI_ROUTER_MIN_SUCCESS (def=0.7), PIWI_CACHE_DIR (def=~/.cache/piwi)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi")
+LOG = CACHE / "router.jsonl"
+KEEP = 2000          # enregistrements pris en compte (et conservés à la rotation)
+PRIOR = (4.0, 1.0)   # a priori bêta (réussites, échecs) : un modèle sans historique est essayé
+_STEPS = re.compile(r"\b(?:et|puis|ensuite|après|and|then|after)\b|[;,\n]|\d+\)", re.I)
+_HEAVY = re.compile(
+    r"compil|build|make\b|cmake|gcc|cargo|kernel|driver|cuda|gpu|docker|podman|kubernetes|k8s|"
+    r"service|systemd|daemon|nginx|apache|serveur|server|postgres|mysql|mariadb|redis|mongo|base de donn|database|"
+    r"cron|ssl|certificat|vpn|firewall|pare-feu|ufw|iptables|réseau|network|proxy|migrat|cluster|"
+    r"depuis les sources|from source|environnement virtuel|venv|conda", re.I)
+
+
+def ladder() -> list:
+    raw = os.getenv("PIWI_MODELS", "").strip()
+    if raw:
+        return [m.strip() for m in raw.split(",") if m.strip()]
+    pinned = os.getenv("PIWI_MODEL", "").strip()
+    return [pinned] if pinned else ["gpt-4o-mini", "gpt-4o"]
+
+
+def enabled() -> bool:
+    return os.getenv("PIWI_ROUTER", "1") != "0" and len(ladder()) > 1
+
+
+def features(instruction: str) -> dict:
+    text = instruction or ""
+    words = len(text.split())
+    steps = 1 + len(_STEPS.findall(text))
+    heavy = len({m.group(0).lower() for m in _HEAVY.finditer(text)})
+    score = min(1.0, words / 80) * 0.35 + min(1.0, (steps - 1) / 6) * 0.35 + min(1.0, heavy / 3) * 0.3
+    bucket = "low" if score < 0.25 else ("mid" if score < 0.55 else "high")
+    return {"words": words, "steps": steps, "heavy": heavy, "score": round(score, 3), "bucket": bucket}
+
+
+def _load() -> list:
+    try:
+        lines = LOG.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return []
+    out = []
+    for line in lines[-KEEP:]:
+        try:
+            out.append(json.loads(line))
+        except ValueError:
+            pass
+    return out
+
+
+def table(records: list | None = None) -> dict:
+    """{modèle: {bucket|"all": {ok, n, lat: [...], fix_ok, fix_n}}} depuis l'historique."""
+    tab: dict = {}
+    for r in records if records is not None else _load():
+        m = r.get("model")
+        if not m:
+            continue
+        for key in (r.get("bucket", "low"), "all"):
+            t = tab.setdefault(m, {}).setdefault(key, {"ok": 0, "n": 0, "lat": [], "fix_ok": 0, "fix_n": 0})
+            if r.get("kind") == "call" and r.get("seconds") is not None:
+                t["lat"].append(r["seconds"])
+            elif r.get("kind") == "result":
+                if r.get("round") == "first":
+                    t["n"] += 1
+                    t["ok"] += 1 if r.get("ok") else 0
+                else:
+                    t["fix_n"] += 1
+                    t["fix_ok"] += 1 if r.get("ok") else 0
+    return tab
+
+
+def _p50(xs: list):
+    if not xs:
+        return None
+    s = sorted(xs)
+    return round(s[len(s) // 2], 3)
+
+
+def _success(t: dict | None) -> float:
+    ok, n = (t["ok"], t["n"]) if t else (0, 0)
+    return (ok + PRIOR[0]) / (n + PRIOR[0] + PRIOR[1])
+
+
+def choose(instruction: str) -> SimpleNamespace:
+    """Modèle pour la génération initiale (+ raison, caractéristiques)."""
+    ms = ladder()
+    f = features(instruction)
+    if not enabled():
+        return SimpleNamespace(model=ms[0], reason="fixé", features=f, estimates={})
+    try:
+        need = float(os.getenv("PIWI_ROUTER_MIN_SUCCESS", "") or 0.7)
+    except ValueError:
+        need = 0.7
+    tab = table()
+    est = {m: round(_success(tab.get(m, {}).get(f["bucket"])), 3) for m in ms}
+    for m in ms:
+        if est[m] >= need:
+            return SimpleNamespace(model=m, reason=f"réussite estimée {est[m]:.0%} ({f['bucket']})",
+                                   features=f, estimates=est)
+    return SimpleNamespace(model=ms[-1], reason=f"aucun modèle >= {need:.0%} ({f['bucket']}) : le plus fort",
+                           features=f, estimates=est)
+
+
+def escalate(model: str) -> str:
+    """Modèle suivant (plus fort) dans l'échelle ; inchangé en haut de l'échelle ou si désactivé."""
+    ms = ladder()
+    if not enabled() or model not in ms:
+        return model
+    return ms[min(ms.index(model) + 1, len(ms) - 1)]
+
+
+def record(kind: str, model: str, bucket: str, **fields):
+    """kind="call" (seconds=...) ou "result" (round="first"|"fix", ok=bool)."""
+    rec = {"ts": round(time.time(), 3), "kind": kind, "model": model, "bucket": bucket, **fields}
+    try:
+        CACHE.mkdir(parents=True, exist_ok=True)
+        with open(LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        if LOG.stat().st_size > 1 << 20:  # rotation : on garde les KEEP derniers
+            lines = LOG.read_text(encoding="utf-8").splitlines()[-KEEP:]
+            tmp = LOG.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            os.replace(tmp, LOG)
+    except OSError:
+        pass
+
+
+def summary() -> dict:
+    """Par modèle : appels, p50 de latence, réussite au 1er essai et après correction."""
+    out = {}
+    for m, t in table().items():
+        a = t.get("all", {})
+        out[m] = {"calls": len(a.get("lat", [])), "p50_s": _p50(a.get("lat", [])),
+                  "first_try": f"{a['ok']}/{a['n']}" if a.get("n") else "0/0",
+                  "first_try_rate": round(a["ok"] / a["n"], 3) if a.get("n") else None,
+                  "fix_rate": round(a["fix_ok"] / a["fix_n"], 3) if a.get("fix_n") else None,
+                  "by_bucket": {b: {"n": v["n"], "rate": round(v["ok"] / v["n"], 3) if v["n"] else None}
+                                for b, v in t.items() if b != "all"}}
+    return out
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["stats"]:
+        print(__doc__)
+        sys.exit(1)
+    print(f"Échelle : {' -> '.join(ladder())} ({'actif' if enabled() else 'désactivé'})")
+    for m, s in summary().items():
+        print(f"{m:<20} appels={s['calls']:<5} p50={s['p50_s']}s  1er essai={s['first_try']}"
+              f" ({s['first_try_rate']})  correction={s['fix_rate']}  {s['by_bucket']}")
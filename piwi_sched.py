@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Ordonnanceur de ressources pour l'exécution des scripts (côté WSL)
+
+- classify() : déduit les ressources d'un script bash
+    dpkg           apt / apt-get / dpkg / aptitude / add-apt-repository
+    pip:<interp>   pip hors venv privé ("system" ou chemin de l'interpréteur)
+    path:<dir>     DEST_DIR explicite, si le script y fait référence
+- hold() : prend des verrous exclusifs fins (flock) dans un ordre fixe (tri des
+  clés : aucun interblocage), avec une file à priorités par ressource.
+  Les requêtes sans ressource commune s'exécutent en parallèle.
+- Le temps d'attente est renvoyé pour être consigné (meta.json "sched").
+
+Verrous : /tmp/piwi-locks (natif, partagé root/utilisateur ; flock n'est pas
+fiable sur /mnt/c). Tickets d'attente : /tmp/piwi-locks/queue/<ressource>/.
+
+Env :
+  PIWI_PRIORITY      interactive | normal | batch | <entier> (def=normal ; plus petit = prioritaire)
+  PIWI_SCHED_TIMEOUT attente max en secondes avant de passer outre (def=1800)
+  PIWI_LOCK_DIR      dossier des verrous (def=/tmp/piwi-locks)
+"""
+
+import os
+import re
+import time
+import fcntl
+import hashlib
+from pathlib import Path
+from contextlib import contextmanager
+
+LOCK_DIR = Path(os.getenv("PIWI_LOCK_DIR", "") or "/tmp/piwi-locks")
+PRIORITIES = {"interactive": 0, "normal": 5, "batch": 9}
+
+_RX_DPKG = re.compile(r"(?<![\w./-])(apt-get|apt|dpkg|aptitude|add-apt-repository)(?![\w-])")
+_RX_PIP = re.compile(r"(?<![\w-])(\S*/)?(?:(pip3?(?:\.\d+)?)|(python3?(?:\.\d+)?)\s+-m\s+pip)\s+install\b")
+_RX_VENV = re.compile(r"\b(?:source|\.)\s+\S*/bin/activate\b|\bpiwi-venv\s+create\b")
+
+
+def priority(env=None) -> int:
+    raw = ((env or os.environ).get("PIWI_PRIORITY", "") or "normal").strip().lower()
+    if raw in PRIORITIES:
+        return PRIORITIES[raw]
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return PRIORITIES["normal"]
+
+
+def classify(script: str, dest_dir: str = "") -> list:
+    """Ressources requises par `script`, triées (= ordre d'acquisition)."""
+    code = "\n".join(l for l in script.splitlines() if not l.lstrip().startswith("#"))
+    res = set()
+    if _RX_DPKG.search(code):
+        res.add("dpkg")
+    in_venv = bool(_RX_VENV.search(code))
+    for m in _RX_PIP.finditer(code):
+        prefix = m.group(1) or ""
+        if prefix:
+            # pip d'un venv privé à la requête : aucune contention
+            if "REQ_INTERNAL" in prefix or "venv" in prefix.lower():
+                continue
+            res.add(f"pip:{prefix}{m.group(2) or m.group(3)}")
+        elif not in_venv:
+            res.add("pip:system")
+    if dest_dir and "DEST_DIR" in code:
+        res.add(f"path:{os.path.realpath(dest_dir)}")
+    return sorted(res)
+
+
+def _slug(res: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", res)[:40] + "-" + hashlib.sha1(res.encode()).hexdigest()[:8]
+
+
+def _ensure_dir(p: Path):
+    if not p.exists():
+        p.mkdir(parents=True, exist_ok=True)
+        try:
+            os.chmod(p, 0o1777)  # root et utilisateur partagent les mêmes verrous
+        except OSError:
+            pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+
+def _front_ticket(qdir: Path):
+    """Ticket vivant le plus prioritaire (prio, horodatage) ; supprime les orphelins."""
+    best = None
+    for t in qdir.iterdir():
+        try:
+            prio, ts, pid = t.name.split("-")
+            key = (int(prio), int(ts), int(pid))
+        except ValueError:
+            continue
+        if not _alive(key[2]):
+            try:
+                t.unlink()
+            except OSError:
+                pass
+            continue
+        if best is None or key < best[0]:
+            best = (key, t)
+    return best[1] if best else None
+
+
+def _holder(fd: int) -> str:
+    try:
+        return os.pread(fd, 64, 0).decode("utf-8", "replace").strip()
+    except OSError:
+        return ""
+
+
+def _acquire(res: str, prio: int, deadline: float, log=None):
+    """Verrou exclusif sur `res`, en respectant la file à priorités. Retourne le fd (ou None si délai dépassé)."""
+    slug = _slug(res)
+    _ensure_dir(LOCK_DIR)
+    qdir = LOCK_DIR / "queue" / slug
+    _ensure_dir(LOCK_DIR / "queue")
+    _ensure_dir(qdir)
+    lock = LOCK_DIR / f"{slug}.lock"
+    fd = os.open(lock, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        os.fchmod(fd, 0o666)
+    except OSError:
+        pass
+    ticket = qdir / f"{prio:03d}-{time.time_ns()}-{os.getpid()}"
+    ticket.touch()
+    delay, told = 0.02, False
+    try:
+        while True:
+            if _front_ticket(qdir) == ticket:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.pwrite(fd, f"pid={os.getpid()} prio={prio}".ljust(63).encode() + b"\n", 0)
+                    return fd
+                except BlockingIOError:
+                    pass
+            if time.time() > deadline:
+                os.close(fd)
+                return None
+            if log and not told:
+                who = _holder(fd)
+                log(f"⏳ Ressource '{res}' occupée{f' ({who})' if who else ''} : mise en file (priorité {prio}).")
+                told = True
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.5)
+    finally:
+        try:
+            ticket.unlink()
+        except OSError:
+            pass
+
+
+@contextmanager
+def hold(resources: list, prio: int | None = None, log=None, timeout: float | None = None):
+    """
+    Tient toutes les ressources (ordre fixe) le temps du bloc.
+    Produit un dict {resources, priority, wait_s, waited, timed_out} à consigner.
+    """
+    prio = priority() if prio is None else prio
+    if timeout is None:
+        try:
+            timeout = float(os.getenv("PIWI_SCHED_TIMEOUT", "1800") or 1800)
+        except ValueError:
+            timeout = 1800.0
+    info = {"resources": sorted(resources), "priority": prio, "wait_s": 0.0, "waited": {}, "timed_out": []}
+    fds = []
+    t0 = time.perf_counter()
+    deadline = time.time() + timeout
+    try:
+        for res in info["resources"]:
+            t1 = time.perf_counter()
+            fd = _acquire(res, prio, deadline, log)
+            w = round(time.perf_counter() - t1, 4)
+            if w >= 0.05:
+                info["waited"][res] = w
+            if fd is None:
+                info["timed_out"].append(res)
+                if log:
+                    log(f"[WARN] Attente de '{res}' > {timeout:.0f}s : exécution sans verrou.")
+            else:
+                fds.append(fd)
+        info["wait_s"] = round(time.perf_counter() - t0, 4)
+        yield info
+    finally:
+        for fd in reversed(fds):
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Génération en flux et exécution en pipeline (côté WSL)
+
+- StatementSplitter : reçoit le texte de la complétion morceau par morceau et
+  rend chaque instruction bash de premier niveau dès qu'elle est complète
+  (guillemets dont $'…', $( ), heredocs <<EOF / <<-'EOF', if/fi, case/esac,
+  boucles, { }, ( ), fonctions "f()" / "function f" dont le corps commence à la
+  ligne suivante, continuations "\\" et opérateurs && || | en fin de ligne).
+  Les clôtures Markdown ``` sont ignorées (seul le code entre elles compte).
+- ShellPipe : un bash persistant qui lit ses instructions sur un tube ; après
+  chaque instruction, une sentinelle remonte son code retour et arrête le shell
+  en cas d'échec (arrêt net : rien de ce qui suit n'est exécuté). ok = nombre
+  d'instructions réussies, donc indice de celle où reprendre.
+- replayable() : instructions qui ne font que poser l'état du shell (variables,
+  export, cd, fonctions, source...) ; rejouées en tête d'une reprise.
+
+Le noyau (PIWI_STREAM=1) lance les instructions pendant que la suite est encore
+générée et consigne le délai avant première commande (meta.json "pipeline").
+"""
+
+import os
+import re
+import time
+import signal
+import threading
+import subprocess
+
+_FENCE = re.compile(r"^\s*```")
+_OPENERS = {"if": "fi", "case-in": "esac", "for": "done", "while": "done", "until": "done", "select": "done"}
+_REOPEN = {"then", "do", "else", "elif", "!", "time", "in"}
+_TRAILING = {"&&", "||", "|", "|&"}
+_STATE_CMDS = {"export", "declare", "typeset", "readonly", "local", "unset", "cd", "pushd", "popd",
+               "set", "shopt", "trap", "umask", "alias", "source", "."}
+_ASSIGN = re.compile(r"^[A-Za-z_]\w*(?:\[[^]]*\])?\+?=")
+_FUNC = re.compile(r"^\s*(?:function\s+[\w.:-]+|[\w.:-]+\s*\(\s*\))")
+
+
+class StatementSplitter:
+    """Découpe incrémentale d'un script bash en instructions de premier niveau."""
+
+    def __init__(self):
+        self._partial = ""
+        self._buf: list = []
+        self._ctx: list = []        # "'", '"', "`", "$(", "(", "${", "{", mots-clés ouvrants
+        self._heredocs: list = []   # (délimiteur, tabulations retirées) en attente
+        self._in_heredoc = None
+        self._fenced = None         # None = inconnu ; True = code entre ``` uniquement
+        self._in_fence = False
+        self._cont = False
+        self._cmd_start = True
+        self._last_tok = None
+        self._fn_name = False       # "function f {" : le mot suivant est un nom
+        self._fn_body = False       # en-tête "f()" / "function f" lu, corps composé attendu
+        self.lines: list = []       # tout le code reçu (pour exec.sh / correction)
+
+    # -- API --
+    def feed(self, text: str) -> list:
+        self._partial += text
+        out = []
+        while "\n" in self._partial:
+            line, self._partial = self._partial.split("\n", 1)
+            st = self._line(line)
+            if st is not None:
+                out.append(st)
+        return out
+
+    def close(self) -> list:
+        """Fin du flux : rend le reliquat (même incomplet : bash signalera l'erreur)."""
+        out = []
+        if self._partial:
+            line, self._partial = self._partial, ""
+            st = self._line(line)
+            if st is not None:
+                out.append(st)
+        if self._buf:
+            st = self._emit()
+            if st is not None:
+                out.append(st)
+        return out
+
+    @property
+    def script(self) -> str:
+        return "\n".join(self.lines).strip()
+
+    # -- interne --
+    def _emit(self):
+        text = "\n".join(self._buf)
+        self._buf = []
+        self._last_tok = None
+        self._cmd_start = True
+        self._fn_body = False
+        if any(l.strip() and not l.lstrip().startswith("#") for l in text.splitlines()):
+            return text
+        return None
+
+    def _complete(self) -> bool:
+        return (not self._ctx and not self._cont and not self._heredocs and not self._fn_body
+                and self._in_heredoc is None and self._last_tok not in _TRAILING)
+
+    def _line(self, line: str):
+        line = line.rstrip("\r")
+        if self._in_heredoc is None and _FENCE.match(line):
+            if self._fenced is None:
+                self._fenced = True
+            self._in_fence = not self._in_fence
+            return None
+        if self._fenced is None and line.strip():
+            self._fenced = False
+        if self._fenced and not self._in_fence:
+            return None
+        self.lines.append(line)
+        self._buf.append(line)
+
+        if self._in_heredoc is not None:
+            delim, strip = self._in_heredoc
+            if (line.lstrip("\t") if strip else line) == delim:
+                self._in_heredoc = self._heredocs.pop(0) if self._heredocs else None
+        else:
+            self._scan(line)
+            if self._heredocs:
+                self._in_heredoc = self._heredocs.pop(0)
+        return self._emit() if self._complete() else None
+
+    def _word(self, w: str, quoted: bool):
+        if not w:
+            return
+        self._last_tok = w
+        top = self._ctx[-1] if self._ctx else None
+        if self._fn_name:
+            self._fn_name = False
+            self._fn_body = True
+            self._cmd_start = True
+            return
+        if w == "function" and self._cmd_start and not quoted:
+            self._fn_name = True
+            return
+        if quoted or not self._cmd_start:
+            if top == "case" and w == "in" and not quoted:
+                self._ctx[-1] = "case-in"
+                self._cmd_start = True
+            else:
+                self._cmd_start = False
+            return
+        if w == "case":
+            self._ctx.append("case")
+            self._fn_body = False
+            self._cmd_start = False
+        elif w in _OPENERS:
+            self._ctx.append(w)
+            self._fn_body = False
+            self._cmd_start = True
+        elif top in _OPENERS and w == _OPENERS[top]:
+            self._ctx.pop()
+            self._cmd_start = False
+        elif w == "{":
+            self._ctx.append("{")
+            self._fn_body = False
+            self._cmd_start = True
+        elif w == "}" and top == "{":
+            self._ctx.pop()
+            self._cmd_start = False
+        else:
+            self._cmd_start = w in _REOPEN
+
+    def _heredoc_at(self, line: str, i: int) -> int:
+        j = i + 2
+        strip = j < len(line) and line[j] == "-"
+        if strip:
+            j += 1
+        while j < len(line) and line[j] in " \t":
+            j += 1
+        k = j
+        while k < len(line) and not line[k].isspace() and line[k] not in ";|&<>()":
+            k += 1
+        delim = re.sub(r"[\"'\\]", "", line[j:k])
+        if delim:
+            self._heredocs.append((delim, strip))
+        return k
+
+    def _scan(self, line: str):
+        self._cont = False
+        word, quoted = "", False
+        i, n = 0, len(line)
+        while i < n:
+            c = line[i]
+            top = self._ctx[-1] if self._ctx else None
+            if top == "'":
+                if c == "'":
+                    self._ctx.pop()
+                i += 1
+                continue
+            if top == "$'":  # guillemets ANSI-C : \' n'est pas une fin
+                if c == "\\":
+                    i += 2
+                else:
+                    if c == "'":
+                        self._ctx.pop()
+                    i += 1
+                continue
+            if top in ('"', "`", "${"):
+                if c == "\\":
+                    i += 2
+                elif top == '"' and c == '"' or top == "`" and c == "`" or top == "${" and c == "}":
+                    self._ctx.pop()
+                    i += 1
+                elif top != "`" and line.startswith("$(", i):
+                    self._ctx.append("$(")
+                    i += 2
+                elif top != "`" and line.startswith("${", i):
+                    self._ctx.append("${")
+                    i += 2
+                elif top == "${" and c in "'\"":
+                    self._ctx.append(c)
+                    i += 1
+                elif top == '"' and c == "`":
+                    self._ctx.append("`")
+                    i += 1
+                else:
+                    i += 1
+                continue
+            # contexte "code" : niveau 0, $( ), ( ), { }, mots-clés
+            if c == "\\":
+                if i == n - 1:
+                    self._cont = True
+                word += line[i:i + 2]
+                i += 2
+                continue
+            if c == "#" and not word:
+                break
+            if line.startswith("$'", i):
+                self._ctx.append("$'")
+                word, quoted = word + "$'", True
+                i += 2
+                continue
+            if c in "'\"`":
+                self._ctx.append(c)
+                word, quoted = word + c, True
+                i += 1
+                continue
+            if line.startswith("$(", i) or line.startswith("${", i):
+                self._ctx.append(line[i:i + 2])
+                word, quoted = word + line[i:i + 2], True
+                i += 2
+                continue
+            if line.startswith("<<", i) and not line.startswith("<<<", i):
+                self._word(word, quoted)
+                word, quoted = "", False
+                i = self._heredoc_at(line, i)
+                self._last_tok = "<<"
+                continue
+            if c in "()":
+                self._word(word, quoted)
+                word, quoted = "", False
+                if c == "(":
+                    self._ctx.append("(")
+                    self._fn_body = False
+                    self._cmd_start = True
+                elif top in ("(", "$("):
+                    self._ctx.pop()
+                    self._cmd_start = self._last_tok == "("  # "f()" : le corps suit
+                    self._fn_body = self._cmd_start and top == "("
+                elif top == "case-in":
+                    self._cmd_start = True  # fin de motif "a|b)"
+                self._last_tok = c
+                i += 1
+                continue
+            if c in ";&|":
+                self._word(word, quoted)
+                word, quoted = "", False
+                op = line[i:i + 2] if line[i:i + 2] in ("&&", "||", ";;", "|&", ";&") else c
+                self._last_tok = op
+                self._cmd_start = True
+                i += len(op)
+                continue
+            if c.isspace():
+                self._word(word, quoted)
+                word, quoted = "", False
+                i += 1
+                continue
+            word += c
+            i += 1
+        self._word(word, quoted)
+        if not self._cont and self._ctx and self._ctx[-1] not in ("'", "$'", '"', "`", "${"):
+            self._cmd_start = True  # un saut de ligne sépare les commandes
+
+
+def replayable(stmt: str) -> bool:
+    """Instruction d'état du shell (sans autre effet) : à rejouer avant de reprendre plus loin."""
+    if _FUNC.match(stmt):
+        return True
+    words = stmt.split()
+    if not words or "\n" in stmt.strip() or any(op in stmt for op in ("&&", "||", ";", "|")):
+        return False
+    if _ASSIGN.match(words[0]):
+        # X=1 / X=1 Y=2 / X="a b" / X=$(cmd arg) ; pas "X=1 cmd" (variable pour cmd seule)
+        return len(words) == 1 or _ASSIGN.match(words[-1]) is not None or any(q in words[0] for q in "\"'$")
+    return words[0] in _STATE_CMDS
+
+
+class ShellPipe:
+    """bash persistant alimenté instruction par instruction ; s'arrête au premier échec."""
+
+    def __init__(self, cwd: str, env: dict, argv_prefix: list | None = None, popen_kwargs: dict | None = None):
+        self._cmd_r, self._cmd_w = os.pipe()
+        self._st_r, self._st_w = os.pipe()
+        argv = (argv_prefix or []) + ["bash", "--noprofile", "--norc", f"/dev/fd/{self._cmd_r}"]
+        kw = {"start_new_session": True, **(popen_kwargs or {})}  # ex. Sandbox.popen_kwargs() (piwi_limits)
+        self.proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     cwd=cwd, env=env, pass_fds=(self._cmd_r, self._st_w), **kw)
+        os.close(self._cmd_r)
+        os.close(self._st_w)
+        self._cmd = os.fdopen(self._cmd_w, "w", encoding="utf-8")
+        self._out: list = []
+        self._err: list = []
+        self.sent = 0
+        self.done = 0
+        self.ok = 0                # instructions réussies (sentinelle rc=0), préambule compris
+        self.failed_rc = None
+        self.first_sent_at = None
+        self.timed_out = False
+        self._threads = [
+            threading.Thread(target=self._pump, args=(self.proc.stdout, self._out), daemon=True),
+            threading.Thread(target=self._pump, args=(self.proc.stderr, self._err), daemon=True),
+            threading.Thread(target=self._status, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    @staticmethod
+    def _pump(stream, sink: list):
+        for chunk in iter(lambda: stream.read1(65536) if hasattr(stream, "read1") else stream.read(65536), b""):
+            sink.append(chunk)
+
+    def _status(self):
+        with os.fdopen(self._st_r, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    _seq, rc = (int(x) for x in line.split())
+                except ValueError:
+                    continue
+                self.done += 1
+                if rc == 0:
+                    self.ok += 1
+                if rc != 0 and self.failed_rc is None:
+                    self.failed_rc = rc
+        # EOF : le shell est terminé (fin normale, set -e ou sentinelle)
+        rc = self.proc.wait()
+        if rc != 0 and self.failed_rc is None:
+            self.failed_rc = rc
+
+    @property
+    def failed(self) -> bool:
+        return self.failed_rc is not None
+
+    def send(self, stmt: str) -> bool:
+        """Envoie une instruction (+ sentinelle). False si le shell a déjà échoué/fini."""
+        if self.failed or self.proc.poll() is not None:
+            return False
+        self.sent += 1
+        if self.first_sent_at is None:
+            self.first_sent_at = time.perf_counter()
+        sentinel = (f'__piwi_rc=$?; printf "%d %d\\n" {self.sent} "$__piwi_rc" >&{self._st_w}; '
+                    f'[ "$__piwi_rc" -eq 0 ] || exit "$__piwi_rc"')
+        try:
+            self._cmd.write(stmt + "\n" + sentinel + "\n")
+            self._cmd.flush()
+        except (BrokenPipeError, ValueError):
+            return False
+        return True
+
+    def finish(self, timeout: float | None = None) -> tuple:
+        """Ferme l'entrée, attend la fin du shell. Retourne (rc, stdout, stderr)."""
+        try:
+            self._cmd.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            rc = self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.timed_out = True
+            self.abort(signal.SIGKILL)
+            rc = self.proc.wait()
+        for t in self._threads:
+            t.join(timeout=5)
+        if self.failed_rc is not None and rc == 0:
+            rc = self.failed_rc
+        return rc, b"".join(self._out).decode("utf-8", "replace"), b"".join(self._err).decode("utf-8", "replace")
+
+    def abort(self, sig: int = signal.SIGTERM):
+        try:
+            os.killpg(self.proc.pid, sig)
+        except OSError:
+            pass
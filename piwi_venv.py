@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+piwi-venv – Fabrique de virtualenvs pour les scripts générés par Piwi
+
+- Wheelhouse partagé (~/.cache/piwi/wheelhouse) : les dépendances sont résolues
+  d'abord hors-ligne contre ce cache, puis en ligne seulement si nécessaire.
+- Templates : un venv "modèle" par (version de Python, ensemble d'exigences),
+  construit une fois depuis le wheelhouse.
+- Création : le venv demandé est cloné depuis le modèle par liens physiques
+  (copie si la cible est sur un autre système de fichiers, ex. /mnt/c) ; seuls
+  les scripts de bin/ contenant le chemin du modèle sont réécrits.
+- Durée de création et octets économisés sont affichés et journalisés
+  (~/.cache/piwi/venv_stats.jsonl, et $REQ_INTERNAL/venv_stats.jsonl si défini).
+
+Usage :
+  piwi-venv create <dir> [-r requirements.txt] [paquet ...] [--python python3]
+  piwi-venv stats
+  piwi-venv prune [--days 30]
+
+Env : PIWI_CACHE_DIR (def=~/.cache/piwi)
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+
+CACHE = Path(os.getenv("PIWI_CACHE_DIR", "") or Path.home() / ".cache" / "piwi")
+WHEELHOUSE = CACHE / "wheelhouse"
+TEMPLATES = CACHE / "venv-templates"
+STATS = CACHE / "venv_stats.jsonl"
+
+
+def info(msg: str):
+    print(f"piwi-venv: {msg}", file=sys.stderr, flush=True)
+
+
+def read_requirements(pkgs, req_file) -> list:
+    reqs = list(pkgs or [])
+    if req_file:
+        for line in Path(req_file).read_text(encoding="utf-8").splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line and not line.startswith("-"):
+                reqs.append(line)
+    return sorted({r.strip() for r in reqs if r.strip()}, key=str.lower)
+
+
+def python_tag(python: str) -> str:
+    cp = subprocess.run([python, "-c", "import sys,platform;print(platform.python_implementation(),sys.version.split()[0],sys.platform)"],
+                        stdout=subprocess.PIPE, text=True, check=True)
+    return cp.stdout.strip()
+
+
+def template_key(python: str, reqs: list) -> str:
+    h = hashlib.sha256((python_tag(python) + "\n" + "\n".join(reqs)).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _dir_bytes(p: Path) -> int:
+    n = 0
+    for root, _, files in os.walk(p):
+        for f in files:
+            fp = os.path.join(root, f)
+            if not os.path.islink(fp):
+                try:
+                    n += os.path.getsize(fp)
+                except OSError:
+                    pass
+    return n
+
+
+def fill_wheelhouse(python: str, reqs: list) -> dict:
+    """Garantit que les wheels de `reqs` sont dans le wheelhouse (hors-ligne d'abord)."""
+    WHEELHOUSE.mkdir(parents=True, exist_ok=True)
+    if not reqs:
+        return {"offline": True, "downloaded_bytes": 0}
+    before = _dir_bytes(WHEELHOUSE)
+    base = [python, "-m", "pip", "wheel", "-q", "--wheel-dir", str(WHEELHOUSE), "--find-links", str(WHEELHOUSE)]
+    off = subprocess.run(base + ["--no-index"] + reqs, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if off.returncode == 0:
+        return {"offline": True, "downloaded_bytes": 0}
+    subprocess.run(base + reqs, check=True)
+    return {"offline": False, "downloaded_bytes": max(0, _dir_bytes(WHEELHOUSE) - before)}
+
+
+def build_template(python: str, reqs: list, key: str) -> Path:
+    tpl = TEMPLATES / key
+    if (tpl / ".piwi_ready").exists():
+        return tpl
+    TEMPLATES.mkdir(parents=True, exist_ok=True)
+    tmp = TEMPLATES / f".{key}.{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    subprocess.run([python, "-m", "venv", str(tmp)], check=True)
+    if reqs:
+        subprocess.run([str(tmp / "bin" / "python"), "-m", "pip", "install", "-q", "--no-index",
+                        "--find-links", str(WHEELHOUSE)] + reqs, check=True)
+    # Les chemins absolus pointent vers tmp : on les fige vers l'emplacement final
+    _rewrite_bin(tmp, str(tmp), str(tpl))
+    (tmp / ".piwi_ready").write_text(json.dumps({"reqs": reqs, "created": time.time()}), encoding="utf-8")
+    try:
+        os.rename(tmp, tpl)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # construit en parallèle par un autre processus
+    return tpl
+
+
+def _rewrite_bin(venv: Path, old: str, new: str):
+    """Réécrit (nouvel inode) les fichiers texte de bin/ et pyvenv.cfg qui citent `old`."""
+    old_b, new_b = old.encode(), new.encode()
+    for p in list((venv / "bin").iterdir()) + [venv / "pyvenv.cfg"]:
+        if p.is_symlink() or not p.is_file():
+            continue
+        data = p.read_bytes()
+        if old_b in data:
+            mode = p.stat().st_mode
+            p.unlink()
+            p.write_bytes(data.replace(old_b, new_b))
+            os.chmod(p, mode)
+
+
+def clone(tpl: Path, dst: Path) -> dict:
+    """Clone tpl -> dst par liens physiques (repli en copie). Retourne les compteurs."""
+    linked = copied = 0
+    mode = "hardlink"
+    for root, dirs, files in os.walk(tpl):
+        rel = os.path.relpath(root, tpl)
+        droot = dst / rel if rel != "." else dst
+        droot.mkdir(parents=True, exist_ok=True)
+        for d in list(dirs):
+            sp = os.path.join(root, d)
+            if os.path.islink(sp):
+                os.symlink(os.readlink(sp), droot / d)
+                dirs.remove(d)
+        for f in files:
+            if rel == "." and f == ".piwi_ready":
+                continue
+            sp, dp = os.path.join(root, f), droot / f
+            if os.path.islink(sp):
+                os.symlink(os.readlink(sp), dp)
+                continue
+            size = os.path.getsize(sp)
+            if mode == "hardlink":
+                try:
+                    os.link(sp, dp)
+                    linked += size
+                    continue
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                        raise
+                    mode = "copy"
+            shutil.copy2(sp, dp)
+            copied += size
+    _rewrite_bin(dst, str(tpl), str(dst.resolve()))
+    return {"mode": mode, "linked_bytes": linked, "copied_bytes": copied}
+
+
+def _log_stats(rec: dict):
+    line = json.dumps(rec, ensure_ascii=False) + "\n"
+    targets = [STATS]
+    if os.getenv("REQ_INTERNAL"):
+        targets.append(Path(os.environ["REQ_INTERNAL"]) / "venv_stats.jsonl")
+    for t in targets:
+        try:
+            t.parent.mkdir(parents=True, exist_ok=True)
+            with open(t, "a", encoding="utf-8") as f:
+                f.write(line)
+        except Exception:
+            pass
+
+
+def cmd_create(a) -> int:
+    t0 = time.perf_counter()
+    dst = Path(a.dir).expanduser().absolute()
+    if dst.exists() and any(dst.iterdir()):
+        info(f"{dst} existe déjà et n'est pas vide.")
+        return 1
+    python = shutil.which(a.python) or a.python
+    reqs = read_requirements(a.packages, a.requirement)
+    key = template_key(python, reqs)
+    reused = (TEMPLATES / key / ".piwi_ready").exists()
+    wh = {"offline": True, "downloaded_bytes": 0}
+    if not reused:
+        wh = fill_wheelhouse(python, reqs)
+        build_template(python, reqs, key)
+    res = clone(TEMPLATES / key, dst)
+    dt = time.perf_counter() - t0
+    saved = res["linked_bytes"] if res["mode"] == "hardlink" else 0
+    rec = {"ts": time.time(), "dir": str(dst), "reqs": reqs, "template": key, "template_reused": reused,
+           "wheelhouse_offline": wh["offline"], "downloaded_bytes": wh["downloaded_bytes"],
+           "seconds": round(dt, 3), "bytes_saved": saved, **res}
+    _log_stats(rec)
+    info(f"venv prêt en {dt:.2f}s -> {dst} (modèle {'réutilisé' if reused else 'construit'}, "
+         f"{res['mode']}, {saved / 1048576:.1f} MiB économisés, "
+         f"{wh['downloaded_bytes'] / 1048576:.1f} MiB téléchargés)")
+    return 0
+
+
+def cmd_stats(_a) -> int:
+    recs = []
+    try:
+        recs = [json.loads(l) for l in STATS.read_text(encoding="utf-8").splitlines() if l.strip()]
+    except Exception:
+        pass
+    if not recs:
+        print("(aucune création)")
+        return 0
+    reused = sum(1 for r in recs if r.get("template_reused"))
+    secs = sorted(r.get("seconds", 0) for r in recs)
+    print(f"créations={len(recs)} modèles réutilisés={reused} ({reused / len(recs) * 100:.0f}%) "
+          f"p50={secs[len(secs) // 2]:.2f}s économisé={sum(r.get('bytes_saved', 0) for r in recs) / 1048576:.1f} MiB")
+    return 0
+
+
+def cmd_prune(a) -> int:
+    limit = time.time() - a.days * 86400
+    n = 0
+    for tpl in TEMPLATES.glob("*"):
+        if tpl.is_dir() and tpl.stat().st_mtime < limit:
+            shutil.rmtree(tpl, ignore_errors=True)
+            n += 1
+    print(f"{n} modèle(s) supprimé(s)")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="piwi-venv", description="Virtualenvs rapides depuis un wheelhouse partagé.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("create")
+    c.add_argument("dir")
+    c.add_argument("packages", nargs="*")
+    c.add_argument("-r", "--requirement", default="")
+    c.add_argument("--python", default="python3")
+    sub.add_parser("stats")
+    p = sub.add_parser("prune")
+    p.add_argument("--days", type=int, default=30)
+    a = ap.parse_args()
+    sys.exit({"create": cmd_create, "stats": cmd_stats, "prune": cmd_prune}[a.cmd](a))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Piwi – Préchauffage de la distro (côté WSL), lancé par la GUI à l'ouverture
+
+- Le simple lancement via wsl.exe démarre la VM / la distro (démarrage à froid).
+- Importe les modules du noyau (ses imports optionnels, lus dans noyau.py) et
+  `openai` : fichiers .py/.pyc et bibliothèques en cache disque de la VM,
+  __pycache__ écrits -> le premier noyau.py démarre vite.
+- Ouvre une connexion TLS vers l'API (DNS + NAT WSL + poignée de main) : chaque
+  noyau ouvrant son propre client, c'est le chemin réseau qui est préchauffé.
+- Imprime une ligne JSON {uptime_s, import_s, connect_s, ...} sur stdout.
+- --hold : puis se remplace par `cat` (quelques Ko) qui lit stdin jusqu'à sa
+  fermeture par la GUI ; ce processus vivant empêche l'arrêt de la VM pour
+  inactivité tant que la fenêtre est ouverte. Lance aussi la tâche de fond
+  piwi_idle.py (pré-chargement pendant l'inactivité), qui s'arrête avec la session.
+
+Env : PIWI_OPENAI_BASE_URL (hôte à préchauffer, def=api.openai.com), PIWI_IDLE=0
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import subprocess
+
+T0 = time.perf_counter()
+HERE = os.path.dirname(os.path.abspath(__file__))
+# repli si noyau.py est illisible ; sinon ses imports optionnels (cf. noyau_modules)
+MODULES = ("path_resolver", "piwi_profile", "piwi_actions", "piwi_sched", "piwi_fixer", "piwi_stream",
+           "piwi_limits", "piwi_exec", "piwi_errctx", "piwi_router", "piwi_plan", "piwi_pty",
+           "piwi_prefetch", "piwi_idle", "piwi_ratelimit", "piwi_privs", "piwi_archive")
+_IMPORT = re.compile(r"^\s+import ((?:piwi_\w+|path_resolver)) as \w+", re.M)
+
+
+def _uptime() -> float:
+    try:
+        return float(open("/proc/uptime", encoding="utf-8").read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return -1.0
+
+
+def noyau_modules() -> tuple:
+    """Modules importés par noyau.py à chaque requête (lus dans sa source : liste toujours à jour)."""
+    try:
+        with open(os.path.join(HERE, "noyau.py"), encoding="utf-8") as f:
+            found = tuple(dict.fromkeys(_IMPORT.findall(f.read())))
+    except OSError:
+        found = ()
+    return found or MODULES
+
+
+def warm_imports() -> list:
+    sys.path.insert(0, HERE)
+    failed = []
+    for name in ("openai",) + noyau_modules():
+        try:
+            __import__(name)
+        except Exception:
+            failed.append(name)
+    return failed
+
+
+def warm_connection(timeout: float = 5.0):
+    import ssl
+    import socket
+    from urllib.parse import urlparse
+    url = urlparse(os.getenv("PIWI_OPENAI_BASE_URL", "").strip() or "https://api.openai.com/v1")
+    host, port = url.hostname or "api.openai.com", url.port or (443 if url.scheme == "https" else 80)
+    t = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as s:
+            if url.scheme == "https":
+                with ssl.create_default_context().wrap_socket(s, server_hostname=host):
+                    pass
+    except OSError:
+        return host, None
+    return host, round(time.perf_counter() - t, 3)
+
+
+def start_idle():
+    """piwi_idle.py daemon rattaché à ce pid (conservé par exec : il vit autant que la session)."""
+    if os.getenv("PIWI_IDLE", "1") == "0":
+        return
+    try:
+        subprocess.Popen([sys.executable, os.path.join(HERE, "piwi_idle.py"), "daemon", "--parent", str(os.getpid())],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         cwd=HERE, start_new_session=True)
+    except OSError:
+        pass
+
+
+def main():
+    t_imp = time.perf_counter()
+    failed = warm_imports()
+    import_s = round(time.perf_counter() - t_imp, 3)
+    host, connect_s = warm_connection()
+    print(json.dumps({
+        "uptime_s": round(_uptime(), 1),   # faible = la VM vient de démarrer (à froid)
+        "import_s": import_s,
+        "import_failed": failed,
+        "host": host,
+        "connect_s": connect_s,
+        "total_s": round(time.perf_counter() - T0, 3),
+    }), flush=True)
+    if "--hold" in sys.argv[1:]:
+        start_idle()
+        os.execvp("sh", ["sh", "-c", "exec cat >/dev/null"])
+
+
+if __name__ == "__main__":
+    main()
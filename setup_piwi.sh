@@ -5,6 +5,16 @@
 # - Crée PIWI_HOME (Bureau\Piwi) et sa structure
 # - Copie create_shortcut.sh dans PIWI_HOME/bin
 # - Écrit un marqueur .piwi/.piwi_home.json et un README
+# - Crée l'utilisateur par défaut (piwi, groupe sudo) + /etc/wsl.conf
+#
+# Idempotent : chaque étape porte une empreinte (paquets, hashes de fichiers,
+# état utilisateur) mémorisée dans $PIWI_SETUP_STATE. Seules les étapes dont
+# l'empreinte a changé sont rejouées ; les étapes indépendantes tournent en
+# parallèle. Chaque étape émet une ligne "PIWI_STEP <nom> <ran|skip|fail> <s>"
+# reprise par l'installateur dans ses détails.
+#
+# Env : PIWI_HOME, PIWI_SETUP_FORCE=1 (ignore les empreintes),
+#       PIWI_SETUP_STATE (def=/var/lib/piwi/setup), PIWI_DEFAULT_USER (def=piwi)
 
 set -euo pipefail
 
@@ -49,57 +59,74 @@ guess_piwi_home() {
   printf "%s" "$HOME/Desktop/Piwi"
 }
 
-ensure_packages() {
-  export DEBIAN_FRONTEND=noninteractive
-  apt-get update -y
-  apt-get install -y --no-install-recommends \
-    ca-certificates curl gnupg \
-    python3 python3-pip python3-venv python3-apt
-}
-
-ensure_python_packages() {
-  python3 -m pip install --upgrade pip >/dev/null 2>&1 || true
-  python3 -m pip install --upgrade "openai>=1.40.0" >/dev/null 2>&1 || true
-}
+# Empreinte courte de stdin
+fingerprint() { sha256sum | cut -c1-16; }
 
-# ---------- main ----------
-log "==> Initialisation Piwi (WSL)…"
+# ---------- paramètres ----------
+BASE_PACKAGES=(ca-certificates curl gnupg python3 python3-pip python3-venv python3-apt)
+OPENAI_SPEC="openai>=1.40.0"
+ZSTD_SPEC="zstandard>=0.21"   # optionnel : archive des req_* (repli zlib sinon)
+HELPERS=(create_shortcut.sh launch.sh piwi_venv.py:piwi-venv piwi_fetch.py:piwi-fetch)   # source[:nom installé]
+PIWI_USER="${PIWI_DEFAULT_USER:-piwi}"
+FORCE="${PIWI_SETUP_FORCE:-0}"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
-# 1) Paquets de base
-ensure_packages
-ensure_python_packages
+if [[ $EUID -eq 0 ]]; then
+  STATE_DIR="${PIWI_SETUP_STATE:-/var/lib/piwi/setup}"
+else
+  STATE_DIR="${PIWI_SETUP_STATE:-$HOME/.cache/piwi/setup}"
+fi
+mkdir -p "$STATE_DIR"
 
-# 2) Résolution PIWI_HOME (côté Windows si possible)
 PIWI_HOME="${PIWI_HOME:-}"
 if [[ -z "$PIWI_HOME" ]]; then
   PIWI_HOME="$(guess_piwi_home)"
 fi
+MARKER_DIR="$PIWI_HOME/.piwi"
+MARKER_JSON="$MARKER_DIR/.piwi_home.json"
+README_TXT="$PIWI_HOME/README_PIWI.txt"
 
-log "PIWI_HOME ciblé : $PIWI_HOME"
-mkdir -p "$PIWI_HOME"/{Applications,bin,_internal} || true
-
-# 3) Copie des utilitaires
-SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
-
-# create_shortcut.sh -> PIWI_HOME/bin
-if [[ -f "$SCRIPT_DIR/create_shortcut.sh" ]]; then
-  cp -f "$SCRIPT_DIR/create_shortcut.sh" "$PIWI_HOME/bin/create_shortcut.sh"
-  chmod +x "$PIWI_HOME/bin/create_shortcut.sh"
-fi
+# ---------- étapes (fp_<nom> = empreinte, step_<nom> = action) ----------
 
-# (optionnel) expose aussi launch.sh s'il existe
-if [[ -f "$SCRIPT_DIR/launch.sh" ]]; then
-  cp -f "$SCRIPT_DIR/launch.sh" "$PIWI_HOME/bin/launch.sh"
-  chmod +x "$PIWI_HOME/bin/launch.sh"
-fi
+# 1) Paquets de base
+fp_packages() {
+  { printf "%s\n" "${BASE_PACKAGES[@]}"
+    dpkg-query -W -f='${Package} ${Status}\n' "${BASE_PACKAGES[@]}" 2>&1 || true
+  } | fingerprint
+}
+step_packages() {
+  export DEBIAN_FRONTEND=noninteractive
+  apt-get update -y
+  apt-get install -y --no-install-recommends "${BASE_PACKAGES[@]}"
+}
 
-# 4) Marqueurs & README
-MARKER_DIR="$PIWI_HOME/.piwi"
-MARKER_JSON="$MARKER_DIR/.piwi_home.json"
-mkdir -p "$MARKER_DIR"
+# 2) SDK OpenAI (dépend de packages)
+fp_python() {
+  { printf "%s\n" "$OPENAI_SPEC" "$ZSTD_SPEC"
+    python3 -m pip --version 2>&1 || true
+    python3 -c 'import openai; print(openai.__version__)' 2>&1 || true
+    python3 -c 'import zstandard; print(zstandard.__version__)' 2>&1 || true
+  } | fingerprint
+}
+step_python() {
+  python3 -m pip install --upgrade pip >/dev/null 2>&1 || true
+  python3 -m pip install --upgrade "$OPENAI_SPEC" >/dev/null 2>&1 || true
+  python3 -m pip install "$ZSTD_SPEC" >/dev/null 2>&1 || true
+}
 
-log "==> Écriture du marqueur PIWI_HOME…"
-cat > "$MARKER_JSON" <<EOF
+# 3) PIWI_HOME : structure, marqueur, README
+fp_home() {
+  { printf "%s\n" "$PIWI_HOME"
+    for d in Applications bin _internal; do [[ -d "$PIWI_HOME/$d" ]] && echo "$d"; done
+    [[ -f "$MARKER_JSON" ]] && echo marker
+    [[ -f "$README_TXT" ]] && echo readme
+    true
+  } | fingerprint
+}
+step_home() {
+  mkdir -p "$PIWI_HOME"/{Applications,bin,_internal} "$MARKER_DIR"
+  log "==> Écriture du marqueur PIWI_HOME…"
+  cat > "$MARKER_JSON" <<EOF
 {
   "piwi_home": "$(printf "%s" "$PIWI_HOME" | sed 's/\\/\\\\/g')",
   "created_at": "$(date -u +%Y-%m-%dT%H:%M:%SZ)",
@@ -107,10 +134,8 @@ cat > "$MARKER_JSON" <<EOF
   "version": "1.0"
 }
 EOF
-
-README_TXT="$PIWI_HOME/README_PIWI.txt"
-if [[ ! -f "$README_TXT" ]]; then
-  cat > "$README_TXT" <<'EOF'
+  if [[ ! -f "$README_TXT" ]]; then
+    cat > "$README_TXT" <<'EOF'
 Piwi – Dossier de travail (PIWI_HOME)
 -------------------------------------
 
@@ -125,11 +150,102 @@ Astuce :
 - Si une action nécessite des droits admin Linux, relancez en mode "Exécuter en root (WSL)"
   OU fournissez un mot de passe sudo quand l’interface le demande.
 EOF
-fi
+  fi
+}
+
+# 4) Utilitaires -> PIWI_HOME/bin (dépend de home)
+fp_helpers() {
+  { printf "%s\n" "$PIWI_HOME"
+    for h in "${HELPERS[@]}"; do
+      sha256sum "$SCRIPT_DIR/${h%%:*}" "$PIWI_HOME/bin/${h##*:}" 2>&1 | cut -c1-64 || true
+    done
+  } | fingerprint
+}
+step_helpers() {
+  mkdir -p "$PIWI_HOME/bin"
+  for h in "${HELPERS[@]}"; do
+    if [[ -f "$SCRIPT_DIR/${h%%:*}" ]]; then
+      cp -f "$SCRIPT_DIR/${h%%:*}" "$PIWI_HOME/bin/${h##*:}"
+      chmod +x "$PIWI_HOME/bin/${h##*:}"
+    fi
+  done
+}
+
+# 5) Utilisateur par défaut (ex-set_default_user de l'installateur)
+fp_user() {
+  { printf "%s\n" "$PIWI_USER"
+    id "$PIWI_USER" 2>&1 || true
+    cat /etc/wsl.conf 2>&1 || true
+  } | fingerprint
+}
+step_user() {
+  local SUDO=""
+  [[ $EUID -ne 0 ]] && SUDO="sudo"
+  if ! id -u "$PIWI_USER" >/dev/null 2>&1; then
+    $SUDO adduser --disabled-password --gecos "" "$PIWI_USER"
+  fi
+  if getent group sudo >/dev/null 2>&1; then
+    $SUDO usermod -aG sudo "$PIWI_USER"
+  fi
+  $SUDO sh -c "printf '[user]\ndefault=%s\n' '$PIWI_USER' > /etc/wsl.conf"
+}
+
+# ---------- moteur ----------
+STEP_TMP="$(mktemp -d)"
+trap 'rm -rf "$STEP_TMP"' EXIT
 
-# 5) Info finale
+now() { date +%s.%N; }
+
+run_step() {
+  local name="$1" t0 stored status rc
+  t0="$(now)"
+  stored="$(cat "$STATE_DIR/$name.fp" 2>/dev/null || true)"
+  if [[ "$FORCE" != "1" && -n "$stored" && "$(fp_"$name")" == "$stored" ]]; then
+    status="skip"
+  else
+    set +e
+    ( set -euo pipefail; "step_$name" )
+    rc=$?
+    set -e
+    if [[ $rc -eq 0 ]]; then
+      fp_"$name" > "$STATE_DIR/$name.fp" || true
+      status="ran"
+    else
+      rm -f "$STATE_DIR/$name.fp"
+      touch "$STEP_TMP/$name.failed"
+      status="fail"
+    fi
+  fi
+  printf "PIWI_STEP %s %s %s\n" "$name" "$status" "$(awk -v a="$t0" -v b="$(now)" 'BEGIN{printf "%.2f", b-a}')"
+}
+
+# Lance les étapes d'un niveau en parallèle, puis restitue leurs sorties dans l'ordre
+run_level() {
+  local n pids=()
+  for n in "$@"; do
+    run_step "$n" > "$STEP_TMP/$n.log" 2>&1 &
+    pids+=("$!")
+  done
+  for n in "${pids[@]}"; do wait "$n" || true; done
+  for n in "$@"; do cat "$STEP_TMP/$n.log"; done
+}
+
+# ---------- main ----------
+T_START="$(now)"
+log "==> Initialisation Piwi (WSL)…"
+log "PIWI_HOME ciblé : $PIWI_HOME"
+
+# Graphe : python dépend de packages, helpers dépend de home ; user est autonome.
+run_level packages home user
+run_level python helpers
+
+# ---------- Info finale ----------
 log
-log "✓ Installation de base Piwi terminée."
+if ls "$STEP_TMP"/*.failed >/dev/null 2>&1; then
+  err "Étape(s) en échec : $(basename -s .failed "$STEP_TMP"/*.failed | tr '\n' ' ')"
+  exit 1
+fi
+log "✓ Installation de base Piwi terminée ($(awk -v a="$T_START" -v b="$(now)" 'BEGIN{printf "%.2f", b-a}')s)."
 log "   PIWI_HOME  : $PIWI_HOME"
 log "   create_shortcut.sh installé dans : $PIWI_HOME/bin"
 log "   SDK OpenAI : $(python3 - <<'PY'
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests des backends d'exécution avec FakeTransport ("fake:/dossier") : worker simulé
+par un HOME local, sans sshd. Sélection du backend, env transmis, délai, sortie en
+direct et rapatriement des artefacts.
+
+Lancer : python3 -m pytest -q tests
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import piwi_exec as EX  # noqa: E402
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="bash requis")
+
+
+@pytest.fixture
+def job(tmp_path):
+    """Arborescence locale d'une requête : PIWI_HOME, REQ_INTERNAL, DEST_DIR, exec.sh."""
+    home, req, dest = tmp_path / "Piwi", tmp_path / "Piwi" / "_internal" / "req_t", tmp_path / "Piwi" / "out"
+    for d in (req, dest):
+        d.mkdir(parents=True)
+    env = dict(os.environ, PIWI_HOME=str(home), REQ_INTERNAL=str(req), DEST_DIR=str(dest))
+
+    def script(body: str) -> Path:
+        p = req / "exec.sh"
+        p.write_text("set -euo pipefail\n" + body + "\n", encoding="utf-8")
+        return p
+    return env, script, tmp_path
+
+
+def test_select_local_by_default(monkeypatch):
+    monkeypatch.delenv("PIWI_EXEC_BACKEND", raising=False)
+    assert EX.backend_kind() == "local"
+    assert EX.select_backend() == (None, {})
+
+
+def test_select_ssh_without_workers_falls_back(monkeypatch):
+    monkeypatch.setenv("PIWI_EXEC_BACKEND", "ssh")
+    monkeypatch.setenv("PIWI_WORKERS", "")
+    logs = []
+    assert EX.select_backend(logs.append) == (None, {})
+    assert logs and "exécution locale" in logs[0]
+
+
+def test_select_container_without_runtime_falls_back(monkeypatch):
+    monkeypatch.setenv("PIWI_EXEC_BACKEND", "container")
+    monkeypatch.setenv("PIWI_CONTAINER_RUNTIME", "false")
+    assert EX.select_backend(lambda _m: None) == (None, {})
+
+
+def test_select_ssh_picks_least_loaded(monkeypatch, tmp_path):
+    monkeypatch.setenv("PIWI_EXEC_BACKEND", "ssh")
+    monkeypatch.setenv("PIWI_WORKERS", f"fake:{tmp_path}/w1,fake:{tmp_path}/w2,fake:{tmp_path}/down")
+    loads = {"w1": 0.9, "w2": 0.2, "down": None}
+    monkeypatch.setattr(EX.SSHPool, "probe", lambda self, tr: loads[Path(tr.root).name])
+    be, info = EX.select_backend()
+    assert be.name == "ssh"
+    assert info == {"worker": f"fake:{tmp_path}/w2", "load": 0.2}
+
+
+def test_fake_worker_health_probe(tmp_path):
+    load = EX.SSHPool([]).probe(EX.make_transport(f"fake:{tmp_path}/w"))
+    assert load is not None and load >= 0
+
+
+def test_shipped_env_filters(monkeypatch):
+    monkeypatch.setenv("PIWI_OPENAI_KEY", "sk-secret")
+    env = dict(os.environ, EXTRA="1", PIWI_XY="z", PIP_INDEX_URL="http://mirror/simple",
+               PATH="/local/bin:" + os.environ.get("PATH", ""), PIWI_HOME="/local/Piwi")
+    shipped = EX.shipped_env(env)
+    assert shipped["EXTRA"] == "1" and shipped["PIWI_XY"] == "z"
+    assert shipped["PIP_INDEX_URL"] == "http://mirror/simple"
+    for k in ("PATH", "PIWI_HOME", "PIWI_OPENAI_KEY", "HOME"):
+        assert k not in shipped
+
+
+def test_ssh_run_ships_env_and_pulls_artifacts(job, tmp_path):
+    env, script, _ = job
+    env.update(FIX_FLAG="a b'c", PIWI_STEP="2")
+    p = script('echo "flag=$FIX_FLAG step=$PIWI_STEP"\n'
+               'echo "home=$PIWI_HOME"\n'
+               'echo art > "$REQ_INTERNAL/artifact.txt"\n'
+               'echo data > "$DEST_DIR/result.txt"')
+    pool = EX.SSHPool([f"fake:{tmp_path}/worker"])
+    r = pool.run(p, env, transport=pool.transports[0])
+    assert r.rc == 0, r.err
+    assert "flag=a b'c step=2" in r.out
+    assert f"home={tmp_path}/worker/.piwi-worker/" in r.out  # chemins distants, pas locaux
+    assert (Path(env["REQ_INTERNAL"]) / "artifact.txt").read_text() == "art\n"
+    assert (Path(env["DEST_DIR"]) / "result.txt").read_text() == "data\n"
+    assert not (Path(env["REQ_INTERNAL"]) / "env.sh").exists()
+    assert not (tmp_path / "worker" / ".piwi-worker" / Path(env["REQ_INTERNAL"]).name).exists()
+
+
+def test_ssh_run_streams_lines(job, tmp_path):
+    env, script, _ = job
+    p = script("echo one; sleep 0.3; echo two >&2; sleep 0.3; echo three")
+    seen = []
+    pool = EX.SSHPool([f"fake:{tmp_path}/worker"])
+    r = pool.run(p, env, on_line=lambda l: seen.append((time.monotonic(), l)), transport=pool.transports[0])
+    assert r.rc == 0
+    assert [l for _, l in seen] == ["one", "[stderr] two", "three"]
+    assert seen[-1][0] - seen[0][0] >= 0.5  # relayées au fil de l'eau, pas à la fin
+
+
+def test_ssh_run_timeout(job, tmp_path):
+    env, script, _ = job
+    p = script("echo start; sleep 30; echo never")
+    pool = EX.SSHPool([f"fake:{tmp_path}/worker"])
+    t0 = time.monotonic()
+    r = pool.run(p, env, timeout=1, transport=pool.transports[0])
+    assert r.rc != 0
+    assert "start" in r.out and "never" not in r.out
+    assert time.monotonic() - t0 < 5
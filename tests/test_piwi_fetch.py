@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de piwi_fetch contre bench/http_files.py (Range, If-Range, --drop-after) servi
+sur un thread : plages parallèles, reprise après coupure, cache, ETag modifié.
+
+Lancer : python3 -m pytest -q tests
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "bench"))
+import piwi_fetch as PF  # noqa: E402
+import http_files as HF  # noqa: E402
+
+MB = 1 << 20
+
+
+class Server:
+    """http_files.Handler sur un port libre ; journal des GET (en-tête Range)."""
+
+    def __init__(self, root: Path, drop_after: int = 0):
+        self.gets: list = []
+        gets = self.gets
+
+        class Handler(HF.Handler):
+            dropped: set = set()
+
+            def do_GET(self):
+                gets.append(self.headers.get("Range"))
+                super().do_GET()
+
+        Handler.root, Handler.drop_after = str(root), drop_after
+        self.handler = Handler
+        self.srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.srv.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.srv.server_address[1]}/{name}"
+
+    def close(self):
+        self.srv.shutdown()
+        self.srv.server_close()
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    cache = tmp_path / "cache" / "fetch"
+    for name, sub in (("CACHE", ""), ("BLOBS", "blobs"), ("INDEX", "index"), ("PARTS", "partial")):
+        monkeypatch.setattr(PF, name, cache / sub if sub else cache)
+    monkeypatch.setenv("REQ_INTERNAL", str(tmp_path))  # fetch_stats.jsonl
+    monkeypatch.setenv("PIWI_FETCH_SPLIT_MIN", "1M")
+    # pas d'attente entre deux essais (côté piwi_fetch seulement : le serveur garde son débit)
+    monkeypatch.setattr(PF, "time", SimpleNamespace(time=time.time, monotonic=time.monotonic,
+                                                    perf_counter=time.perf_counter, sleep=lambda _s: None))
+    files = tmp_path / "files"
+    files.mkdir()
+    servers = []
+
+    def serve(drop_after: int = 0) -> Server:
+        servers.append(Server(files, drop_after))
+        return servers[-1]
+    yield files, serve, tmp_path
+    for s in servers:
+        s.close()
+
+
+def payload(path: Path, size: int, seed: bytes = b"piwi") -> str:
+    block = hashlib.sha256(seed).digest() * 2048
+    path.write_bytes((block * (size // len(block) + 1))[:size])
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def sha(p: Path) -> str:
+    return hashlib.sha256(p.read_bytes()).hexdigest()
+
+
+def stats(tmp_path: Path) -> list:
+    return [json.loads(l) for l in (tmp_path / "fetch_stats.jsonl").read_text().splitlines()]
+
+
+def test_split_download(env):
+    files, serve, tmp = env
+    digest = payload(files / "big.bin", 3 * MB + 123)
+    srv = serve()
+    out = PF.fetch(srv.url("big.bin"), dest_dir=tmp / "out", connections=4, quiet=True)
+    assert sha(out) == digest
+    assert stats(tmp)[-1]["connections"] == 4
+    assert len([r for r in srv.gets if r]) == 4  # une requête Range par plage
+    assert not list(PF.PARTS.glob("*"))  # ni .part, ni état, ni .lock
+
+
+def test_resume_after_drop_same_run(env):
+    files, serve, tmp = env
+    digest = payload(files / "one.bin", 512 * 1024)  # < SPLIT_MIN : une seule connexion
+    srv = serve(drop_after=200 * 1024)
+    out = PF.fetch(srv.url("one.bin"), dest_dir=tmp / "out", quiet=True)
+    assert sha(out) == digest
+    assert srv.gets[0] is None and srv.gets[1].startswith(f"bytes={200 * 1024}-")
+
+
+def test_resume_across_runs(env, monkeypatch):
+    files, serve, tmp = env
+    digest = payload(files / "one.bin", 512 * 1024)
+    srv = serve(drop_after=300 * 1024)
+    orig = PF.Download._fetch_range
+    monkeypatch.setattr(PF.Download, "_fetch_range", lambda self, r, fd, tries=4: orig(self, r, fd, tries=1))
+    with pytest.raises(OSError):
+        PF.fetch(srv.url("one.bin"), dest_dir=tmp / "out", quiet=True)
+    assert list(PF.PARTS.glob("*.part")) and list(PF.PARTS.glob("*.lock"))  # échec : partiel gardé
+    monkeypatch.setattr(PF.Download, "_fetch_range", orig)
+    out = PF.fetch(srv.url("one.bin"), dest_dir=tmp / "out", quiet=True)
+    assert sha(out) == digest
+    assert stats(tmp)[-1]["resumed_bytes"] == 300 * 1024
+    assert srv.gets[-1].startswith(f"bytes={300 * 1024}-")
+    assert not list(PF.PARTS.glob("*"))
+
+
+def test_cache_hit(env):
+    files, serve, tmp = env
+    digest = payload(files / "c.bin", 100 * 1024)
+    srv = serve()
+    PF.fetch(srv.url("c.bin"), dest_dir=tmp / "a", quiet=True)
+    n = len(srv.gets)
+    out = PF.fetch(srv.url("c.bin"), dest_dir=tmp / "b", quiet=True)
+    assert sha(out) == digest
+    assert stats(tmp)[-1]["cache_hit"] is True
+    assert len(srv.gets) == n  # HEAD seulement
+    assert PF.warm(srv.url("c.bin")) == "cache"
+
+
+def test_changed_etag_refetches(env):
+    files, serve, tmp = env
+    payload(files / "e.bin", 100 * 1024, b"v1")
+    srv = serve()
+    PF.fetch(srv.url("e.bin"), dest_dir=tmp / "a", quiet=True)
+    digest2 = payload(files / "e.bin", 100 * 1024, b"v2")
+    os.utime(files / "e.bin", (time.time() + 5, time.time() + 5))
+    out = PF.fetch(srv.url("e.bin"), dest_dir=tmp / "b", quiet=True)
+    assert sha(out) == digest2
+    assert stats(tmp)[-1]["cache_hit"] is False
+
+
+def test_lock_serializes_and_is_removed(env):
+    files, serve, tmp = env
+    digest = payload(files / "s.bin", 2 * MB)
+    srv = serve()
+    srv.handler.rate = 8 * MB  # ~0,25 s par connexion : les deux appels se chevauchent
+    res = {}
+    ts = [threading.Thread(target=lambda: res.setdefault("warm", PF.warm(srv.url("s.bin"), connections=2))),
+          threading.Thread(target=lambda: res.setdefault("fetch", PF.fetch(srv.url("s.bin"), dest_dir=tmp / "o",
+                                                                           quiet=True)))]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join(timeout=30)
+    assert sha(res["fetch"]) == digest
+    assert len([r for r in srv.gets if r]) <= 2  # téléchargé une seule fois
+    assert not list(PF.PARTS.glob("*.lock"))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du découpage en instructions (StatementSplitter) et de ShellPipe : chaque
+script est aussi donné caractère par caractère, comme le flux de la complétion.
+
+Lancer : python3 -m pytest -q tests
+"""
+
+import os
+import sys
+import shutil
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import piwi_stream as PS  # noqa: E402
+
+
+def split(script: str) -> list:
+    sp = PS.StatementSplitter()
+    return sp.feed(script) + sp.close()
+
+
+def split_chars(script: str) -> list:
+    sp = PS.StatementSplitter()
+    out = []
+    for c in script:
+        out += sp.feed(c)
+    return out + sp.close()
+
+
+CASES = {
+    "allman": ("foo()\n{\n  echo hi\n}\nfoo\n",
+               ["foo()\n{\n  echo hi\n}", "foo"]),
+    "function_keyword": ("function bar\n{\n  echo x\n}\nbar\n",
+                         ["function bar\n{\n  echo x\n}", "bar"]),
+    "function_inline": ("f() { echo a; }\nf\n",
+                        ["f() { echo a; }", "f"]),
+    "function_subshell": ("g()\n(\n  cd /tmp\n)\ng\n",
+                          ["g()\n(\n  cd /tmp\n)", "g"]),
+    "ansi_c": ("echo $'a\\'b'\necho 2\n",
+               ["echo $'a\\'b'", "echo 2"]),
+    "heredoc": ("cat <<EOF > out.txt\nif (\n'\nEOF\necho done\n",
+                ["cat <<EOF > out.txt\nif (\n'\nEOF", "echo done"]),
+    "heredoc_tabs_quoted": ("cat <<-'END'\n\t$x\n\tEND\necho ok\n",
+                            ["cat <<-'END'\n\t$x\n\tEND", "echo ok"]),
+    "case": ('case "$1" in\n  a|b) echo ab ;;\n  *) echo other ;;\nesac\necho after\n',
+             ['case "$1" in\n  a|b) echo ab ;;\n  *) echo other ;;\nesac', "echo after"]),
+    "continuation": ("printf '%s\\n' \\\n  a \\\n  b\necho x\n",
+                     ["printf '%s\\n' \\\n  a \\\n  b", "echo x"]),
+    "trailing_operator": ("mkdir -p d &&\n  cd d\npwd\n",
+                          ["mkdir -p d &&\n  cd d", "pwd"]),
+    "loop": ("for i in 1 2; do\n  echo $i\ndone\necho end\n",
+             ["for i in 1 2; do\n  echo $i\ndone", "echo end"]),
+    "fenced": ("```bash\necho a\n```\nCommentaire hors bloc.\n",
+               ["echo a"]),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_split(name):
+    script, expected = CASES[name]
+    assert split(script) == expected
+    assert split_chars(script) == expected
+
+
+def test_unterminated_returned_on_close():
+    sp = PS.StatementSplitter()
+    assert sp.feed("foo()\n{\n  echo hi\n") == []
+    assert sp.close() == ["foo()\n{\n  echo hi"]
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash requis")
+@pytest.mark.parametrize("name", ["allman", "function_keyword", "ansi_c", "case", "continuation"])
+def test_shellpipe_runs_statements(name, tmp_path):
+    script, expected = CASES[name]
+    pipe = PS.ShellPipe(str(tmp_path), dict(os.environ))
+    for st in split(script):
+        assert pipe.send(st)
+    rc, out, err = pipe.finish(timeout=20)
+    assert rc == 0, err
+    assert pipe.done == len(expected)
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="bash requis")
+def test_shellpipe_stops_on_failure(tmp_path):
+    pipe = PS.ShellPipe(str(tmp_path), dict(os.environ))
+    for st in split("echo a\nfalse\necho never\n"):
+        pipe.send(st)
+    rc, out, _ = pipe.finish(timeout=20)
+    assert rc == 1 and "never" not in out
+    assert pipe.ok == 1  # reprise à l'instruction 2 ("false")
+
+
+@pytest.mark.parametrize("stmt,expected", [
+    ("X=1", True), ("X=1 Y=2", True), ('X="a b"', True), ("DIR=$(mktemp -d)", True),
+    ("export PATH=$HOME/bin:$PATH", True), ("cd /tmp", True), ("source .venv/bin/activate", True),
+    ("foo()\n{\n  echo hi\n}", True), ("X=1 make", False), ("cd d && make", False),
+    ("apt-get install -y curl", False), ("echo x >> log", False),
+])
+def test_replayable(stmt, expected):
+    assert PS.replayable(stmt) is expected
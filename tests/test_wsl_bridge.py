@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de wsl_bridge sous Linux : PIWI_WSL_EXE pointe vers un faux wsl.exe qui répond
+en UTF-16LE comme le vrai et journalise ses appels (pour compter les sondes).
+
+Lancer : python3 -m pytest -q tests
+"""
+
+import os
+import sys
+import time
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import wsl_bridge as WB  # noqa: E402
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="faux wsl.exe POSIX")
+
+STUB = r'''#!/usr/bin/env python3
+import os, sys
+from pathlib import Path
+d = Path(os.environ["WSL_STUB_DIR"])
+with open(d / "calls", "a") as f:
+    f.write(" ".join(sys.argv[1:]) + "\n")
+def out(text):
+    sys.stdout.buffer.write(text.replace("\n", "\r\n").encode("utf-16le"))
+distros = [l for l in (d / "distros").read_text().splitlines() if l.strip()]
+args = sys.argv[1:]
+if args == ["--status"]:
+    out("Version par défaut : 2\n")
+elif args == ["-l", "-q"]:
+    if (d / "quiet_fails").exists():
+        sys.exit(1)
+    out("".join(n + "\n" for n in distros))
+elif args == ["-l", "-v"]:
+    out("  NAME            STATE           VERSION\n"
+        + "".join(("* " if i == 0 else "  ") + f"{n:<16}Running         2\n" for i, n in enumerate(distros)))
+elif args[:1] == ["-d"] and "--" in args:
+    if args[1] not in distros:
+        sys.exit(1)
+    os.execvp(args[args.index("--") + 1], args[args.index("--") + 1:])
+else:
+    sys.exit(1)
+'''
+
+
+class StubWSL:
+    """Dossier du faux wsl.exe : distros enregistrées, appels journalisés."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def distros(self, *names):
+        (self.path / "distros").write_text("".join(n + "\n" for n in names), encoding="utf-8")
+
+    def calls(self, prefix: str = "") -> int:
+        try:
+            lines = (self.path / "calls").read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return 0
+        return sum(1 for l in lines if l.startswith(prefix))
+
+
+@pytest.fixture
+def wsl(tmp_path, monkeypatch):
+    stub = tmp_path / "wsl.exe"
+    stub.write_text(STUB, encoding="utf-8")
+    stub.chmod(0o755)
+    (tmp_path / "distros").write_text("PiwiUbuntu\nUbuntu\n", encoding="utf-8")
+    monkeypatch.setenv("WSL_STUB_DIR", str(tmp_path))
+    monkeypatch.setenv("PIWI_WSL_EXE", str(stub))
+    monkeypatch.setenv("PIWI_STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(WB, "WSL_EXE", str(stub))
+    return StubWSL(tmp_path)
+
+
+def test_decode_utf16_quiet_list(wsl):
+    raw = "PiwiUbuntu\r\nUbuntu\r\n".encode("utf-16le")
+    assert WB._normalize_lines(WB._decode_bytes(raw)) == ["PiwiUbuntu", "Ubuntu"]
+    assert WB._normalize_lines(WB._decode_bytes(b"\xff\xfe" + raw)) == ["PiwiUbuntu", "Ubuntu"]
+    assert WB.distro_list_quiet() == ["PiwiUbuntu", "Ubuntu"]
+    assert WB.distro_exists("piwiubuntu")
+    assert not WB.distro_exists("Debian")
+
+
+def test_distro_exists_falls_back_to_verbose(wsl):
+    (wsl.path / "quiet_fails").touch()
+    assert WB.distro_list_quiet() is None
+    assert WB.distro_exists("PiwiUbuntu")  # "* PiwiUbuntu  Running 2"
+    assert not WB.distro_exists("Debian")
+    assert wsl.calls("-l -v") == 2
+
+
+def test_probe_health_cache_hit(wsl):
+    first = WB.probe_health("PiwiUbuntu", ttl=60)
+    assert first.ready and not first.cached
+    n = wsl.calls()
+    second = WB.probe_health("PiwiUbuntu", ttl=60)
+    assert second.ready and second.cached
+    assert wsl.calls() == n  # aucun wsl.exe lancé
+
+
+def test_probe_health_cache_expiry(wsl):
+    assert not WB.probe_health("PiwiUbuntu", ttl=0.2).cached
+    time.sleep(0.3)
+    assert not WB.probe_health("PiwiUbuntu", ttl=0.2).cached
+    assert WB.probe_health("PiwiUbuntu", ttl=60).cached
+
+
+def test_probe_health_degraded_not_cached(wsl):
+    wsl.distros("Ubuntu")
+    r = WB.probe_health("PiwiUbuntu", ttl=60)
+    assert not r.exists and not r.ready
+    assert not WB.probe_health("PiwiUbuntu", ttl=60).cached  # re-sondé
+    WB.invalidate_health_cache()
+    assert not (wsl.path / "state" / "wsl_health.json").exists()
+
+
+def test_wait_for_distro_backoff(wsl):
+    wsl.distros("Ubuntu")
+    t = threading.Timer(0.5, wsl.distros, args=("Ubuntu", "PiwiUbuntu"))
+    t.start()
+    t0 = time.monotonic()
+    lines = WB.wait_for_distro("PiwiUbuntu", timeout=5)
+    t.join()
+    assert lines == ["Ubuntu", "PiwiUbuntu"]
+    assert time.monotonic() - t0 < 2.5
+    assert wsl.calls("-l -q") <= 6  # 0.1, 0.2, 0.4, 0.8 s : pas une boucle serrée
+
+
+def test_wait_for_distro_timeout(wsl):
+    wsl.distros("Ubuntu")
+    t0 = time.monotonic()
+    assert WB.wait_for_distro("PiwiUbuntu", timeout=1.0) is None
+    assert 0.9 <= time.monotonic() - t0 < 2.0
+    assert wsl.calls("-l -q") <= 6
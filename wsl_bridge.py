@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+r"""
+Piwi – Pont WSL partagé (GUI principale + installateur)
+
+- Helpers sous-processus communs : run(), _decode_bytes(), _normalize_lines().
+- Sondes WSL : wsl_ok(), distro_list_quiet(), distro_exists(), distro_healthy().
+- probe_health() : lance les sondes EN PARALLÈLE et met le résultat en cache
+  (TTL court) dans un fichier d'état -> démarrage rapide de la GUI.
+- wait_for_distro() : attente de l'enregistrement après `wsl --import`
+  (une seule liste `-l -q` par tentative, avec backoff).
+- log_latency() : latence de la première requête (à froid / à chaud) dans
+  <state_dir>/latency.jsonl.
+
+Env :
+  PIWI_DISTRO_NAME (def="PiwiUbuntu"), PIWI_WSL_EXE (def="wsl.exe"),
+  PIWI_HEALTH_TTL (secondes, def=60), PIWI_STATE_DIR (def=~/Piwi/.state)
+"""
+
+import os
+import json
+import time
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+DISTRO_NAME = os.environ.get("PIWI_DISTRO_NAME", "PiwiUbuntu")
+WSL_EXE = os.environ.get("PIWI_WSL_EXE", "wsl.exe")
+HEALTH_TTL = float(os.environ.get("PIWI_HEALTH_TTL", "60") or 60)
+CREATE_NO_WINDOW = 0x08000000 if os.name == "nt" else 0
+
+
+# ---------- Sous-processus ----------
+
+def _decode_bytes(b) -> str:
+    """Décodage robuste des sorties de wsl.exe (UTF-16LE fréquent)."""
+    if not b:
+        return ""
+    if isinstance(b, str):
+        return b
+    if b.startswith(b"\xff\xfe") or b"\x00" in b[:4]:
+        try:
+            return b.decode("utf-16le", errors="replace")
+        except Exception:
+            pass
+    try:
+        return b.decode("utf-8")
+    except Exception:
+        return b.decode("cp1252", errors="replace")
+
+
+def run(cmd, **kw) -> SimpleNamespace:
+    """
+    Lance un sous-processus, capture en BYTES, puis décode proprement.
+    Retourne un objet {returncode, stdout(str), stderr(str)}.
+    """
+    if os.name == "nt":
+        kw.setdefault("creationflags", CREATE_NO_WINDOW)
+        kw.setdefault("shell", False)
+    kw.setdefault("stdout", subprocess.PIPE)
+    kw.setdefault("stderr", subprocess.PIPE)
+    kw["text"] = False  # bytes
+
+    p = subprocess.run(cmd, **kw)
+    return SimpleNamespace(
+        returncode=p.returncode,
+        stdout=_decode_bytes(p.stdout),
+        stderr=_decode_bytes(p.stderr),
+    )
+
+
+def _normalize_lines(s: str):
+    """Nettoie les sorties : supprime NULs/BOM/astérisques éventuels, strip par ligne."""
+    s = (s or "").replace("\x00", "")
+    out = []
+    for ln in s.splitlines():
+        ln = ln.replace("\ufeff", "").lstrip("*").strip()
+        if ln:
+            out.append(ln)
+    return out
+
+
+def to_wsl_path(win_path) -> str:
+    """C:\\Users\\x -> /mnt/c/Users/x (inchangé si ce n'est pas un chemin Windows)."""
+    p = str(win_path or "")
+    if len(p) < 3 or p[1:3] != ":\\":
+        return p
+    rest = p[3:].replace("\\", "/")
+    return f"/mnt/{p[0].lower()}/{rest}"
+
+
+def wsl_bash(cmd: str, *, user: Optional[str] = None, distro: str = DISTRO_NAME) -> list:
+    base = [WSL_EXE, "-d", distro]
+    if user:
+        base += ["-u", user]
+    base += ["--", "bash", "-lc", cmd]
+    return base
+
+
+# ---------- Sondes ----------
+
+def _wsl_available() -> bool:
+    # Sous Linux, seul un wsl.exe explicitement fourni (stub de test) est utilisé
+    return os.name == "nt" or "PIWI_WSL_EXE" in os.environ
+
+
+def wsl_ok() -> bool:
+    if not _wsl_available():
+        return False
+    try:
+        c = run([WSL_EXE, "--status"])
+        return c.returncode == 0
+    except Exception:
+        return False
+
+
+def distro_list_quiet():
+    try:
+        q = run([WSL_EXE, "-l", "-q"])
+    except Exception:
+        return None
+    return _normalize_lines(q.stdout) if q.returncode == 0 else None
+
+
+def _distro_in_verbose(name: str) -> bool:
+    try:
+        out = run([WSL_EXE, "-l", "-v"])
+        if out.returncode != 0:
+            return False
+        return any(name.lower() in ln.lower() for ln in _normalize_lines(out.stdout))
+    except Exception:
+        return False
+
+
+def distro_exists(name: str = DISTRO_NAME) -> bool:
+    # 1) liste "quiet" fiable (non localisée), 2) fallback verbose
+    lines = distro_list_quiet()
+    if lines is not None:
+        return any(ln.lower() == name.lower() for ln in lines)
+    return _distro_in_verbose(name)
+
+
+def distro_healthy(name: str = DISTRO_NAME) -> bool:
+    try:
+        r = run([WSL_EXE, "-d", name, "--", "bash", "-lc", "echo OK"])
+        return r.returncode == 0 and "OK" in (r.stdout or "")
+    except Exception:
+        return False
+
+
+def wait_for_distro(name: str = DISTRO_NAME, timeout: float = 15.0) -> Optional[list]:
+    """
+    Attend que `name` apparaisse dans `wsl -l -q`. Retourne la liste des distros
+    au moment de la détection, ou None si timeout.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while True:
+        lines = distro_list_quiet() or []
+        if any(ln.lower() == name.lower() for ln in lines):
+            return lines
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 1.0)
+
+
+# ---------- Santé (parallèle + cache) ----------
+
+def state_dir() -> Path:
+    d = os.environ.get("PIWI_STATE_DIR", "").strip()
+    return Path(d) if d else Path(os.path.expanduser("~")) / "Piwi" / ".state"
+
+
+def _health_file() -> Path:
+    return state_dir() / "wsl_health.json"
+
+
+def _read_cached(name: str, ttl: float) -> Optional[dict]:
+    try:
+        data = json.loads(_health_file().read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if data.get("distro") != name:
+        return None
+    if time.time() - float(data.get("ts", 0)) > ttl:
+        return None
+    return data
+
+
+def _write_cache(data: dict):
+    f = _health_file()
+    try:
+        f.parent.mkdir(parents=True, exist_ok=True)
+        tmp = f.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        os.replace(tmp, f)
+    except Exception:
+        pass
+
+
+def invalidate_health_cache():
+    try:
+        _health_file().unlink()
+    except Exception:
+        pass
+
+
+def probe_health(name: str = DISTRO_NAME, *, use_cache: bool = True, ttl: float = HEALTH_TTL) -> SimpleNamespace:
+    """
+    Retourne {wsl_ok, exists, healthy, ready, elapsed, cached}.
+    Seul un résultat "prêt" est servi depuis le cache : un état dégradé est
+    toujours re-sondé (il déclenche une réparation, autant qu'il soit exact).
+    """
+    if use_cache:
+        c = _read_cached(name, ttl)
+        if c and c.get("ready"):
+            return SimpleNamespace(**{**c, "cached": True})
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        f_ok = ex.submit(wsl_ok)
+        f_list = ex.submit(distro_list_quiet)
+        f_health = ex.submit(distro_healthy, name)
+        ok, lines, healthy = f_ok.result(), f_list.result(), f_health.result()
+
+    if lines is not None:
+        exists = any(ln.lower() == name.lower() for ln in lines)
+    else:
+        exists = healthy or _distro_in_verbose(name)
+
+    data = {
+        "distro": name,
+        "wsl_ok": ok,
+        "exists": exists,
+        "healthy": healthy,
+        "ready": bool(ok and exists and healthy),
+        "elapsed": round(time.monotonic() - t0, 3),
+        "ts": time.time(),
+    }
+    _write_cache(data)
+    return SimpleNamespace(**{**data, "cached": False})
+
+
+def need_install(name: str = DISTRO_NAME) -> bool:
+    return not probe_health(name).ready
+
+
+# ---------- Latence (préchauffage) ----------
+
+def log_latency(record: dict):
+    """Ajoute une mesure (JSON Lines) à <state_dir>/latency.jsonl ; silencieux en cas d'erreur."""
+    try:
+        f = state_dir() / "latency.jsonl"
+        f.parent.mkdir(parents=True, exist_ok=True)
+        with open(f, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps({"ts": round(time.time(), 3), **record}) + "\n")
+    except Exception:
+        pass